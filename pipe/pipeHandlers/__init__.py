@@ -1 +1,17 @@
-__all__ = ['pipeline_io', 'select_from_list', 'environment', 'project', 'body', 'project', 'element', 'quick_dialogs']
+import importlib
+
+__all__ = ['pipeline_io', 'select_from_list', 'environment', 'project', 'body', 'project', 'element', 'quick_dialogs', 'resolver', 'dependency_graph', 'shotgun_sync', 'list_cache', 'list_search']
+
+def __getattr__(name):
+	'''
+	import a submodule the first time it is used as an attribute of the package, so
+	importing the package (or one module in it) never imports the others. Newer modules
+	are left out of __all__ and imported by name.
+	'''
+	if not name.startswith('_'):
+		try:
+			return importlib.import_module('.' + name, __name__)
+		except ModuleNotFoundError as e:
+			if e.name != __name__ + '.' + name:
+				raise # the submodule exists, something it imports doesn't
+	raise AttributeError("module '" + __name__ + "' has no attribute '" + name + "'")
@@ -0,0 +1,525 @@
+import hashlib
+import os
+import re
+import sys
+import threading
+import time
+import zlib
+
+from pipe.pipeHandlers import pipeline_io
+
+'''
+chunk_store module
+
+Keeps the versions of large binary scenes (.hip, .mb, ...) as chunks shared between
+versions, so storing a new publish costs about what changed in it rather than the
+whole file.
+
+A file is cut where its content says so (content-defined chunking): a rolling
+fingerprint of the last WINDOW bytes is computed at every position, and a chunk ends
+where it matches BOUNDARY, between MIN_CHUNK and MAX_CHUNK bytes in. An edit only moves
+the cuts next to it, so the chunks before and after it are the same as in the previous
+version. The fingerprint is the XOR of a byte table over the window, which Python
+computes a whole buffer at a time with big integers instead of byte by byte.
+
+Each chunk is stored once, compressed, under production/.chunks by its sha256. A
+version folder keeps a .chunked file listing the chunks of its files in place of the
+files themselves. restore_version() rebuilds the files in the folder itself, checking
+every chunk and the whole file against their hashes, so scenes only ever hold published
+paths. The resolver does this when a uri points at a chunked version, and
+Element.restore_version when a tool is about to open or reference one; the latter also
+tags the version to be kept, so it isn't moved into the store again under the scene.
+
+The store is opt-in: set PIPE_CHUNK_STORE=1 and each Element.publish moves the version
+that just fell out of the newest PIPE_CHUNK_STORE_KEEP (default 3) into the store in the
+background, so recent versions stay plain files. Versions tagged with
+Element.keep_version are left alone, as the retention policy leaves them (see storage).
+Older versions are moved with:
+python -m pipe.pipeHandlers.chunk_store ingest [--keep 3] [--dry-run]
+python -m pipe.pipeHandlers.chunk_store du
+python -m pipe.pipeHandlers.chunk_store gc [--dry-run]
+'''
+
+CHUNK_STORE_ENV = 'PIPE_CHUNK_STORE'
+KEEP_ENV = 'PIPE_CHUNK_STORE_KEEP'
+MANIFEST_FILENAME = '.chunked'
+STORE_DIRNAME = '.chunks'
+CHUNKED_EXTENSIONS = ('.hip', '.hipnc', '.hiplc', '.mb')
+
+MIN_CHUNK = 16 * 1024
+MAX_CHUNK = 256 * 1024
+# about one position in 65536 matches the two-byte BOUNDARY, for ~80KB chunks on average
+BOUNDARY = b'\x5e\xed'
+# where BOUNDARY isn't found before MAX_CHUNK, the last match of its second byte is used
+BACKUP = BOUNDARY[1:]
+WINDOW = 32
+READ_SIZE = 8 * 1024 * 1024
+
+COMPRESS_LEVEL = 1
+DEFAULT_KEEP = 3
+# gc leaves younger chunks alone, as a publish may be writing the manifest that uses them
+GC_GRACE_SECONDS = 24 * 60 * 60
+
+_VERSION_DIR = re.compile(r'^\.v(\d{4,})$')
+_DIGEST = re.compile(r'^[0-9a-f]{64}$')
+
+def _tables():
+	# four byte permutations that never change, since the chunks of every stored version depend on them
+	tables = []
+	for index in range(4):
+		order = sorted(range(256), key=lambda value: hashlib.sha256(bytes([index, value])).digest())
+		tables.append(bytes.maketrans(bytes(range(256)), bytes(order)))
+	return tables
+
+_TABLES = _tables()
+
+def fingerprint(data):
+	'''
+	return a bytes object as long as data whose byte i is the fingerprint of
+	data[i - WINDOW + 1:i + 1]
+	'''
+	mixed = 0
+	for index, table in enumerate(_TABLES):
+		mixed ^= int.from_bytes(data.translate(table), 'little') << (8 * index)
+	shift = 8 * len(_TABLES)
+	while shift < 8 * WINDOW:
+		mixed ^= mixed << shift
+		shift *= 2
+	return mixed.to_bytes(len(data) + WINDOW, 'little')[:len(data)]
+
+def _cut(marks, start, end):
+	'''
+	return where the chunk starting at start ends, given the fingerprint of the data up to end
+	'''
+	if end - start <= MIN_CHUNK:
+		return end
+	limit = min(end, start + MAX_CHUNK)
+	index = marks.find(BOUNDARY, start + MIN_CHUNK - len(BOUNDARY), limit)
+	if index >= 0:
+		return index + len(BOUNDARY)
+	index = marks.rfind(BACKUP, start + MIN_CHUNK - len(BACKUP), limit)
+	if index >= 0:
+		return index + len(BACKUP)
+	return limit
+
+def split(source):
+	'''
+	yield the chunks of a binary file object, in order
+	'''
+	buffer = b''
+	while True:
+		data = source.read(READ_SIZE)
+		buffer = buffer + data if buffer else data
+		if not buffer:
+			return
+		marks = fingerprint(buffer)
+		start = 0
+		# unless the file has ended, keep a full MAX_CHUNK so the last cut isn't the buffer's end
+		while len(buffer) - start >= (1 if not data else MAX_CHUNK):
+			end = _cut(marks, start, len(buffer))
+			yield buffer[start:end]
+			start = end
+		buffer = buffer[start:]
+		if not data:
+			return
+
+def enabled():
+	'''
+	whether publishes go to the chunk store (PIPE_CHUNK_STORE is set to something other than 0)
+	'''
+	return os.getenv(CHUNK_STORE_ENV, '0') not in ('', '0')
+
+def keep_count():
+	'''
+	the number of newest versions of every element publishes leave as plain files
+	(PIPE_CHUNK_STORE_KEEP, default DEFAULT_KEEP, at least 1)
+	'''
+	try:
+		return max(1, int(os.getenv(KEEP_ENV, DEFAULT_KEEP)))
+	except ValueError:
+		return DEFAULT_KEEP
+
+def chunkable(name):
+	return name.lower().endswith(CHUNKED_EXTENSIONS)
+
+def read_manifest(version_dir):
+	'''
+	return {name: entry} for the chunked files of a version folder ({} if there are none).
+	An entry holds the size and sha256 of the file and its chunks as [sha256, size] pairs.
+	'''
+	try:
+		return pipeline_io.readfile(os.path.join(version_dir, MANIFEST_FILENAME))
+	except (IOError, OSError, ValueError):
+		return {}
+
+def is_chunked(version_dir):
+	return os.path.exists(os.path.join(version_dir, MANIFEST_FILENAME))
+
+
+class ChunkStore:
+	'''
+	The chunks of a project, stored once each by their sha256.
+	'''
+
+	def __init__(self, env=None, root=None):
+		'''
+		env -- (optional) the Environment whose production folder holds the store. Defaults to the current project.
+		root -- (optional) the folder of the store, instead of production/.chunks
+		'''
+		if root is None:
+			if env is None:
+				from pipe.pipeHandlers.environment import Environment
+				env = Environment()
+			root = os.path.join(env.get_production_dir(), STORE_DIRNAME)
+		self.root = root
+
+	def chunk_path(self, digest):
+		return os.path.join(self.root, digest[:2], digest)
+
+	def put(self, data):
+		'''
+		store a chunk unless it's there already. Returns (sha256, bytes written).
+		'''
+		digest = hashlib.sha256(data).hexdigest()
+		path = self.chunk_path(digest)
+		try:
+			os.utime(path, None) # tells gc it's in use again
+			return digest, 0
+		except OSError:
+			pass
+		folder = os.path.dirname(path)
+		if not os.path.isdir(folder):
+			pipeline_io.mkdir(self.root)
+			pipeline_io.mkdir(folder)
+		compressed = zlib.compress(data, COMPRESS_LEVEL)
+		tmp_path = '%s_tmp%d_%d' % (path, os.getpid(), threading.get_ident())
+		with open(tmp_path, 'wb') as f:
+			f.write(compressed)
+		os.rename(tmp_path, path) # another writer's copy is the same bytes
+		return digest, len(compressed)
+
+	def get(self, digest):
+		'''
+		return the bytes of a chunk, checked against its sha256
+		'''
+		with open(self.chunk_path(digest), 'rb') as f:
+			data = zlib.decompress(f.read())
+		if hashlib.sha256(data).hexdigest() != digest:
+			raise IOError('chunk ' + digest + ' in ' + self.root + ' is damaged')
+		return data
+
+	def add_file(self, path):
+		'''
+		store the chunks of a file and return (its manifest entry, bytes written)
+		'''
+		digest = hashlib.sha256()
+		chunks = []
+		size = 0
+		written = 0
+		with open(path, 'rb') as source:
+			for data in split(source):
+				digest.update(data)
+				size += len(data)
+				chunk_digest, chunk_written = self.put(data)
+				chunks.append([chunk_digest, len(data)])
+				written += chunk_written
+		entry = {}
+		entry['size'] = size
+		entry['sha256'] = digest.hexdigest()
+		entry['chunks'] = chunks
+		return entry, written
+
+	def write_file(self, entry, target):
+		'''
+		rebuild a file from its manifest entry, checking it against its sha256
+		'''
+		digest = hashlib.sha256()
+		with open(target, 'wb') as output:
+			for chunk_digest, size in entry['chunks']:
+				data = self.get(chunk_digest)
+				digest.update(data)
+				output.write(data)
+		if digest.hexdigest() != entry['sha256']:
+			raise IOError('could not rebuild ' + target + ' from ' + self.root)
+
+	def missing(self, entry):
+		'''
+		return the chunks of a manifest entry that aren't in the store
+		'''
+		return [chunk_digest for chunk_digest, size in entry['chunks'] if not os.path.exists(self.chunk_path(chunk_digest))]
+
+	def list_chunks(self):
+		'''
+		return (sha256, stored bytes, modification time) for every chunk in the store
+		'''
+		chunks = []
+		try:
+			prefixes = os.listdir(self.root)
+		except OSError:
+			return chunks
+		for prefix in prefixes:
+			try:
+				entries = list(os.scandir(os.path.join(self.root, prefix)))
+			except OSError:
+				continue
+			for entry in entries:
+				if _DIGEST.match(entry.name):
+					try:
+						st = entry.stat()
+					except OSError:
+						continue
+					chunks.append((entry.name, st.st_size, st.st_mtime))
+		return chunks
+
+	def collect(self, referenced, grace=GC_GRACE_SECONDS, dry_run=False):
+		'''
+		delete the chunks older than grace seconds that aren't in referenced, a set of
+		sha256s. Returns (chunks, bytes) deleted.
+		'''
+		deadline = time.time() - grace
+		count = 0
+		freed = 0
+		for digest, size, modified in self.list_chunks():
+			if digest in referenced or modified > deadline:
+				continue
+			if not dry_run:
+				try:
+					os.remove(self.chunk_path(digest))
+				except OSError:
+					continue
+			count += 1
+			freed += size
+		return count, freed
+
+def chunk_version(version_dir, store):
+	'''
+	move the scene files of a version folder into the store and return the bytes saved.
+	The manifest is written before the originals are removed, so an interrupted run
+	leaves both and the original is still read.
+	'''
+	manifest = read_manifest(version_dir)
+	added = []
+	saved = 0
+	for entry in os.scandir(version_dir):
+		if entry.name.startswith('.') or entry.name in manifest or not chunkable(entry.name):
+			continue
+		if not entry.is_file(follow_symlinks=False):
+			continue
+		manifest[entry.name], written = store.add_file(entry.path)
+		added.append(entry.path)
+		saved += manifest[entry.name]['size'] - written
+	if added:
+		pipeline_io.writefile(os.path.join(version_dir, MANIFEST_FILENAME), manifest)
+		for path in added:
+			os.remove(path)
+	return saved
+
+def restore_version(version_dir, store=None):
+	'''
+	put the chunked files of a version folder back in place and remove its manifest.
+	Returns the number of files rebuilt. The chunks stay in the store until gc finds no
+	version using them.
+	'''
+	manifest = read_manifest(version_dir)
+	if not manifest:
+		return 0
+	if store is None:
+		# version folders are production/<kind>/<body>/<department>/<element>/.vNNNN
+		store = ChunkStore(root=_store_root(version_dir))
+	restored = 0
+	for name, entry in manifest.items():
+		target = os.path.join(version_dir, name)
+		if os.path.exists(target):
+			continue # an original chunk_version was interrupted before removing, or another restore's
+		tmp_path = '%s_tmp%d_%d' % (target, os.getpid(), threading.get_ident())
+		try:
+			store.write_file(entry, tmp_path)
+			os.rename(tmp_path, target)
+		finally:
+			if os.path.exists(tmp_path):
+				os.remove(tmp_path)
+		pipeline_io.set_permissions(target)
+		restored += 1
+	try:
+		os.remove(os.path.join(version_dir, MANIFEST_FILENAME))
+	except OSError:
+		pass # another process restored it at the same time
+	return restored
+
+def _store_root(version_dir):
+	'''
+	return the store of the production a version folder is in: the nearest production/.chunks above it
+	'''
+	folder = os.path.dirname(os.path.abspath(version_dir))
+	while True:
+		root = os.path.join(folder, STORE_DIRNAME)
+		if os.path.isdir(root):
+			return root
+		parent = os.path.dirname(folder)
+		if parent == folder:
+			raise EnvironmentError('no chunk store above ' + version_dir)
+		folder = parent
+
+def ingest_previous(element_dir, version, env=None, keep=None):
+	'''
+	chunk the version of an element that publishing the given one pushed out of the newest
+	keep (default keep_count()), in a background thread. Called by Element.publish when
+	the store is enabled. Returns the thread, or None.
+	'''
+	if keep is None:
+		keep = keep_count()
+	previous = version - max(1, keep)
+	if previous < 0:
+		return None
+	try:
+		datadict = pipeline_io.readfile(os.path.join(element_dir, '.element'))
+	except (IOError, OSError, ValueError):
+		return None
+	if previous in datadict.get('keep_versions', []) or previous in pipeline_io.read_retired(element_dir):
+		return None
+	version_dir = os.path.join(element_dir, '.v%04d' % previous)
+	try:
+		pending = any(chunkable(name) for name in os.listdir(version_dir) if not name.startswith('.'))
+	except OSError:
+		return None
+	if not pending:
+		return None
+	store = ChunkStore(env)
+
+	def run():
+		try:
+			chunk_version(version_dir, store)
+		except (IOError, OSError) as e:
+			print('could not chunk ' + version_dir + ': ' + str(e))
+
+	# a daemon thread, so a DCC or script can exit while it runs. chunk_version writes the
+	# manifest before removing anything, so a cut off run leaves the plain files, and the
+	# ingest job picks the version up later
+	thread = threading.Thread(target=run, name='chunk ' + version_dir)
+	thread.daemon = True
+	thread.start()
+	return thread
+
+
+class Ingester:
+	'''
+	Moves the scene files of every version older than the newest few into the chunk store,
+	and collects the chunks no version uses any more.
+	'''
+
+	def __init__(self, env=None, keep=DEFAULT_KEEP):
+		'''
+		env -- (optional) the Environment to work on. Defaults to the current project.
+		keep -- number of newest versions of every element left as plain files (at least 1)
+		'''
+		from pipe.pipeHandlers.storage import Storage
+		self._storage = Storage(env)
+		self.store = ChunkStore(env)
+		self.keep = max(1, keep)
+
+	def version_dirs(self):
+		'''
+		return (element folder, version, version folder) for every version in the project
+		'''
+		result = []
+		for kind, name, body_dir in self._storage.list_bodies():
+			for element_dir in self._storage.list_elements(body_dir):
+				for entry in os.scandir(element_dir):
+					match = _VERSION_DIR.match(entry.name)
+					if match and entry.is_dir():
+						result.append((element_dir, int(match.group(1)), entry.path))
+		return sorted(result)
+
+	def candidates(self):
+		'''
+		return the version folders with scene files that should be chunked
+		'''
+		latest = {}
+		kept = {}
+		folders = []
+		for element_dir, version, version_dir in self.version_dirs():
+			if element_dir not in latest:
+				try:
+					datadict = pipeline_io.readfile(os.path.join(element_dir, '.element'))
+				except (IOError, OSError, ValueError):
+					datadict = {}
+				latest[element_dir] = datadict.get('latest_version', -1)
+				kept[element_dir] = set(datadict.get('keep_versions', []))
+			if version > latest[element_dir] - self.keep or version in kept[element_dir]:
+				continue
+			manifest = read_manifest(version_dir)
+			if any(chunkable(name) and name not in manifest for name in os.listdir(version_dir) if not name.startswith('.')):
+				folders.append(version_dir)
+		return folders
+
+	def run(self, dry_run=False):
+		'''
+		chunk the candidates and return (folders, bytes saved)
+		'''
+		folders = self.candidates()
+		saved = 0
+		if not dry_run:
+			for version_dir in folders:
+				try:
+					saved += chunk_version(version_dir, self.store)
+				except (IOError, OSError) as e:
+					print('could not chunk ' + version_dir + ': ' + str(e))
+		return folders, saved
+
+	def referenced(self):
+		'''
+		return the sha256s of the chunks used by any version folder, including the ones in
+		the trash, which can still be restored
+		'''
+		manifests = [os.path.join(version_dir, MANIFEST_FILENAME) for element_dir, version, version_dir in self.version_dirs()]
+		for folder, dirnames, filenames in os.walk(self._storage.trash_dir):
+			if MANIFEST_FILENAME in filenames:
+				manifests.append(os.path.join(folder, MANIFEST_FILENAME))
+		digests = set()
+		for manifest_path in manifests:
+			try:
+				manifest = pipeline_io.readfile(manifest_path)
+			except (IOError, OSError, ValueError):
+				continue
+			for entry in manifest.values():
+				digests.update(chunk_digest for chunk_digest, size in entry['chunks'])
+		return digests
+
+	def collect(self, dry_run=False):
+		return self.store.collect(self.referenced(), dry_run=dry_run)
+
+
+def main(argv=None):
+	import argparse # only the command line needs it
+
+	parser = argparse.ArgumentParser(description='Store old versions of scene files as shared chunks.')
+	subparsers = parser.add_subparsers(dest='command')
+	ingest = subparsers.add_parser('ingest', help='Move older versions into the chunk store.')
+	ingest.add_argument('--keep', type=int, default=DEFAULT_KEEP, help='newest versions of each element to leave alone (default %d)' % DEFAULT_KEEP)
+	ingest.add_argument('--dry-run', '-n', action='store_true', help='only list the versions that would be chunked')
+	subparsers.add_parser('du', help='Report the size of the chunk store.')
+	gc = subparsers.add_parser('gc', help='Delete the chunks no version uses.')
+	gc.add_argument('--dry-run', '-n', action='store_true', help='only count the chunks that would be deleted')
+	args = parser.parse_args(argv)
+	if args.command is None:
+		parser.print_help()
+		return 1
+
+	from pipe.pipeHandlers.storage import format_bytes
+	ingester = Ingester(keep=getattr(args, 'keep', DEFAULT_KEEP))
+	if args.command == 'ingest':
+		folders, saved = ingester.run(args.dry_run)
+		for folder in folders:
+			print(('would chunk ' if args.dry_run else 'chunked ') + folder)
+		if not args.dry_run:
+			print('saved %s in %d versions' % (format_bytes(saved), len(folders)))
+	elif args.command == 'du':
+		chunks = ingester.store.list_chunks()
+		print('%s in %d chunks' % (format_bytes(sum(size for digest, size, modified in chunks)), len(chunks)))
+	else:
+		count, freed = ingester.collect(args.dry_run)
+		print('%s %d chunks, %s' % ('would delete' if args.dry_run else 'deleted', count, format_bytes(freed)))
+	return 0
+
+if __name__ == '__main__':
+	sys.exit(main())
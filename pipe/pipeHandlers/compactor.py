@@ -0,0 +1,346 @@
+import gzip
+import hashlib
+import lzma
+import os
+import re
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from pipe.pipeHandlers import pipeline_io
+
+'''
+compactor module
+
+Compresses the text files (.json, .ma, .obj, ...) in old .vNNNN folders, which shrink
+10-20 times. Every file is cut into frames of FRAME_SIZE bytes that are compressed on
+their own and written one after the other, giving a .xz (or .gz) file that the usual
+tools still decompress in one go. The frame offsets are kept in the folder's .compacted
+file, so part of a file can be read without decompressing the rest (see FramedReader).
+
+The latest versions of an element are never compacted, so DCCs open them directly.
+restore_version() puts the originals of an older one back in its own folder, so scenes
+only ever hold published paths. The resolver does this when a uri points at a compacted
+version, and Element.restore_version when a tool is about to open or reference one; the
+latter also tags the version to be kept, which the compactor leaves alone.
+
+Folders holding USD layers or MaterialX documents are never compacted: other layers
+and renderers open them by path, with nothing to restore them first. Such a folder
+compacted by an earlier run is restored the next time the compactor runs.
+
+Run it from cron, or in the background with --interval:
+python -m pipe.pipeHandlers.compactor [--keep 3] [--codec xz|gzip] [--dry-run] [--interval SECONDS]
+'''
+
+MANIFEST_FILENAME = '.compacted'
+COMPRESSIBLE_EXTENSIONS = ('.json', '.ma', '.obj', '.txt', '.xml', '.py')
+# files that find what they reference relative to their own folder, so must stay in it
+ANCHORED_EXTENSIONS = ('.usd', '.usda', '.usdc', '.usdz', '.mtlx')
+
+XZ = 'xz'
+GZIP = 'gzip'
+CODECS = {
+	XZ: ('.xz', lambda data: lzma.compress(data, format=lzma.FORMAT_XZ), lzma.decompress),
+	GZIP: ('.gz', lambda data: gzip.compress(data, mtime=0), gzip.decompress),
+}
+
+FRAME_SIZE = 4 * 1024 * 1024
+DEFAULT_KEEP = 3
+# a file is only replaced if compressing saves at least this fraction of it
+MIN_SAVING = 0.2
+# smaller files aren't worth a frame table
+MIN_SIZE = 4096
+
+_VERSION_DIR = re.compile(r'^\.v(\d{4,})$')
+
+def compressible(name):
+	return name.lower().endswith(COMPRESSIBLE_EXTENSIONS)
+
+def anchored(version_dir):
+	'''
+	whether a version folder holds files that must not be moved out of it (see ANCHORED_EXTENSIONS)
+	'''
+	return any(name.lower().endswith(ANCHORED_EXTENSIONS) for name in os.listdir(version_dir)) or \
+		any(name.lower().endswith(ANCHORED_EXTENSIONS) for name in read_manifest(version_dir))
+
+def read_manifest(version_dir):
+	'''
+	return {name: entry} for the compacted files of a version folder ({} if there are none).
+	An entry holds the codec, the compressed file name, the size, sha256 and the frame
+	offsets of the original file. Files that didn't compress well have None.
+	'''
+	try:
+		return pipeline_io.readfile(os.path.join(version_dir, MANIFEST_FILENAME))
+	except (IOError, OSError, ValueError):
+		return {}
+
+def is_compacted(version_dir):
+	return os.path.exists(os.path.join(version_dir, MANIFEST_FILENAME))
+
+def compress_file(path, codec=XZ, frame_size=FRAME_SIZE):
+	'''
+	write the framed, compressed copy of a file next to it and return its manifest entry
+	'''
+	extension, compress, decompress = CODECS[codec]
+	compressed_path = path + extension
+	tmp_path = compressed_path + '_tmp'
+	digest = hashlib.sha256()
+	frames = [0]
+	size = 0
+	with open(path, 'rb') as source, open(tmp_path, 'wb') as target:
+		for chunk in iter(lambda: source.read(frame_size), b''):
+			digest.update(chunk)
+			size += len(chunk)
+			target.write(compress(chunk))
+			frames.append(target.tell())
+	os.rename(tmp_path, compressed_path)
+
+	entry = {}
+	entry['codec'] = codec
+	entry['file'] = os.path.basename(compressed_path)
+	entry['size'] = size
+	entry['sha256'] = digest.hexdigest()
+	entry['frame_size'] = frame_size
+	entry['frames'] = frames
+	return entry
+
+def _pending(entry, manifest):
+	'''
+	whether a version folder entry is a file compact_version still has to look at
+	'''
+	if entry.name.startswith('.') or entry.name in manifest or not compressible(entry.name):
+		return False
+	try:
+		return entry.is_file(follow_symlinks=False) and entry.stat(follow_symlinks=False).st_size >= MIN_SIZE
+	except OSError:
+		return False
+
+def compact_version(version_dir, codec=XZ, frame_size=FRAME_SIZE):
+	'''
+	compress the text files of a version folder and return the bytes saved. The manifest
+	is written before the originals are removed, so an interrupted run leaves both copies
+	and the original is still read.
+	'''
+	if anchored(version_dir):
+		return 0
+	manifest = read_manifest(version_dir)
+	saved = 0
+	added = []
+	changed = False
+	for entry in os.scandir(version_dir):
+		if not _pending(entry, manifest):
+			continue
+		compressed = compress_file(entry.path, codec, frame_size)
+		compressed_size = os.path.getsize(os.path.join(version_dir, compressed['file']))
+		changed = True
+		if compressed_size > compressed['size'] * (1 - MIN_SAVING):
+			os.remove(os.path.join(version_dir, compressed['file']))
+			manifest[entry.name] = None # left as it is, and not tried again
+			continue
+		manifest[entry.name] = compressed
+		added.append(entry.path)
+		saved += compressed['size'] - compressed_size
+	if changed:
+		pipeline_io.writefile(os.path.join(version_dir, MANIFEST_FILENAME), manifest)
+		for path in added:
+			os.remove(path)
+	return saved
+
+
+class FramedReader:
+	'''
+	Reads a compacted file as if it were the original, decompressing only the frames a
+	read touches.
+	'''
+
+	def __init__(self, version_dir, name):
+		self._entry = read_manifest(version_dir).get(name)
+		if not self._entry:
+			raise ValueError(name + ' in ' + version_dir + ' is not compacted')
+		self._decompress = CODECS[self._entry['codec']][2]
+		self._file = open(os.path.join(version_dir, self._entry['file']), 'rb')
+		self._position = 0
+		self._frame = (None, b'')
+
+	def _read_frame(self, index):
+		if self._frame[0] != index:
+			frames = self._entry['frames']
+			self._file.seek(frames[index])
+			self._frame = (index, self._decompress(self._file.read(frames[index + 1] - frames[index])))
+		return self._frame[1]
+
+	def read(self, size=-1):
+		end = self._entry['size'] if size is None or size < 0 else min(self._entry['size'], self._position + size)
+		frame_size = self._entry['frame_size']
+		chunks = []
+		while self._position < end:
+			index, offset = divmod(self._position, frame_size)
+			chunk = self._read_frame(index)[offset:offset + end - self._position]
+			chunks.append(chunk)
+			self._position += len(chunk)
+		return b''.join(chunks)
+
+	def seek(self, offset, whence=os.SEEK_SET):
+		if whence == os.SEEK_CUR:
+			offset += self._position
+		elif whence == os.SEEK_END:
+			offset += self._entry['size']
+		self._position = max(0, offset)
+		return self._position
+
+	def tell(self):
+		return self._position
+
+	def close(self):
+		self._file.close()
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, *args):
+		self.close()
+
+def decompress_file(version_dir, name, target):
+	'''
+	write the original of a compacted file to target, checking it against its sha256
+	'''
+	entry = read_manifest(version_dir)[name]
+	decompress = CODECS[entry['codec']][2]
+	digest = hashlib.sha256()
+	frames = entry['frames']
+	with open(os.path.join(version_dir, entry['file']), 'rb') as source, open(target, 'wb') as output:
+		for start, end in zip(frames, frames[1:]):
+			chunk = decompress(source.read(end - start))
+			digest.update(chunk)
+			output.write(chunk)
+	if digest.hexdigest() != entry['sha256']:
+		raise IOError('the compacted copy of ' + os.path.join(version_dir, name) + ' is damaged')
+
+def restore_version(version_dir):
+	'''
+	put the originals of a compacted version folder back and remove its manifest. Returns
+	the number of files restored.
+	'''
+	manifest = read_manifest(version_dir)
+	if not manifest:
+		return 0
+	restored = 0
+	for name, entry in manifest.items():
+		if not entry:
+			continue
+		target = os.path.join(version_dir, name)
+		if not os.path.exists(target): # else an original the compactor was interrupted before removing, or another restore's
+			tmp_path = '%s_tmp%d_%d' % (target, os.getpid(), threading.get_ident())
+			try:
+				decompress_file(version_dir, name, tmp_path)
+				os.rename(tmp_path, target)
+			finally:
+				if os.path.exists(tmp_path):
+					os.remove(tmp_path)
+			pipeline_io.set_permissions(target)
+		restored += 1
+	# the manifest goes first, so nothing looks for the compressed files once they're removed
+	for path in [MANIFEST_FILENAME] + [entry['file'] for entry in manifest.values() if entry]:
+		try:
+			os.remove(os.path.join(version_dir, path))
+		except OSError:
+			pass # another process restored it at the same time
+	return restored
+
+
+class Compactor:
+	'''
+	Compacts every version of the project that is older than the newest few.
+	'''
+
+	def __init__(self, env=None, keep=DEFAULT_KEEP, codec=XZ, workers=4):
+		'''
+		env -- (optional) the Environment to compact. Defaults to the current project.
+		keep -- number of newest versions of every element left uncompressed (at least 1)
+		codec -- XZ or GZIP
+		workers -- number of versions compressed at once
+		'''
+		from pipe.pipeHandlers.storage import Storage
+		self._storage = Storage(env)
+		self.keep = max(1, keep)
+		self.codec = codec
+		self.workers = workers
+
+	def candidates(self):
+		'''
+		return the version folders that should be compacted and aren't yet
+		'''
+		folders = []
+		for kind, name, body_dir in self._storage.list_bodies():
+			for element_dir in self._storage.list_elements(body_dir):
+				try:
+					datadict = pipeline_io.readfile(os.path.join(element_dir, '.element'))
+				except (IOError, OSError, ValueError):
+					continue
+				newest = datadict.get('latest_version', -1) - self.keep
+				kept = set(datadict.get('keep_versions', []))
+				for entry in os.scandir(element_dir):
+					match = _VERSION_DIR.match(entry.name)
+					if not match or not entry.is_dir():
+						continue
+					if is_compacted(entry.path) and anchored(entry.path):
+						folders.append(entry.path) # compacted before anchored folders were skipped
+					elif int(match.group(1)) <= newest and int(match.group(1)) not in kept and self._pending(entry.path):
+						folders.append(entry.path)
+		return sorted(folders)
+
+	def _pending(self, version_dir):
+		if anchored(version_dir):
+			return False
+		manifest = read_manifest(version_dir)
+		return any(_pending(entry, manifest) for entry in os.scandir(version_dir))
+
+	def run(self, dry_run=False):
+		'''
+		compact the candidates and return (folders, bytes saved)
+		'''
+		folders = self.candidates()
+		if dry_run:
+			return folders, 0
+		with ThreadPoolExecutor(max_workers=self.workers) as pool:
+			saved = sum(pool.map(self._compact, folders))
+		return folders, saved
+
+	def _compact(self, version_dir):
+		try:
+			if is_compacted(version_dir) and anchored(version_dir):
+				restore_version(version_dir)
+				return 0
+			return compact_version(version_dir, self.codec)
+		except (IOError, OSError, lzma.LZMAError) as e:
+			print('could not compact ' + version_dir + ': ' + str(e))
+			return 0
+
+
+def main(argv=None):
+	import argparse # only the command line needs it
+
+	parser = argparse.ArgumentParser(description='Compress the text files of old versions.')
+	parser.add_argument('--keep', type=int, default=DEFAULT_KEEP, help='newest versions of each element to leave alone (default %d)' % DEFAULT_KEEP)
+	parser.add_argument('--codec', choices=sorted(CODECS), default=XZ, help='compression (default xz)')
+	parser.add_argument('--workers', '-w', type=int, default=4, help='versions compressed at once (default 4)')
+	parser.add_argument('--dry-run', '-n', action='store_true', help='only list the versions that would be compacted')
+	parser.add_argument('--interval', type=float, help='keep running, compacting every INTERVAL seconds')
+	args = parser.parse_args(argv)
+
+	if args.interval:
+		os.nice(10) # stay out of the way of interactive work
+	compactor = Compactor(keep=args.keep, codec=args.codec, workers=args.workers)
+	while True:
+		folders, saved = compactor.run(args.dry_run)
+		for folder in folders:
+			print(('would compact ' if args.dry_run else 'compacted ') + folder)
+		if not args.dry_run:
+			print('saved %.1f MB in %d versions' % (saved / 1024.0 ** 2, len(folders)))
+		if not args.interval:
+			return 0
+		time.sleep(args.interval)
+
+if __name__ == '__main__':
+	sys.exit(main())
@@ -0,0 +1,404 @@
+import os
+import time
+
+from pipe.pipeHandlers.environment import Environment
+from pipe.pipeHandlers import pipeline_io
+from pipe.pipeHandlers import resolver
+
+'''
+dependency graph module
+
+Records which bodies consume which other bodies so that, after a publish, only the
+layouts and shots that actually use the published asset need to be updated.
+Edges come from:
+	- the references list in each .body file
+	- asset paths inside the current .usda files of each body (layouts, asset usd
+	  publishes that assemble variants, and the layout copies inside shots)
+	- the per-asset animation elements of a shot
+	- the sequence a shot belongs to (the first letter of the shot name)
+
+The graph is saved to production/.dependency_graph. update() only re-reads the bodies
+whose .body, .element or .usda files changed since the last update.
+
+Usage:
+	python -m pipe.pipeHandlers.dependency_graph update
+	python -m pipe.pipeHandlers.dependency_graph dependents chair --shots [--no-update]
+	python -m pipe.pipeHandlers.dependency_graph stale "Mon, 05 Oct 2026 09:00:00 AM"
+'''
+
+PIPELINE_FILENAME = '.dependency_graph'
+BODY_FILENAME = '.body'
+ELEMENT_FILENAME = '.element'
+
+KIND = 'kind'
+NAME = 'name'
+SOURCES = 'sources'
+REFERENCES = 'references'
+DEPENDS_ON = 'depends_on'
+PUBLISHED = 'published'
+NODES = 'nodes'
+UPDATED = 'updated'
+
+# departments whose subdirectories are elements of their own, e.g. animation/<asset>
+SUB_ELEMENT_DEPARTMENTS = ['animation', 'camera', 'hda']
+IGNORED_DIRS = ['cache', 'render']
+
+# the order names from a .body references list are matched against
+REFERENCE_KINDS = [resolver.ASSET, resolver.LAYOUT, resolver.SHOT, resolver.TOOL, resolver.SEQUENCE]
+
+def node_key(kind, name):
+	'''
+	return the key a body is stored under in the graph, e.g. asset/chair
+	'''
+	return kind + '/' + name
+
+def split_key(key):
+	'''
+	return the (kind, name) tuple for the given node key
+	'''
+	return tuple(key.split('/', 1))
+
+def parse_timestamp(timestamp):
+	'''
+	convert a pipeline_io.timestamp() string to seconds since the epoch
+	'''
+	return time.mktime(time.strptime(timestamp, "%a, %d %b %Y %I:%M:%S %p"))
+
+def _signature(entry):
+	st = entry.stat()
+	return [st.st_mtime_ns, st.st_size]
+
+
+class DependencyGraph:
+	'''
+	Reverse dependency index of the bodies in a project.
+	'''
+
+	def __init__(self, env=None, filepath=None):
+		'''
+		env -- (optional) the Environment to index. Defaults to the current project.
+		filepath -- (optional) where the graph is stored. Defaults to production/.dependency_graph
+		'''
+		self._env = env if env is not None else Environment()
+		self._roots = {}
+		self._names = {}
+		path_resolver = resolver.Resolver(self._env)
+		for kind in REFERENCE_KINDS:
+			try:
+				self._roots[kind] = os.path.normpath(path_resolver.get_root(kind))
+			except KeyError:
+				pass # this project doesn't have that kind of body
+
+		if filepath is None:
+			filepath = os.path.join(self._env.get_production_dir(), PIPELINE_FILENAME)
+		self._filepath = filepath
+		self._nodes = {}
+		self._updated = None
+		if os.path.exists(filepath):
+			datadict = pipeline_io.readfile(filepath)
+			self._nodes = datadict[NODES]
+			self._updated = datadict[UPDATED]
+		self._build_index()
+
+	def get_filepath(self):
+		return self._filepath
+
+	def get_updated(self):
+		'''
+		return the time (seconds since the epoch) of the last update, or None
+		'''
+		return self._updated
+
+	def update(self, save=True):
+		'''
+		rescan the project, re-reading only the bodies whose files changed.
+		returns the list of node keys that were (re)scanned.
+		'''
+		scanned = []
+		seen = set()
+		self._names = {}
+		for kind, root in self._roots.items():
+			if not os.path.isdir(root):
+				continue
+			for entry in os.scandir(root):
+				if not entry.is_dir() or not os.path.exists(os.path.join(entry.path, BODY_FILENAME)):
+					continue
+				key = node_key(kind, entry.name)
+				seen.add(key)
+				sources = self._collect_sources(entry.path)
+				node = self._nodes.get(key)
+				if node is None or node[SOURCES] != sources:
+					self._nodes[key] = self._scan(kind, entry.name, entry.path, sources)
+					scanned.append(key)
+
+		for key in list(self._nodes.keys()):
+			if key not in seen:
+				del self._nodes[key]
+
+		self._updated = time.time()
+		self._build_index()
+		if save:
+			self.save()
+		return scanned
+
+	def save(self):
+		datadict = {}
+		datadict[UPDATED] = self._updated
+		datadict[NODES] = self._nodes
+		pipeline_io.writefile(self._filepath, datadict)
+		pipeline_io.set_permissions(self._filepath)
+
+	def _collect_sources(self, body_dir):
+		'''
+		stat every file the dependencies of a body are read from
+		'''
+		sources = {}
+		sources[BODY_FILENAME] = _signature(_Stat(body_dir, BODY_FILENAME))
+		for department in os.scandir(body_dir):
+			if not department.is_dir() or department.name.startswith('.'):
+				continue
+			for entry in os.scandir(department.path):
+				if entry.name == ELEMENT_FILENAME or entry.name.endswith('.usda'):
+					sources[department.name + '/' + entry.name] = _signature(entry)
+				elif department.name in SUB_ELEMENT_DEPARTMENTS and entry.is_dir() and self._is_sub_element(entry):
+					sub_element = department.name + '/' + entry.name + '/' + ELEMENT_FILENAME
+					sources[sub_element] = _signature(_Stat(department.path, entry.name + '/' + ELEMENT_FILENAME))
+		return sources
+
+	def _is_sub_element(self, entry):
+		if entry.name.startswith('.') or entry.name in IGNORED_DIRS:
+			return False
+		return os.path.exists(os.path.join(entry.path, ELEMENT_FILENAME))
+
+	def _scan(self, kind, name, body_dir, sources):
+		'''
+		read the dependencies and publish times of a single body
+		'''
+		node = {}
+		node[KIND] = kind
+		node[NAME] = name
+		node[SOURCES] = sources
+
+		datadict = pipeline_io.readfile(os.path.join(body_dir, BODY_FILENAME))
+		node[REFERENCES] = list(datadict.get(REFERENCES, []))
+
+		depends_on = set()
+		published = {}
+		for source in sources:
+			path = os.path.join(body_dir, source)
+			if source.endswith(ELEMENT_FILENAME) and source != BODY_FILENAME:
+				element = os.path.dirname(source)
+				publish_time = self._last_publish_time(path)
+				if publish_time is not None:
+					published[element] = publish_time
+				if '/' in element and kind == resolver.SHOT:
+					# shots keep one element per asset, e.g. animation/<asset>
+					sub_name = element.split('/', 1)[1]
+					if sub_name in self._list_names(resolver.ASSET):
+						depends_on.add(node_key(resolver.ASSET, sub_name))
+			elif source.endswith('.usda'):
+				depends_on.update(self._usda_dependencies(path))
+
+		if kind == resolver.SHOT and name[:1] in self._list_names(resolver.SEQUENCE):
+			depends_on.add(node_key(resolver.SEQUENCE, name[:1]))
+
+		depends_on.discard(node_key(kind, name))
+		node[DEPENDS_ON] = sorted(depends_on)
+		node[PUBLISHED] = published
+		return node
+
+	def _list_names(self, kind):
+		names = self._names.get(kind)
+		if names is None:
+			root = self._roots.get(kind)
+			names = set(os.listdir(root)) if root is not None and os.path.isdir(root) else set()
+			self._names[kind] = names
+		return names
+
+	def _last_publish_time(self, element_file):
+		datadict = pipeline_io.readfile(element_file)
+		latest_version = datadict.get('latest_version', -1)
+		if latest_version < 0:
+			return None
+		try:
+			return parse_timestamp(datadict['publishes'][latest_version][1])
+		except (ValueError, IndexError):
+			return os.path.getmtime(element_file)
+
+	def _usda_dependencies(self, usda_file):
+		'''
+		return the node keys of every body referenced by asset paths in the given usda file
+		'''
+		with open(usda_file, 'r') as f:
+			text = f.read()
+
+		usda_dir = os.path.dirname(usda_file)
+		depends_on = set()
+		for asset_path in resolver.USDA_ASSET_PATH.findall(text):
+			if asset_path.startswith(resolver.SCHEME):
+				try:
+					parsed = resolver.parse(asset_path)
+				except ValueError:
+					continue
+				depends_on.add(node_key(parsed.kind, parsed.name))
+				continue
+
+			key = self.path_to_key(os.path.join(usda_dir, asset_path))
+			if key is not None:
+				depends_on.add(key)
+		return depends_on
+
+	def path_to_key(self, path):
+		'''
+		return the node key of the body the given file lives in, or None if it isn't inside a body
+		'''
+		path = os.path.normpath(path)
+		for kind, root in self._roots.items():
+			if path.startswith(root + os.sep):
+				return node_key(kind, path[len(root) + 1:].split(os.sep, 1)[0])
+		return None
+
+	def _build_index(self):
+		'''
+		build the reverse (dependents) index from the stored forward edges
+		'''
+		self._dependents = {}
+		for key, node in self._nodes.items():
+			for dependency in self._forward_edges(node):
+				self._dependents.setdefault(dependency, set()).add(key)
+
+	def _forward_edges(self, node):
+		edges = set(node[DEPENDS_ON])
+		for reference in node[REFERENCES]:
+			for kind in REFERENCE_KINDS:
+				key = node_key(kind, reference)
+				if key in self._nodes:
+					edges.add(key)
+					break
+		return edges
+
+	def depends_on(self, key):
+		'''
+		return the keys of the bodies the given body uses directly
+		'''
+		node = self._nodes.get(key)
+		if node is None:
+			return []
+		return sorted(self._forward_edges(node))
+
+	def dependents(self, name, kind=resolver.ASSET, transitive=True):
+		'''
+		return the keys of every body that uses the given body. With transitive set, bodies
+		that use it through a layout or another asset are included too.
+		'''
+		start = node_key(kind, name)
+		found = set()
+		pending = [start]
+		while pending:
+			key = pending.pop()
+			for dependent in self._dependents.get(key, ()):
+				if dependent not in found:
+					found.add(dependent)
+					if transitive:
+						pending.append(dependent)
+		found.discard(start)
+		return sorted(found)
+
+	def dependent_shots(self, name, kind=resolver.ASSET):
+		'''
+		return the names of the shots that need updating after the given body is published
+		'''
+		return [split_key(key)[1] for key in self.dependents(name, kind) if key.startswith(resolver.SHOT + '/')]
+
+	def published_since(self, since, departments=None):
+		'''
+		return the keys of the bodies with a publish newer than since (seconds since the epoch)
+		departments -- (optional) only consider publishes to these departments
+		'''
+		published = []
+		for key, node in self._nodes.items():
+			for element, publish_time in node[PUBLISHED].items():
+				if departments is not None and element.split('/')[0] not in departments:
+					continue
+				if publish_time > since:
+					published.append(key)
+					break
+		return sorted(published)
+
+	def stale_shots(self, since, departments=None):
+		'''
+		return the names of the shots that use something that has been published since the given
+		time (seconds since the epoch). A shot's own publishes don't make it stale.
+		'''
+		shots = set()
+		for key in self.published_since(since, departments):
+			kind, name = split_key(key)
+			shots.update(self.dependent_shots(name, kind))
+		return sorted(shots)
+
+
+class _Stat:
+	'''
+	minimal stand-in for os.DirEntry so _signature can stat files that weren't listed
+	'''
+
+	def __init__(self, dirpath, name):
+		self.path = os.path.join(dirpath, name)
+
+	def stat(self):
+		return os.stat(self.path)
+
+
+def _parse_since(value):
+	try:
+		return float(value)
+	except ValueError:
+		return parse_timestamp(value)
+
+def main(argv=None):
+	import argparse # only the command line needs it
+
+	parser = argparse.ArgumentParser(description='Find the layouts and shots that use a published body.')
+	parser.add_argument('--no-update', action='store_true', help='query the saved graph without rescanning first')
+	subparsers = parser.add_subparsers(dest='command')
+	# the queries take --no-update after the command too. SUPPRESS keeps them from
+	# resetting it when it was given before the command
+	query = argparse.ArgumentParser(add_help=False)
+	query.add_argument('--no-update', action='store_true', default=argparse.SUPPRESS, help='query the saved graph without rescanning first')
+
+	subparsers.add_parser('update', help='Rescan the bodies that changed since the last update.')
+
+	dependents = subparsers.add_parser('dependents', parents=[query], help='List everything that uses the given body.')
+	dependents.add_argument('name', help='name of the published body')
+	dependents.add_argument('--kind', '-k', default=resolver.ASSET, choices=REFERENCE_KINDS, help='kind of the published body (default asset)')
+	dependents.add_argument('--shots', '-s', action='store_true', help='only print the shots that need updating')
+
+	stale = subparsers.add_parser('stale', parents=[query], help='List the shots using anything published since the given time.')
+	stale.add_argument('since', help='seconds since the epoch, or a pipe timestamp e.g. "Mon, 05 Oct 2026 09:00:00 AM"')
+	stale.add_argument('--department', '-d', action='append', help='only consider publishes to this department. May be repeated.')
+
+	args = parser.parse_args(argv)
+	if args.command is None:
+		parser.print_help()
+		return
+
+	graph = DependencyGraph()
+	if args.command == 'update' or not args.no_update:
+		scanned = graph.update()
+		if args.command == 'update':
+			print("rescanned " + str(len(scanned)) + " bodies")
+			return
+
+	if args.command == 'dependents':
+		if args.shots:
+			results = graph.dependent_shots(args.name, args.kind)
+		else:
+			results = graph.dependents(args.name, args.kind)
+	else:
+		results = graph.stale_shots(_parse_since(args.since), args.department)
+
+	for result in results:
+		print(result)
+
+if __name__ == '__main__':
+	main()
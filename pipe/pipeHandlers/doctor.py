@@ -0,0 +1,407 @@
+import hashlib
+import os
+import re
+import sys
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+from pipe.pipeHandlers.environment import Environment
+from pipe.pipeHandlers import chunk_store
+from pipe.pipeHandlers import pipeline_io
+from pipe.pipeHandlers import resolver
+
+'''
+pipe doctor module
+
+Checks the production tree for broken pipeline state in one pass:
+	- publishes whose recorded file, or whose .vNNNN folder, is gone
+	- elements whose latest_version disagrees with their publishes
+	- version folders no publish accounts for
+	- versions kept in the chunk store whose chunks are missing from it
+	- dangling symlinks left in element caches by update_cache
+	- bodies missing from the name list of their folder
+	- .body and .element files that can't be read
+Bodies are checked in parallel with os.scandir. With --hash every published file is
+hashed too: the main file of an element has to match its latest version, and a report
+saved by an earlier run (--baseline) catches version files that changed since, which
+they never should.
+
+--fix makes the repairs that can't lose data: latest_version is set from the publishes
+when their version folders are all there, dangling cache links are removed and missing
+bodies are added to the name lists. Everything else is only reported.
+
+python -m pipe.pipeHandlers.doctor [--hash] [--baseline REPORT] [--json REPORT] [--fix]
+'''
+
+# checks
+BAD_FILE = 'bad_file' # a .body or .element that isn't valid json
+MISSING_PUBLISH = 'missing_publish' # the file a publish recorded is gone
+MISSING_VERSION = 'missing_version' # a publish without its .vNNNN folder, or an empty one
+LATEST_MISMATCH = 'latest_mismatch' # latest_version doesn't match the publishes
+ORPHAN_VERSION = 'orphan_version' # a .vNNNN folder with no publish
+DANGLING_LINK = 'dangling_link' # a cache symlink, or cache_filepath, pointing at nothing
+NOT_LISTED = 'not_listed' # a body missing from its folder's name list
+MAIN_MISMATCH = 'main_mismatch' # the main file differs from the latest version (--hash)
+CHANGED_PAYLOAD = 'changed_payload' # a version file changed since the baseline (--hash)
+MISSING_CHUNK = 'missing_chunk' # a chunked version whose chunks aren't all in the store
+
+CHECKS = [BAD_FILE, MISSING_PUBLISH, MISSING_VERSION, LATEST_MISMATCH, ORPHAN_VERSION, DANGLING_LINK, NOT_LISTED, MAIN_MISMATCH, CHANGED_PAYLOAD, MISSING_CHUNK]
+
+BODY_FILENAME = '.body'
+ELEMENT_FILENAME = '.element'
+LIST_FILES = {
+	resolver.ASSET: '.asset_list.txt',
+	resolver.SHOT: '.shot_list',
+	resolver.LAYOUT: '.layout_list',
+	resolver.SEQUENCE: '.sequence_list',
+}
+# element folders that hold no elements of their own
+IGNORED_DIRS = ['cache', 'render']
+
+_VERSION_DIR = re.compile(r'^\.v(\d{4,})$')
+
+HASH_CHUNK = 1024 * 1024
+DEFAULT_WORKERS = 16
+
+Issue = namedtuple('Issue', ['check', 'path', 'message', 'fixable'])
+Issue.__doc__ = '''
+check -- one of CHECKS
+path -- the file or folder the issue is about
+message -- what is wrong
+fixable -- whether --fix repairs it
+'''
+
+def hash_file(path):
+	'''
+	return the sha256 hex digest of a file
+	'''
+	digest = hashlib.sha256()
+	with open(path, 'rb') as f:
+		for chunk in iter(lambda: f.read(HASH_CHUNK), b''):
+			digest.update(chunk)
+	return digest.hexdigest()
+
+def version_files(version_dir):
+	'''
+	return the published files in a version folder
+	'''
+	try:
+		return sorted(entry.path for entry in os.scandir(version_dir) if not entry.name.startswith('.') and entry.is_file())
+	except OSError:
+		return []
+
+def version_file(version_dir, publish_path, element_name):
+	'''
+	return the file of a version folder that matches the publish it belongs to, or None.
+	The folder holds <asset_name><ext> while the publish records <asset_name>_<element><ext>.
+	'''
+	base, ext = os.path.splitext(os.path.basename(publish_path))
+	suffix = '_' + element_name
+	if base.endswith(suffix):
+		base = base[:-len(suffix)]
+	files = version_files(version_dir)
+	path = os.path.join(version_dir, base + ext)
+	if path in files:
+		return path
+	return files[0] if len(files) == 1 else None
+
+
+class Doctor:
+	'''
+	Runs every check over a project and, if asked, repairs what can be repaired safely.
+	'''
+
+	def __init__(self, env=None, workers=DEFAULT_WORKERS, hash_payloads=False, baseline=None, fix=False):
+		'''
+		env -- (optional) the Environment to check. Defaults to the current project.
+		workers -- number of threads reading the tree
+		hash_payloads -- hash every published file
+		baseline -- (optional) the payloads of an earlier report, {path: sha256}
+		fix -- make the safe repairs
+		'''
+		self._env = env if env is not None else Environment()
+		self.workers = workers
+		self.hash_payloads = hash_payloads
+		self.baseline = baseline or {}
+		self.fix = fix
+		self.roots = {}
+		path_resolver = resolver.Resolver(self._env)
+		for kind in resolver.KINDS:
+			try:
+				root = os.path.normpath(path_resolver.get_root(kind))
+			except KeyError:
+				continue # this project doesn't have that kind of body
+			if os.path.isdir(root):
+				self.roots[kind] = root
+		self._chunks = chunk_store.ChunkStore(self._env)
+		self._stored = set()
+
+	def run(self):
+		'''
+		check the project and return the report, a json-ready dictionary
+		'''
+		start = time.time()
+		bodies = []
+		for kind, root in sorted(self.roots.items()):
+			for entry in os.scandir(root):
+				if entry.is_dir() and not entry.name.startswith('.') and os.path.exists(os.path.join(entry.path, BODY_FILENAME)):
+					bodies.append((kind, entry.name, entry.path))
+
+		issues = []
+		hash_jobs = []
+		files = 0
+		self._stored = set(digest for digest, size, modified in self._chunks.list_chunks())
+		with ThreadPoolExecutor(max_workers=self.workers) as pool:
+			for body_issues, body_jobs, body_files in pool.map(self._check_body, bodies):
+				issues.extend(body_issues)
+				hash_jobs.extend(body_jobs)
+				files += body_files
+
+			payloads = {}
+			if self.hash_payloads:
+				paths = sorted(set(path for job in hash_jobs for path in job[1:] if path))
+				for path, digest in zip(paths, pool.map(self._hash, paths)):
+					payloads[path] = digest
+				issues.extend(self._compare(hash_jobs, payloads))
+
+		issues.extend(self._check_lists(bodies))
+
+		fixed = []
+		if self.fix:
+			fixed = self._fix([issue for issue in issues if issue.fixable])
+
+		counts = dict((check, 0) for check in CHECKS)
+		for issue in issues:
+			counts[issue.check] += 1
+
+		report = {}
+		report['project'] = self._env.get_project_dir()
+		report['time'] = pipeline_io.timestamp()
+		report['seconds'] = round(time.time() - start, 3)
+		report['bodies'] = len(bodies)
+		report['files'] = files
+		report['counts'] = counts
+		report['issues'] = [dict(issue._asdict(), fixed=issue in fixed) for issue in issues]
+		if self.hash_payloads:
+			report['payloads'] = payloads
+		return report
+
+	def _hash(self, path):
+		try:
+			return hash_file(path)
+		except (IOError, OSError):
+			return None
+
+	def _check_body(self, body):
+		'''
+		check one body and every element below it. Returns (issues, hash jobs, files seen).
+		'''
+		kind, name, body_dir = body
+		issues = []
+		jobs = []
+		files = 1
+		try:
+			pipeline_io.readfile(os.path.join(body_dir, BODY_FILENAME))
+		except ValueError as e:
+			issues.append(Issue(BAD_FILE, os.path.join(body_dir, BODY_FILENAME), str(e), False))
+
+		folders = [body_dir]
+		while folders:
+			folder = folders.pop()
+			try:
+				entries = list(os.scandir(folder))
+			except OSError:
+				continue
+			files += len(entries)
+			names = set(entry.name for entry in entries)
+			if folder != body_dir and ELEMENT_FILENAME in names:
+				element_issues, element_jobs, element_files = self._check_element(folder, entries)
+				issues.extend(element_issues)
+				jobs.extend(element_jobs)
+				files += element_files
+			for entry in entries:
+				if entry.is_dir(follow_symlinks=False) and not entry.name.startswith('.') and entry.name not in IGNORED_DIRS:
+					folders.append(entry.path)
+		return issues, jobs, files
+
+	def _check_element(self, element_dir, entries):
+		'''
+		check one element, given the entries of its folder. Returns (issues, hash jobs, files seen).
+		'''
+		issues = []
+		jobs = []
+		files = 0
+		pipeline_file = os.path.join(element_dir, ELEMENT_FILENAME)
+		try:
+			datadict = pipeline_io.readfile(pipeline_file)
+			latest_version = datadict.get('latest_version', -1)
+			publishes = datadict.get('publishes', [])
+			element_name = datadict.get('name', '')
+			retired = pipeline_io.read_retired(element_dir) # removed by the retention policy (see storage)
+		except (IOError, OSError, ValueError) as e:
+			return [Issue(BAD_FILE, pipeline_file, str(e), False)], [], 0
+
+		versions = {}
+		for entry in entries:
+			match = _VERSION_DIR.match(entry.name)
+			if match and entry.is_dir():
+				versions[int(match.group(1))] = entry.path
+
+		if latest_version != len(publishes) - 1:
+			fixable = all(version in versions for version in range(len(publishes)))
+			issues.append(Issue(LATEST_MISMATCH, pipeline_file,
+				'latest_version is %d but there are %d publishes' % (latest_version, len(publishes)), fixable))
+
+		missing_paths = set()
+		for version, publish in enumerate(publishes):
+			publish_path = publish[3]
+			if publish_path not in missing_paths and not os.path.exists(publish_path):
+				missing_paths.add(publish_path)
+				issues.append(Issue(MISSING_PUBLISH, publish_path, 'recorded by v%04d of %s is gone' % (version, element_dir), False))
+			version_dir = versions.get(version)
+			if version_dir is None and version in retired:
+				continue
+			if version_dir is None:
+				issues.append(Issue(MISSING_VERSION, os.path.join(element_dir, '.v%04d' % version), 'the folder of a recorded publish is gone', False))
+				continue
+			files += 1
+			chunked = chunk_store.read_manifest(version_dir)
+			if chunked:
+				# the rebuilt files are checked against their sha256 whenever they're read
+				missing = [digest for entry in chunked.values() for digest, size in entry['chunks'] if digest not in self._stored]
+				if missing:
+					issues.append(Issue(MISSING_CHUNK, version_dir, '%d chunks are missing from %s' % (len(missing), self._chunks.root), False))
+				continue
+			path = version_file(version_dir, publish_path, element_name)
+			if path is None:
+				issues.append(Issue(MISSING_VERSION, version_dir, 'no published file in the version folder', False))
+			elif self.hash_payloads:
+				for payload in version_files(version_dir):
+					jobs.append(('payload', payload))
+				if version == latest_version and os.path.exists(publish_path):
+					jobs.append((MAIN_MISMATCH, publish_path, path))
+
+		for version in sorted(versions):
+			if version >= len(publishes):
+				issues.append(Issue(ORPHAN_VERSION, versions[version], 'no publish records this version', False))
+
+		cache_dir = os.path.join(element_dir, 'cache')
+		try:
+			cache_entries = list(os.scandir(cache_dir))
+		except OSError:
+			cache_entries = []
+		files += len(cache_entries)
+		for entry in cache_entries:
+			if entry.is_symlink() and not os.path.exists(entry.path):
+				issues.append(Issue(DANGLING_LINK, entry.path, 'links to missing ' + os.readlink(entry.path), True))
+		cache_filepath = datadict.get('cache_filepath')
+		if cache_filepath and not os.path.lexists(cache_filepath):
+			issues.append(Issue(DANGLING_LINK, pipeline_file, 'cache_filepath ' + cache_filepath + ' is gone', False))
+		return issues, jobs, files
+
+	def _compare(self, jobs, payloads):
+		issues = []
+		for job in jobs:
+			if job[0] == MAIN_MISMATCH:
+				main_path, version_path = job[1:]
+				if payloads.get(main_path) != payloads.get(version_path):
+					issues.append(Issue(MAIN_MISMATCH, main_path, 'differs from the latest version ' + version_path, False))
+			else:
+				path = job[1]
+				expected = self.baseline.get(path)
+				if expected is not None and payloads.get(path) not in (None, expected):
+					issues.append(Issue(CHANGED_PAYLOAD, path, 'changed since the baseline report', False))
+		return issues
+
+	def _check_lists(self, bodies):
+		issues = []
+		for kind, filename in sorted(LIST_FILES.items()):
+			root = self.roots.get(kind)
+			if root is None:
+				continue
+			list_file = os.path.join(root, filename)
+			try:
+				with open(list_file) as f:
+					listed = set(line.rstrip('\n') for line in f)
+			except (IOError, OSError):
+				continue # the project doesn't keep this list
+			for body_kind, name, body_dir in bodies:
+				if body_kind == kind and name not in listed:
+					issues.append(Issue(NOT_LISTED, list_file, name, True))
+		return issues
+
+	def _fix(self, issues):
+		'''
+		repair the fixable issues and return the ones that were fixed
+		'''
+		fixed = []
+		additions = {}
+		for issue in issues:
+			try:
+				if issue.check == LATEST_MISMATCH:
+					datadict = pipeline_io.readfile(issue.path)
+					datadict['latest_version'] = len(datadict.get('publishes', [])) - 1
+					pipeline_io.writefile(issue.path, datadict)
+				elif issue.check == DANGLING_LINK:
+					if os.path.islink(issue.path) and not os.path.exists(issue.path):
+						os.remove(issue.path)
+				elif issue.check == NOT_LISTED:
+					additions.setdefault(issue.path, []).append(issue.message)
+					continue
+				else:
+					continue
+			except (IOError, OSError, ValueError) as e:
+				print('could not fix ' + issue.path + ': ' + str(e))
+				continue
+			fixed.append(issue)
+
+		for list_file, names in sorted(additions.items()):
+			try:
+				with open(list_file) as f:
+					text = f.read()
+				if text and not text.endswith('\n'):
+					text += '\n'
+				tmp_file = list_file + '_tmp'
+				with open(tmp_file, 'w') as f:
+					f.write(text + ''.join(name + '\n' for name in sorted(names)))
+				os.rename(tmp_file, list_file)
+			except (IOError, OSError) as e:
+				print('could not fix ' + list_file + ': ' + str(e))
+				continue
+			fixed.extend(issue for issue in issues if issue.check == NOT_LISTED and issue.path == list_file)
+		return fixed
+
+
+def main(argv=None):
+	import argparse # only the command line needs it
+	import json
+
+	parser = argparse.ArgumentParser(description='Check the project for broken publishes, versions, caches and lists.')
+	parser.add_argument('--hash', action='store_true', help='hash every published file')
+	parser.add_argument('--baseline', help='report of an earlier --hash run to compare the version files against')
+	parser.add_argument('--json', help="write the report to this file ('-' for stdout)")
+	parser.add_argument('--fix', action='store_true', help='make the repairs that are safe')
+	parser.add_argument('--workers', '-w', type=int, default=DEFAULT_WORKERS, help='number of threads (default %d)' % DEFAULT_WORKERS)
+	args = parser.parse_args(argv)
+
+	baseline = None
+	if args.baseline:
+		baseline = pipeline_io.readfile(args.baseline).get('payloads', {})
+	report = Doctor(workers=args.workers, hash_payloads=args.hash or baseline is not None, baseline=baseline, fix=args.fix).run()
+
+	if args.json == '-':
+		print(json.dumps(report, indent=4))
+	else:
+		if args.json:
+			with open(args.json, 'w') as f:
+				json.dump(report, f, indent=1)
+		for issue in report['issues']:
+			print('%-16s %s: %s%s' % (issue['check'], issue['path'], issue['message'], ' (fixed)' if issue['fixed'] else ''))
+		print('checked %d bodies and %d files in %.1fs' % (report['bodies'], report['files'], report['seconds']))
+
+	remaining = [issue for issue in report['issues'] if not issue['fixed']]
+	return 1 if remaining else 0
+
+if __name__ == '__main__':
+	sys.exit(main())
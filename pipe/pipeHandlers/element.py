@@ -104,6 +104,7 @@ class Element:
     CACHE_EXT = "cache_ext"
     CACHE_FILEPATH = "cache_filepath"
     ASSIGNED_USER = "assigned_user"
+    KEEP_VERSIONS = "keep_versions"
 
     def __init__(self, filepath=None):
         """
@@ -172,8 +173,10 @@ class Element:
         return self._filepath
 
     def get_department(self):
-
-        return self._datadict[self.DEPARTMENT]
+        """
+        return the department of this element, which is the name of the folder it is stored in
+        """
+        return os.path.basename(os.path.normpath(self._filepath))
 
     def get_long_name(self):
         """
@@ -268,10 +271,49 @@ class Element:
 
     def get_version_dir(self, version):
         """
-        return the path to the directory of the given version
+        return the path to the directory of the given version. The files of a version the
+        compactor or the chunk store has packed are only in it after restore_version.
         """
         return os.path.join(self._filepath, ".v%04d" % version)
 
+    def restore_version(self, version):
+        """
+        return the directory of the given version with its published files in it, for a
+        tool about to open or reference them. Files the compactor or the chunk store has
+        packed are rebuilt in place, and the version is tagged to be kept (see keep_version),
+        so neither packs it again under a scene that uses it.
+        """
+        from pipe.pipeHandlers import chunk_store
+        from pipe.pipeHandlers import compactor
+        version_dir = self.get_version_dir(version)
+        if chunk_store.restore_version(version_dir) + compactor.restore_version(version_dir):
+            self.keep_version(version)
+        return version_dir
+
+    def list_kept_versions(self):
+        """
+        return the versions tagged to be kept by the retention policy (see storage)
+        """
+        return sorted(self._datadict.get(self.KEEP_VERSIONS, []))
+
+    def keep_version(self, version, keep=True):
+        """
+        tag a version so the retention policy never retires it, or remove the tag
+        """
+        kept = set(self._datadict.get(self.KEEP_VERSIONS, []))
+        if keep:
+            kept.add(version)
+        else:
+            kept.discard(version)
+        self._datadict[self.KEEP_VERSIONS] = sorted(kept)
+        self._update_pipeline_file()
+
+    def list_retired_versions(self):
+        """
+        return the versions whose folders the retention policy has removed
+        """
+        return sorted(pipeline_io.read_retired(self._filepath))
+
     def get_cache_ext(self):
         """
         return the extension of the cache files for this element (including the period)
@@ -363,26 +405,65 @@ class Element:
         """
         return os.path.join(self._env.get_users_dir(), username, self.get_long_name())
 
-    def checkout(self, username):
+    def get_version_filepath(self, version):
+        """
+        return the path to the file saved in the folder of the given version, or None if
+        it can't be found. The version folder holds {asset name}{ext}, while the publish
+        records {asset name}_{element name}{ext}. The files are restored first (see
+        restore_version).
+        """
+        version_dir = self.restore_version(version)
+        base, ext = os.path.splitext(os.path.basename(self._datadict[self.PUBLISHES][version][3]))
+        suffix = "_" + self.get_name()
+        if base.endswith(suffix):
+            base = base[:-len(suffix)]
+        version_path = os.path.join(version_dir, base + ext)
+        if os.path.exists(version_path):
+            return version_path
+        try:
+            files = [name for name in os.listdir(version_dir) if not name.startswith(".")]
+        except OSError:
+            return None
+        if len(files) == 1:
+            return os.path.join(version_dir, files[0])
+        return None
+
+    def checkout(self, username, lazy=True):
         """
         Copies the element to the given user's work area in a directory with the following name:
             {the parent body's name}_{this element's department}_{this element's name}
         Adds username to the list of checkout users.
+        The app file is checked out if there is one, otherwise the latest published version.
         username -- the username (string) of the user performing this action
-        Returns the absolute filepath to the copied file. If this element has no app file,
-        the returned filepath will not exist.
+        lazy -- if true (the default) reflink the file where the filesystem supports it, so
+                its data isn't copied until it's changed. If false, always copy. Either way
+                the checkout is the user's own writable file.
+        Returns the absolute filepath to the copied file. If this element has no app file
+        or publish, the returned filepath will not exist.
         """
         checkout_dir = self.get_checkout_dir(username)
-        if not os.path.exists(checkout_dir):
+        pipeline_file = os.path.join(checkout_dir, Checkout.PIPELINE_FILENAME)
+        if os.path.exists(pipeline_file):
+            datadict = pipeline_io.readfile(pipeline_file)
+        else:
             pipeline_io.mkdir(checkout_dir)
             datadict = Checkout.create_new_dict(username, self.get_parent(), self.get_department(), self.get_name())
-            pipeline_io.writefile(os.path.join(checkout_dir, Checkout.PIPELINE_FILENAME), datadict)
-        checkout = Checkout(checkout_dir)
-        app_file = self.get_app_filepath()
+
+        source = self.get_app_filepath()
+        if not os.path.exists(source) and self.get_last_version() >= 0:
+            source = self.get_version_filepath(self.get_last_version())
+
         checkout_file = pipeline_io.version_file(os.path.join(checkout_dir, self.get_app_filename()))
-        if os.path.exists(app_file):
-            shutil.copyfile(app_file, checkout_file)
-            checkout.add_operation(checkout_file)
+        if source is not None and os.path.exists(source):
+            if lazy:
+                pipeline_io.clone_file(source, checkout_file)
+            else:
+                shutil.copyfile(source, checkout_file)
+            datadict[Checkout.FILES].append(checkout_file)
+            datadict[Checkout.TIMES].append(pipeline_io.timestamp())
+
+        # the checkout record is written once, the element only for a new checkout user
+        pipeline_io.writefile(pipeline_file, datadict)
         self.update_checkout_users(username)
         return checkout_file
 
@@ -437,6 +518,11 @@ class Element:
         self._datadict[self.PUBLISHES].append((username, timestamp, comment, main_path))
         self._update_pipeline_file()
 
+        #move the version that falls out of the newest few into the chunk store, if it's enabled
+        from pipe.pipeHandlers import chunk_store
+        if chunk_store.enabled() and chunk_store.chunkable(main_path):
+            chunk_store.ingest_previous(self._filepath, new_version, self._env)
+
 
     def update_cache(self, src, reference=False):
         """
@@ -18,14 +18,15 @@ class Environment:
     TOOLS_DIR = 'tools_dir'
     USERS_DIR = 'users_dir'
 
-    def __init__(self):
+    def __init__(self, project_dir=None):
         '''
         Creates an Environment instance from data in the .project file in the directory defined by the
         environment variable $MEDIA_PROJECT_DIR. If this variable is not defined or the .project file does
         not exist inside it, an EnvironmentError is raised. Creates the workspace for the current user
         if it doesn't already exist.
+        project_dir -- (optional) the project directory to use instead of $MEDIA_PROJECT_DIR
         '''
-        self._project_dir = os.getenv(Environment.PROJECT_ENV)
+        self._project_dir = project_dir if project_dir is not None else os.getenv(Environment.PROJECT_ENV)
 
         if self._project_dir is None:
             raise EnvironmentError(Environment.PROJECT_ENV + ' is not defined')
@@ -0,0 +1,125 @@
+import os
+import pkgutil
+import subprocess
+import sys
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+'''
+import audit module
+
+Measures what importing each pipe module costs. Every module is imported in a fresh
+interpreter with python -X importtime, and the report lists its cumulative import time
+and any heavy dependency it drags in: Qt, smtplib or a DCC module. Modules used by
+command line tools and the farm should stay clear of those.
+
+python -m pipe.pipeHandlers.import_audit [--all] [--json]
+'''
+
+# top level packages that headless code must not import
+HEAVY = ('PySide', 'PySide2', 'shiboken2', 'smtplib', 'hou', 'maya', 'pymel', 'nuke', 'nukescripts', 'pxr', 'shotgun_api3')
+
+# pipeHandlers modules that are dialogs, or talk to shotgun, and may import them
+INTERACTIVE = ('pipe.pipeHandlers.quick_dialogs', 'pipe.pipeHandlers.select_from_list', 'pipe.pipeHandlers.shotgun_dummy')
+
+ImportCost = namedtuple('ImportCost', ['module', 'microseconds', 'heavy', 'error'])
+ImportCost.__doc__ = '''
+module -- the module name
+microseconds -- cumulative import time of the module, None if it failed to import
+heavy -- sorted tuple of the HEAVY packages the import pulled in
+error -- last line of the error if the import failed, else None
+'''
+
+def _root():
+	'''
+	the folder holding the pipe package
+	'''
+	return os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+def list_modules(package='pipe.pipeHandlers'):
+	'''
+	return the names of every module in the package, subpackages included
+	'''
+	path = os.path.join(_root(), *package.split('.'))
+	return sorted(name for finder, name, ispkg in pkgutil.walk_packages([path], package + '.') if not ispkg)
+
+def parse_importtime(output, module):
+	'''
+	return (microseconds, imported) from the -X importtime output of importing module,
+	where imported is the set of every module name that was imported
+	'''
+	microseconds = None
+	imported = set()
+	for line in output.splitlines():
+		if not line.startswith('import time:'):
+			continue
+		fields = line[len('import time:'):].split('|')
+		if len(fields) != 3 or not fields[0].strip().isdigit():
+			continue # the header
+		name = fields[2].strip()
+		imported.add(name)
+		if name == module:
+			microseconds = int(fields[1])
+	return microseconds, imported
+
+def measure(module):
+	'''
+	import the module in a new interpreter and return its ImportCost
+	'''
+	env = dict(os.environ)
+	env['PYTHONPATH'] = os.pathsep.join([_root()] + [p for p in [env.get('PYTHONPATH')] if p])
+	process = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import ' + module],
+		cwd=_root(), env=env, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, universal_newlines=True)
+	microseconds, imported = parse_importtime(process.stderr, module)
+	heavy = tuple(sorted(set(name.split('.')[0] for name in imported) & set(HEAVY)))
+	error = None
+	if process.returncode != 0:
+		lines = process.stderr.strip().splitlines()
+		error = lines[-1] if lines else 'exit status ' + str(process.returncode)
+		microseconds = None
+	return ImportCost(module, microseconds, heavy, error)
+
+def audit(modules, workers=1):
+	'''
+	return the ImportCost of every module, slowest first. Modules that failed to import
+	(usually because they need a DCC) come last.
+	'''
+	with ThreadPoolExecutor(max_workers=workers) as pool:
+		costs = list(pool.map(measure, modules))
+	return sorted(costs, key=lambda cost: (cost.microseconds is None, -(cost.microseconds or 0), cost.module))
+
+def violations(costs):
+	'''
+	return the costs of the headless modules that import something in HEAVY
+	'''
+	return [cost for cost in costs if cost.heavy and cost.error is None and cost.module.startswith('pipe.pipeHandlers.') and cost.module not in INTERACTIVE]
+
+def main(argv=None):
+	import argparse # only the command line needs it
+	import json
+
+	parser = argparse.ArgumentParser(description='Measure the import time of the pipe modules.')
+	parser.add_argument('--all', '-a', action='store_true', help='audit every pipe module, not just pipe.pipeHandlers')
+	parser.add_argument('--json', action='store_true', help='print the results as json')
+	parser.add_argument('--workers', '-w', type=int, default=1, help='number of modules to import at once. More is faster but inflates the times (default 1)')
+	args = parser.parse_args(argv)
+
+	costs = audit(list_modules('pipe' if args.all else 'pipe.pipeHandlers'), args.workers)
+	bad = violations(costs)
+
+	if args.json:
+		print(json.dumps([cost._asdict() for cost in costs], indent=4))
+	else:
+		for cost in costs:
+			if cost.error is not None:
+				print('%10s  %s  (%s)' % ('failed', cost.module, cost.error))
+			else:
+				heavy = '  imports ' + ', '.join(cost.heavy) if cost.heavy else ''
+				print('%8.1fms  %s%s' % (cost.microseconds / 1000.0, cost.module, heavy))
+		for cost in bad:
+			print('headless module ' + cost.module + ' imports ' + ', '.join(cost.heavy))
+
+	return 1 if bad else 0
+
+if __name__ == '__main__':
+	sys.exit(main())
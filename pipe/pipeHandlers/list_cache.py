@@ -0,0 +1,78 @@
+import os
+import re
+import types
+from collections import namedtuple
+
+'''
+list cache module
+
+Loads the project's name list files (.asset_list.txt, .short_asset_list, .shot_list,
+.layout_list, .sequence_list) once and keeps them in memory until the file changes.
+Each list is stored as an immutable NameList so it can be shared by every caller.
+'''
+
+NameList = namedtuple('NameList', ['names', 'sorted', 'members', 'sanitized'])
+NameList.__doc__ = '''
+names -- tuple of the names in file order
+sorted -- tuple of the names sorted case-insensitively
+members -- frozenset of the names, for membership tests
+sanitized -- read-only dict from the sanitized name (see sanitize) to the name
+'''
+
+_cache = {}
+
+def sanitize(name):
+	'''
+	return the name with every non-word character removed. This is the form asset names
+	take as houdini node types, e.g. material hdas.
+	'''
+	return re.sub(r'\W+', '', name)
+
+def _signature(filepath):
+	st = os.stat(filepath)
+	return (st.st_mtime_ns, st.st_size, st.st_ino)
+
+def read_names(filepath):
+	'''
+	return the names in a list file, in file order, without going through the cache
+	'''
+	names = []
+	with open(filepath, 'r') as f:
+		for name in f:
+			if name[-1:] == '\n': # remove newline character
+				name = name[:-1]
+			names.append(name)
+	return names
+
+def name_list(names):
+	'''
+	return the NameList of the given names
+	'''
+	names = list(names)
+	sanitized = {}
+	for name in names:
+		sanitized.setdefault(sanitize(name), name)
+
+	return NameList(tuple(names), tuple(sorted(names, key=str.lower)), frozenset(names), types.MappingProxyType(sanitized))
+
+def load(filepath):
+	'''
+	return the NameList for the given list file, reading it only if it changed since the last load
+	'''
+	signature = _signature(filepath)
+	entry = _cache.get(filepath)
+	if entry is not None and entry[0] == signature:
+		return entry[1]
+
+	names = name_list(read_names(filepath))
+	_cache[filepath] = (signature, names)
+	return names
+
+def invalidate(filepath=None):
+	'''
+	drop the cached list for the given file, or every cached list if no filepath is given
+	'''
+	if filepath is None:
+		_cache.clear()
+	else:
+		_cache.pop(filepath, None)
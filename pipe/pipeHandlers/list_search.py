@@ -0,0 +1,108 @@
+'''
+list search module
+
+Filters long lists of names as the user types. The lowercase form of every item is
+built once, and when a query extends the previous one only the previous matches are
+searched again. Has no Qt dependency so it can be used from any tool.
+'''
+
+def is_subsequence(needle, haystack):
+	'''
+	return True if the characters of needle appear in haystack in order
+	'''
+	position = 0
+	for char in needle:
+		position = haystack.find(char, position) + 1
+		if position == 0:
+			return False
+	return True
+
+def _fuzzy_score(needle, haystack):
+	'''
+	return a sort key for a subsequence match: substring matches first, then matches
+	that start earlier and have fewer gaps, then shorter items. None if there's no match.
+	'''
+	start = haystack.find(needle)
+	if start >= 0:
+		return (0, start, 0, len(haystack))
+
+	first = -1
+	gaps = 0
+	position = 0
+	for char in needle:
+		found = haystack.find(char, position)
+		if found < 0:
+			return None
+		if first < 0:
+			first = found
+		else:
+			gaps += found - position
+		position = found + 1
+	return (1, first, gaps, len(haystack))
+
+
+class SearchIndex:
+	'''
+	Search index over a list of strings. Results are lists of indices into items.
+	'''
+
+	def __init__(self, items=[]):
+		self.items = list(items)
+		self._lower = [item.lower() for item in self.items]
+		self._all = list(range(len(self.items)))
+		self._last = None # (needle, case_sensitive, fuzzy, result)
+
+	def __len__(self):
+		return len(self.items)
+
+	def search(self, query, case_sensitive=False, fuzzy=False):
+		'''
+		return the indices of the items matching the query, in list order. With fuzzy set,
+		items match if they contain the query's characters in order, and the results are
+		ranked best match first.
+		'''
+		if not query:
+			self._last = None
+			return self._all[:]
+
+		needle = query if case_sensitive else query.lower()
+		haystacks = self.items if case_sensitive else self._lower
+		candidates = self._candidates(needle, case_sensitive, fuzzy)
+
+		if fuzzy:
+			scored = []
+			for i in candidates:
+				score = _fuzzy_score(needle, haystacks[i])
+				if score is not None:
+					scored.append((score, i))
+			scored.sort()
+			result = [i for score, i in scored]
+		else:
+			result = [i for i in candidates if needle in haystacks[i]]
+
+		self._last = (needle, case_sensitive, fuzzy, result)
+		return result[:]
+
+	def _candidates(self, needle, case_sensitive, fuzzy):
+		'''
+		anything matching the new query also matched the previous one if the previous
+		query is contained in (or, for fuzzy, a subsequence of) the new one
+		'''
+		if self._last is None:
+			return self._all
+		last_needle, last_case_sensitive, last_fuzzy, last_result = self._last
+		if last_case_sensitive != case_sensitive or last_fuzzy != fuzzy:
+			return self._all
+		if fuzzy:
+			narrows = is_subsequence(last_needle, needle)
+		else:
+			narrows = last_needle in needle
+		if not narrows:
+			return self._all
+		return last_result
+
+	def filter(self, query, case_sensitive=False, fuzzy=False):
+		'''
+		return the matching items themselves rather than their indices
+		'''
+		return [self.items[i] for i in self.search(query, case_sensitive, fuzzy)]
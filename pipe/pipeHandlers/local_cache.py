@@ -0,0 +1,285 @@
+import errno
+import fcntl
+import hashlib
+import os
+import shutil
+import tempfile
+import time
+from contextlib import contextmanager
+
+from pipe.pipeHandlers.element import Element
+from pipe.pipeHandlers import pipeline_io
+
+'''
+local cache module
+
+Keeps copies of published files on a workstation's local disk so alembic caches, hdas
+and scene files are pulled over NFS once per machine instead of once per open. The
+cache is opt-in: set PIPE_LOCAL_CACHE to a local directory (and optionally
+PIPE_LOCAL_CACHE_SIZE to its size in GB). Without it localize() returns the path it is
+given.
+
+An entry is keyed on the published path together with its size and modification time,
+so a republish over the same path gets a new entry. Entries are copied into a temporary
+directory and renamed into place, and a per entry lock file stops two processes on the
+machine from copying the same file at once. When the cache grows past its size the
+least recently used entries are removed.
+
+Only hand a cached path to something that reads the file and forgets it, like an import.
+Anything saved in a scene (references, file parms, installed hdas) must keep the
+published path, or the scene only opens on machines with the same cache; source_path()
+maps a cached path back to the published one.
+'''
+
+CACHE_ENV = 'PIPE_LOCAL_CACHE'
+SIZE_ENV = 'PIPE_LOCAL_CACHE_SIZE'
+DEFAULT_SIZE_GB = 50
+
+# usd layers are left out, they resolve relative references from their own folder
+CACHEABLE_EXTENSIONS = ('.abc', '.hda', '.hdanc', '.hdalc', '.otl', '.mb', '.ma', '.obj', '.fbx', '.vdb', '.bgeo', '.sc')
+
+SOURCE_FILENAME = '.source'
+
+# temporary directories older than this are left over from a crashed copy
+STALE_SECONDS = 3600
+
+class LocalCache:
+	'''
+	A size bounded cache of published files in a local directory.
+	'''
+
+	def __init__(self, root, max_bytes):
+		self.root = root
+		self.max_bytes = max_bytes
+		self._objects = os.path.join(root, 'objects')
+		self._tmp = os.path.join(root, 'tmp')
+		self._locks = os.path.join(root, 'locks')
+		for folder in (self._objects, self._tmp, self._locks):
+			try:
+				os.makedirs(folder)
+			except OSError as e:
+				if e.errno != errno.EEXIST:
+					raise
+
+	def cacheable(self, path):
+		return path.lower().endswith(CACHEABLE_EXTENSIONS)
+
+	def key(self, path, st):
+		'''
+		the entry name of a published file: a hash of its path, size and mtime
+		'''
+		digest = hashlib.sha1()
+		digest.update(('%s\n%d\n%d' % (os.path.abspath(path), st.st_size, st.st_mtime_ns)).encode('utf-8'))
+		return digest.hexdigest()
+
+	def _entry(self, key):
+		return os.path.join(self._objects, key)
+
+	def get(self, path):
+		'''
+		return the local copy of a published file if the cache has it, else None
+		'''
+		try:
+			st = os.stat(path)
+		except OSError:
+			return None
+		entry = self._entry(self.key(path, st))
+		local = os.path.join(entry, os.path.basename(path))
+		if not os.path.exists(local):
+			return None
+		self._touch(entry)
+		return local
+
+	def localize(self, path):
+		'''
+		return the local copy of a published file, copying it into the cache first if needed.
+		Falls back to the published path for files the cache doesn't keep or can't copy.
+		'''
+		if not path or not self.cacheable(path):
+			return path
+		try:
+			st = os.stat(path)
+		except OSError:
+			return path
+		if st.st_size > self.max_bytes:
+			return path
+
+		key = self.key(path, st)
+		entry = self._entry(key)
+		local = os.path.join(entry, os.path.basename(path))
+		if os.path.exists(local):
+			self._touch(entry)
+			return local
+
+		try:
+			with self._lock(key):
+				if not os.path.exists(local): # another process may have copied it while we waited
+					self._populate(path, st, entry)
+		except (IOError, OSError) as e:
+			print('local cache: could not copy ' + path + ': ' + str(e))
+			return path
+
+		self._touch(entry)
+		self.evict()
+		return local
+
+	@contextmanager
+	def _lock(self, key):
+		with open(os.path.join(self._locks, key), 'a') as lock_file:
+			fcntl.flock(lock_file, fcntl.LOCK_EX)
+			try:
+				yield
+			finally:
+				fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+	def _populate(self, path, st, entry):
+		'''
+		copy the file into a temporary directory and rename it to the entry, so other
+		processes see either no entry or a complete one
+		'''
+		staging = tempfile.mkdtemp(dir=self._tmp)
+		try:
+			local = os.path.join(staging, os.path.basename(path))
+			shutil.copyfile(path, local)
+			after = os.stat(path)
+			if (after.st_size, after.st_mtime_ns) != (st.st_size, st.st_mtime_ns) or os.path.getsize(local) != st.st_size:
+				raise IOError('the file changed while it was copied')
+			with open(os.path.join(staging, SOURCE_FILENAME), 'w') as source_file:
+				source_file.write(os.path.abspath(path))
+			try:
+				os.rename(staging, entry)
+			except OSError:
+				if not os.path.isdir(entry):
+					raise
+		finally:
+			if os.path.isdir(staging):
+				shutil.rmtree(staging, ignore_errors=True)
+
+	def _touch(self, entry):
+		try:
+			os.utime(entry, None)
+		except OSError:
+			pass # evicted in the meantime
+
+	def entries(self):
+		'''
+		return a list of (last used time, size in bytes, entry directory), least recently used first
+		'''
+		result = []
+		for key in os.listdir(self._objects):
+			entry = self._entry(key)
+			try:
+				used = os.stat(entry).st_mtime
+				size = sum(os.path.getsize(os.path.join(entry, name)) for name in os.listdir(entry))
+			except OSError:
+				continue
+			result.append((used, size, entry))
+		result.sort()
+		return result
+
+	def usage(self):
+		'''
+		return the number of bytes the cache holds
+		'''
+		return sum(size for used, size, entry in self.entries())
+
+	def evict(self, max_bytes=None):
+		'''
+		remove the least recently used entries until the cache fits in max_bytes (the size
+		of the cache by default). Only one process evicts at a time, the others skip it.
+		'''
+		max_bytes = self.max_bytes if max_bytes is None else max_bytes
+		with open(os.path.join(self.root, '.evict'), 'a') as lock_file:
+			try:
+				fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+			except (IOError, OSError):
+				return
+			try:
+				self._remove_stale()
+				entries = self.entries()
+				total = sum(size for used, size, entry in entries)
+				for used, size, entry in entries:
+					if total <= max_bytes:
+						break
+					self._remove(entry)
+					total -= size
+			finally:
+				fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+	def _remove(self, entry):
+		# rename first so no process finds a half deleted entry
+		doomed = tempfile.mkdtemp(dir=self._tmp)
+		try:
+			os.rename(entry, os.path.join(doomed, 'entry'))
+		except OSError:
+			pass
+		shutil.rmtree(doomed, ignore_errors=True)
+		try:
+			os.remove(os.path.join(self._locks, os.path.basename(entry)))
+		except OSError:
+			pass
+
+	def _remove_stale(self):
+		now = time.time()
+		for name in os.listdir(self._tmp):
+			staging = os.path.join(self._tmp, name)
+			try:
+				if now - os.stat(staging).st_mtime > STALE_SECONDS:
+					shutil.rmtree(staging, ignore_errors=True)
+			except OSError:
+				pass
+
+	def clear(self):
+		self.evict(0)
+
+_cache = None
+
+def get_cache():
+	'''
+	return the LocalCache set up by the environment, or None if PIPE_LOCAL_CACHE isn't set
+	'''
+	global _cache
+	root = os.getenv(CACHE_ENV)
+	if not root:
+		return None
+	if _cache is None or _cache.root != root:
+		size = float(os.getenv(SIZE_ENV) or DEFAULT_SIZE_GB)
+		_cache = LocalCache(root, int(size * 1024 ** 3))
+	return _cache
+
+def localize(path):
+	'''
+	return the local copy of a published file, or the path itself when there is no local cache
+	'''
+	cache = get_cache()
+	if cache is None:
+		return path
+	return cache.localize(path)
+
+def source_path(path):
+	'''
+	return the published path a local copy was made from. Other paths are returned as is.
+	'''
+	source = os.path.join(os.path.dirname(path), SOURCE_FILENAME)
+	if not os.path.exists(source):
+		return path
+	with open(source) as source_file:
+		return source_file.read()
+
+def latest_publishes(folder):
+	'''
+	return the latest published file of every element under folder
+	'''
+	paths = []
+	for dirpath, dirnames, filenames in os.walk(folder):
+		dirnames[:] = [name for name in dirnames if not name.startswith('.v')]
+		if Element.PIPELINE_FILENAME not in filenames:
+			continue
+		try:
+			datadict = pipeline_io.readfile_cached(os.path.join(dirpath, Element.PIPELINE_FILENAME))
+		except (IOError, OSError, ValueError):
+			continue
+		latest_version = datadict[Element.LATEST_VERSION]
+		if latest_version >= 0:
+			paths.append(datadict[Element.PUBLISHES][latest_version][3])
+	return paths
@@ -0,0 +1,575 @@
+import errno
+import hashlib
+import json
+import os
+import socket
+import stat
+import struct
+import tempfile
+import threading
+import time
+
+from pipe.pipeHandlers import list_cache
+from pipe.pipeHandlers import pipeline_io
+
+'''
+metadata daemon module
+
+One process per workstation keeps the project's pipeline files (.body, .element and the
+name lists) in memory and answers the questions every Houdini, Maya and Nuke session
+would otherwise answer by reading them over NFS: the name lists, which bodies exist, a
+body or element's data, what a pipe uri resolves to and an element's latest publish.
+A PublishWatcher keeps the index current.
+
+Sessions talk to it over a Unix socket, one json object per line. A request carries a
+batch of queries and the reply carries a result for each, together with the snapshot
+number of the index. The snapshot goes up whenever the index changes, so a client may
+keep answers for as long as the snapshot stays the same.
+
+	{"s": 12, "q": [["list", "assets"], ["resolve", "pipe://asset/chair/model"]]}
+	{"s": 12, "r": [[0, ["chair", "table"]], [0, "/groups/.../chair_model.abc"]]}
+
+A result is [0, value], or [1, message] if the query failed.
+
+The socket lives in a directory only the user can enter ($XDG_RUNTIME_DIR, or
+/tmp/pipe-<uid>) and is only open to the user, so every user runs their own daemon.
+Both ends check that the other side belongs to the same user before trusting it.
+
+Project and Resolver use the daemon through client() when one is running for the
+project, and read the files themselves when it isn't. With the watcher polling (needed
+when publishes are written from other machines) answers may be a poll interval old.
+
+python -m pipe.pipeHandlers.metadata_daemon [--poll SECONDS] [--socket PATH] [--broadcast]
+'''
+
+SOCKET_ENV = 'PIPE_METADATA_SOCKET'
+
+# name lists by query name, relative to the folder they list
+LISTS = {
+	'assets': ('asset', '.asset_list.txt'),
+	'short_assets': ('asset', '.short_asset_list'),
+	'shots': ('shot', '.shot_list'),
+	'layouts': ('layout', '.layout_list'),
+	'sequences': ('sequence', '.sequence_list'),
+}
+LIST_FILENAMES = frozenset(filename for kind, filename in LISTS.values())
+
+BODY_FILENAME = '.body'
+ELEMENT_FILENAME = '.element'
+
+# a client that couldn't reach the daemon tries again after this many seconds
+RETRY_SECONDS = 30
+CLIENT_TIMEOUT = 5.0
+WARM_WORKERS = 8
+
+def _private_dir(path):
+	try:
+		st = os.lstat(path)
+	except OSError:
+		return False
+	return stat.S_ISDIR(st.st_mode) and st.st_uid == os.getuid() and not st.st_mode & 0o077
+
+def runtime_dir():
+	'''
+	return a directory that only the current user can write to, for the daemon's socket.
+	Raises EnvironmentError if /tmp/pipe-<uid> exists but belongs to someone else.
+	'''
+	path = os.getenv('XDG_RUNTIME_DIR')
+	if path and _private_dir(path):
+		return path
+	path = os.path.join(tempfile.gettempdir(), 'pipe-' + str(os.getuid()))
+	try:
+		os.mkdir(path, 0o700)
+	except OSError as e:
+		if e.errno != errno.EEXIST:
+			raise
+	if not _private_dir(path):
+		raise EnvironmentError(path + ' is not a private directory of this user; remove it or set ' + SOCKET_ENV)
+	return path
+
+def default_socket_path():
+	path = os.getenv(SOCKET_ENV)
+	if path:
+		return path
+	project = os.path.abspath(os.getenv('MEDIA_PROJECT_DIR', '/'))
+	return os.path.join(runtime_dir(), 'pipe_metadata_' + hashlib.sha1(project.encode('utf-8')).hexdigest()[:8] + '.sock')
+
+def peer_uid(connection):
+	'''
+	return the uid of the process at the other end of a connected Unix socket, or None
+	where the platform can't tell
+	'''
+	try:
+		creds = connection.getsockopt(socket.SOL_SOCKET, socket.SO_PEERCRED, struct.calcsize('3i'))
+	except (AttributeError, socket.error, OSError):
+		return None
+	return struct.unpack('3i', creds)[1]
+
+
+class DaemonUnavailable(Exception):
+	'''
+	Raised by the client when the daemon can't be reached. Callers fall back to the filesystem.
+	'''
+
+
+class MetadataIndex:
+	'''
+	The daemon's in-memory copy of the pipeline files, filled as it is asked and dropped
+	entry by entry as the watcher reports changes.
+	'''
+
+	def __init__(self, env):
+		from pipe.pipeHandlers.resolver import Resolver, KINDS
+
+		index = self
+
+		class IndexResolver(Resolver):
+			def _read_element(self, element_dir):
+				datadict = index.read(os.path.join(element_dir, ELEMENT_FILENAME))
+				if datadict is None:
+					raise EnvironmentError('no such element: ' + os.path.join(element_dir, ELEMENT_FILENAME) + ' does not exist')
+				return datadict
+
+		self.resolver = IndexResolver(env)
+		self.roots = dict((kind, os.path.normpath(self.resolver.get_root(kind))) for kind in KINDS)
+		self.snapshot = 0
+		self._files = {} # pipeline file -> datadict, or None if it doesn't exist
+		self._lists = {} # list file -> names
+		self._bodies = {} # root -> [(name, type)]
+		self._lock = threading.Lock()
+
+	def _load(self, cache, key, load):
+		'''
+		return cache[key], loading it first if needed. A value loaded while the index
+		changed is returned but not kept, since it may have been read before the change.
+		'''
+		with self._lock:
+			if key in cache:
+				return cache[key]
+			snapshot = self.snapshot
+		value = load(key)
+		with self._lock:
+			if self.snapshot == snapshot:
+				cache[key] = value
+		return value
+
+	def read(self, path):
+		'''
+		return the data of a pipeline file, or None if it doesn't exist
+		'''
+		return self._load(self._files, os.path.normpath(path), _read_file)
+
+	def names(self, list_name):
+		kind, filename = LISTS[list_name]
+		return self._load(self._lists, os.path.join(self.roots[kind], filename), list_cache.read_names)
+
+	def bodies(self, kind):
+		'''
+		return [name, type] for every body of the given kind, sorted by name
+		'''
+		return self._load(self._bodies, self._root(kind), self._list_bodies)
+
+	def _list_bodies(self, root):
+		bodies = []
+		for name in sorted(os.listdir(root)):
+			datadict = self.read(os.path.join(root, name, BODY_FILENAME))
+			if datadict is not None:
+				bodies.append([name, datadict.get('type')])
+		return bodies
+
+	def apply(self, event):
+		'''
+		drop what a PublishEvent made stale. Subscribe this to the watcher.
+		'''
+		with self._lock:
+			self.snapshot += 1
+			if event.path is None:
+				self._files.clear()
+				self._lists.clear()
+				self._bodies.clear()
+				return
+			path = os.path.normpath(event.path)
+			if os.path.basename(path) in LIST_FILENAMES:
+				self._lists.pop(path, None)
+				return
+			self._files.pop(path, None)
+			if os.path.basename(path) == BODY_FILENAME:
+				self._bodies.pop(os.path.dirname(os.path.dirname(path)), None)
+
+	def warm(self, workers=WARM_WORKERS):
+		'''
+		read every body and element file of the project, so the first queries are quick
+		'''
+		from concurrent.futures import ThreadPoolExecutor
+		paths = []
+		for root in sorted(set(self.roots.values())):
+			for dirpath, dirnames, filenames in os.walk(root):
+				dirnames[:] = [name for name in dirnames if not name.startswith('.')]
+				paths.extend(os.path.join(dirpath, name) for name in filenames if name in (BODY_FILENAME, ELEMENT_FILENAME))
+		with ThreadPoolExecutor(max_workers=workers) as pool:
+			list(pool.map(self.read, paths))
+		return len(paths)
+
+	def _root(self, kind):
+		if kind not in self.roots:
+			raise ValueError('unknown kind: ' + str(kind))
+		return self.roots[kind]
+
+	def query(self, op):
+		'''
+		answer one query. Raises for a bad query.
+		'''
+		name, args = op[0], op[1:]
+		if name == 'snapshot':
+			return self.snapshot
+		if name == 'list':
+			if args[0] not in LISTS:
+				raise ValueError('unknown list: ' + str(args[0]))
+			return self.names(args[0])
+		if name == 'bodies':
+			return self.bodies(args[0])
+		if name == 'body':
+			return self.read(os.path.join(self._root(args[0]), args[1], BODY_FILENAME))
+		if name == 'element':
+			return self.read(os.path.join(self._root(args[0]), args[1], args[2], ELEMENT_FILENAME))
+		if name == 'resolve':
+			return self.resolver.resolve(args[0])
+		if name == 'latest':
+			return self.latest(args[0])
+		raise ValueError('unknown query: ' + str(name))
+
+	def latest(self, uri):
+		'''
+		return [version, user, timestamp, comment, path] of the latest publish of the
+		element a uri points at, or None if nothing has been published
+		'''
+		element_dir = self.resolver.element_dir(uri)
+		datadict = self.resolver._read_element(element_dir)
+		version = datadict['latest_version']
+		if version < 0:
+			return None
+		return [version] + list(datadict['publishes'][version])
+
+	def answer(self, request):
+		'''
+		answer a decoded request and return the reply. The reply carries the snapshot the
+		answers started from, so a change made meanwhile shows up as a new snapshot next time.
+		'''
+		snapshot = self.snapshot
+		results = []
+		for op in request.get('q', []):
+			try:
+				results.append([0, self.query(op)])
+			except (EnvironmentError, ValueError, KeyError, IndexError, TypeError) as e:
+				results.append([1, str(e)])
+		return {'s': snapshot, 'r': results}
+
+def _read_file(path):
+	try:
+		return pipeline_io.readfile(path)
+	except (IOError, OSError):
+		return None
+
+
+class MetadataDaemon:
+	'''
+	Serves a MetadataIndex on a Unix socket and keeps it current with a PublishWatcher.
+	'''
+
+	def __init__(self, socket_path=None, env=None, poll=None, broadcast=False):
+		'''
+		socket_path -- (optional) where to listen. Defaults to default_socket_path().
+		env -- (optional) the Environment to serve. Defaults to the current project.
+		poll -- (optional) seconds between scans, to poll instead of using inotify
+		broadcast -- also broadcast the watcher's events to EventClients (see publish_watcher)
+		'''
+		from pipe.pipeHandlers import publish_watcher
+		if env is None:
+			from pipe.pipeHandlers.environment import Environment
+			env = Environment()
+		self.socket_path = socket_path or default_socket_path()
+		self.index = MetadataIndex(env)
+		self.watcher = publish_watcher.PublishWatcher(publish_watcher.default_roots(env), poll)
+		self.watcher.subscribe(self.index.apply)
+		self.broadcaster = publish_watcher.Broadcaster() if broadcast else None
+		if self.broadcaster is not None:
+			self.watcher.subscribe(self.broadcaster)
+		self._server = None
+		self._connections = set()
+		self._lock = threading.Lock()
+
+	def _serve_client(self, connection):
+		try:
+			reader = connection.makefile('rb')
+			for line in reader:
+				try:
+					reply = self.index.answer(json.loads(line.decode('utf-8')))
+				except ValueError as e:
+					reply = {'s': self.index.snapshot, 'e': 'bad request: ' + str(e)}
+				connection.sendall((json.dumps(reply, separators=(',', ':')) + '\n').encode('utf-8'))
+		except (socket.error, OSError):
+			pass
+		finally:
+			with self._lock:
+				self._connections.discard(connection)
+			connection.close()
+
+	def _accept(self):
+		while True:
+			try:
+				connection = self._server.accept()[0]
+			except (socket.error, OSError, AttributeError):
+				return # closed
+			if peer_uid(connection) not in (None, os.getuid()):
+				connection.close() # only answer this user's sessions
+				continue
+			with self._lock:
+				self._connections.add(connection)
+			thread = threading.Thread(target=self._serve_client, args=(connection,), name='metadata client')
+			thread.daemon = True
+			thread.start()
+
+	def start(self, warm=True):
+		'''
+		start listening, watching and (optionally) warming the index, each on its own thread
+		'''
+		if os.path.exists(self.socket_path):
+			probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+			try:
+				probe.connect(self.socket_path)
+				probe.close()
+				raise EnvironmentError('a metadata daemon is already running on ' + self.socket_path)
+			except socket.error:
+				os.remove(self.socket_path) # left behind by a daemon that died
+		self._server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+		self._server.bind(self.socket_path)
+		os.chmod(self.socket_path, 0o600) # only this user's sessions may ask
+		self._server.listen(64)
+		if self.broadcaster is not None:
+			self.broadcaster.start()
+		self.watcher.start()
+		for target, name in ((self._accept, 'metadata daemon'),) + (((self._warm, 'metadata warm'),) if warm else ()):
+			thread = threading.Thread(target=target, name=name)
+			thread.daemon = True
+			thread.start()
+
+	def _warm(self):
+		start = time.time()
+		count = self.index.warm()
+		print('metadata daemon: read %d pipeline files in %.1fs' % (count, time.time() - start))
+
+	def close(self):
+		self.watcher.stop()
+		server, self._server = self._server, None
+		if server is not None:
+			server.close()
+			try:
+				os.remove(self.socket_path)
+			except OSError:
+				pass
+		with self._lock:
+			for connection in self._connections:
+				try:
+					connection.shutdown(socket.SHUT_RDWR)
+				except socket.error:
+					pass
+		if self.broadcaster is not None:
+			self.broadcaster.close()
+
+
+class MetadataClient:
+	'''
+	A session's connection to the daemon. Answers are kept until the daemon's snapshot
+	changes, so asking again for an unchanged list only costs a round trip that sends no
+	queries. Safe to share between threads.
+	'''
+
+	def __init__(self, socket_path=None, timeout=CLIENT_TIMEOUT):
+		self.socket_path = socket_path or default_socket_path()
+		self.timeout = timeout
+		self.snapshot = None
+		self._answers = {}
+		self._name_lists = {} # list name -> (snapshot, NameList)
+		self._socket = None
+		self._reader = None
+		self._lock = threading.Lock()
+
+	def _connect(self):
+		connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+		connection.settimeout(self.timeout)
+		try:
+			connection.connect(self.socket_path)
+			owner = peer_uid(connection)
+			if owner is None:
+				owner = os.stat(self.socket_path).st_uid
+		except (socket.error, OSError) as e:
+			connection.close()
+			raise DaemonUnavailable(str(e))
+		if owner != os.getuid():
+			connection.close()
+			raise DaemonUnavailable(self.socket_path + ' is served by uid ' + str(owner) + ', not this user')
+		self._socket = connection
+		self._reader = connection.makefile('rb')
+
+	def close(self):
+		if self._socket is not None:
+			self._reader.close()
+			self._socket.close()
+		self._socket = self._reader = None
+
+	def _send(self, ops):
+		if self._socket is None:
+			self._connect()
+		try:
+			self._socket.sendall((json.dumps({'s': self.snapshot, 'q': ops}, separators=(',', ':')) + '\n').encode('utf-8'))
+			line = self._reader.readline()
+		except (socket.error, OSError) as e:
+			self.close()
+			raise DaemonUnavailable(str(e))
+		if not line:
+			self.close()
+			raise DaemonUnavailable('the metadata daemon closed the connection')
+		reply = json.loads(line.decode('utf-8'))
+		if 'e' in reply:
+			raise ValueError(reply['e'])
+		return reply
+
+	def query(self, ops, strict=True):
+		'''
+		answer a batch of queries in one round trip and return the values in order.
+		A failed query raises EnvironmentError, or gives None if strict is False.
+		Raises DaemonUnavailable if the daemon can't be reached.
+		'''
+		return self._query(ops, strict)[1]
+
+	def name_list(self, list_name):
+		'''
+		return the list_cache NameList of a name list. It is built once per snapshot.
+		'''
+		snapshot, values = self._query([['list', list_name]], True)
+		cached = self._name_lists.get(list_name)
+		if cached is not None and cached[0] == snapshot:
+			return cached[1]
+		names = list_cache.name_list(values[0])
+		self._name_lists[list_name] = (snapshot, names)
+		return names
+
+	def _query(self, ops, strict):
+		'''
+		return (snapshot, values) for query(), the snapshot being the one the values belong to
+		'''
+		keys = [json.dumps(op) for op in ops]
+		with self._lock:
+			missing = [op for op, key in zip(ops, keys) if key not in self._answers]
+			reply = self._send(missing)
+			if reply['s'] != self.snapshot:
+				self._answers = {}
+				self.snapshot = reply['s']
+				if len(missing) < len(ops): # the kept answers are stale, ask for everything
+					missing = ops
+					reply = self._send(ops)
+			for op, result in zip(missing, reply['r']):
+				self._answers[json.dumps(op)] = result
+			results = [self._answers[key] for key in keys]
+			snapshot = self.snapshot
+
+		values = []
+		for failed, value in results:
+			if failed and strict:
+				raise EnvironmentError(value)
+			values.append(None if failed else value)
+		return snapshot, values
+
+	def get(self, *op):
+		'''
+		answer a single query, e.g. get('list', 'assets')
+		'''
+		return self.query([list(op)])[0]
+
+_client = None
+_unavailable_until = 0
+
+def client():
+	'''
+	return the shared MetadataClient if a daemon is running for this project, else None.
+	After a failed connection the daemon isn't tried again for RETRY_SECONDS.
+	'''
+	global _client, _unavailable_until
+	try:
+		socket_path = default_socket_path()
+	except EnvironmentError:
+		return None
+	if _client is not None and _client.socket_path == socket_path:
+		return _client
+	if time.time() < _unavailable_until or not os.path.exists(socket_path):
+		return None
+	candidate = MetadataClient(socket_path)
+	try:
+		with candidate._lock:
+			candidate._connect()
+	except DaemonUnavailable:
+		_unavailable_until = time.time() + RETRY_SECONDS
+		return None
+	_client = candidate
+	return _client
+
+def forget(failed_client):
+	'''
+	stop using a client whose daemon went away; the filesystem is used until it is back
+	'''
+	global _client, _unavailable_until
+	if _client is failed_client:
+		_client = None
+		_unavailable_until = time.time() + RETRY_SECONDS
+
+def query(ops, strict=True):
+	'''
+	answer queries through the daemon. Returns None (rather than a list) when no daemon
+	is running, so callers can fall back to reading the files.
+	'''
+	daemon = client()
+	if daemon is None:
+		return None
+	try:
+		return daemon.query(ops, strict)
+	except DaemonUnavailable:
+		forget(daemon)
+		return None
+
+def name_list(list_name):
+	'''
+	return a name list's NameList through the daemon, or None when no daemon is running
+	'''
+	daemon = client()
+	if daemon is None:
+		return None
+	try:
+		return daemon.name_list(list_name)
+	except DaemonUnavailable:
+		forget(daemon)
+		return None
+
+
+def main(argv=None):
+	import argparse # only the command line needs it
+
+	parser = argparse.ArgumentParser(description="Serve the project's pipeline metadata to the sessions on this machine.")
+	parser.add_argument('--poll', type=float, help='stat the pipeline files every POLL seconds instead of using inotify')
+	parser.add_argument('--socket', help='unix socket to listen on (default $' + SOCKET_ENV + ' or a path in the user\'s runtime dir)')
+	parser.add_argument('--broadcast', action='store_true', help='also broadcast publish events, as publish_watcher does')
+	parser.add_argument('--no-warm', dest='warm', action='store_false', help="don't read the whole project on start")
+	args = parser.parse_args(argv)
+
+	daemon = MetadataDaemon(args.socket, poll=args.poll, broadcast=args.broadcast)
+	daemon.start(args.warm)
+	print('serving ' + ', '.join(daemon.watcher.roots) + ' on ' + daemon.socket_path)
+	try:
+		while True:
+			time.sleep(60)
+	except KeyboardInterrupt:
+		pass
+	finally:
+		daemon.close()
+
+if __name__ == '__main__':
+	main()
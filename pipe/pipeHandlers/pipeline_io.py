@@ -2,7 +2,6 @@ import glob
 import json
 import os
 import re
-import smtplib
 import time
 
 def readfile(filepath):
@@ -14,6 +13,55 @@ def readfile(filepath):
 
 	return json_data
 
+'''
+cache of parsed pipeline files, keyed by filepath. each entry holds the stat
+signature the file had when it was read, so a stale entry is detected with a
+single os.stat instead of re-reading json over the network.
+'''
+_file_cache = {}
+
+def _stat_signature(filepath):
+	st = os.stat(filepath)
+	return (st.st_mtime_ns, st.st_size, st.st_ino)
+
+def readfile_cached(filepath):
+	"""
+	reads a pipeline json file through the metadata cache. the file is only parsed
+	again when its mtime, size or inode changes. the returned dictionary is shared,
+	so callers must not modify it.
+	"""
+	signature = _stat_signature(filepath)
+	entry = _file_cache.get(filepath)
+	if entry is not None and entry[0] == signature:
+		return entry[1]
+
+	json_data = readfile(filepath)
+	_file_cache[filepath] = (signature, json_data)
+	return json_data
+
+def invalidate_cache(filepath=None):
+	"""
+	drops the cached copy of the given pipeline file, or every cached file if no
+	filepath is given
+	"""
+	if filepath is None:
+		_file_cache.clear()
+	else:
+		_file_cache.pop(filepath, None)
+
+RETIRED_FILENAME = ".retired"
+
+def read_retired(element_dir):
+	"""
+	returns the set of versions of the element in element_dir that the retention policy
+	has retired (see storage). They are kept in their own file next to the .element, which
+	only storage writes, so publishes and retires can't overwrite each other.
+	"""
+	try:
+		return set(readfile_cached(os.path.join(element_dir, RETIRED_FILENAME)))
+	except (IOError, OSError, ValueError):
+		return set()
+
 def writefile(filepath, datadict):
 	"""
 	writes the given data dictionary to a pipeline json file at the given filepath
@@ -23,6 +71,7 @@ def writefile(filepath, datadict):
 	with open(tmp_filepath, "w") as json_file:
 		json.dump(datadict, json_file, indent=0)
 	os.rename(tmp_filepath, filepath)
+	invalidate_cache(filepath)
 
 def mkdir(dirpath):
 	"""
@@ -42,6 +91,41 @@ def set_permissions(path):
 	except:
 		print("Couldn't set permissions.")
 
+# linux ioctl that makes a file share another file's blocks (btrfs, xfs, ...)
+FICLONE = 0x40049409
+
+REFLINK = "reflink"
+COPY = "copy"
+
+def reflink(src, dst):
+	"""
+	make dst a copy-on-write clone of src. Raises OSError if the filesystem can't do it,
+	leaving no dst behind.
+	"""
+	import fcntl
+	with open(src, "rb") as src_file:
+		with open(dst, "wb") as dst_file:
+			try:
+				fcntl.ioctl(dst_file.fileno(), FICLONE, src_file.fileno())
+			except (IOError, OSError):
+				os.remove(dst)
+				raise
+
+def clone_file(src, dst):
+	"""
+	copy src to dst as cheaply as the filesystem allows and return how it was done:
+	REFLINK (a copy-on-write clone) or COPY. Either way dst is a file of its own, which
+	can be written without changing src.
+	"""
+	try:
+		reflink(src, dst)
+		return REFLINK
+	except (IOError, OSError):
+		pass
+	import shutil # only copies need it
+	shutil.copyfile(src, dst)
+	return COPY
+
 def version_file(filepath):
 	"""
 	versions up the given file based on other files in the same directory. The given filepath
@@ -135,10 +219,7 @@ def get_project_info(project_dir, key):
 	opens .project and gets information from this file
 	'''
 	filepath = os.path.join(project_dir, ".project")
-	with open(filepath, "r") as json_file:
-		json_data = json.load(json_file)
-
-	return json_data[key]
+	return readfile_cached(filepath)[key]
 
 def get_settings_info(project_dir, key):
 	'''
@@ -1,10 +1,12 @@
 import os
 import shutil
 
-from pipeHandlers.body import Body, Asset, Shot, Tool, CrowdCycle, AssetType, Layout, Sequence
-from pipeHandlers.element import Checkout, Element
-from pipeHandlers.environment import Environment, User
-from pipeHandlers import pipeline_io
+from pipe.pipeHandlers.body import Body, Asset, Shot, Tool, CrowdCycle, AssetType, Layout, Sequence
+from pipe.pipeHandlers.element import Checkout, Element
+from pipe.pipeHandlers.environment import Environment, User
+from pipe.pipeHandlers import pipeline_io
+from pipe.pipeHandlers import list_cache
+from pipe.pipeHandlers import metadata_daemon
 
 
 
@@ -246,17 +248,43 @@ class Project:
 		'''
 		return self.create_body(name, Tool)
 
-	def _list_bodies_in_dir(self, filepath, filter=None):
-		dirlist = os.listdir(filepath)
+	def _daemon_bodies(self, filepath):
+		'''
+		returns [name, type] for every body in one of the project's body folders from the
+		metadata daemon, or None if no daemon is running
+		'''
+		filepath = os.path.normpath(filepath)
+		for kind, root in (('asset', self._env.get_assets_dir()), ('shot', self._env.get_shots_dir()), ('tool', self._env.get_tools_dir()),
+				('layout', self._env.get_layouts_dir()), ('sequence', self._env.get_sequences_dir())):
+			if os.path.normpath(root) == filepath:
+				answers = metadata_daemon.query([['bodies', kind]])
+				return None if answers is None else answers[0]
+		return None
+
+	def _list_body_types(self, filepath):
+		'''
+		returns (name, type) for every body in the given folder, sorted by name
+		'''
+		bodies = self._daemon_bodies(filepath)
+		if bodies is not None:
+			return [(name, type) for name, type in bodies]
+		return [(name, Body(os.path.join(filepath, name)).get_type()) for name in self._list_bodies_in_dir(filepath)]
 
-		bodylist = []
-		for bodydir in dirlist:
-			abspath = os.path.join(filepath, bodydir)
-			if os.path.exists(os.path.join(abspath, Body.PIPELINE_FILENAME)):
-				bodylist.append(bodydir)
-			else:
-				print("path doesn't exist for ", bodydir)
-		bodylist.sort()
+	def _list_bodies_in_dir(self, filepath, filter=None):
+		bodies = self._daemon_bodies(filepath)
+		if bodies is not None:
+			bodylist = [name for name, type in bodies]
+		else:
+			dirlist = os.listdir(filepath)
+
+			bodylist = []
+			for bodydir in dirlist:
+				abspath = os.path.join(filepath, bodydir)
+				if os.path.exists(os.path.join(abspath, Body.PIPELINE_FILENAME)):
+					bodylist.append(bodydir)
+				else:
+					print("path doesn't exist for ", bodydir)
+			bodylist.sort()
 
 		if filter is not None and len(filter)==3:
 			filtered_bodylist = []
@@ -268,31 +296,61 @@ class Project:
 
 		return bodylist
 
+	def _load_index(self, list_name, filepath):
+		'''
+		returns the NameList of a list file from the metadata daemon if one is running,
+		otherwise through list_cache
+		'''
+		names = metadata_daemon.name_list(list_name)
+		if names is None:
+			return list_cache.load(filepath)
+		return names
+
+	def get_asset_index(self):
+		'''
+		returns the cached NameList (see list_cache) of all assets in the production. Use its
+		members and sanitized fields for lookups instead of searching list_assets().
+		'''
+		return self._load_index('assets', self._env.get_assets_dir() + ".asset_list.txt")
+
+	def get_short_asset_index(self):
+		'''
+		returns the cached NameList of the shortlist of assets
+		'''
+		return self._load_index('short_assets', self._env.get_assets_dir() + ".short_asset_list")
+
+	def get_shot_index(self):
+		'''
+		returns the cached NameList of all shots in the production
+		'''
+		return self._load_index('shots', self._env.get_shots_dir() + ".shot_list")
+
+	def get_layout_index(self):
+		'''
+		returns the cached NameList of all layouts in the production
+		'''
+		return self._load_index('layouts', self._env.get_layouts_dir() + ".layout_list")
+
+	def get_sequence_index(self):
+		'''
+		returns the cached NameList of all sequences in the production
+		'''
+		return self._load_index('sequences', self._env.get_sequences_dir() + ".sequence_list")
+
 	def list_assets(self):
 		'''
 		returns the names of all assets in the production
 		'''
-		path = self._env.get_assets_dir() + ".asset_list.txt"
-		assets = []
-		f = open(path, "r")
-		for aName in f:
-			if aName[-1] == "\n":  # remove newline character
-				aName = aName[:-1]
-			assets.append(aName)
-
-		assets.sort(key=str.lower)
-		return assets
+		return list(self.get_asset_index().sorted)
 
 	def list_existing_assets(self):
 		'''
 		lists only assets that have already been created
 		'''
-		list = self._list_bodies_in_dir(self._env.get_assets_dir())
 		assets = []
 
-		for item in list:
-			asset = self.get_asset(item)
-			if asset.get_type() == AssetType.ASSET:
+		for item, type in self._list_body_types(self._env.get_assets_dir()):
+			if type == AssetType.ASSET:
 				assets.append(str(item))
 		assets.sort(key=str.lower)
 		return assets
@@ -301,52 +359,16 @@ class Project:
 		'''
 		returns the shortlist of assets
 		'''
-		path = self._env.get_assets_dir() + ".short_asset_list"
-		assets = []
-		f = open(path, "r")
-		for aName in f:
-			if aName[-1] == "\n":
-				aName = aName[:-1]
-			assets.append(aName)
-
-		assets.sort(key=str.lower)
-		return assets
+		return list(self.get_short_asset_index().sorted)
 
 	def list_shots(self):
-		path = self._env.get_shots_dir() + ".shot_list"
-		shots = []
-		f = open(path, "r")
-		for shot in f:
-			if shot[-1] == "\n": #remove newline character
-				shot = shot[:-1]
-			shots.append(shot)
-
-		shots.sort(key=str.lower)
-		return shots
+		return list(self.get_shot_index().sorted)
 
 	def list_layouts(self):
-		path = self._env.get_layouts_dir() + ".layout_list"
-		layouts = []
-		f = open(path, "r")
-		for layout in f:
-			if layout[-1] == "\n": #remove newline character
-				layout = layout[:-1]
-			layouts.append(layout)
-
-		layouts.sort(key=str.lower)
-		return layouts
+		return list(self.get_layout_index().sorted)
 
 	def list_sequences(self):
-		path = self._env.get_sequences_dir() + ".sequence_list"
-		sequences = []
-		f = open(path, "r")
-		for sequence in f:
-			if sequence[-1] == "\n":
-				sequence = sequence[:-1]
-			sequences.append(sequence)
-
-		sequences.sort(key=str.lower)
-		return sequences
+		return list(self.get_sequence_index().sorted)
 
 	def list_existing_shots(self, filter=None):
 		'''
@@ -355,13 +377,10 @@ class Project:
 				e.g. (Shot.FRAME_RANGE, operator.gt, 100). Only returns shots whose
 				given attribute has the relation to the given desired value. Defaults to None.
 		'''
-		list = self._list_bodies_in_dir(self._env.get_shots_dir())
-
 		shot_list = []
 
-		for item in list:
-			shot = self.get_shot(item)
-			if shot.get_type() == AssetType.SHOT:
+		for item, type in self._list_body_types(self._env.get_shots_dir()):
+			if type == AssetType.SHOT:
 				shot_list.append(str(item))
 
 		shot_list.sort(key=str.lower)
@@ -416,12 +435,10 @@ class Project:
 		'''
 		returns a list of strings containing the names of all sets in this project
 		'''
-		list = self._list_bodies_in_dir(self._env.get_assets_dir())
 		set_list = []
 
-		for item in list:
-			asset = self.get_asset(item)
-			if asset.get_type() == AssetType.SET:
+		for item, type in self._list_body_types(self._env.get_assets_dir()):
+			if type == AssetType.SET:
 				set_list.append(str(item))
 
 		set_list.sort(key=str.lower)
@@ -506,7 +523,7 @@ class Project:
 		'''
 		delete the given shot
 		'''
-		if shot in self.list_shots():
+		if shot in self.get_shot_index().members:
 			shutil.rmtree(os.path.join(self.get_shots_dir(), shot))
 
 	def delete_asset(self, asset):
@@ -0,0 +1,571 @@
+import ctypes
+import ctypes.util
+import errno
+import hashlib
+import json
+import os
+import queue
+import select
+import socket
+import struct
+import threading
+import time
+from collections import namedtuple
+
+from pipe.pipeHandlers import list_cache
+from pipe.pipeHandlers import pipeline_io
+
+'''
+publish watcher module
+
+Watches the production tree for changes to the pipeline files (.element, .body and the
+name lists) and turns them into typed events. Every event invalidates the matching entry
+of the in-process metadata caches (pipeline_io.readfile_cached, list_cache) and is handed
+to the subscribed callbacks. A Broadcaster fans the events out over a Unix socket so open
+DCC sessions can follow along with an EventClient, e.g. to show how many upstream updates
+are waiting, without scanning anything.
+
+Changes are picked up with inotify, called through ctypes. inotify only sees writes made
+through the local kernel, which on an NFS mounted tree means writes from this machine, so
+run the watcher where the publishes are written (the file server, or a host that mounts
+the tree locally) or use the polling backend, which stats the pipeline files every few
+seconds.
+
+python -m pipe.pipeHandlers.publish_watcher [--poll SECONDS] [--socket PATH]
+'''
+
+# event kinds
+PUBLISHED = 'published' # an element has a new latest version
+ELEMENT_CHANGED = 'element' # an .element file changed without a new publish, e.g. a checkout
+BODY_CHANGED = 'body'
+LIST_CHANGED = 'list' # one of the project's name lists
+RESYNC = 'resync' # events were lost, every cache has been dropped
+
+ELEMENT_FILENAME = '.element'
+BODY_FILENAME = '.body'
+LIST_FILENAMES = ('.asset_list.txt', '.short_asset_list', '.shot_list', '.layout_list', '.sequence_list')
+
+# an element seen for the first time counts as published if its latest publish is this recent
+RECENT_SECONDS = 300
+
+POLL_INTERVAL = 5.0
+
+SOCKET_ENV = 'PIPE_WATCHER_SOCKET'
+
+# a broadcast client that has this many events waiting, or takes longer than
+# SEND_TIMEOUT seconds to take one, is dropped so it can't hold up the others
+CLIENT_BACKLOG = 1000
+SEND_TIMEOUT = 5.0
+
+PublishEvent = namedtuple('PublishEvent', ['kind', 'path', 'version', 'time'])
+PublishEvent.__doc__ = '''
+kind -- PUBLISHED, ELEMENT_CHANGED, BODY_CHANGED, LIST_CHANGED or RESYNC
+path -- the pipeline file that changed, None for RESYNC
+version -- the latest version of the element for element events, else None.
+	-1 if the .element file was removed.
+time -- when the change was seen, in seconds since the epoch
+'''
+
+def is_pipeline_file(name):
+	return name == ELEMENT_FILENAME or name == BODY_FILENAME or name in LIST_FILENAMES
+
+def _skip_dir(name):
+	# version folders (.v0001) and other hidden folders never hold pipeline files we follow
+	return name.startswith('.')
+
+def _unique(paths):
+	seen = set()
+	return [path for path in paths if not (path in seen or seen.add(path))]
+
+def default_roots(env=None):
+	'''
+	the folders holding the project's bodies
+	'''
+	if env is None:
+		from pipe.pipeHandlers.environment import Environment
+		env = Environment()
+	roots = [env.get_assets_dir(), env.get_shots_dir(), env.get_layouts_dir(), env.get_sequences_dir(), env.get_tools_dir()]
+	return sorted(set(os.path.normpath(root) for root in roots if os.path.isdir(root)))
+
+def default_socket_path():
+	path = os.getenv(SOCKET_ENV)
+	if path:
+		return path
+	project = os.path.abspath(os.getenv('MEDIA_PROJECT_DIR', '/'))
+	return os.path.join('/tmp', 'pipe_watcher_' + hashlib.sha1(project.encode('utf-8')).hexdigest()[:8] + '.sock')
+
+def invalidate(event):
+	'''
+	drop whatever the in-process caches hold for the file an event is about
+	'''
+	if event.kind == RESYNC:
+		pipeline_io.invalidate_cache()
+		list_cache.invalidate()
+	elif event.kind == LIST_CHANGED:
+		list_cache.invalidate(event.path)
+	else:
+		pipeline_io.invalidate_cache(event.path)
+
+
+class InotifyBackend:
+	'''
+	Reports changed pipeline files with inotify, watching every folder below the roots.
+	'''
+
+	IN_MODIFY = 0x00000002
+	IN_CLOSE_WRITE = 0x00000008
+	IN_MOVED_FROM = 0x00000040
+	IN_MOVED_TO = 0x00000080
+	IN_CREATE = 0x00000100
+	IN_DELETE = 0x00000200
+	IN_Q_OVERFLOW = 0x00004000
+	IN_IGNORED = 0x00008000
+	IN_ISDIR = 0x40000000
+	IN_NONBLOCK = 0o4000
+	IN_CLOEXEC = 0o2000000
+
+	MASK = IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+
+	_EVENT = struct.Struct('iIII')
+
+	def __init__(self, roots):
+		libc_name = ctypes.util.find_library('c')
+		if libc_name is None:
+			raise OSError(errno.ENOSYS, 'inotify needs the C library')
+		self._libc = ctypes.CDLL(libc_name, use_errno=True)
+		if not hasattr(self._libc, 'inotify_init1'):
+			raise OSError(errno.ENOSYS, 'inotify is not available')
+		self._fd = self._libc.inotify_init1(self.IN_NONBLOCK | self.IN_CLOEXEC)
+		if self._fd < 0:
+			raise OSError(ctypes.get_errno(), 'inotify_init1 failed')
+		self._dirs = {} # watch descriptor -> folder
+		for root in roots:
+			self.add_tree(root)
+
+	def add_tree(self, top):
+		'''
+		watch top and every folder below it. Returns the pipeline files already in them,
+		which matters for folders created after the watcher started.
+		'''
+		found = []
+		for dirpath, dirnames, filenames in os.walk(top):
+			dirnames[:] = [name for name in dirnames if not _skip_dir(name)]
+			wd = self._libc.inotify_add_watch(self._fd, os.fsencode(dirpath), self.MASK)
+			if wd < 0:
+				code = ctypes.get_errno()
+				if code == errno.ENOSPC:
+					raise OSError(code, 'out of inotify watches, raise fs.inotify.max_user_watches')
+				continue # removed while walking
+			self._dirs[wd] = dirpath
+			found.extend(os.path.join(dirpath, name) for name in filenames if is_pipeline_file(name))
+		return found
+
+	def changes(self, timeout):
+		'''
+		wait up to timeout seconds and return the changed pipeline files. None in the list
+		means the kernel dropped events.
+		'''
+		readable = select.select([self._fd], [], [], timeout)[0]
+		if not readable:
+			return []
+		try:
+			data = os.read(self._fd, 64 * 1024)
+		except OSError as e:
+			if e.errno == errno.EAGAIN:
+				return []
+			raise
+
+		changed = []
+		offset = 0
+		while offset + self._EVENT.size <= len(data):
+			wd, mask, cookie, length = self._EVENT.unpack_from(data, offset)
+			offset += self._EVENT.size
+			name = data[offset:offset + length].rstrip(b'\0').decode('utf-8', 'replace')
+			offset += length
+
+			if mask & self.IN_Q_OVERFLOW:
+				changed.append(None)
+				continue
+			if mask & self.IN_IGNORED:
+				self._dirs.pop(wd, None)
+				continue
+			folder = self._dirs.get(wd)
+			if folder is None:
+				continue
+			path = os.path.join(folder, name)
+			if mask & self.IN_ISDIR:
+				if mask & (self.IN_CREATE | self.IN_MOVED_TO) and not _skip_dir(name):
+					changed.extend(self.add_tree(path))
+			elif is_pipeline_file(name) and not mask & self.IN_CREATE: # the write that follows reports it
+				changed.append(path)
+		return _unique(changed)
+
+	def close(self):
+		if self._fd >= 0:
+			os.close(self._fd)
+			self._fd = -1
+
+
+class PollingBackend:
+	'''
+	Reports changed pipeline files by statting all of them every interval seconds. Slower
+	than inotify but sees changes made by any NFS client.
+	'''
+
+	def __init__(self, roots, interval=POLL_INTERVAL):
+		self._roots = roots
+		self._interval = interval
+		self._signatures = self._scan()
+		self._next = time.time() + interval
+
+	def _scan(self):
+		signatures = {}
+		stack = list(self._roots)
+		while stack:
+			try:
+				entries = list(os.scandir(stack.pop()))
+			except OSError:
+				continue
+			for entry in entries:
+				try:
+					if entry.is_dir(follow_symlinks=False):
+						if not _skip_dir(entry.name):
+							stack.append(entry.path)
+					elif is_pipeline_file(entry.name):
+						st = entry.stat()
+						signatures[entry.path] = (st.st_mtime_ns, st.st_size, st.st_ino)
+				except OSError:
+					continue
+		return signatures
+
+	def changes(self, timeout):
+		wait = self._next - time.time()
+		if wait > timeout:
+			time.sleep(timeout)
+			return []
+		if wait > 0:
+			time.sleep(wait)
+		self._next = time.time() + self._interval
+
+		signatures = self._scan()
+		old = self._signatures
+		self._signatures = signatures
+		changed = [path for path, signature in signatures.items() if old.get(path) != signature]
+		changed.extend(path for path in old if path not in signatures)
+		return sorted(changed)
+
+	def close(self):
+		pass
+
+
+class PublishWatcher:
+	'''
+	Turns changed pipeline files into PublishEvents, invalidates the caches and calls the
+	subscribers. Run it on a thread with start(), or in the foreground with run().
+	'''
+
+	def __init__(self, roots=None, poll=None):
+		'''
+		roots -- (optional) folders to watch. Defaults to the project's body folders.
+		poll -- (optional) seconds between scans to use the polling backend instead of inotify
+		'''
+		self.roots = roots if roots is not None else default_roots()
+		if poll is None:
+			self._backend = InotifyBackend(self.roots)
+		else:
+			self._backend = PollingBackend(self.roots, poll)
+		self._versions = {} # .element path -> latest version last seen
+		self._subscribers = {}
+		self._next_token = 0
+		self._lock = threading.Lock()
+		self._stopped = threading.Event()
+		self._thread = None
+
+	def subscribe(self, callback, kinds=None):
+		'''
+		call callback(event) for every event, or only the events of the given kinds.
+		Callbacks run on the watcher thread. Returns a token for unsubscribe.
+		'''
+		with self._lock:
+			self._next_token += 1
+			self._subscribers[self._next_token] = (callback, None if kinds is None else frozenset(kinds))
+			return self._next_token
+
+	def unsubscribe(self, token):
+		with self._lock:
+			self._subscribers.pop(token, None)
+
+	def _classify(self, path):
+		now = time.time()
+		if path is None:
+			self._versions.clear()
+			return PublishEvent(RESYNC, None, None, now)
+
+		name = os.path.basename(path)
+		if name in LIST_FILENAMES:
+			return PublishEvent(LIST_CHANGED, path, None, now)
+		if name == BODY_FILENAME:
+			return PublishEvent(BODY_CHANGED, path, None, now)
+
+		pipeline_io.invalidate_cache(path)
+		try:
+			datadict = pipeline_io.readfile_cached(path)
+			version = datadict['latest_version']
+		except (IOError, OSError, ValueError, KeyError):
+			self._versions.pop(path, None)
+			return PublishEvent(ELEMENT_CHANGED, path, -1, now)
+
+		previous = self._versions.get(path)
+		self._versions[path] = version
+		if previous is None:
+			published = version >= 0 and self._recent(datadict['publishes'][version], now)
+		else:
+			published = version > previous
+		return PublishEvent(PUBLISHED if published else ELEMENT_CHANGED, path, version, now)
+
+	def _recent(self, publish, now):
+		from pipe.pipeHandlers.dependency_graph import parse_timestamp
+		try:
+			return now - parse_timestamp(publish[1]) < RECENT_SECONDS
+		except (ValueError, IndexError, TypeError):
+			return False
+
+	def handle(self, path):
+		'''
+		process one changed pipeline file (None for lost events) and return its event
+		'''
+		event = self._classify(path)
+		invalidate(event)
+		with self._lock:
+			subscribers = list(self._subscribers.values())
+		for callback, kinds in subscribers:
+			if kinds is None or event.kind in kinds:
+				try:
+					callback(event)
+				except Exception as e:
+					print('publish watcher: subscriber failed: ' + str(e))
+		return event
+
+	def poll(self, timeout=1.0):
+		'''
+		wait up to timeout seconds for changes and handle them. Returns the events.
+		'''
+		return [self.handle(path) for path in self._backend.changes(timeout)]
+
+	def run(self):
+		while not self._stopped.is_set():
+			self.poll()
+
+	def start(self):
+		self._thread = threading.Thread(target=self.run, name='publish watcher')
+		self._thread.daemon = True
+		self._thread.start()
+		return self._thread
+
+	def stop(self):
+		self._stopped.set()
+		if self._thread is not None:
+			self._thread.join()
+		self._backend.close()
+
+
+class Broadcaster:
+	'''
+	Sends every event it is given to the clients connected to a Unix socket, one json
+	object per line. Subscribe it to a PublishWatcher.
+
+	Each client has its own queue and sending thread, so the watcher never waits on a
+	client. A client that falls CLIENT_BACKLOG events behind or stops reading for
+	SEND_TIMEOUT seconds is disconnected. EventClients reconnect on their own and treat
+	the gap as a RESYNC.
+	'''
+
+	def __init__(self, socket_path=None):
+		self.socket_path = socket_path or default_socket_path()
+		self._clients = {} # socket -> queue of lines to send
+		self._lock = threading.Lock()
+		self._server = None
+
+	def start(self):
+		if os.path.exists(self.socket_path):
+			probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+			try:
+				probe.connect(self.socket_path)
+				probe.close()
+				raise EnvironmentError('a watcher is already broadcasting on ' + self.socket_path)
+			except socket.error:
+				os.remove(self.socket_path) # left behind by a watcher that died
+		self._server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+		self._server.bind(self.socket_path)
+		os.chmod(self.socket_path, 0o777) # every user's sessions may listen
+		self._server.listen(64)
+		thread = threading.Thread(target=self._accept, name='publish broadcaster')
+		thread.daemon = True
+		thread.start()
+
+	def _accept(self):
+		while True:
+			try:
+				client = self._server.accept()[0]
+			except (socket.error, OSError, AttributeError):
+				return # closed
+			client.settimeout(SEND_TIMEOUT)
+			lines = queue.Queue(CLIENT_BACKLOG)
+			with self._lock:
+				self._clients[client] = lines
+			thread = threading.Thread(target=self._send, args=(client, lines), name='publish broadcast client')
+			thread.daemon = True
+			thread.start()
+
+	def _send(self, client, lines):
+		try:
+			while True:
+				line = lines.get()
+				if line is None:
+					break
+				client.sendall(line)
+		except (socket.error, OSError):
+			pass # gone, or too slow to read
+		finally:
+			self._drop(client)
+
+	def _drop(self, client):
+		with self._lock:
+			lines = self._clients.pop(client, None)
+		if lines is not None:
+			try:
+				lines.put_nowait(None) # wake the sending thread so it ends
+			except queue.Full:
+				pass
+		try:
+			client.shutdown(socket.SHUT_RDWR)
+		except (socket.error, OSError):
+			pass
+		client.close()
+
+	def __call__(self, event):
+		line = (json.dumps(event._asdict()) + '\n').encode('utf-8')
+		with self._lock:
+			clients = list(self._clients.items())
+		for client, lines in clients:
+			try:
+				lines.put_nowait(line)
+			except queue.Full:
+				self._drop(client)
+
+	def close(self):
+		server, self._server = self._server, None
+		if server is not None:
+			server.close()
+			try:
+				os.remove(self.socket_path)
+			except OSError:
+				pass
+		with self._lock:
+			clients = list(self._clients.keys())
+		for client in clients:
+			self._drop(client)
+
+
+class EventClient:
+	'''
+	Follows a Broadcaster from a DCC session. Every event invalidates this process' caches
+	and is passed to the callback, on the client's thread. Published events are kept until
+	clear() so tools can show how many upstream updates are waiting.
+	If no watcher is running the client keeps trying to connect in the background.
+	'''
+
+	RETRY_SECONDS = 10
+
+	def __init__(self, callback=None, socket_path=None):
+		self.socket_path = socket_path or default_socket_path()
+		self._callback = callback
+		self._pending = []
+		self._lock = threading.Lock()
+		self._stopped = threading.Event()
+		self._socket = None
+
+	def start(self):
+		thread = threading.Thread(target=self._run, name='publish events')
+		thread.daemon = True
+		thread.start()
+		return thread
+
+	def _run(self):
+		connected = False
+		while not self._stopped.is_set():
+			try:
+				self._socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+				self._socket.connect(self.socket_path)
+				if connected:
+					# events may have been missed while disconnected (or dropped for being slow)
+					self._receive(PublishEvent(RESYNC, None, None, time.time()))
+				connected = True
+				reader = self._socket.makefile('rb')
+				for line in reader:
+					self._receive(PublishEvent(**json.loads(line.decode('utf-8'))))
+			except (socket.error, OSError, ValueError):
+				pass
+			finally:
+				if self._socket is not None:
+					self._socket.close()
+			self._stopped.wait(self.RETRY_SECONDS)
+
+	def _receive(self, event):
+		invalidate(event)
+		if event.kind == PUBLISHED:
+			with self._lock:
+				self._pending.append(event)
+		if self._callback is not None:
+			self._callback(event)
+
+	def pending(self, folder=None):
+		'''
+		return the published events since the last clear(), or only those for elements
+		under the given folder
+		'''
+		with self._lock:
+			events = list(self._pending)
+		if folder is not None:
+			folder = os.path.join(os.path.normpath(folder), '')
+			events = [event for event in events if event.path.startswith(folder)]
+		return events
+
+	def clear(self):
+		with self._lock:
+			self._pending = []
+
+	def stop(self):
+		self._stopped.set()
+		if self._socket is not None:
+			try:
+				self._socket.shutdown(socket.SHUT_RDWR)
+			except socket.error:
+				pass
+
+
+def main(argv=None):
+	import argparse # only the command line needs it
+
+	parser = argparse.ArgumentParser(description='Watch the production tree and broadcast publishes to open sessions.')
+	parser.add_argument('--poll', type=float, help='stat the pipeline files every POLL seconds instead of using inotify')
+	parser.add_argument('--socket', help='unix socket to broadcast on (default $' + SOCKET_ENV + ' or a path in /tmp)')
+	parser.add_argument('--quiet', '-q', action='store_true', help="don't print the events")
+	args = parser.parse_args(argv)
+
+	watcher = PublishWatcher(poll=args.poll)
+	broadcaster = Broadcaster(args.socket)
+	broadcaster.start()
+	watcher.subscribe(broadcaster)
+	if not args.quiet:
+		watcher.subscribe(lambda event: print(event.kind + ' ' + str(event.path) + ('' if event.version is None else ' v%d' % event.version)))
+	print('watching ' + ', '.join(watcher.roots) + ' on ' + broadcaster.socket_path)
+	try:
+		watcher.run()
+	except KeyboardInterrupt:
+		pass
+	finally:
+		broadcaster.close()
+
+if __name__ == '__main__':
+	main()
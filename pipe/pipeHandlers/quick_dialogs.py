@@ -1,6 +1,5 @@
 from PySide2 import QtWidgets, QtCore, QtGui
 import os #, hou        we can't have import hou here because it makes it break on the maya side
-from pipe.pipeHandlers.project import Project
 
 '''Reports a critical error'''
 def error(errMsg, details=None, title='Error'):
@@ -167,6 +166,7 @@ class HoudiniInput(QtWidgets.QDialog):
     def submit(self):
         print('comment input: '+ self.values +'\n')
         self.button.setText("Loading...")
+        from pipe.pipeHandlers.project import Project # not needed until a dialog is submitted
         icon_path = os.path.join(Project().get_project_dir(
         ), "pipe", "tools", "_resources", "loading_indicator_transparent.gif")
         self.movie = QtGui.QMovie(icon_path)
@@ -0,0 +1,583 @@
+import hashlib
+import io
+import os
+import shutil
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from pipe.pipeHandlers.environment import Environment
+from pipe.pipeHandlers import chunk_store
+from pipe.pipeHandlers import pipeline_io
+from pipe.pipeHandlers import resolver
+
+'''
+replicate module
+
+Copies the new publishes of a project to a second project root, e.g. the one of a
+remote site, instead of copying the whole production tree.
+
+The .element file of every element is compared, by modification time and size, with
+what the last run saw (kept in the target's production/.replication folder). Only
+elements that changed are read, and only the publishes the target's .element doesn't
+have yet are sent, so a run costs about the number of new publishes rather than the
+size of the tree.
+
+A file is sent as a delta against the target's copy of the version before it (or the
+target's own copy of the same file, for an element's main file and cache). The target
+gives the sha256s of the chunks of that file (see chunk_store.split, a rolling
+fingerprint that cuts both files in the same places around an edit) and only the
+chunks it doesn't have travel. Versions kept in the chunk store are sent as their
+.chunked file and whichever chunks the target's store lacks.
+
+Nothing appears half done on the target. A version folder is written under a
+temporary name and renamed into place, files are renamed over the old ones once their
+sha256 matches, and an element's .element file is only replaced after all its new
+versions are there. .body files and the name lists come last. Paths inside the
+metadata, and the asset paths in .usda text layers, are changed from the source project
+folder to the target's. Pipe uris and relative asset paths are left as they are.
+
+Elements are sent in parallel, sharing one bandwidth cap. Versions retired or purged
+on the source are not removed from the target.
+
+python -m pipe.pipeHandlers.replicate SOURCE TARGET [--workers 4] [--limit MB_PER_SECOND] [--dry-run] [--interval SECONDS]
+'''
+
+STATE_DIRNAME = '.replication'
+STATE_FILENAME = 'state'
+SIGNATURES_DIRNAME = 'signatures'
+INCOMING_SUFFIX = '.incoming'
+DEFAULT_WORKERS = 4
+
+# delta operations
+COPY = 'copy' # a chunk the target already has, by sha256
+DATA = 'data' # the bytes of a chunk it hasn't
+END = 'end' # the sha256 of the whole file, which the target checks before keeping it
+# what a COPY costs on the wire, for the bandwidth cap
+COPY_BYTES = 72
+
+BODY_FILENAME = '.body'
+ELEMENT_FILENAME = '.element'
+
+# text layers, whose asset paths are rewritten along with the metadata
+LAYER_EXTENSIONS = ('.usda',)
+
+def rewrite_paths(value, old, new):
+	'''
+	return a copy of json data with every string starting with the old folder starting with the new one
+	'''
+	if isinstance(value, dict):
+		return dict((key, rewrite_paths(item, old, new)) for key, item in value.items())
+	if isinstance(value, (list, tuple)):
+		return [rewrite_paths(item, old, new) for item in value]
+	if isinstance(value, str) and (value == old or value.startswith(old + os.sep)):
+		return new + value[len(old):]
+	return value
+
+
+def rewrite_layer(text, old, new):
+	'''
+	return a usda text layer with every asset path into the old folder pointing into the new one
+	'''
+	return resolver.USDA_ASSET_PATH.sub(lambda match: '@' + rewrite_paths(match.group(1), old, new) + '@', text)
+
+
+class Throttle:
+	'''
+	A bandwidth cap shared by the transfer threads (a token bucket).
+	'''
+
+	def __init__(self, bytes_per_second=None):
+		'''
+		bytes_per_second -- the cap, or None for no cap
+		'''
+		self.rate = bytes_per_second
+		self.sent = 0
+		self._lock = threading.Lock()
+		self._available = 0.0
+		self._time = time.time()
+
+	def consume(self, size):
+		'''
+		count size bytes as sent, sleeping as long as the cap asks for
+		'''
+		with self._lock:
+			self.sent += size
+			if not self.rate:
+				return
+			now = time.time()
+			# at most a second's worth can be saved up
+			self._available = min(self.rate, self._available + (now - self._time) * self.rate) - size
+			self._time = now
+			wait = -self._available / self.rate if self._available < 0 else 0
+		if wait:
+			time.sleep(wait)
+
+def delta(path, signature, throttle=None, data=None):
+	'''
+	yield the operations that rebuild the file at path on a site holding the chunks in
+	signature, a set of sha256s: (COPY, sha256) for a chunk it has, (DATA, bytes) for
+	one it hasn't and finally (END, sha256 of the file).
+	data -- (optional) bytes to send in place of the file's, e.g. a rewritten layer
+	'''
+	digest = hashlib.sha256()
+	with (open(path, 'rb') if data is None else io.BytesIO(data)) as source:
+		for chunk in chunk_store.split(source):
+			digest.update(chunk)
+			chunk_digest = hashlib.sha256(chunk).hexdigest()
+			if chunk_digest in signature:
+				operation, size = (COPY, chunk_digest), COPY_BYTES
+			else:
+				operation, size = (DATA, chunk), len(chunk)
+			if throttle is not None:
+				throttle.consume(size)
+			yield operation
+	yield (END, digest.hexdigest())
+
+
+class LocalSite:
+	'''
+	The receiving end of a replication: a project folder on a mounted file system. A site
+	on another host would offer the same methods over the network. Paths are relative to
+	the project folder.
+	'''
+
+	def __init__(self, project_dir):
+		self.project_dir = os.path.abspath(project_dir)
+		self._state_dir = None
+		self._bases = {}
+		self._lock = threading.Lock()
+
+	def path(self, rel_path):
+		return os.path.join(self.project_dir, rel_path)
+
+	def set_production_dir(self, production_dir):
+		'''
+		tell the site where its production folder is, which holds the replication state and the chunk store
+		'''
+		self._state_dir = os.path.join(production_dir, STATE_DIRNAME)
+		self.chunks = chunk_store.ChunkStore(root=self.path(os.path.join(production_dir, chunk_store.STORE_DIRNAME)))
+		self.makedirs(os.path.join(self._state_dir, SIGNATURES_DIRNAME))
+
+	def exists(self, rel_path):
+		return os.path.lexists(self.path(rel_path))
+
+	def listdir(self, rel_path):
+		try:
+			return sorted(os.listdir(self.path(rel_path)))
+		except OSError:
+			return []
+
+	def makedirs(self, rel_path):
+		if not os.path.isdir(self.path(rel_path)):
+			os.makedirs(self.path(rel_path))
+
+	def read_json(self, rel_path):
+		'''
+		return the data of a pipeline file, or None if there is none
+		'''
+		try:
+			return pipeline_io.readfile(self.path(rel_path))
+		except (IOError, OSError, ValueError):
+			return None
+
+	def write_json(self, rel_path, datadict):
+		'''
+		replace a pipeline file at once (see pipeline_io.writefile)
+		'''
+		self.makedirs(os.path.dirname(rel_path))
+		pipeline_io.writefile(self.path(rel_path), datadict)
+
+	def read_state(self):
+		return self.read_json(os.path.join(self._state_dir, STATE_FILENAME)) or {}
+
+	def write_state(self, state):
+		self.write_json(os.path.join(self._state_dir, STATE_FILENAME), state)
+
+	def _signature_file(self, rel_path):
+		name = hashlib.sha1(rel_path.encode('utf-8')).hexdigest()
+		return self.path(os.path.join(self._state_dir, SIGNATURES_DIRNAME, name))
+
+	def signature(self, rel_path):
+		'''
+		return the sha256s of the chunks of a file, or of the chunks of a chunked version
+		folder. The chunks of files are remembered, so they are only read once.
+		'''
+		path = self.path(rel_path)
+		if os.path.isdir(path):
+			index = {}
+			for entry in chunk_store.read_manifest(path).values():
+				for digest, size in entry['chunks']:
+					index[digest] = (None, 0, size)
+		else:
+			index = self._file_index(rel_path)
+		with self._lock:
+			self._bases[rel_path] = index
+		return set(index)
+
+	def _file_index(self, rel_path):
+		'''
+		return {sha256: (path, offset, size)} for the chunks of a file
+		'''
+		path = self.path(rel_path)
+		try:
+			st = os.stat(path)
+		except OSError:
+			return {}
+		stamp = [st.st_size, st.st_mtime_ns]
+		try:
+			cached = pipeline_io.readfile(self._signature_file(rel_path))
+			if cached['stamp'] == stamp:
+				return dict((digest, (path, offset, size)) for digest, offset, size in cached['chunks'])
+		except (IOError, OSError, ValueError, KeyError):
+			pass
+		chunks = []
+		offset = 0
+		with open(path, 'rb') as source:
+			for data in chunk_store.split(source):
+				chunks.append([hashlib.sha256(data).hexdigest(), offset, len(data)])
+				offset += len(data)
+		self._remember(rel_path, stamp, chunks)
+		return dict((digest, (path, offset, size)) for digest, offset, size in chunks)
+
+	def _remember(self, rel_path, stamp, chunks):
+		pipeline_io.writefile(self._signature_file(rel_path), {'stamp': stamp, 'chunks': chunks})
+
+	def forget(self, rel_path):
+		'''
+		drop the remembered chunks of a file no delta will be made against again
+		'''
+		try:
+			os.remove(self._signature_file(rel_path))
+		except OSError:
+			pass
+
+	def _read_chunk(self, location, digest):
+		path, offset, size = location
+		if path is None:
+			return self.chunks.get(digest)
+		with open(path, 'rb') as f:
+			f.seek(offset)
+			return f.read(size)
+
+	def apply_delta(self, rel_path, basis, operations):
+		'''
+		write a file from the operations of delta(), reading the chunks it already has from
+		basis, the file or folder its signature was asked for. The file only replaces the
+		one at rel_path once its sha256 is right.
+		'''
+		with self._lock:
+			index = self._bases.pop(basis, {})
+		path = self.path(rel_path)
+		self.makedirs(os.path.dirname(rel_path))
+		tmp_path = '%s_tmp%d_%d' % (path, os.getpid(), threading.get_ident())
+		digest = hashlib.sha256()
+		chunks = []
+		offset = 0
+		complete = False
+		try:
+			with open(tmp_path, 'wb') as target:
+				for kind, value in operations:
+					if kind == END:
+						if digest.hexdigest() != value:
+							raise IOError('the copy of ' + rel_path + ' does not match the source')
+						complete = True
+						break
+					if kind == COPY:
+						data = self._read_chunk(index[value], value)
+						chunk_digest = value
+					else:
+						data = value
+						chunk_digest = hashlib.sha256(data).hexdigest()
+					digest.update(data)
+					target.write(data)
+					chunks.append([chunk_digest, offset, len(data)])
+					offset += len(data)
+			if not complete:
+				raise IOError('the copy of ' + rel_path + ' was cut short')
+			os.rename(tmp_path, path)
+		finally:
+			if os.path.exists(tmp_path):
+				os.remove(tmp_path)
+		st = os.stat(path)
+		self._remember(rel_path, [st.st_size, st.st_mtime_ns], chunks)
+
+	def has_chunk(self, digest):
+		return os.path.exists(self.chunks.chunk_path(digest))
+
+	def put_chunk(self, digest, stored):
+		'''
+		add a chunk to the store as its stored (compressed) bytes
+		'''
+		path = self.chunks.chunk_path(digest)
+		self.makedirs(os.path.dirname(path))
+		tmp_path = '%s_tmp%d_%d' % (path, os.getpid(), threading.get_ident())
+		with open(tmp_path, 'wb') as f:
+			f.write(stored)
+		os.rename(tmp_path, path)
+
+	def symlink(self, rel_path, link):
+		path = self.path(rel_path)
+		self.makedirs(os.path.dirname(rel_path))
+		if os.path.lexists(path):
+			os.remove(path)
+		os.symlink(link, path)
+
+	def start_folder(self, rel_path):
+		'''
+		return the temporary folder a new folder is written in, emptied
+		'''
+		incoming = rel_path + INCOMING_SUFFIX
+		shutil.rmtree(self.path(incoming), ignore_errors=True)
+		self.makedirs(incoming)
+		return incoming
+
+	def finish_folder(self, incoming, rel_path):
+		'''
+		rename a folder written with start_folder into place, and move the signatures of its files along
+		'''
+		for name in os.listdir(self.path(incoming)):
+			source = self._signature_file(os.path.join(incoming, name))
+			if os.path.exists(source):
+				os.rename(source, self._signature_file(os.path.join(rel_path, name)))
+		os.rename(self.path(incoming), self.path(rel_path))
+
+
+class Replicator:
+	'''
+	Sends the publishes of a project that a site doesn't have yet.
+	'''
+
+	def __init__(self, source_dir, site, workers=DEFAULT_WORKERS, limit=None, rewrite=True):
+		'''
+		source_dir -- the folder of the project to copy from
+		site -- the receiving end, e.g. a LocalSite
+		workers -- number of elements sent at once
+		limit -- (optional) the bandwidth cap in bytes per second
+		rewrite -- change the source project folder to the target's in the metadata
+		'''
+		from pipe.pipeHandlers.storage import Storage
+		self._env = Environment(os.path.abspath(source_dir))
+		self._storage = Storage(self._env)
+		self.source_dir = self._env.get_project_dir()
+		self.site = site
+		self.workers = workers
+		self.throttle = Throttle(limit)
+		self.rewrite = rewrite and os.path.normpath(site.project_dir) != os.path.normpath(self.source_dir)
+		self.chunks = chunk_store.ChunkStore(self._env)
+		self._production = self._rel(self._env.get_production_dir())
+		site.set_production_dir(self._production)
+		if not site.exists(Environment.PIPELINE_FILENAME):
+			# a new site gets the project file and its folders, like the ones users work in
+			self._send_metadata(Environment.PIPELINE_FILENAME)
+			for folder in (self._env.get_assets_dir(), self._env.get_shots_dir(), self._env.get_layouts_dir(),
+					self._env.get_sequences_dir(), self._env.get_tools_dir(), self._env.get_users_dir()):
+				site.makedirs(self._rel(folder))
+
+	def _rel(self, path):
+		return os.path.relpath(os.path.normpath(path), self.source_dir)
+
+	def _source(self, rel_path):
+		return os.path.join(self.source_dir, rel_path)
+
+	def _stamp(self, rel_path):
+		st = os.stat(self._source(rel_path))
+		return [st.st_mtime_ns, st.st_size]
+
+	def _send_metadata(self, rel_path):
+		datadict = pipeline_io.readfile(self._source(rel_path))
+		if self.rewrite:
+			datadict = rewrite_paths(datadict, self.source_dir, self.site.project_dir)
+		self.site.write_json(rel_path, datadict)
+
+	def changes(self):
+		'''
+		return (changed elements, changed .body files, changed name lists, state) by what the
+		last run saw, as relative paths. The state holds the stamps of everything.
+		'''
+		from pipe.pipeHandlers.doctor import LIST_FILES
+		seen = self.site.read_state().get('files', {})
+		state = {}
+		elements, bodies, lists = [], [], []
+
+		def check(rel_path, changed):
+			try:
+				stamp = self._stamp(rel_path)
+			except OSError:
+				return
+			state[rel_path] = stamp
+			if seen.get(rel_path) != stamp:
+				changed.append(rel_path)
+
+		for kind, name, body_dir in self._storage.list_bodies():
+			check(self._rel(os.path.join(body_dir, BODY_FILENAME)), bodies)
+			for element_dir in self._storage.list_elements(body_dir):
+				check(self._rel(os.path.join(element_dir, ELEMENT_FILENAME)), elements)
+		for kind, root in self._storage.roots.items():
+			if kind in LIST_FILES:
+				check(self._rel(os.path.join(root, LIST_FILES[kind])), lists)
+		elements = [os.path.dirname(rel_path) for rel_path in elements]
+		return elements, bodies, lists, {'source': self.source_dir, 'files': state}
+
+	def new_versions(self, element):
+		'''
+		return the versions of an element (a relative path) the site doesn't have
+		'''
+		datadict = pipeline_io.readfile(self._source(os.path.join(element, ELEMENT_FILENAME)))
+		target = self.site.read_json(os.path.join(element, ELEMENT_FILENAME)) or {}
+		have = len(target.get('publishes', []))
+		versions = []
+		for version in range(have, len(datadict.get('publishes', []))):
+			rel_path = os.path.join(element, '.v%04d' % version)
+			if os.path.isdir(self._source(rel_path)) and not self.site.exists(rel_path):
+				versions.append(version)
+		return versions
+
+	def run(self, dry_run=False):
+		'''
+		send what changed and return (new versions sent, bytes sent)
+		'''
+		elements, bodies, lists, state = self.changes()
+		sent = self.throttle.sent
+		if dry_run:
+			return [(element, version) for element in elements for version in self.new_versions(element)], 0
+		with ThreadPoolExecutor(max_workers=self.workers) as pool:
+			versions = [version for done in pool.map(self._send_element, elements) for version in done]
+		# the bodies and lists only name what's complete on the site now
+		for rel_path in bodies:
+			self._send_metadata(rel_path)
+		for rel_path in lists:
+			self._send_file(rel_path, rel_path)
+		self.site.write_state(state)
+		return versions, self.throttle.sent - sent
+
+	def _send_element(self, element):
+		'''
+		send the new versions, main files and cache of an element, then its .element
+		'''
+		done = []
+		for version in self.new_versions(element):
+			self._send_version(element, version)
+			done.append((element, version))
+		source_dir = self._source(element)
+		for entry in os.scandir(source_dir):
+			if entry.name.startswith('.'):
+				continue # the .element goes last, and the version folders are sent above
+			rel_path = os.path.join(element, entry.name)
+			if entry.is_symlink():
+				self._send_link(rel_path)
+			elif entry.is_file() and not self._same(rel_path):
+				self._send_file(rel_path, rel_path)
+			elif entry.name == 'cache':
+				self._send_tree(rel_path)
+		self._send_metadata(os.path.join(element, ELEMENT_FILENAME))
+		return done
+
+	def _send_version(self, element, version):
+		rel_path = os.path.join(element, '.v%04d' % version)
+		previous = os.path.join(element, '.v%04d' % (version - 1))
+		incoming = self.site.start_folder(rel_path)
+		bases = []
+		for name in os.listdir(self._source(rel_path)):
+			if name == chunk_store.MANIFEST_FILENAME:
+				self._send_chunks(self._source(rel_path))
+			# the previous version's file of the same name, or its only file
+			basis = None
+			if not name.startswith('.') and self.site.exists(previous):
+				if chunk_store.is_chunked(self.site.path(previous)):
+					basis = previous
+				else:
+					files = [other for other in self.site.listdir(previous) if not other.startswith('.')]
+					if name in files:
+						basis = os.path.join(previous, name)
+					elif len(files) == 1:
+						basis = os.path.join(previous, files[0])
+			self._send_file(os.path.join(rel_path, name), os.path.join(incoming, name), basis)
+			bases.append(basis)
+		self.site.finish_folder(incoming, rel_path)
+		for basis in bases:
+			if basis is not None and basis != previous:
+				self.site.forget(basis)
+
+	def _send_chunks(self, version_dir):
+		'''
+		send the chunks of a chunked version folder that the site's store doesn't have
+		'''
+		for entry in chunk_store.read_manifest(version_dir).values():
+			for digest, size in entry['chunks']:
+				if self.site.has_chunk(digest):
+					continue
+				with open(self.chunks.chunk_path(digest), 'rb') as f:
+					stored = f.read()
+				self.throttle.consume(len(stored))
+				self.site.put_chunk(digest, stored)
+
+	def _send_file(self, rel_path, target_path, basis=None):
+		'''
+		send a file as a delta against basis, or against the site's copy of it if it has one
+		'''
+		if basis is None and self.site.exists(target_path):
+			basis = target_path
+		signature = self.site.signature(basis) if basis is not None else set()
+		data = None
+		if self.rewrite and rel_path.lower().endswith(LAYER_EXTENSIONS):
+			with open(self._source(rel_path), 'r') as f:
+				data = rewrite_layer(f.read(), self.source_dir, self.site.project_dir).encode('utf-8')
+		self.site.apply_delta(target_path, basis, delta(self._source(rel_path), signature, self.throttle, data))
+
+	def _send_link(self, rel_path):
+		link = os.readlink(self._source(rel_path))
+		if self.rewrite:
+			link = rewrite_paths(link, self.source_dir, self.site.project_dir)
+		self.site.symlink(rel_path, link)
+
+	def _send_tree(self, rel_path):
+		'''
+		send the files of a folder that changed since they were last sent
+		'''
+		for folder, dirnames, filenames in os.walk(self._source(rel_path)):
+			for name in dirnames + filenames:
+				source_path = os.path.join(folder, name)
+				file_path = self._rel(source_path)
+				if os.path.islink(source_path):
+					self._send_link(file_path)
+				elif name in filenames and not self._same(file_path):
+					self._send_file(file_path, file_path)
+
+	def _same(self, rel_path):
+		try:
+			source, target = os.stat(self._source(rel_path)), os.stat(self.site.path(rel_path))
+		except OSError:
+			return False
+		return source.st_size == target.st_size and source.st_mtime_ns <= target.st_mtime_ns
+
+
+def main(argv=None):
+	import argparse # only the command line needs it
+
+	parser = argparse.ArgumentParser(description='Copy the new publishes of a project to another project folder.')
+	parser.add_argument('source', help='the project folder to copy from')
+	parser.add_argument('target', help='the project folder to copy to')
+	parser.add_argument('--workers', '-w', type=int, default=DEFAULT_WORKERS, help='elements sent at once (default %d)' % DEFAULT_WORKERS)
+	parser.add_argument('--limit', type=float, help='bandwidth cap in MB per second')
+	parser.add_argument('--dry-run', '-n', action='store_true', help='only list the versions that would be sent')
+	parser.add_argument('--keep-paths', action='store_true', help="don't change the source folder to the target's in the metadata")
+	parser.add_argument('--interval', type=float, help='keep running, replicating every INTERVAL seconds')
+	args = parser.parse_args(argv)
+
+	limit = args.limit * 1024 ** 2 if args.limit else None
+	replicator = Replicator(args.source, LocalSite(args.target), args.workers, limit, not args.keep_paths)
+	while True:
+		start = time.time()
+		versions, sent = replicator.run(args.dry_run)
+		for element, version in versions:
+			print('%s %s v%04d' % ('would send' if args.dry_run else 'sent', element, version))
+		if not args.dry_run:
+			print('%d versions, %.1f MB sent in %.1f s' % (len(versions), sent / 1024.0 ** 2, time.time() - start))
+		if not args.interval:
+			return 0
+		time.sleep(args.interval)
+
+if __name__ == '__main__':
+	sys.exit(main())
@@ -0,0 +1,285 @@
+import os
+import re
+from collections import namedtuple
+
+from pipe.pipeHandlers.environment import Environment
+from pipe.pipeHandlers import pipeline_io
+
+'''
+resolver module
+
+Resolves pipe URIs to published files without building Body and Element objects.
+Supported forms:
+	pipe://asset/<name>/<department>/latest
+	pipe://asset/<name>/<department>@v12
+	pipe://shot/<name>/animation/<asset>/latest
+The version may be given as a trailing path component (latest, v12) or with @
+(@latest, @v12). If it is left off, the latest publish is used.
+'''
+
+SCHEME = 'pipe://'
+LATEST = 'latest'
+
+ASSET = 'asset'
+SHOT = 'shot'
+LAYOUT = 'layout'
+SEQUENCE = 'sequence'
+TOOL = 'tool'
+KINDS = [ASSET, SHOT, LAYOUT, SEQUENCE, TOOL]
+
+ELEMENT_FILENAME = '.element'
+COMPACTED_FILENAME = '.compacted'
+CHUNKED_FILENAME = '.chunked'
+NAME = 'name'
+LATEST_VERSION = 'latest_version'
+PUBLISHES = 'publishes'
+
+_VERSION_TOKEN = re.compile(r'^(?:latest|v?\d+)$')
+# an asset path in a usda layer, @/a/file.usda@ or @pipe://...@. asset paths are delimited
+# by @, so a uri's own @version has to be matched explicitly
+USDA_ASSET_PATH = re.compile(r'@(pipe://[^@\s]+(?:@(?:latest|v?\d+))?|[^@\n]+)@')
+
+PipeURI = namedtuple('PipeURI', ['kind', 'name', 'element', 'version'])
+
+def asset_uri(name, department, version=None):
+	'''
+	build a pipe URI for an asset element. version is an int, or None for the latest publish.
+	'''
+	return _build_uri(ASSET, name, department, version)
+
+def shot_uri(name, department, version=None):
+	'''
+	build a pipe URI for a shot element. department may include a sub element,
+	e.g. os.path.join(Asset.ANIMATION, asset_name)
+	'''
+	return _build_uri(SHOT, name, department, version)
+
+def _build_uri(kind, name, element, version):
+	if version is None:
+		return SCHEME + kind + '/' + name + '/' + element + '/' + LATEST
+	return SCHEME + kind + '/' + name + '/' + element + '@v' + str(int(version))
+
+def _parse_version(token):
+	if token == LATEST:
+		return None
+	return int(token.lstrip('v'))
+
+def parse(uri):
+	'''
+	split a pipe URI into a PipeURI tuple: (kind, name, element, version).
+	version is None for the latest publish. Raises ValueError for malformed URIs.
+	'''
+	if not uri.startswith(SCHEME):
+		raise ValueError('not a pipe uri: ' + uri)
+
+	rest = uri[len(SCHEME):].strip('/')
+	version = None
+	if '@' in rest:
+		rest, token = rest.rsplit('@', 1)
+		if not _VERSION_TOKEN.match(token):
+			raise ValueError('invalid version in pipe uri: ' + uri)
+		version = _parse_version(token)
+
+	parts = [part for part in rest.split('/') if part]
+	if len(parts) > 3 and _VERSION_TOKEN.match(parts[-1]):
+		version = _parse_version(parts.pop())
+
+	if len(parts) < 3 or parts[0] not in KINDS:
+		raise ValueError('invalid pipe uri: ' + uri)
+
+	return PipeURI(parts[0], parts[1], '/'.join(parts[2:]), version)
+
+
+class Resolver:
+	'''
+	Resolves pipe URIs through the cached .element metadata.
+	'''
+
+	def __init__(self, env=None):
+		'''
+		env -- (optional) the Environment to resolve against. Defaults to the current project,
+			which is resolved through the metadata daemon when one is running.
+		'''
+		self._use_daemon = env is None
+		self._env = env if env is not None else Environment()
+		self._roots = {}
+
+	def _ask_daemon(self, ops, strict=True):
+		# None when there is no daemon to ask
+		if not self._use_daemon:
+			return None
+		from pipe.pipeHandlers import metadata_daemon # keeps resolver quick to import
+		return metadata_daemon.query(ops, strict)
+
+	def get_root(self, kind):
+		'''
+		return the directory bodies of the given kind (asset, shot, ...) are stored in
+		'''
+		root = self._roots.get(kind)
+		if root is None:
+			if kind == ASSET:
+				root = self._env.get_assets_dir()
+			elif kind == SHOT:
+				root = self._env.get_shots_dir()
+			elif kind == LAYOUT:
+				root = self._env.get_layouts_dir()
+			elif kind == SEQUENCE:
+				root = self._env.get_sequences_dir()
+			else:
+				root = self._env.get_tools_dir()
+			self._roots[kind] = root
+		return root
+
+	def element_dir(self, uri):
+		'''
+		return the directory of the element the given uri points at. The directory may not exist.
+		'''
+		parsed = uri if isinstance(uri, PipeURI) else parse(uri)
+		return os.path.join(self.get_root(parsed.kind), parsed.name, parsed.element)
+
+	def _read_element(self, element_dir):
+		pipeline_file = os.path.join(element_dir, ELEMENT_FILENAME)
+		try:
+			return pipeline_io.readfile_cached(pipeline_file)
+		except (IOError, OSError):
+			raise EnvironmentError('no such element: ' + pipeline_file + ' does not exist')
+
+	def _publish_path(self, element_dir, datadict, version):
+		latest_version = datadict[LATEST_VERSION]
+		if latest_version < 0:
+			return None
+		if version is None:
+			return datadict[PUBLISHES][latest_version][3]
+		if version < 0 or version > latest_version:
+			raise EnvironmentError('no such version: v%04d of ' % version + element_dir)
+		if version in pipeline_io.read_retired(element_dir):
+			raise EnvironmentError('v%04d of ' % version + element_dir + ' has been retired')
+
+		# the version folder holds <asset_name><ext>, while the publish records
+		# the main file <asset_name>_<element name><ext>
+		version_dir = os.path.join(element_dir, '.v%04d' % version)
+		# packed files are rebuilt in place, without tagging the version to be kept: a uri is
+		# resolved again whenever it's loaded, so the version may be packed again
+		if os.path.exists(os.path.join(version_dir, CHUNKED_FILENAME)):
+			from pipe.pipeHandlers import chunk_store
+			chunk_store.restore_version(version_dir)
+		if os.path.exists(os.path.join(version_dir, COMPACTED_FILENAME)):
+			from pipe.pipeHandlers import compactor
+			compactor.restore_version(version_dir)
+		base, ext = os.path.splitext(os.path.basename(datadict[PUBLISHES][version][3]))
+		suffix = '_' + datadict[NAME]
+		if base.endswith(suffix):
+			base = base[:-len(suffix)]
+		version_path = os.path.join(version_dir, base + ext)
+		if os.path.exists(version_path):
+			return version_path
+
+		files = [name for name in os.listdir(version_dir) if not name.startswith('.')]
+		if len(files) == 1:
+			return os.path.join(version_dir, files[0])
+		raise EnvironmentError('could not find the published file in ' + version_dir)
+
+	def resolve(self, uri):
+		'''
+		return the published filepath for the given uri, or None if the element has no publishes.
+		Raises EnvironmentError if the element or version doesn't exist.
+		'''
+		parsed = parse(uri)
+		answers = self._ask_daemon([['resolve', uri]])
+		if answers is not None:
+			return answers[0]
+		element_dir = self.element_dir(parsed)
+		return self._publish_path(element_dir, self._read_element(element_dir), parsed.version)
+
+	def resolve_local(self, uri):
+		'''
+		like resolve, but return the workstation's local copy of the published file (see
+		local_cache). Without a local cache, or for files it doesn't keep, this is resolve().
+		'''
+		from pipe.pipeHandlers import local_cache # keeps resolver quick to import
+		return local_cache.localize(self.resolve(uri))
+
+	def resolve_many(self, uris, strict=True):
+		'''
+		resolve a list of uris in one pass and return the paths in the same order.
+		Each .element file is read at most once, however many uris point at it.
+		strict -- if False, uris that can't be resolved give None instead of raising EnvironmentError
+		'''
+		parsed_uris = [parse(uri) for uri in uris]
+		answers = self._ask_daemon([['resolve', uri] for uri in uris], strict)
+		if answers is not None:
+			return answers
+		elements = {}
+		paths = []
+		for parsed in parsed_uris:
+			element_dir = self.element_dir(parsed)
+			if element_dir not in elements:
+				try:
+					elements[element_dir] = self._read_element(element_dir)
+				except EnvironmentError:
+					if strict:
+						raise
+					elements[element_dir] = None
+
+			datadict = elements[element_dir]
+			if datadict is None:
+				paths.append(None)
+				continue
+			try:
+				paths.append(self._publish_path(element_dir, datadict, parsed.version))
+			except EnvironmentError:
+				if strict:
+					raise
+				paths.append(None)
+		return paths
+
+	def usda_reference(self, uri, prim_path=None):
+		'''
+		return the resolved uri as a usda asset reference, e.g. @/path/to/file.usda@</prim>
+		'''
+		path = self.resolve(uri)
+		if path is None:
+			raise EnvironmentError('nothing has been published for ' + uri)
+		return _format_reference(path, prim_path)
+
+	def usda_references(self, uris, prim_paths=None):
+		'''
+		resolve the uris in one batch and return a usda references list, e.g.
+		prepend references = [@/a.usda@, @/b.usda@</prim>]
+		prim_paths -- (optional) list of prim paths matching uris. entries may be None.
+		'''
+		paths = self.resolve_many(uris)
+		if prim_paths is None:
+			prim_paths = [None] * len(paths)
+
+		references = []
+		for uri, path, prim_path in zip(uris, paths, prim_paths):
+			if path is None:
+				raise EnvironmentError('nothing has been published for ' + uri)
+			references.append(_format_reference(path, prim_path))
+		return 'prepend references = [' + ', '.join(references) + ']'
+
+	def resolve_usda(self, text):
+		'''
+		replace every @pipe://...@ asset path in the given usda text with its resolved
+		filepath. All uris in the layer are resolved in one batch.
+		'''
+		uris = sorted(set(path for path in USDA_ASSET_PATH.findall(text) if path.startswith(SCHEME)))
+		if not uris:
+			return text
+		resolved = dict(zip(uris, self.resolve_many(uris)))
+		for uri, path in resolved.items():
+			if path is None:
+				raise EnvironmentError('nothing has been published for ' + uri)
+
+		def replace(match):
+			path = resolved.get(match.group(1))
+			return match.group(0) if path is None else '@' + path + '@'
+
+		return USDA_ASSET_PATH.sub(replace, text)
+
+def _format_reference(path, prim_path=None):
+	reference = '@' + path + '@'
+	if prim_path:
+		reference += '<' + prim_path + '>'
+	return reference
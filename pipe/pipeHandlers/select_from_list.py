@@ -5,31 +5,147 @@ try:
 except ImportError:
     from PySide2 import QtWidgets, QtGui, QtCore
 
-from pipe.pipeHandlers.project import Project
+from pipe.pipeHandlers.list_search import SearchIndex
 import os
 
 def select_from_list(list, parent):  # TODO: finish this.
     window = QtWidgets.QWidget()
     pass
 
-class ItemList(QtWidgets.QListWidget):
-    all_items = []
-    shown_items = []
+class ItemListModel(QtCore.QAbstractListModel):
+    '''
+    Holds every item of the list. Filtering is done by SearchProxyModel on top of it.
+    '''
 
-    def __init__(self, l=[], multiple_selection=False):
-        QtWidgets.QListWidget.__init__(self)
+    def __init__(self, l=[], parent=None):
+        super(ItemListModel, self).__init__(parent)
+        self._items = list(l)
+
+    def items(self):
+        return self._items
+
+    def set_items(self, l):
+        self.beginResetModel()
+        self._items = list(l)
+        self.endResetModel()
 
-        # Create the list widget
-        self.shown_items = l
-        self.all_items = l
+    def rowCount(self, parent=QtCore.QModelIndex()):
+        if parent.isValid():
+            return 0
+        return len(self._items)
+
+    def data(self, index, role=QtCore.Qt.DisplayRole):
+        if not index.isValid() or role != QtCore.Qt.DisplayRole:
+            return None
+        return self._items[index.row()]
+
+
+class SearchProxyModel(QtCore.QAbstractProxyModel):
+    '''
+    Shows the rows of an ItemListModel that match the current search. Matching is done
+    by a SearchIndex, so typing doesn't call back into python once per row.
+    '''
+
+    def __init__(self, parent=None):
+        super(SearchProxyModel, self).__init__(parent)
+        self._search = SearchIndex()
+        self._rows = []
+        self._proxy_rows = None
+        self._query = ""
+        self._case_sensitive = False
+        self._fuzzy = False
+
+    def setSourceModel(self, model):
+        super(SearchProxyModel, self).setSourceModel(model)
+        model.modelReset.connect(self._reload)
+        self._reload()
+
+    def _reload(self):
+        self.beginResetModel()
+        self._search = SearchIndex(self.sourceModel().items())
+        self._rows = self._search.search(self._query, self._case_sensitive, self._fuzzy)
+        self._proxy_rows = None
+        self.endResetModel()
+
+    def set_filter(self, query, case_sensitive=False, fuzzy=False):
+        self.beginResetModel()
+        self._query = query
+        self._case_sensitive = case_sensitive
+        self._fuzzy = fuzzy
+        self._rows = self._search.search(query, case_sensitive, fuzzy)
+        self._proxy_rows = None
+        self.endResetModel()
+
+    def shown_items(self):
+        items = self._search.items
+        return [items[row] for row in self._rows]
+
+    def index(self, row, column=0, parent=QtCore.QModelIndex()):
+        if parent.isValid() or column != 0 or row < 0 or row >= len(self._rows):
+            return QtCore.QModelIndex()
+        return self.createIndex(row, column)
+
+    def parent(self, index=None):
+        return QtCore.QModelIndex()
+
+    def rowCount(self, parent=QtCore.QModelIndex()):
+        if parent.isValid():
+            return 0
+        return len(self._rows)
+
+    def columnCount(self, parent=QtCore.QModelIndex()):
+        if parent.isValid():
+            return 0
+        return 1
+
+    def mapToSource(self, proxy_index):
+        if not proxy_index.isValid():
+            return QtCore.QModelIndex()
+        return self.sourceModel().index(self._rows[proxy_index.row()], 0)
+
+    def mapFromSource(self, source_index):
+        if not source_index.isValid():
+            return QtCore.QModelIndex()
+        if self._proxy_rows is None:
+            self._proxy_rows = dict((source_row, row) for row, source_row in enumerate(self._rows))
+        row = self._proxy_rows.get(source_index.row())
+        if row is None:
+            return QtCore.QModelIndex()
+        return self.createIndex(row, 0)
+
+
+class ItemList(QtWidgets.QListView):
+
+    def __init__(self, l=[], multiple_selection=False):
+        QtWidgets.QListView.__init__(self)
+
+        # Create the list view over a filterable model
+        self.source_model = ItemListModel(l, self)
+        self.proxy_model = SearchProxyModel(self)
+        self.proxy_model.setSourceModel(self.source_model)
+        self.setModel(self.proxy_model)
+        self.setUniformItemSizes(True)
+        self.setEditTriggers(QtWidgets.QAbstractItemView.NoEditTriggers)
         self.setSizePolicy(QtWidgets.QSizePolicy.MinimumExpanding, QtWidgets.QSizePolicy.Expanding)
         if multiple_selection:
             self.setSelectionMode(QtWidgets.QAbstractItemView.MultiSelection)
 
+    @property
+    def all_items(self):
+        return self.source_model.items()
+
+    @property
+    def shown_items(self):
+        return self.proxy_model.shown_items()
+
     def set_list(self, l):
-        self.clear()
-        for item in l:
-            self.addItem(item)
+        self.source_model.set_items(l)
+
+    def set_filter(self, text, case_sensitive=False, fuzzy=False):
+        self.proxy_model.set_filter(text, case_sensitive, fuzzy)
+
+    def selected_values(self):
+        return [index.data() for index in self.selectionModel().selectedIndexes()]
 
 
 class SelectFromList(QtWidgets.QDialog):
@@ -40,7 +156,7 @@ class SelectFromList(QtWidgets.QDialog):
     '''
     submitted = QtCore.Signal(list)
 
-    def __init__(self, parent=None, title="Select", l=[], multiple_selection=False, width=600, height=600):
+    def __init__(self, parent=None, title="Select", l=[], multiple_selection=False, width=600, height=600, fuzzy=False):
         super(SelectFromList, self).__init__(parent)
         if parent:
             self.parent = parent
@@ -48,6 +164,7 @@ class SelectFromList(QtWidgets.QDialog):
         self.values = []
         self.multiple_selection = multiple_selection
         self.case_sensitive = False
+        self.fuzzy = fuzzy
 
         self.setWindowTitle(title)
         self.setObjectName('SelectFromList')
@@ -83,11 +200,9 @@ class SelectFromList(QtWidgets.QDialog):
 
     def initializeListWidget(self):
         self.listWidget = ItemList(self.list, self.multiple_selection)
-        self.listWidget.itemSelectionChanged.connect(self.select)
-        self.listWidget.itemDoubleClicked.connect(self.double_clicked)
+        self.listWidget.selectionModel().selectionChanged.connect(self.select)
+        self.listWidget.doubleClicked.connect(self.double_clicked)
         self.vbox.addWidget(self.listWidget)
-        self.listWidget.shown_items = self.list
-        self.listWidget.set_list(self.listWidget.shown_items)
 
     def initializeSubmitButton(self):
         # Create the button widget
@@ -107,12 +222,9 @@ class SelectFromList(QtWidgets.QDialog):
             self.button.setAutoDefault(True)
             self.button.setEnabled(True)
 
-    def select(self):
+    def select(self, *args):
         # print "selected items: {0}".format(self.listWidget.selectedItems())
-        if len(self.listWidget.selectedItems()) == 0:
-            self.set_values([])
-        else:
-            self.set_values([x.text() for x in self.listWidget.selectedItems()])
+        self.set_values(self.listWidget.selected_values())
 
     def checked(self):
         checked = self.checkBox.checkState()
@@ -131,16 +243,8 @@ class SelectFromList(QtWidgets.QDialog):
     Update the shown list items when a user types in the search bar
     '''
     def textEdited(self, newText):
-        self.listWidget.shown_items = []
-        for item in self.listWidget.all_items:
-            if self.case_sensitive:
-                if newText in item:
-                    self.listWidget.shown_items.append(item)
-            else:
-                if newText.lower() in item.lower():
-                    self.listWidget.shown_items.append(item)
-        self.listWidget.set_list(self.listWidget.shown_items)
-        self.set_values([x.text() for x in self.listWidget.selectedItems()])
+        self.listWidget.set_filter(newText, self.case_sensitive, self.fuzzy)
+        self.set_values(self.listWidget.selected_values())
 
     '''
     Get the current state of the loading indicator gif as an icon
@@ -155,6 +259,7 @@ class SelectFromList(QtWidgets.QDialog):
     '''
     def submit(self):
         self.button.setText("Loading...")
+        from pipe.pipeHandlers.project import Project # not needed until a list is submitted
         icon_path = os.path.join(Project().get_project_dir(), "icons", "loading_indicator_transparent.gif")
         self.movie = QtGui.QMovie(icon_path)
         self.movie.frameChanged.connect(self.setButtonIcon)
@@ -182,6 +287,8 @@ class SelectFromMultipleLists(SelectFromList):
         self.setWindowTitle(title)
         self.lists = lists
         self.multiple_selection = multiple_selection
+        self.case_sensitive = False
+        self.fuzzy = False
 
         self.labels = sorted([x for x in lists])
         self.initializeVBox()
@@ -216,9 +323,6 @@ class SelectFromMultipleLists(SelectFromList):
             return
         newList = self.lists[newLabel]
         self.currLabel = newLabel
-        self.listWidget.all_items = newList
-        self.listWidget.shown_items = newList
-        print("newList: {0}".format(newList))
         self.listWidget.set_list(newList)
         if not init and self.multiple_selection:
             self.textEdited(self.searchBox.text())
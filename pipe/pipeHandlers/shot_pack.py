@@ -0,0 +1,532 @@
+import glob
+import hashlib
+import json
+import os
+import queue
+import sys
+import tarfile
+import threading
+import time
+import zipfile
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from pipe.pipeHandlers.environment import Environment
+from pipe.pipeHandlers.body import Asset
+from pipe.pipeHandlers import local_cache
+from pipe.pipeHandlers import pipeline_io
+from pipe.pipeHandlers import resolver
+
+'''
+shot pack module
+
+Packs everything a shot needs to render into one tar or zip file, for a farm outside
+the studio, and unpacks and checks it on the other end.
+
+The files are the ones BuildShot puts together, followed through their references:
+	- the latest publish of every element of the shot (camera, animation, ...)
+	- the current .usda files of the shot's layout element
+	- the latest lights and fx hdas of the shot's sequence
+	- every asset path in a .usda file reached so far, pipe:// uris included, which
+	  brings in the asset layers and their textures
+	- the latest materials publish of every asset reached
+Files are stored under their path in the project. Absolute paths into the project and
+pipe:// uris inside .usda files are rewritten relative to the layer, so the unpacked
+folder works anywhere. The archive ends with MANIFEST.json, which lists the sha256 of
+every file as packed, the file it came from and what couldn't be found.
+
+Nothing is staged on disk. A pool of threads reads (and hashes) the next files while
+the archive is written, each a few blocks ahead, so packing runs at the speed of the
+disks rather than one file at a time. The archive can be written to stdout.
+
+python -m pipe.pipeHandlers.shot_pack pack SHOT OUTPUT.tar|.tar.gz|.zip|- [--workers 8]
+python -m pipe.pipeHandlers.shot_pack unpack ARCHIVE FOLDER
+python -m pipe.pipeHandlers.shot_pack verify ARCHIVE|FOLDER
+'''
+
+MANIFEST_NAME = 'MANIFEST.json'
+TEXT_LAYER_EXTENSIONS = ('.usda',)
+# the departments of the sequence and of the referenced assets that are packed
+SEQUENCE_DEPARTMENTS = [Asset.LIGHTS, Asset.HDA]
+ASSET_DEPARTMENTS = [Asset.MATERIALS]
+
+BLOCK_SIZE = 4 * 1024 * 1024
+# blocks a reader gets ahead of the writer, per file
+QUEUE_BLOCKS = 4
+DEFAULT_WORKERS = 8
+
+UDIM_TOKEN = '<UDIM>'
+
+class _Stopped(Exception):
+	pass
+
+def hash_file(path):
+	digest = hashlib.sha256()
+	with open(path, 'rb') as f:
+		for block in iter(lambda: f.read(BLOCK_SIZE), b''):
+			digest.update(block)
+	return digest.hexdigest()
+
+def _published_path(path):
+	'''
+	return the published file a local cache copy was made from, or the path itself
+	'''
+	return os.path.normpath(local_cache.source_path(path))
+
+
+class ShotPacker:
+	'''
+	Finds the files a shot depends on and streams them into an archive.
+	'''
+
+	def __init__(self, shot_name, env=None, workers=DEFAULT_WORKERS):
+		'''
+		shot_name -- the shot to pack
+		env -- (optional) the Environment of the project. Defaults to the current project.
+		workers -- number of files read at once
+		'''
+		self._env = env if env is not None else Environment()
+		self._resolver = resolver.Resolver(self._env)
+		self.shot_name = shot_name
+		self.workers = workers
+		self.project_dir = os.path.normpath(self._env.get_project_dir())
+		self.files = {} # published path -> archive name
+		self.links = {} # text layer -> {asset path in it: published path}
+		self.missing = []
+		self.external = []
+		self._stop = threading.Event()
+
+	def _arcname(self, path):
+		if path.startswith(self.project_dir + os.sep):
+			return os.path.relpath(path, self.project_dir).replace(os.sep, '/')
+		return None
+
+	def _seeds(self):
+		shot_dir = os.path.join(self._env.get_shots_dir(), self.shot_name)
+		if not os.path.isdir(shot_dir):
+			raise EnvironmentError('no such shot ' + self.shot_name)
+		seeds = local_cache.latest_publishes(shot_dir)
+		layout_dir = os.path.join(shot_dir, Asset.LAYOUT)
+		if os.path.isdir(layout_dir):
+			seeds += [os.path.join(layout_dir, name) for name in sorted(os.listdir(layout_dir)) if name.endswith(TEXT_LAYER_EXTENSIONS)]
+		sequence_dir = os.path.join(self._env.get_sequences_dir(), self.shot_name[:1])
+		for department in SEQUENCE_DEPARTMENTS:
+			seeds += local_cache.latest_publishes(os.path.join(sequence_dir, department))
+		return seeds
+
+	def closure(self):
+		'''
+		find the files of the shot and return {published path: archive name}. Paths that
+		couldn't be found end up in missing, and ones outside the project in external.
+		'''
+		self.files, self.links, self.missing, self.external = {}, {}, [], []
+		assets_root = os.path.normpath(self._env.get_assets_dir())
+		assets = set()
+		pending = deque(self._seeds())
+		while pending:
+			path = _published_path(pending.popleft())
+			if path in self.files or path in self.missing or path in self.external:
+				continue
+			if not os.path.isfile(path):
+				self.missing.append(path)
+				continue
+			arcname = self._arcname(path)
+			if arcname is None:
+				self.external.append(path)
+				continue
+			self.files[path] = arcname
+			if path.startswith(assets_root + os.sep):
+				asset = path[len(assets_root) + 1:].split(os.sep, 1)[0]
+				if asset not in assets:
+					assets.add(asset)
+					for department in ASSET_DEPARTMENTS:
+						pending.extend(local_cache.latest_publishes(os.path.join(assets_root, asset, department)))
+			if path.endswith(TEXT_LAYER_EXTENSIONS):
+				self.links[path] = self._layer_links(path)
+				for target in self.links[path].values():
+					if UDIM_TOKEN in target:
+						pending.extend(sorted(glob.glob(glob.escape(target).replace(glob.escape(UDIM_TOKEN), '[1-9][0-9][0-9][0-9]'))))
+					else:
+						pending.append(target)
+		return self.files
+
+	def _layer_links(self, layer):
+		'''
+		return {asset path: the file it points at} for the asset paths of a text layer
+		'''
+		with open(layer, 'r') as f:
+			text = f.read()
+		links = {}
+		layer_dir = os.path.dirname(layer)
+		for asset_path in set(resolver.USDA_ASSET_PATH.findall(text)):
+			if asset_path.startswith(resolver.SCHEME):
+				try:
+					target = self._resolver.resolve(asset_path)
+				except (EnvironmentError, ValueError):
+					self.missing.append(asset_path)
+					continue
+			else:
+				target = os.path.join(layer_dir, asset_path)
+			links[asset_path] = os.path.normpath(target)
+		return links
+
+	def _layer_bytes(self, layer):
+		'''
+		return a text layer with the asset paths into the archive made relative to it
+		'''
+		with open(layer, 'r') as f:
+			text = f.read()
+		layer_dir = os.path.dirname(self.files[layer])
+		links = self.links.get(layer, {})
+
+		def relative(match):
+			target = links.get(match.group(1))
+			if target is None:
+				return match.group(0)
+			if UDIM_TOKEN in target:
+				arcname = self._arcname(target) # the tiles are packed next to each other
+			else:
+				arcname = self.files.get(_published_path(target))
+			if arcname is None:
+				return match.group(0)
+			path = os.path.relpath(arcname, layer_dir).replace(os.sep, '/')
+			return '@' + (path if path.startswith('..') else './' + path) + '@'
+
+		return resolver.USDA_ASSET_PATH.sub(relative, text).encode('utf-8')
+
+	def _put(self, blocks, item):
+		while True:
+			try:
+				return blocks.put(item, timeout=1)
+			except queue.Full:
+				if self._stop.is_set():
+					raise _Stopped()
+
+	def _read(self, path, blocks):
+		'''
+		put ('size', n), the blocks of a file and ('end', sha256) on a queue, in a pool thread
+		'''
+		if self._stop.is_set():
+			return
+		try:
+			digest = hashlib.sha256()
+			if path in self.links:
+				data = self._layer_bytes(path)
+				digest.update(data)
+				self._put(blocks, ('size', len(data), os.path.getmtime(path)))
+				self._put(blocks, data)
+			else:
+				with open(path, 'rb') as f:
+					st = os.fstat(f.fileno())
+					self._put(blocks, ('size', st.st_size, st.st_mtime))
+					left = st.st_size
+					while left:
+						block = f.read(min(BLOCK_SIZE, left))
+						if not block:
+							raise IOError(path + ' got shorter while it was packed')
+						digest.update(block)
+						self._put(blocks, block)
+						left -= len(block)
+			self._put(blocks, ('end', digest.hexdigest()))
+		except _Stopped:
+			pass
+		except Exception as e:
+			self._put(blocks, ('error', e))
+
+	def pack(self, output):
+		'''
+		write the archive to output, a file path ending in .tar, .tar.gz or .zip, or '-'
+		for a tar on stdout. Returns the manifest.
+		'''
+		if not self.files:
+			self.closure()
+		manifest = {}
+		manifest['shot'] = self.shot_name
+		manifest['project'] = self.project_dir
+		manifest['time'] = pipeline_io.timestamp()
+		manifest['files'] = {}
+		manifest['missing'] = sorted(set(self.missing))
+		manifest['external'] = sorted(set(self.external))
+
+		paths = iter(sorted(self.files, key=self.files.get))
+		reading = deque()
+		self._stop.clear()
+		with ThreadPoolExecutor(max_workers=self.workers) as pool:
+
+			def start(path):
+				blocks = queue.Queue(QUEUE_BLOCKS)
+				pool.submit(self._read, path, blocks)
+				reading.append((path, blocks))
+
+			try:
+				with _open_writer(output) as writer:
+					# the next files are read while one is written, in the order they are packed
+					for path in paths:
+						start(path)
+						if len(reading) == self.workers:
+							break
+					while reading:
+						path, blocks = reading.popleft()
+						next_path = next(paths, None)
+						if next_path is not None:
+							start(next_path)
+						manifest['files'][self.files[path]] = self._write(writer, path, blocks)
+					data = json.dumps(manifest, indent=1, sort_keys=True).encode('utf-8')
+					writer.add(MANIFEST_NAME, len(data), time.time(), [data])
+			finally:
+				self._stop.set() # frees readers still waiting on a full queue after an error
+		return manifest
+
+	def _write(self, writer, path, blocks):
+		header = blocks.get()
+		if header[0] == 'error':
+			raise header[1]
+		result = {}
+
+		def stream():
+			while True:
+				block = blocks.get()
+				if isinstance(block, tuple):
+					if block[0] == 'error':
+						raise block[1]
+					result['sha256'] = block[1]
+					return
+				yield block
+
+		writer.add(self.files[path], header[1], header[2], stream())
+		entry = {}
+		entry['size'] = header[1]
+		entry['sha256'] = result['sha256']
+		entry['source'] = path
+		return entry
+
+
+class _BlockReader:
+	'''
+	A file object over an iterator of blocks, for tarfile
+	'''
+
+	def __init__(self, blocks):
+		self._blocks = iter(blocks)
+		self._block = memoryview(b'')
+
+	def read(self, size=-1):
+		pieces = []
+		while size != 0:
+			if not self._block:
+				block = next(self._blocks, None)
+				if block is None:
+					break
+				self._block = memoryview(block)
+			piece = self._block if size < 0 else self._block[:size]
+			self._block = self._block[len(piece):]
+			pieces.append(piece)
+			size -= len(piece) if size > 0 else 0
+		return b''.join(pieces)
+
+	def drain(self):
+		for block in self._blocks:
+			pass
+
+
+class _TarWriter:
+
+	def __init__(self, fileobj, mode):
+		self._tar = tarfile.open(fileobj=fileobj, mode=mode)
+
+	def add(self, name, size, mtime, blocks):
+		info = tarfile.TarInfo(name)
+		info.size = size
+		info.mtime = int(mtime)
+		info.mode = 0o644
+		reader = _BlockReader(blocks)
+		self._tar.addfile(info, reader)
+		reader.drain() # lets the reader check the file's hash
+
+	def close(self):
+		self._tar.close()
+
+
+class _ZipWriter:
+
+	def __init__(self, fileobj):
+		self._zip = zipfile.ZipFile(fileobj, 'w', zipfile.ZIP_STORED, allowZip64=True)
+
+	def add(self, name, size, mtime, blocks):
+		info = zipfile.ZipInfo(name, time.localtime(mtime)[:6])
+		info.external_attr = 0o644 << 16
+		with self._zip.open(info, 'w', force_zip64=size >= zipfile.ZIP64_LIMIT) as f:
+			for block in blocks:
+				f.write(block)
+
+	def close(self):
+		self._zip.close()
+
+
+class _open_writer:
+	'''
+	opens the archive a pack is written to, by the name of the output
+	'''
+
+	def __init__(self, output):
+		self._output = output
+
+	def __enter__(self):
+		if self._output == '-':
+			self._file = None
+			fileobj = sys.stdout.buffer
+		else:
+			self._file = fileobj = open(self._output, 'wb')
+		if self._output.endswith('.zip'):
+			self._writer = _ZipWriter(fileobj)
+		else:
+			self._writer = _TarWriter(fileobj, 'w|gz' if self._output.endswith(('.tar.gz', '.tgz')) else 'w|')
+		return self._writer
+
+	def __exit__(self, error_type, error, traceback):
+		try:
+			self._writer.close()
+		finally:
+			if self._file is not None:
+				self._file.close()
+				if error_type is not None:
+					os.remove(self._output) # no half written archives
+
+def _members(archive):
+	'''
+	yield (name, file object) for the files of an archive, in the order they were packed
+	'''
+	if archive.endswith('.zip'):
+		with zipfile.ZipFile(archive) as zf:
+			for info in zf.infolist():
+				if not info.is_dir():
+					with zf.open(info) as f:
+						yield info.filename, f
+	else:
+		with tarfile.open(archive, 'r|*') as tar:
+			for member in tar:
+				if member.isfile():
+					yield member.name, tar.extractfile(member)
+
+def _safe_path(folder, name):
+	path = os.path.normpath(os.path.join(folder, name))
+	if os.path.isabs(name) or not path.startswith(os.path.normpath(folder) + os.sep):
+		raise IOError('refusing to unpack ' + name + ' outside of ' + folder)
+	return path
+
+def _check(manifest, digests):
+	'''
+	return the problems found comparing {name: sha256} with a manifest
+	'''
+	if manifest is None:
+		return ['there is no ' + MANIFEST_NAME]
+	problems = []
+	for name, entry in sorted(manifest['files'].items()):
+		if name not in digests:
+			problems.append('missing ' + name)
+		elif digests[name] != entry['sha256']:
+			problems.append('damaged ' + name)
+	for name in sorted(set(digests) - set(manifest['files'])):
+		problems.append('not in the manifest ' + name)
+	return problems
+
+def unpack(archive, folder):
+	'''
+	unpack an archive into folder, checking every file against the manifest. Returns the
+	problems found (an empty list if there are none).
+	'''
+	digests = {}
+	manifest = None
+	for name, f in _members(archive):
+		if name == MANIFEST_NAME:
+			manifest = json.loads(f.read().decode('utf-8'))
+			continue
+		path = _safe_path(folder, name)
+		if not os.path.isdir(os.path.dirname(path)):
+			os.makedirs(os.path.dirname(path))
+		digest = hashlib.sha256()
+		with open(path, 'wb') as target:
+			for block in iter(lambda: f.read(BLOCK_SIZE), b''):
+				digest.update(block)
+				target.write(block)
+		digests[name] = digest.hexdigest()
+	if manifest is not None:
+		if not os.path.isdir(folder):
+			os.makedirs(folder)
+		with open(os.path.join(folder, MANIFEST_NAME), 'w') as f:
+			json.dump(manifest, f, indent=1, sort_keys=True)
+	return _check(manifest, digests)
+
+def verify(path, workers=DEFAULT_WORKERS):
+	'''
+	check an archive, or a folder it was unpacked into, against its manifest. Returns the
+	problems found (an empty list if there are none).
+	'''
+	if not os.path.isdir(path):
+		digests = {}
+		manifest = None
+		for name, f in _members(path):
+			if name == MANIFEST_NAME:
+				manifest = json.loads(f.read().decode('utf-8'))
+				continue
+			digest = hashlib.sha256()
+			for block in iter(lambda: f.read(BLOCK_SIZE), b''):
+				digest.update(block)
+			digests[name] = digest.hexdigest()
+		return _check(manifest, digests)
+
+	try:
+		with open(os.path.join(path, MANIFEST_NAME)) as f:
+			manifest = json.load(f)
+	except (IOError, OSError, ValueError):
+		return _check(None, {})
+	names = [name for name in sorted(manifest['files']) if os.path.isfile(os.path.join(path, name))]
+	with ThreadPoolExecutor(max_workers=workers) as pool:
+		digests = dict(zip(names, pool.map(hash_file, [os.path.join(path, name) for name in names])))
+	return _check(manifest, digests)
+
+
+def main(argv=None):
+	import argparse # only the command line needs it
+
+	parser = argparse.ArgumentParser(description='Pack a shot and everything it uses for rendering elsewhere.')
+	subparsers = parser.add_subparsers(dest='command')
+	pack = subparsers.add_parser('pack', help='Write the archive of a shot.')
+	pack.add_argument('shot', help='the shot to pack')
+	pack.add_argument('output', help='the archive, .tar, .tar.gz or .zip, or - for a tar on stdout')
+	pack.add_argument('--workers', '-w', type=int, default=DEFAULT_WORKERS, help='files read at once (default %d)' % DEFAULT_WORKERS)
+	pack.add_argument('--list', action='store_true', help="only list the files that would be packed")
+	unpack_parser = subparsers.add_parser('unpack', help='Unpack an archive and check it.')
+	unpack_parser.add_argument('archive')
+	unpack_parser.add_argument('folder')
+	verify_parser = subparsers.add_parser('verify', help='Check an archive or an unpacked folder against its manifest.')
+	verify_parser.add_argument('path')
+	args = parser.parse_args(argv)
+	if args.command is None:
+		parser.print_help()
+		return 1
+
+	# messages go to stderr, so the archive can go to stdout
+	if args.command == 'pack':
+		packer = ShotPacker(args.shot, workers=args.workers)
+		files = packer.closure()
+		if args.list:
+			for path in sorted(files, key=files.get):
+				print(files[path])
+		else:
+			start = time.time()
+			manifest = packer.pack(args.output)
+			size = sum(entry['size'] for entry in manifest['files'].values())
+			sys.stderr.write('packed %d files, %.1f MB in %.1f s\n' % (len(manifest['files']), size / 1024.0 ** 2, time.time() - start))
+		for path in sorted(set(packer.missing)):
+			sys.stderr.write('missing ' + path + '\n')
+		for path in sorted(set(packer.external)):
+			sys.stderr.write('outside the project, not packed ' + path + '\n')
+		return 0
+	problems = unpack(args.archive, args.folder) if args.command == 'unpack' else verify(args.path)
+	for problem in problems:
+		sys.stderr.write(problem + '\n')
+	return 1 if problems else 0
+
+if __name__ == '__main__':
+	sys.exit(main())
@@ -1,6 +1,8 @@
 import shotgun_api3
 import pprint
 
+from pipe.pipeHandlers.shotgun_sync import asset_name, build_asset_lists
+
 SERVER_PATH = ""
 ASSET_SCRIPT_NAME = ''
 ASSET_SCRIPT_KEY = ''
@@ -18,73 +20,43 @@ class ShotgunReader:
         #getAssetLists();
         pass
 
+    def connect(self, entity_type):
+        if entity_type == "Shot":
+            return shotgun_api3.Shotgun(SERVER_PATH, SHOT_SCRIPT_NAME, SHOT_SCRIPT_KEY)
+        return shotgun_api3.Shotgun(SERVER_PATH, ASSET_SCRIPT_NAME, ASSET_SCRIPT_KEY)
+
+    def filters(self, entity_type):
+        filters = [
+            ["project", "is", {"type": "Project", "id": PROJECT_ID}]
+        ]
+        if entity_type == "Asset":
+            filters.append(["sg_asset_type", "is_not", "Environment"])
+        return filters
+
     def getAssetLists(self):
 
-        sg = shotgun_api3.Shotgun(SERVER_PATH, ASSET_SCRIPT_NAME, ASSET_SCRIPT_KEY)
+        sg = self.connect("Asset")
 
         #pprint.pprint([symbol for symbol in sorted(dir(sg)) if not symbol.startswith('_')])
 
         fields = ['code', 'parents']
-        filters = [
-            ["project", "is", {"type": "Project", "id": PROJECT_ID}],
-            ["sg_asset_type", "is_not", "Environment"]
-        ]
-        result = sg.find("Asset", filters=filters, fields=fields)
+        result = sg.find("Asset", filters=self.filters("Asset"), fields=fields)
 
         #pprint.pprint(result)
 
-        full_list = []
-        name_list = []
-        short_list = []
-        short_name_list = []
-
+        assets = []
         for asset in result:
-            temp = {}
-            temp["name"] = asset["code"].replace(" ", "")
-            temp["children"] = []
-            full_list.append(temp)
-            name_list.append(asset["code"].replace(" ", ""))
-
-        short_name_list = name_list[:]
+            parents = [asset_name(par["name"]) for par in asset["parents"]]
+            assets.append((asset_name(asset["code"]), parents))
 
-        for asset in result:
-            for par in asset["parents"]:
-                if par["name"].replace(" ", "") in name_list:
-                    parent = par["name"].replace(" ", "")
-                    parent_asset = list(filter(lambda temp: temp["name"].replace(" ", "") == parent, short_list))
-                    if len(parent_asset) == 0:
-                        parent_asset = {}
-                        parent_asset["name"] = parent
-                        parent_asset["children"] = []
-                        short_list.append(parent_asset)
-                    else:
-                        parent_asset = parent_asset[0]
-                    parent_asset["children"].append(asset["code"].replace(" ", ""))
-                    #print(asset["code"].replace(" ", ""))
-                    short_name_list.remove(asset["code"].replace(" ", ""))
-
-        for name in short_name_list:
-            asset = list(filter(lambda temp: temp["name"] == name, short_list))
-            if len(asset) == 0:
-                new = {}
-                new["name"] = name
-                new["children"] = [name]
-                short_list.append(new)
-
-        #pprint.pprint(short_list)
-        #pprint.pprint(name_list)
-        return [name_list, short_list]
+        return build_asset_lists(assets)
 
     def getShotList(self):
 
-        sg = shotgun_api3.Shotgun(SERVER_PATH, SHOT_SCRIPT_NAME, SHOT_SCRIPT_KEY)
+        sg = self.connect("Shot")
 
         fields = ['code']
-        filters = [
-            ["project", "is", {"type": "Project", "id": PROJECT_ID}]
-        ]
-
-        result = sg.find("Shot", filters=filters, fields=fields)
+        result = sg.find("Shot", filters=self.filters("Shot"), fields=fields)
         #pprint.pprint(result)
         #print(len(result))
 
@@ -95,4 +67,4 @@ class ShotgunReader:
             shot_list.append(name)
         #print(shot_list)
         #print("done")
-        return shot_list
\ No newline at end of file
+        return shot_list
@@ -0,0 +1,299 @@
+import copy
+import datetime
+import os
+import time
+from collections import OrderedDict
+
+from pipe.pipeHandlers.environment import Environment
+from pipe.pipeHandlers import pipeline_io
+
+'''
+Keeps a local mirror of the ShotGrid assets and shots so that a sync only asks
+ShotGrid for entities updated since the last sync, and reports only what was
+added, removed or renamed.
+
+The reader passed to ShotgunSync supplies the connection and the project filters:
+    reader.connect(entity_type) -- a shotgun_api3.Shotgun (or anything with find())
+    reader.filters(entity_type) -- the filters that select this project's entities
+ShotgunReader in pipe.pipeHandlers.shotgun_dummy does both. A reader that only has
+getAssetLists() and getShotList() still works: every sync then fetches the full lists
+and compares them by name, so renames show up as an add and a remove. LocalShotgun
+below is a stand-in that serves entities from a json file, for working without ShotGrid.
+
+sync() only updates the mirror in memory. Call commit() once the pipe has been updated
+from the result, so a failed update is picked up again by the next sync.
+'''
+
+ASSET = "Asset"
+SHOT = "Shot"
+ENTITY_TYPES = [ASSET, SHOT]
+
+PIPELINE_FILENAME = ".shotgun_mirror"
+LAST_SYNC = "last_sync"
+ENTITIES = "entities"
+NAME = "name"
+PARENTS = "parents"
+
+ADDED = "added"
+REMOVED = "removed"
+RENAMED = "renamed"
+CHANGED = "changed"
+
+FIELDS = {
+    ASSET: ["code", "parents", "updated_at"],
+    SHOT: ["code", "updated_at"],
+}
+
+# re-fetch anything updated this many seconds before the last sync, so edits made
+# while the previous sync was running aren't missed
+SYNC_OVERLAP = 60
+
+
+def asset_name(code):
+    return code.replace(" ", "")
+
+
+def build_asset_lists(assets):
+    """
+    group assets under their parents in a single pass.
+    assets -- list of (name, parent_names) tuples
+    returns [name_list, short_list] in the form ShotgunReader.getAssetLists returns:
+    every asset name, and a list of {"name": parent, "children": [...]} groups where
+    assets without a parent form a group of their own.
+    """
+    name_list = [name for name, parents in assets]
+    names = set(name_list)
+    groups = OrderedDict()
+    children = set()
+
+    for name, parents in assets:
+        for parent in parents:
+            if parent in names:
+                groups.setdefault(parent, {"name": parent, "children": []})["children"].append(name)
+                children.add(name)
+
+    for name in name_list:
+        if name not in children and name not in groups:
+            groups[name] = {"name": name, "children": [name]}
+
+    return [name_list, list(groups.values())]
+
+
+def _to_epoch(value):
+    if value is None:
+        return None
+    if isinstance(value, datetime.datetime):
+        return value.timestamp()
+    return float(value)
+
+
+def _paged_find(sg, entity_type, filters, fields, page_size):
+    page = 1
+    while True:
+        results = sg.find(entity_type, filters, fields, order=[{"field_name": "id", "direction": "asc"}],
+                          limit=page_size, page=page)
+        for result in results:
+            yield result
+        if len(results) < page_size:
+            return
+        page += 1
+
+
+class ShotgunSync:
+    """
+    Incremental ShotGrid sync backed by a json mirror in the production directory.
+    """
+
+    def __init__(self, reader, filepath=None, page_size=500):
+        """
+        reader -- supplies connect(entity_type) and filters(entity_type), e.g. a ShotgunReader
+        filepath -- (optional) where the mirror is stored. Defaults to production/.shotgun_mirror
+        page_size -- number of entities requested per page
+        """
+        self.reader = reader
+        self.page_size = page_size
+        if filepath is None:
+            filepath = os.path.join(Environment().get_production_dir(), PIPELINE_FILENAME)
+        self._filepath = filepath
+        if os.path.exists(filepath):
+            self._datadict = pipeline_io.readfile(filepath)
+        else:
+            self._datadict = {}
+        for entity_type in ENTITY_TYPES:
+            self._datadict.setdefault(entity_type, {LAST_SYNC: None, ENTITIES: {}})
+
+    def get_filepath(self):
+        return self._filepath
+
+    def sync(self, entity_types=ENTITY_TYPES, check_removed=True):
+        """
+        fetch the entities updated since the last sync and merge them into the mirror.
+        The mirror is not written until commit() is called.
+        check_removed -- also list the ids of every entity (one small paged query) to find
+                         the ones that were retired or no longer match the filters
+        returns {entity_type: {"added": [...], "removed": [...], "renamed": [(old, new)], "changed": [...]}}
+        """
+        # work on a copy so a sync that fails half way leaves the mirror as it was
+        datadict = copy.deepcopy(self._datadict)
+        results = {}
+        for entity_type in entity_types:
+            if hasattr(self.reader, "connect") and hasattr(self.reader, "filters"):
+                results[entity_type] = self._sync_type(datadict[entity_type], entity_type, check_removed)
+            else:
+                results[entity_type] = self._sync_lists(datadict[entity_type], entity_type)
+        self._datadict = datadict
+        return results
+
+    def commit(self):
+        """
+        write the mirror. Call this after the pipe has been updated from sync()'s result.
+        """
+        pipeline_io.writefile(self._filepath, self._datadict)
+        pipeline_io.set_permissions(self._filepath)
+
+    def _sync_type(self, mirror, entity_type, check_removed):
+        entities = mirror[ENTITIES]
+        sg = self.reader.connect(entity_type)
+        filters = list(self.reader.filters(entity_type))
+        diff = {ADDED: [], REMOVED: [], RENAMED: [], CHANGED: []}
+
+        delta_filters = filters[:]
+        if mirror[LAST_SYNC] is not None:
+            since = datetime.datetime.fromtimestamp(mirror[LAST_SYNC] - SYNC_OVERLAP)
+            delta_filters.append(["updated_at", "greater_than", since])
+
+        last_sync = mirror[LAST_SYNC]
+        for result in _paged_find(sg, entity_type, delta_filters, FIELDS[entity_type], self.page_size):
+            entity = self._normalize(entity_type, result)
+            key = str(result["id"])
+            old = entities.get(key)
+            if old is None:
+                diff[ADDED].append(entity[NAME])
+            elif old[NAME] != entity[NAME]:
+                diff[RENAMED].append((old[NAME], entity[NAME]))
+            elif old != entity:
+                diff[CHANGED].append(entity[NAME])
+            entities[key] = entity
+
+            updated_at = _to_epoch(result.get("updated_at"))
+            if updated_at is not None and (last_sync is None or updated_at > last_sync):
+                last_sync = updated_at
+
+        if check_removed and mirror[LAST_SYNC] is not None:
+            current = set(str(result["id"]) for result in _paged_find(sg, entity_type, filters, ["id"], self.page_size))
+            for key in list(entities.keys()):
+                if key not in current:
+                    diff[REMOVED].append(entities.pop(key)[NAME])
+
+        mirror[LAST_SYNC] = last_sync if last_sync is not None else time.time()
+        return diff
+
+    def _sync_lists(self, mirror, entity_type):
+        '''
+        sync through a reader that only has getAssetLists() and getShotList(). There are no
+        ids or update times, so the full lists are fetched and compared by name.
+        '''
+        if entity_type == ASSET:
+            name_list, short_list = self.reader.getAssetLists()
+            parents = dict((name, []) for name in name_list)
+            for group in short_list:
+                for child in group["children"]:
+                    if child != group["name"] and child in parents:
+                        parents[child].append(group["name"])
+            fetched = [{NAME: name, PARENTS: parents[name]} for name in name_list]
+        else:
+            fetched = [{NAME: name} for name in self.reader.getShotList()]
+
+        old = dict((entity[NAME], entity) for entity in mirror[ENTITIES].values())
+        new_names = set(entity[NAME] for entity in fetched)
+        diff = {ADDED: [], REMOVED: [], RENAMED: [], CHANGED: []}
+        for entity in fetched:
+            if entity[NAME] not in old:
+                diff[ADDED].append(entity[NAME])
+            elif old[entity[NAME]] != entity:
+                diff[CHANGED].append(entity[NAME])
+        for entity in self._sorted(mirror):
+            if entity[NAME] not in new_names:
+                diff[REMOVED].append(entity[NAME])
+
+        # keyed on position so the mirror keeps the reader's order
+        mirror[ENTITIES] = dict((str(i), entity) for i, entity in enumerate(fetched))
+        mirror[LAST_SYNC] = time.time()
+        return diff
+
+    def _normalize(self, entity_type, result):
+        entity = {}
+        if entity_type == ASSET:
+            entity[NAME] = asset_name(result["code"])
+            entity[PARENTS] = [asset_name(parent["name"]) for parent in result.get("parents") or []]
+        else:
+            entity[NAME] = result["code"]
+        return entity
+
+    def _sorted(self, mirror):
+        entities = mirror[ENTITIES]
+        return [entities[key] for key in sorted(entities.keys(), key=int)]
+
+    def _sorted_entities(self, entity_type):
+        return self._sorted(self._datadict[entity_type])
+
+    def get_asset_lists(self):
+        """
+        return [name_list, short_list] for the mirrored assets, like ShotgunReader.getAssetLists
+        """
+        assets = [(entity[NAME], entity[PARENTS]) for entity in self._sorted_entities(ASSET)]
+        return build_asset_lists(assets)
+
+    def get_shot_list(self):
+        """
+        return the names of the mirrored shots, like ShotgunReader.getShotList
+        """
+        return [entity[NAME] for entity in self._sorted_entities(SHOT)]
+
+
+class LocalShotgun:
+    """
+    Serves ShotGrid entities from a json file ({"Asset": [...], "Shot": [...]}) so the
+    sync can run without a ShotGrid server. Only the filter operators the pipe uses
+    are supported: is, is_not, in and greater_than.
+    """
+
+    def __init__(self, filepath):
+        self._filepath = filepath
+
+    def connect(self, entity_type):
+        return self
+
+    def filters(self, entity_type):
+        return []
+
+    def find(self, entity_type, filters, fields=None, order=None, limit=0, page=0):
+        entities = pipeline_io.readfile(self._filepath).get(entity_type, [])
+        matches = [entity for entity in entities if all(self._match(entity, f) for f in filters)]
+        matches.sort(key=lambda entity: entity["id"])
+        if limit:
+            start = (max(page, 1) - 1) * limit
+            matches = matches[start:start + limit]
+
+        results = []
+        for entity in matches:
+            result = {"type": entity_type, "id": entity["id"]}
+            for field in fields or []:
+                result[field] = entity.get(field)
+            results.append(result)
+        return results
+
+    def _match(self, entity, condition):
+        field, relation, value = condition
+        actual = entity.get(field)
+        if relation == "is":
+            return actual == value
+        if relation == "is_not":
+            return actual != value
+        if relation == "in":
+            return actual in value
+        if relation == "greater_than":
+            if field == "updated_at":
+                return _to_epoch(actual) > _to_epoch(value)
+            return actual > value
+        raise ValueError("unsupported filter relation: " + relation)
@@ -0,0 +1,549 @@
+import fcntl
+import json
+import os
+import re
+import shutil
+import sys
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+from pipe.pipeHandlers.environment import Environment
+from pipe.pipeHandlers import pipeline_io
+from pipe.pipeHandlers import resolver
+
+'''
+storage module
+
+Accounts for the disk space of the production and retires old versions.
+
+scan() walks every body on a thread pool and adds up the bytes of each element, split
+into its .vNNNN folders and everything else. totals() sums them by body, department,
+element or version. Hardlinked files are counted once.
+
+The retention policy picks the version folders that can go: everything but the last
+keep_last versions of an element, unless the version is
+	- the latest version of its element
+	- tagged with Element.keep_version
+	- referenced from a .usda file in a shot, layout or asset, either by a versioned pipe
+	  uri or by a path into its .vNNNN folder. Only the current files and the latest
+	  version of each element are read, since those are what gets opened.
+Numbered checkouts in the users folder can be trimmed to the newest few as well.
+
+Nothing is deleted right away. retire() renames the folders into a batch under
+production/.trash and records the version in the element's .retired file, so the
+space is only given back when purge() removes batches older than a grace period. That
+can run in the background. restore() moves a batch back.
+
+python -m pipe.pipeHandlers.storage du [--by body|department|element|version]
+python -m pipe.pipeHandlers.storage retain --keep 5 [--checkouts 3] [--apply]
+python -m pipe.pipeHandlers.storage purge [--days 7]
+python -m pipe.pipeHandlers.storage restore BATCH
+'''
+
+BODY_FILENAME = '.body'
+ELEMENT_FILENAME = '.element'
+CHECKOUT_FILENAME = '.checkout'
+TRASH_DIRNAME = '.trash'
+MANIFEST_FILENAME = '.manifest'
+RETIRED_LOCK_FILENAME = '.retired_lock'
+
+BODY = 'body'
+DEPARTMENT = 'department'
+ELEMENT = 'element'
+VERSION = 'version'
+LEVELS = [BODY, DEPARTMENT, ELEMENT, VERSION]
+
+VERSION_CANDIDATE = 'version'
+CHECKOUT_CANDIDATE = 'checkout'
+
+DEFAULT_WORKERS = 16
+DEFAULT_GRACE_DAYS = 7
+
+_VERSION_DIR = re.compile(r'^\.v(\d{4,})$')
+_VERSION_IN_PATH = re.compile(r'^(.*)/\.v(\d{4,})(?:/|$)')
+_CHECKOUT_NUMBER = re.compile(r'(\d{4})(\.[^.]*)?$')
+
+Usage = namedtuple('Usage', ['kind', 'body', 'element', 'version', 'bytes', 'files'])
+Usage.__doc__ = '''
+kind -- the kind of the body (asset, shot, ...)
+body -- the name of the body
+element -- the element's folder relative to the body, e.g. geo or animation/chair
+version -- the version a .vNNNN folder holds, or None for the rest of the element
+bytes -- size of the files
+files -- number of files
+'''
+
+Candidate = namedtuple('Candidate', ['type', 'path', 'element_file', 'version', 'bytes'])
+Candidate.__doc__ = '''
+type -- VERSION_CANDIDATE or CHECKOUT_CANDIDATE
+path -- the version folder or checkout file to retire
+element_file -- the .element the version belongs to (None for checkouts)
+version -- the version number (None for checkouts)
+bytes -- the space retiring it gives back
+'''
+
+def _size(path):
+	'''
+	return (bytes, files, [(dev, ino, size)] of the hardlinked files) of everything under path
+	'''
+	total = 0
+	count = 0
+	linked = []
+	folders = [path]
+	while folders:
+		try:
+			entries = list(os.scandir(folders.pop()))
+		except OSError:
+			continue
+		for entry in entries:
+			try:
+				if entry.is_dir(follow_symlinks=False):
+					folders.append(entry.path)
+					continue
+				st = entry.stat(follow_symlinks=False)
+			except OSError:
+				continue
+			count += 1
+			if st.st_nlink > 1:
+				linked.append((st.st_dev, st.st_ino, st.st_size))
+			else:
+				total += st.st_size
+	return total, count, linked
+
+
+class Storage:
+	'''
+	Disk accounting and version retention for a project.
+	'''
+
+	def __init__(self, env=None, workers=DEFAULT_WORKERS):
+		'''
+		env -- (optional) the Environment to work on. Defaults to the current project.
+		workers -- number of threads reading the tree
+		'''
+		self._env = env if env is not None else Environment()
+		self.workers = workers
+		self.roots = {}
+		path_resolver = resolver.Resolver(self._env)
+		for kind in resolver.KINDS:
+			try:
+				root = os.path.normpath(path_resolver.get_root(kind))
+			except KeyError:
+				continue # this project doesn't have that kind of body
+			if os.path.isdir(root):
+				self.roots[kind] = root
+		self._resolver = path_resolver
+		self.trash_dir = os.path.join(self._env.get_production_dir(), TRASH_DIRNAME)
+
+	def list_bodies(self):
+		'''
+		return (kind, name, folder) for every body in the project
+		'''
+		bodies = []
+		for kind, root in sorted(self.roots.items()):
+			for entry in os.scandir(root):
+				if entry.is_dir() and not entry.name.startswith('.') and os.path.exists(os.path.join(entry.path, BODY_FILENAME)):
+					bodies.append((kind, entry.name, entry.path))
+		return bodies
+
+	def list_elements(self, body_dir):
+		'''
+		return the folders of the elements of a body, including nested ones like animation/<asset>
+		'''
+		elements = []
+		folders = [body_dir]
+		while folders:
+			folder = folders.pop()
+			try:
+				entries = list(os.scandir(folder))
+			except OSError:
+				continue
+			for entry in entries:
+				if entry.name == ELEMENT_FILENAME and folder != body_dir:
+					elements.append(folder)
+				elif entry.is_dir(follow_symlinks=False) and not entry.name.startswith('.') and entry.name not in ('cache', 'render'):
+					folders.append(entry.path)
+		return sorted(elements)
+
+	# accounting
+
+	def scan(self):
+		'''
+		return a Usage for the files of every element and every version folder in the project
+		'''
+		with ThreadPoolExecutor(max_workers=self.workers) as pool:
+			results = list(pool.map(self._scan_body, self.list_bodies()))
+
+		usage = []
+		seen = set()
+		for body_usage in results:
+			for record, linked in body_usage:
+				size = record.bytes
+				for dev, ino, st_size in linked:
+					if (dev, ino) not in seen: # count each hardlinked file once
+						seen.add((dev, ino))
+						size += st_size
+				usage.append(record._replace(bytes=size))
+		return usage
+
+	def _scan_body(self, body):
+		kind, name, body_dir = body
+		results = []
+		for element_dir in self.list_elements(body_dir):
+			element = os.path.relpath(element_dir, body_dir)
+			rest, rest_files, rest_linked = 0, 0, []
+			for entry in os.scandir(element_dir):
+				match = _VERSION_DIR.match(entry.name)
+				if match and entry.is_dir(follow_symlinks=False):
+					size, files, linked = _size(entry.path)
+					results.append((Usage(kind, name, element, int(match.group(1)), size, files), linked))
+				elif entry.is_dir(follow_symlinks=False):
+					if not os.path.exists(os.path.join(entry.path, ELEMENT_FILENAME)): # nested elements count for themselves
+						size, files, linked = _size(entry.path)
+						rest, rest_files = rest + size, rest_files + files
+						rest_linked.extend(linked)
+				else:
+					try:
+						st = entry.stat(follow_symlinks=False)
+					except OSError:
+						continue
+					rest_files += 1
+					if st.st_nlink > 1:
+						rest_linked.append((st.st_dev, st.st_ino, st.st_size))
+					else:
+						rest += st.st_size
+			results.append((Usage(kind, name, element, None, rest, rest_files), rest_linked))
+		return results
+
+	# retention
+
+	def referenced_versions(self, bodies=None):
+		'''
+		return the set of (element folder, version) that .usda files in the project point at
+		'''
+		bodies = self.list_bodies() if bodies is None else bodies
+		with ThreadPoolExecutor(max_workers=self.workers) as pool:
+			results = list(pool.map(self._body_references, bodies))
+		return set().union(*results) if results else set()
+
+	def _body_references(self, body):
+		kind, name, body_dir = body
+		references = set()
+		for element_dir in self.list_elements(body_dir):
+			folders = [element_dir]
+			try:
+				latest_version = pipeline_io.readfile(os.path.join(element_dir, ELEMENT_FILENAME)).get('latest_version', -1)
+			except (IOError, OSError, ValueError):
+				latest_version = -1
+			if latest_version >= 0:
+				folders.append(os.path.join(element_dir, '.v%04d' % latest_version))
+			for folder in folders:
+				try:
+					usda_files = [entry.path for entry in os.scandir(folder) if entry.name.endswith('.usda')]
+				except OSError:
+					continue
+				for usda_file in usda_files:
+					references.update(self._usda_references(usda_file))
+		return references
+
+	def _usda_references(self, usda_file):
+		try:
+			with open(usda_file, 'r') as f:
+				text = f.read()
+		except (IOError, OSError, UnicodeDecodeError):
+			return set()
+		references = set()
+		for asset_path in resolver.USDA_ASSET_PATH.findall(text):
+			if asset_path.startswith(resolver.SCHEME):
+				try:
+					parsed = resolver.parse(asset_path)
+				except ValueError:
+					continue
+				if parsed.version is not None:
+					references.add((os.path.normpath(self._resolver.element_dir(parsed)), parsed.version))
+				continue
+			path = os.path.normpath(os.path.join(os.path.dirname(usda_file), asset_path))
+			match = _VERSION_IN_PATH.match(path)
+			if match:
+				references.add((match.group(1), int(match.group(2))))
+		return references
+
+	def plan(self, keep_last, keep_checkouts=None):
+		'''
+		return the Candidates the retention policy would retire, biggest first. Nothing is changed.
+		keep_last -- number of newest versions of every element to keep
+		keep_checkouts -- (optional) number of newest checkouts of every checkout folder to
+		                  keep. Checkouts are left alone if not given.
+		'''
+		if keep_last < 1:
+			raise ValueError('keep_last has to be at least 1')
+		bodies = self.list_bodies()
+		referenced = self.referenced_versions(bodies)
+		with ThreadPoolExecutor(max_workers=self.workers) as pool:
+			results = list(pool.map(lambda body: self._plan_body(body, keep_last, referenced), bodies))
+		candidates = [candidate for body_candidates in results for candidate in body_candidates]
+		if keep_checkouts is not None:
+			candidates.extend(self._plan_checkouts(keep_checkouts))
+		candidates.sort(key=lambda candidate: (-candidate.bytes, candidate.path))
+		return candidates
+
+	def _plan_body(self, body, keep_last, referenced):
+		candidates = []
+		for element_dir in self.list_elements(body[2]):
+			element_file = os.path.join(element_dir, ELEMENT_FILENAME)
+			try:
+				datadict = pipeline_io.readfile(element_file)
+			except (IOError, OSError, ValueError):
+				continue # the doctor reports these
+			latest_version = datadict.get('latest_version', -1)
+			protected = set(datadict.get('keep_versions', []))
+			protected.add(latest_version)
+			protected.update(range(latest_version - keep_last + 1, latest_version + 1))
+			retired = pipeline_io.read_retired(element_dir)
+			normalized = os.path.normpath(element_dir)
+			for entry in os.scandir(element_dir):
+				match = _VERSION_DIR.match(entry.name)
+				if not match or not entry.is_dir(follow_symlinks=False):
+					continue
+				version = int(match.group(1))
+				if version in protected or version in retired or version > latest_version or (normalized, version) in referenced:
+					continue # versions past the latest are orphans, left for the doctor
+				size = _size(entry.path)[0]
+				candidates.append(Candidate(VERSION_CANDIDATE, entry.path, element_file, version, size))
+		return candidates
+
+	def _plan_checkouts(self, keep_checkouts):
+		candidates = []
+		users_dir = self._env.get_users_dir()
+		for checkout_file in _find(users_dir, CHECKOUT_FILENAME, 2):
+			checkout_dir = os.path.dirname(checkout_file)
+			numbered = {}
+			for entry in os.scandir(checkout_dir):
+				match = _CHECKOUT_NUMBER.search(entry.name)
+				if match and entry.is_file(follow_symlinks=False):
+					stem = entry.name[:match.start()] + (match.group(2) or '')
+					numbered.setdefault(stem, []).append((int(match.group(1)), entry))
+			for stem, files in numbered.items():
+				files.sort()
+				for number, entry in files[:-keep_checkouts] if keep_checkouts > 0 else files:
+					st = entry.stat(follow_symlinks=False)
+					candidates.append(Candidate(CHECKOUT_CANDIDATE, entry.path, None, None, 0 if st.st_nlink > 1 else st.st_size))
+		return candidates
+
+	def retire(self, candidates):
+		'''
+		move the candidates into a new trash batch and return its folder, or None if
+		nothing was moved. Retired versions are recorded in their .element files.
+		'''
+		if not candidates:
+			return None
+		batch = os.path.join(self.trash_dir, time.strftime('%Y%m%d-%H%M%S') + '-' + str(os.getpid()))
+		os.makedirs(batch)
+		entries = []
+		retired = {}
+		for index, candidate in enumerate(candidates):
+			trashed = '%06d' % index
+			try:
+				os.rename(candidate.path, os.path.join(batch, trashed))
+			except OSError as e:
+				print('could not retire ' + candidate.path + ': ' + str(e))
+				continue
+			entries.append([candidate.path, trashed, candidate.element_file, candidate.version, candidate.bytes])
+			if candidate.element_file is not None:
+				retired.setdefault(candidate.element_file, []).append(candidate.version)
+			self._write_manifest(batch, entries) # kept current, so an interrupted retire can still be restored
+
+		for element_file, versions in retired.items():
+			self._update_retired(element_file, add=versions)
+		return batch
+
+	def _write_manifest(self, batch, entries):
+		datadict = {}
+		datadict['time'] = time.time()
+		datadict['entries'] = entries
+		pipeline_io.writefile(os.path.join(batch, MANIFEST_FILENAME), datadict)
+
+	def _update_retired(self, element_file, add=(), remove=()):
+		# one write per element, however many of its versions changed. The .retired file
+		# is never written by a publish, and the lock keeps two storage runs on the same
+		# element from dropping each other's changes
+		element_dir = os.path.dirname(element_file)
+		retired_file = os.path.join(element_dir, pipeline_io.RETIRED_FILENAME)
+		try:
+			with open(os.path.join(element_dir, RETIRED_LOCK_FILENAME), 'a') as lock_file:
+				fcntl.flock(lock_file, fcntl.LOCK_EX)
+				try:
+					retired = set(pipeline_io.readfile(retired_file)) if os.path.exists(retired_file) else set()
+					retired.update(add)
+					retired.difference_update(remove)
+					pipeline_io.writefile(retired_file, sorted(retired))
+				finally:
+					fcntl.flock(lock_file, fcntl.LOCK_UN)
+		except (IOError, OSError, ValueError) as e:
+			print('could not update ' + retired_file + ': ' + str(e))
+
+	def list_batches(self):
+		'''
+		return (folder, time retired, bytes) for every batch in the trash, oldest first
+		'''
+		batches = []
+		try:
+			names = sorted(os.listdir(self.trash_dir))
+		except OSError:
+			return batches
+		for name in names:
+			batch = os.path.join(self.trash_dir, name)
+			try:
+				datadict = pipeline_io.readfile(os.path.join(batch, MANIFEST_FILENAME))
+			except (IOError, OSError, ValueError):
+				continue
+			batches.append((batch, datadict['time'], sum(entry[4] for entry in datadict['entries'])))
+		return batches
+
+	def restore(self, batch):
+		'''
+		move everything in a trash batch back where it was
+		'''
+		manifest = os.path.join(batch, MANIFEST_FILENAME)
+		entries = pipeline_io.readfile(manifest)['entries']
+		restored = {}
+		for path, trashed, element_file, version, size in entries:
+			if os.path.exists(path):
+				print('not restoring ' + path + ', something is in its place')
+				continue
+			os.rename(os.path.join(batch, trashed), path)
+			if element_file is not None:
+				restored.setdefault(element_file, []).append(version)
+		for element_file, versions in restored.items():
+			self._update_retired(element_file, remove=versions)
+		os.remove(manifest)
+		shutil.rmtree(batch, ignore_errors=True)
+
+	def purge(self, days=DEFAULT_GRACE_DAYS, background=False):
+		'''
+		delete the trash batches retired more than the given number of days ago. Returns the
+		batches, or with background=True the thread deleting them.
+		'''
+		cutoff = time.time() - days * 24 * 3600
+		batches = [batch for batch, retired, size in self.list_batches() if retired <= cutoff]
+
+		def run():
+			for batch in batches:
+				# the manifest goes first, so a half deleted batch isn't offered for restore
+				os.remove(os.path.join(batch, MANIFEST_FILENAME))
+				shutil.rmtree(batch, ignore_errors=True)
+
+		if not background:
+			run()
+			return batches
+		thread = threading.Thread(target=run, name='purge trash')
+		thread.start()
+		return thread
+
+def totals(usage, level):
+	'''
+	sum a scan by level (one of LEVELS). Returns [(key, bytes, files)], biggest first.
+	'''
+	sums = {}
+	for record in usage:
+		if level == BODY:
+			key = (record.kind, record.body)
+		elif level == DEPARTMENT:
+			key = (record.kind, record.body, record.element.split(os.sep)[0])
+		elif level == ELEMENT:
+			key = (record.kind, record.body, record.element)
+		else:
+			key = (record.kind, record.body, record.element, record.version)
+		size, files = sums.get(key, (0, 0))
+		sums[key] = (size + record.bytes, files + record.files)
+	return sorted(((key, size, files) for key, (size, files) in sums.items()), key=lambda item: (-item[1], item[0]))
+
+def _find(top, filename, depth):
+	'''
+	return the paths of the files called filename at most depth folders below top
+	'''
+	found = []
+	folders = [(top, 0)]
+	while folders:
+		folder, level = folders.pop()
+		try:
+			entries = list(os.scandir(folder))
+		except OSError:
+			continue
+		for entry in entries:
+			if entry.name == filename:
+				found.append(entry.path)
+			elif level < depth and entry.is_dir(follow_symlinks=False) and not entry.name.startswith('.'):
+				folders.append((entry.path, level + 1))
+	return sorted(found)
+
+def format_bytes(size):
+	for unit in ['B', 'KB', 'MB', 'GB', 'TB']:
+		if size < 1024 or unit == 'TB':
+			return ('%d %s' if unit == 'B' else '%.1f %s') % (size, unit)
+		size /= 1024.0
+
+def _format_key(key):
+	name = '/'.join(str(part) for part in key[:3])
+	if len(key) > 3:
+		name += ('/.v%04d' % key[3]) if key[3] is not None else '/(current)'
+	return name
+
+def main(argv=None):
+	import argparse # only the command line needs it
+
+	parser = argparse.ArgumentParser(description='Account for disk space and retire old versions.')
+	parser.add_argument('--workers', '-w', type=int, default=DEFAULT_WORKERS, help='number of threads (default %d)' % DEFAULT_WORKERS)
+	subparsers = parser.add_subparsers(dest='command')
+
+	du = subparsers.add_parser('du', help='Report the bytes used.')
+	du.add_argument('--by', choices=LEVELS, default=BODY, help='how to sum the usage (default body)')
+	du.add_argument('--top', type=int, default=30, help='number of lines to print (default 30)')
+	du.add_argument('--json', action='store_true', help='print every usage record as json')
+
+	retain = subparsers.add_parser('retain', help='Retire the versions the policy allows. Dry run unless --apply is given.')
+	retain.add_argument('--keep', type=int, required=True, help='number of newest versions of each element to keep')
+	retain.add_argument('--checkouts', type=int, help='also trim checkout folders to this many newest checkouts')
+	retain.add_argument('--apply', action='store_true', help='move the versions to the trash')
+
+	purge = subparsers.add_parser('purge', help='Delete trash batches past the grace period.')
+	purge.add_argument('--days', type=float, default=DEFAULT_GRACE_DAYS, help='grace period (default %d)' % DEFAULT_GRACE_DAYS)
+
+	restore = subparsers.add_parser('restore', help='Move a trash batch back.')
+	restore.add_argument('batch', help='the batch folder')
+
+	args = parser.parse_args(argv)
+	if args.command is None:
+		parser.print_help()
+		return 1
+
+	storage = Storage(workers=args.workers)
+	if args.command == 'du':
+		usage = storage.scan()
+		if args.json:
+			print(json.dumps([record._asdict() for record in usage], indent=1))
+			return 0
+		summed = totals(usage, args.by)
+		for key, size, files in summed[:args.top]:
+			print('%10s %8d  %s' % (format_bytes(size), files, _format_key(key)))
+		print('%10s in total' % format_bytes(sum(record.bytes for record in usage)))
+	elif args.command == 'retain':
+		candidates = storage.plan(args.keep, args.checkouts)
+		for candidate in candidates:
+			print('%10s  %s' % (format_bytes(candidate.bytes), candidate.path))
+		print('%d to retire, %s' % (len(candidates), format_bytes(sum(candidate.bytes for candidate in candidates))))
+		if args.apply:
+			batch = storage.retire(candidates)
+			if batch is not None:
+				print('moved to ' + batch)
+	elif args.command == 'purge':
+		for batch in storage.purge(args.days):
+			print('deleted ' + batch)
+	else:
+		storage.restore(args.batch)
+	return 0
+
+if __name__ == '__main__':
+	sys.exit(main())
@@ -4,6 +4,7 @@ import pipe.pipeHandlers.quick_dialogs as qd
 from pipe.pipeHandlers.project import Project
 from pipe.pipeHandlers.body import Body, Asset, Shot, AssetType
 from pipe.pipeHandlers.element import Element
+from pipe.pipeHandlers import resolver
 
 class Assembler:
     def __init__(self):
@@ -70,9 +71,10 @@ class Assembler:
             geo.parm("rendersubd").set(True)
 
         import_geo = geo.createNode("file", "import_geo")
-        element = Element(os.path.join(body.get_filepath(), "geo")).get_last_publish()
-        if element:
-            import_geo.parm("file").set(element[3])
+        geo_uri = resolver.asset_uri(os.path.basename(body.get_filepath()), Asset.GEO)
+        geo_path = resolver.Resolver().resolve(geo_uri)
+        if geo_path:
+            import_geo.parm("file").set(geo_path)
         out = geo.createNode("null", "OUT_" + asset_name)
         out.setInput(0,import_geo, 0)
         out.setDisplayFlag(True)
@@ -5,6 +5,7 @@ import pipe.pipeHandlers.select_from_list as sfl
 from pipe.pipeHandlers.project import Project
 from pipe.pipeHandlers.body import Body, Asset
 from pipe.pipeHandlers.element import Element
+from pipe.pipeHandlers import resolver
 
 '''
 Pulls animations into the obj context and assigns the corresponding materials
@@ -12,6 +13,7 @@ Pulls animations into the obj context and assigns the corresponding materials
 class AnimCloner:
     def __init__(self):
         self.project = Project()
+        self.resolver = resolver.Resolver()
 
     def clone(self):
         shot_list = self.project.list_existing_shots()
@@ -35,12 +37,11 @@ class AnimCloner:
 
     def asset_results(self, value):
         self.asset_name = value[0]
-        element = self.shot.get_element(os.path.join(Asset.ANIMATION, self.asset_name))
+        path = self.resolver.resolve(resolver.shot_uri(self.shot_name, os.path.join(Asset.ANIMATION, self.asset_name)))
 
-        if element.get_last_version < 0:
+        if not path:
             qd.error("There are no publishes for this asset in this shot.")
             return
-        path = element.get_last_publish()[3]
         self.build_network(path)
 
     def build_network(self, path):
@@ -67,9 +68,8 @@ class AnimCloner:
             qd.error("The material for " + self.asset_name + " needs to be republished before it can be cloned in. Republish the material and try again.")
 
     def getMatPath(self):
-        asset = self.project.get_asset(self.asset_name)
-        element = asset.get_element(Asset.MATERIALS)
-        if element.get_last_version() < 0:
-            return os.path.join(element._filepath, self.asset_name + "_main.usda")
-        path = element.get_last_publish()[3]
+        mat_uri = resolver.asset_uri(self.asset_name, Asset.MATERIALS)
+        path = self.resolver.resolve(mat_uri)
+        if not path:
+            return os.path.join(self.resolver.element_dir(mat_uri), self.asset_name + "_main.usda")
         return path
\ No newline at end of file
@@ -4,6 +4,7 @@ import pipe.pipeHandlers.select_from_list as sfl
 from pipe.pipeHandlers.project import Project
 from pipe.pipeHandlers.body import Body, Asset
 from pipe.pipeHandlers.element import Element
+from pipe.pipeHandlers import resolver
 
 '''
 pulls a USD asset into the stage
@@ -23,15 +24,17 @@ class AssetCloner:
         print("Selected asset: " + value[0])
         filename = value[0]
 
-        self.body = Project().get_body(filename)
-        self.element = self.body.get_element(Asset.USD)
-        if self.element:
-            path = self.element.get_last_publish()[3]
-            if path:
-                ref = hou.node("/stage").createNode("reference")
-                ref.setName(filename+"_ref", 1)
-                ref.parm("filepath1").set(path)
-                ref.parm("primpath").set("/layout/"+filename)
+        try:
+            path = resolver.Resolver().resolve(resolver.asset_uri(filename, Asset.USD))
+        except EnvironmentError as e:
+            print(e)
+            path = None
+
+        if path:
+            ref = hou.node("/stage").createNode("reference")
+            ref.setName(filename+"_ref", 1)
+            ref.parm("filepath1").set(path)
+            ref.parm("primpath").set("/layout/"+filename)
 
         else:
             qd.error("Nothing was cloned")
\ No newline at end of file
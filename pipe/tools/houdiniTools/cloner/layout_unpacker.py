@@ -6,6 +6,7 @@ from pipe.pipeHandlers.project import Project
 from pipe.pipeHandlers.body import Body, Asset
 from pipe.pipeHandlers.element import Element
 import pipe.pipeHandlers.pipeline_io as pio
+from pipe.pipeHandlers import resolver
 
 '''
 pulls layouts into the obj context
@@ -124,17 +125,15 @@ class LayoutUnpacker:
         layout.parm("num_materials").set(len(matDict.keys()))
         index = 1
 
-        for mat in matDict.keys():
+        #look up every material publish in one pass
+        matNames = list(matDict.keys())
+        matUris = [resolver.asset_uri(mat, Asset.MATERIALS) for mat in matNames]
+        matPaths = resolver.Resolver().resolve_many(matUris, strict=False)
+
+        for mat, path in zip(matNames, matPaths):
             #clone in that material's hda to the network
-            asset = self.project.get_asset(mat)
-            if not asset:
-                print("Well there's your problem :/")
-                continue
-                
-            element = asset.get_element(Asset.MATERIALS)
             matNode = None
-            if element.get_last_version() >= 0:
-                path = element.get_last_publish()[3]
+            if path:
                 hdaPath = path.split(".")[0] + ".hda"
                 try:
                     hou.hda.installFile(hdaPath)
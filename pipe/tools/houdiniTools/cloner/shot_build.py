@@ -93,7 +93,7 @@ class BuildShot:
             return False
         try:
             path = self.camElement.get_last_publish()[3]
-            
+
             cameraNode = hou.node("/obj").createNode("cenoteCamera")
             cameraNode.setName(self.shot_name + "_camera", 1)
             cameraNode.parm("fileName").set(path)
@@ -8,8 +8,11 @@ from pipe.pipeHandlers.body import AssetType
 from pipe.pipeHandlers.element import Element
 from pipe.pipeHandlers.environment import Environment
 from pipe.pipeHandlers import pipeline_io as pio
+from pipe.pipeHandlers import resolver
 import pipe.pipeHandlers.quick_dialogs as qd
 from pipe.pipeHandlers.shotgun import ShotgunReader
+from pipe.pipeHandlers import shotgun_sync
+from pipe.pipeHandlers import list_cache
 
 
 def filter(string, substr):
@@ -24,36 +27,73 @@ where applicable, assets are automatically organized into variant sets
 class UpdateAssets:
     def __init__(self):
         self.project = Project()
+        self.resolver = resolver.Resolver()
 
     def update_assets(self):
-        lists = ShotgunReader().getAssetLists()
+        sync = shotgun_sync.ShotgunSync(ShotgunReader())
+        old_variants = dict((asset["name"], asset["children"]) for asset in sync.get_asset_lists()[1])
+        diff = sync.sync([shotgun_sync.ASSET])[shotgun_sync.ASSET]
+        lists = sync.get_asset_lists()
         asset_list = lists[0]
         assets = lists[1]
 
+        #only assets that are new or whose variants changed on shotgrid need to be rebuilt
+        touched = set()
+        for asset in assets:
+            if old_variants.get(asset["name"]) != asset["children"]:
+                touched.add(asset["name"])
+
+        list_path = os.path.join(self.project.get_assets_dir(), ".asset_list.txt")
+        short_list_path = os.path.join(self.project.get_assets_dir(), ".short_asset_list")
+        if not touched and not diff[shotgun_sync.REMOVED] and not diff[shotgun_sync.RENAMED] and os.path.exists(list_path) and os.path.exists(short_list_path):
+            sync.commit()
+            qd.message("Assets are already up to date.")
+            return
+
         #update .asset_list
-        list_file = open(os.path.join(self.project.get_assets_dir(), ".asset_list.txt"), "w")
+        list_file = open(list_path, "w")
         list_file.truncate(0)
         for name in asset_list:
             list_file.write(name + "\n")
         list_file.close()
 
         #update .short_asset_list
-        list_file = open(os.path.join(self.project.get_assets_dir(), ".short_asset_list"), "w")
+        list_file = open(short_list_path, "w")
         list_file.truncate(0)
-        
+
+        failed = []
         for asset in assets:
             name = asset["name"]
             variants = asset["children"][:]
-            print("name: "+name)
-            print("variants: ",variants)
 
-            self.build_asset(name, variants)
+            if name in touched:
+                print("name: "+name)
+                print("variants: ",variants)
+                if not self.build_asset(name, variants):
+                    failed.append(name)
 
             list_file.write(name+"\n")
 
         list_file.close()
+        list_cache.invalidate()
+
+        #the mirror is only saved once every asset is built, so failed ones are retried next time
+        if failed:
+            qd.error("These assets could not be published: " + ", ".join(failed) + ". Run the update again to retry them.")
+            return
+        sync.commit()
+
+        qd.message(self.summary(diff))
 
-        qd.message("Assets updated successfully.")                
+    def summary(self, diff):
+        message = "Assets updated successfully.\n"
+        message += str(len(diff[shotgun_sync.ADDED])) + " added, "
+        message += str(len(diff[shotgun_sync.CHANGED])) + " changed, "
+        message += str(len(diff[shotgun_sync.REMOVED])) + " removed, "
+        message += str(len(diff[shotgun_sync.RENAMED])) + " renamed."
+        for old, new in diff[shotgun_sync.RENAMED]:
+            message += "\n" + old + " was renamed to " + new + " on ShotGrid. Its pipe asset has not been moved."
+        return message
 
 
     def build_asset(self, main_name, variants):
@@ -87,7 +127,7 @@ class UpdateAssets:
         body = self.project.get_asset(main_name)
         if not body:
             qd.error("Error publishing asset " + main_name + ". Continuing to next asset.")
-            return
+            return False
 
         element = body.get_element(Asset.USD)
         element.update_app_ext(".usda")
@@ -111,7 +151,9 @@ class UpdateAssets:
 
         for child in stage.children():
             child.destroy()
-        
+
+        return True
+
     def add_variant(self, var, config, add_var, in_count):
         stage = hou.node("/stage")
 
@@ -155,19 +197,21 @@ class UpdateAssets:
         add_var.setInput(in_count, graft)
 
     def getGeoPath(self, var):
-        body = self.project.get_asset(var)
-        if not body:
-            body = self.project.create_asset(var)
+        geo_uri = resolver.asset_uri(var, Asset.GEO)
+        try:
+            path = self.resolver.resolve(geo_uri)
+        except EnvironmentError:
+            self.project.create_asset(var)
+            path = None
 
-        element = body.get_element(Asset.GEO)
-        if element.get_last_version() >= 0:
-            return element.get_last_publish()[3]
+        if path:
+            return path
 
         else:
             #copy over the blank usda file
             src = self.project.get_project_dir()
             src = os.path.join(src, "blank.usda")
-            dst = os.path.join(element._filepath, var + "_main.usda")
+            dst = os.path.join(self.resolver.element_dir(geo_uri), var + "_main.usda")
 
             shutil.copyfile(src, dst)
             pio.set_permissions(dst)
@@ -14,9 +14,7 @@ their most recent versions
 class LayoutUpdater:
     def __init__(self):
         self.project = Project()
-        self.assetList = self.project.list_assets()
-        for asset in self.assetList:
-            asset = re.sub(r'\W+', '', asset)
+        self.asset_index = self.project.get_asset_index()
 
     def updateAll(self):
         obj = hou.node("/obj")
@@ -54,7 +52,7 @@ class LayoutUpdater:
 
     def reloadMaterial(self, matNode):
         typeName = matNode.type().name()
-        if typeName not in self.assetList:
+        if typeName not in self.asset_index.sanitized:
             return #not a material from the pipe, move on
 
         if matNode.isLockedHDA():
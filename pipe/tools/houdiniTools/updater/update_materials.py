@@ -1,4 +1,4 @@
-import hou, re
+import hou
 from pipe.pipeHandlers.project import Project
 import pipe.pipeHandlers.quick_dialogs as qd
 
@@ -9,6 +9,7 @@ most recent versions
 class MatUpdater:
     def __init__(self):
         self.project = Project()
+        self.asset_index = self.project.get_asset_index()
 
     def updateAll(self):
         obj = hou.node("/obj")
@@ -24,12 +25,8 @@ class MatUpdater:
         qd.message("Updated all materials")
 
     def updateOne(self, mat):
-        assetList = self.project.list_assets()
-        for asset in assetList:
-            asset = re.sub(r'\W+', '', asset)
-
         typeName = mat.type().name()
-        if typeName not in assetList:
+        if typeName not in self.asset_index.sanitized:
             return #not a material from the pipe, move on
 
         if mat.isLockedHDA():
@@ -2,6 +2,8 @@ import hou, sys, os, shutil
 from pipe.pipeHandlers.project import Project
 from pipe.pipeHandlers.body import Asset
 from pipe.pipeHandlers.shotgun import ShotgunReader
+from pipe.pipeHandlers import shotgun_sync
+from pipe.pipeHandlers import list_cache
 import pipe.pipeHandlers.quick_dialogs as qd
 from pipe.pipeHandlers import pipeline_io as pio
 
@@ -14,20 +16,40 @@ class UpdateShots:
         self.project = Project()
 
     def update_shots(self):
-        shot_list = ShotgunReader().getShotList()
+        sync = shotgun_sync.ShotgunSync(ShotgunReader())
+        diff = sync.sync([shotgun_sync.SHOT])[shotgun_sync.SHOT]
+        shot_list = sync.get_shot_list()
         #print(shot_list)
 
-        list_file = open(os.path.join(self.project.get_shots_dir(), ".shot_list"), "w")
+        #only new shots need to be created
+        new_shots = set(diff[shotgun_sync.ADDED])
+        new_shots.update([new for old, new in diff[shotgun_sync.RENAMED]])
+
+        list_path = os.path.join(self.project.get_shots_dir(), ".shot_list")
+        if not new_shots and not diff[shotgun_sync.REMOVED] and os.path.exists(list_path):
+            sync.commit()
+            qd.message("Shots are already up to date.")
+            return
+
+        list_file = open(list_path, "w")
         list_file.truncate(0)
         for shot in shot_list:
             #print("shot " + shot) 
             list_file.write(shot + "\n")
 
-            self.create_shot(shot)
+            if shot in new_shots:
+                self.create_shot(shot)
 
         list_file.close()
+        list_cache.invalidate()
+        #saved only after every new shot was created, so a failed update is retried
+        sync.commit()
 
-        qd.message("Shots updated successfully.")
+        message = "Shots updated successfully.\n"
+        message += str(len(diff[shotgun_sync.ADDED])) + " added, "
+        message += str(len(diff[shotgun_sync.REMOVED])) + " removed, "
+        message += str(len(diff[shotgun_sync.RENAMED])) + " renamed."
+        qd.message(message)
 
     def create_shot(self, shot):
         stage = hou.node("/stage")
@@ -5,6 +5,7 @@ from pipe.pipeHandlers.project import Project
 from pipe.pipeHandlers.body import Body
 from pipe.pipeHandlers.body import Asset
 from pipe.pipeHandlers.element import Element
+from pipe.pipeHandlers import local_cache
 
 from PySide2 import QtWidgets
 import maya.cmds as mc
@@ -216,7 +217,7 @@ class Cloner:
 		for publish in self.publishes:
 			label=publish[0] + " " + publish[1] + " " + publish[2]
 			if label == selected_publish:
-				version_path = self.element.get_version_dir(position)
+				version_path = self.element.restore_version(position)
 				version_path = os.path.join(version_path, self.name + self.element.get_app_ext())
 				selected_scene_file = version_path
 				break
@@ -242,7 +243,9 @@ class Cloner:
 					im = qd.binary_option("Do you want to import or reference this asset?", "Import", "Reference")
 					if im:
 						# import the geometry
-						mc.file(selected_scene_file, i=True, ignoreVersion=True, mnc=False, gl=True, ns=":")
+						# an import keeps no link to its file, so it can read the local cached copy;
+						# references are saved in the scene and must point at the publish
+						mc.file(local_cache.localize(selected_scene_file), i=True, ignoreVersion=True, mnc=False, gl=True, ns=":")
 						print("File imported: " + selected_scene_file)
 					else:
 						# reference the geometry
@@ -2,16 +2,17 @@
 	Welcome to the Maya shelf script!
 
 	If you'd like to add a shelf button, you can add it to
-	the json file for that shelf. Follow the example of the 
+	the json file for that shelf. Follow the example of the
 	other buttons in json shelf files.
 	Remember, the icon should be a .svg and the function
 	must be implemented in the specified tool location
 '''
 import pymel.core as pm
+import ast
 import os
 import sys
 import json
-from pipe.tools.mayaTools.utilities.reload_scripts import *
+import time
 
 
 SHELF_DIR = os.environ.get('MAYA_SHELF_DIR')
@@ -19,52 +20,40 @@ ICON_DIR = os.environ.get('MAYA_ICONS_DIR')
 os.environ["DCC_ASSET_NAME"] = ""
 os.environ["DCC_DEPARTMENT"] = ""
 
+# Compiled shelves are kept here and compiled again when their json file changes
+MANIFEST_DIR = os.path.join(os.environ.get('MAYA_APP_DIR', os.path.expanduser('~/maya')), 'pipe_shelves')
+MANIFEST_VERSION = 1
+
+DISPATCH = "from pipe.tools.mayaTools.custom import shelf_dispatch; shelf_dispatch."
+
 '''
 	Shelf building code. You shouldn't have to edit anything
 	below these lines. If you want to add a new shelf item,
 	follow the instructions at the top of this file.
 '''
-def load_shelf(shelfName, fileName):
+def load_shelf(shelfName, fileName, reload_scripts=False):
 	print("loading ", shelfName)
+	start = time.time()
 	delete_shelf(shelfName)
-	ReloadScripts().go()
+	if reload_scripts:
+		reload_tools()
 
 	gShelfTopLevel = pm.mel.eval('global string $gShelfTopLevel; string $temp=$gShelfTopLevel')
 	pm.shelfLayout(shelfName, cellWidth=33, cellHeight=33, p=gShelfTopLevel)
 
 	# Load in the buttons
-	json_file = open(os.path.join(SHELF_DIR, fileName))
-	data = json.loads(json_file.read())
-	for shelf_item in data['shelfItems']:
+	for shelf_item in load_manifest(fileName):
 		if shelf_item['itemType'] == 'button':
 			icon = os.path.join(ICON_DIR, shelf_item['icon'])
 			annotation = shelf_item['annotation']
 			label = shelf_item['label']
-
-			# dcc = double click command: we can add a different command that goes when double clicked.
+			command = shelf_item['command']
 			dcc = shelf_item['double-click']
-			# menu = submenu for right-click
-			menu = shelf_item['menu']
-
-			path = "pipe.tools." + shelf_item['tool']
-			function = shelf_item['function']
-			class_with_method = function.split(".")
-			module = class_with_method[0]
-			method = class_with_method[1]
-
-			command_base = "from " + str(path) + " import " + str(module) + "; shelf_item = " + str(module) + "(); shelf_item."
-			command = command_base + str(method)
-
-			if dcc == 0:
-				dcc = command
-			else:
-				dcc = command_base + str(dcc)
+			new_menu = shelf_item['menu']
 
-			if menu == 0:
+			if new_menu is None:
 				pm.shelfButton(c=command, ann=annotation, i=icon, l=annotation, iol=label, olb=(0,0,0,0), dcc=dcc)
-			elif menu == 1:
-				menu_items = shelf_item['menu_items']
-				new_menu = build_menu_string(command_base, menu_items)
+			else:
 				mip = []
 				for i in range (len(new_menu)):
 					mip.append(i)
@@ -78,17 +67,125 @@ def load_shelf(shelfName, fileName):
 	pm.env.optionVars['generateUVTilePreviewsOnSceneLoad'] = 1
 
 	# shelf loaded correctly
-	print("*** Shelf loaded :) ***")
+	print("*** Shelf loaded in %.3fs :) ***" % (time.time() - start))
 	sys.path.append(os.getcwd())
 
 	#load up this plugin bc rigging used it
 	pm.loadPlugin("ngSkinTools2")
 
-def build_menu_string(command_base, menu_items):
+def reload_tools():
+	'''
+		Development action: reload the pipe tool modules so edits show
+		up without restarting Maya. Loading a shelf only does this when
+		called with reload_scripts=True.
+	'''
+	from pipe.tools.mayaTools.utilities.reload_scripts import ReloadScripts
+	from pipe.tools.mayaTools.custom import shelf_dispatch
+	ReloadScripts().go()
+	shelf_dispatch.reload_tools()
+
+def load_manifest(fileName):
+	'''
+		Return the compiled buttons of a shelf json file. The compiled
+		shelf is cached on disk with the json's modification time and
+		size, and compiled again when either changes.
+	'''
+	json_path = os.path.join(SHELF_DIR, fileName)
+	st = os.stat(json_path)
+	cache_path = os.path.join(MANIFEST_DIR, fileName)
+	try:
+		with open(cache_path) as cache_file:
+			manifest = json.load(cache_file)
+		if (manifest['version'], manifest['mtime_ns'], manifest['size']) == (MANIFEST_VERSION, st.st_mtime_ns, st.st_size):
+			return manifest['shelfItems']
+	except (IOError, OSError, ValueError, KeyError):
+		pass
+
+	with open(json_path) as json_file:
+		data = json.loads(json_file.read())
+	manifest = {'version': MANIFEST_VERSION, 'mtime_ns': st.st_mtime_ns, 'size': st.st_size, 'shelfItems': compile_shelf(data)}
+	try:
+		if not os.path.isdir(MANIFEST_DIR):
+			os.makedirs(MANIFEST_DIR)
+		temp_path = cache_path + '.' + str(os.getpid())
+		with open(temp_path, 'w') as cache_file:
+			json.dump(manifest, cache_file)
+		os.replace(temp_path, cache_path)
+	except (IOError, OSError):
+		pass # the shelf still loads, it's just compiled again next time
+	return manifest['shelfItems']
+
+def compile_shelf(data):
+	'''
+		Turn the items of a shelf json file into the commands of their
+		buttons. The commands go through shelf_dispatch, which imports
+		the tool on the first click.
+	'''
+	items = []
+	for shelf_item in data['shelfItems']:
+		if shelf_item['itemType'] != 'button':
+			items.append({'itemType': shelf_item['itemType']})
+			continue
+
+		# dcc = double click command: we can add a different command that goes when double clicked.
+		dcc = shelf_item['double-click']
+		# menu = submenu for right-click
+		menu = shelf_item['menu']
+
+		path = "pipe.tools." + shelf_item['tool']
+		function = shelf_item['function']
+		class_with_method = function.split(".")
+		module = class_with_method[0]
+		method = class_with_method[1]
+
+		command = build_command(path, module, method)
+
+		if dcc == 0:
+			dcc = command
+		elif dcc == "":
+			dcc = "" # no double click action
+		else:
+			dcc = build_command(path, module, dcc)
+
+		if menu == 1:
+			menu = build_menu_string(path, module, shelf_item['menu_items'])
+		else:
+			menu = None
+
+		items.append({
+			'itemType': 'button',
+			'icon': shelf_item['icon'],
+			'annotation': shelf_item['annotation'],
+			'label': shelf_item['label'],
+			'command': command,
+			'double-click': dcc,
+			'menu': menu,
+		})
+	return items
+
+def build_command(path, module, method):
+	'''
+		Command that calls method (e.g. "go(alembic=True)") on a new
+		instance of module through the dispatcher. A call with arguments
+		that aren't literals keeps the old import and call command.
+	'''
+	try:
+		call = ast.parse(method.strip(), mode='eval').body
+		if isinstance(call, ast.Name):
+			name, args, kwargs = call.id, [], {}
+		else:
+			name = call.func.id
+			args = [ast.literal_eval(arg) for arg in call.args]
+			kwargs = dict((keyword.arg, ast.literal_eval(keyword.value)) for keyword in call.keywords)
+	except (SyntaxError, ValueError, AttributeError, TypeError):
+		command_base = "from " + str(path) + " import " + str(module) + "; shelf_item = " + str(module) + "(); shelf_item."
+		return command_base + str(method)
+	return DISPATCH + "run(%r, %r, %r, %r, %r)" % (path, module, name, tuple(args), kwargs)
+
+def build_menu_string(path, module, menu_items):
 	menu = []
-	menu_python = [0,1,2,3]
 	for item in menu_items.items():
-		menu_command = command_base + str(item[1])
+		menu_command = build_command(path, module, item[1])
 		label = item[0]
 		new_item = [label, menu_command]
 		menu.append(new_item)
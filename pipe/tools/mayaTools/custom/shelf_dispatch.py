@@ -0,0 +1,36 @@
+'''
+	Shelf button dispatcher.
+
+	Every pipe shelf button calls run() with the tool module, class and
+	method it was compiled to. The module is imported on the first click
+	and kept, so loading a shelf doesn't import any tool.
+	Keep this module free of heavy imports, it is imported by the first
+	click on any button.
+'''
+import importlib
+import sys
+
+_modules = {}
+
+def get_module(path):
+	module = _modules.get(path)
+	if module is None:
+		module = importlib.import_module(path)
+		_modules[path] = module
+	return module
+
+def run(path, class_name, method, args=(), kwargs={}):
+	tool = getattr(get_module(path), class_name)()
+	return getattr(tool, method)(*args, **kwargs)
+
+def reload_tools():
+	'''
+		Development action: reload every tool module the shelf has
+		imported so far, so the next click runs the edited code.
+	'''
+	for path in sorted(_modules):
+		if path in sys.modules:
+			_modules[path] = importlib.reload(sys.modules[path])
+		else:
+			del _modules[path]
+		print("reloaded " + path)
@@ -1,4 +1,3 @@
-from pipe.pipeHandlers import *
 from pipe.pipeHandlers import quick_dialogs
 import os
 import shutil
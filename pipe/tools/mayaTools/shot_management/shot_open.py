@@ -69,7 +69,7 @@ class ShotOpener:
         for publish in self.publishes:
             label=publish[0] + " " + publish[1] + " " + publish[2]
             if label == selected_publish:
-                version_path = self.element.get_version_dir(position)
+                version_path = self.element.restore_version(position)
                 version_path = os.path.join(version_path, self.name + ".mb")
                 selected_scene_file = version_path
                 break
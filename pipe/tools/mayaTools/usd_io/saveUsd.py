@@ -2,7 +2,6 @@
 # version control for each time someone edits the layout
 # in maya. i'm just keeping it for reference :P
 
-from pipe.pipeHandlers import *
 from pipe.pipeHandlers import quick_dialogs
 import os
 import shutil
@@ -2,6 +2,38 @@ import nuke
 import nukescripts
 import os
 import glob
+import render_index
+
+
+def ChooseLayer(readFile):
+
+	# A folder is indexed for its render layers, anything else is read as it is
+	if not os.path.isdir(readFile):
+		return readFile, None
+
+	layers = render_index.layers(readFile)
+	if len(layers) == 0:
+		nuke.message('No image sequences found in\n%s' % (readFile))
+		return None, None
+
+	labels = sorted(layers.keys())
+	label = labels[0]
+	if len(labels) > 1:
+		p = nuke.Panel('Render layers')
+		p.addEnumerationPulldown('Layer', ' '.join(['{%s}' % (l) for l in labels]))
+		p.addButton('Cancel')
+		p.addButton('OK')
+		p.setWidth(600)
+		if p.show() == 0:
+			return None, None
+		label = p.value('Layer')
+
+	sequence = layers[label]
+	missing = sequence.missing()
+	if len(missing) > 0:
+		print ('--> %d missing frames in %s: %s' % (len(missing), label, missing))
+
+	return sequence.nuke_path(), sequence
 
 
 def AutoProjectSettings():
@@ -56,9 +88,6 @@ def AutoProjectSettings():
 
 	else:
 
-		#files = glob.glob(readFile, recursive=True)
-		#print(files)
-
 		# Get values
 		readFile = z.value(readFile)
 
@@ -165,11 +194,18 @@ def AutoProjectSettings():
 			# Create Read #
 
 
-			filelist = [readFile]
+			readFile, sequence = ChooseLayer(readFile)
+
+			if readFile == None:
+				return
 
-			if filelist != None:
-				for f in filelist:
-					newRead = nuke.createNode("Read", "file {" + f + "}", inpanel = True)
+			f = readFile
+
+			if sequence != None: # Range from the index, Nuke doesn't need to look for the frames
+				newRead = nuke.createNode("Read", "file {%s} first %d last %d origfirst %d origlast %d" % (f, sequence.first, sequence.last, sequence.first, sequence.last), inpanel = True)
+
+			else:
+				newRead = nuke.createNode("Read", "file {" + f + "}", inpanel = True)
 
 
 			inPoint = newRead['first'].getValue()
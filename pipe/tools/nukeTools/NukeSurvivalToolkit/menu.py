@@ -20,6 +20,10 @@ nuke.pluginAddPath('./nk_files')
 # Import some helpful functions for the NST
 import NST_helper
 
+# Time the toolkit's startup, set NST_STARTUP_TIMING to print it
+import NST_menu
+NST_startupTimer = NST_menu.StartupTimer()
+
 # This is the prefix being used to customize the gizmo's in this toolkit
 global prefixNST
 prefixNST = "NST_"
@@ -28,6 +32,14 @@ prefixNST = "NST_"
 NST_FolderPath = os.path.dirname(__file__)
 NST_helper.NST_FolderPath = NST_FolderPath
 
+# Python tools are loaded when the first node that needs them is created, the manifest
+# tells which gizmos those are and is only rebuilt when the gizmos folder changes
+try:
+    NST_menu.registerLazyTools(NST_menu.loadManifest(os.path.join(NST_FolderPath, "gizmos")))
+except Exception as error:
+    print("Could not register the NST python tools: {}".format(error))
+NST_startupTimer.mark("manifest")
+
 # give the name of the help doc .pdf in main folder
 NST_helpDoc = "NukeSurvivalToolkit_Documentation_Release_v2.1.0.pdf"
 
@@ -159,13 +171,8 @@ drawMenu.addSeparator()
 drawMenu.addCommand('WaterLens MJT', "nuke.createNode('{}WaterLens')".format(prefixNST), icon="WaterLens.png")
 drawMenu.addCommand("Silk MHD", "nuke.createNode('{}h_silk')".format(prefixNST), icon="h_silk.png")
 
-# Try to add GradientEditor
-try:
-    import ColorGradientUi
-    drawMenu.addCommand("GradientEditor MHD", "nuke.createNode('{}h_gradienteditor')".format(prefixNST), icon="h_gradienteditor.png")
-except:
-    print("Could not load ColorGradientUi from HagbarthTools folder")
-    pass
+# GradientEditor, ColorGradientUi is loaded when the node is created
+drawMenu.addCommand("GradientEditor MHD", "nuke.createNode('{}h_gradienteditor')".format(prefixNST), icon="h_gradienteditor.png")
 
 drawMenu.addSeparator()
 
@@ -442,13 +449,8 @@ transformMenu.addCommand('vector3DMathExpression EL', "nuke.createNode('{}vector
 transformMenu.addCommand('Vectors_Direction EL', "nuke.createNode('{}Vectors_Direction')".format(prefixNST), icon = 'vectorTools.png')
 transformMenu.addCommand('Vectors_to_Degrees EL', "nuke.createNode('{}Vectors_to_Degrees')".format(prefixNST), icon = 'vectorTools.png')
 
-# Add VectorTracker python file
-try:
-    nuke.load('{}VectorTracker.py'.format(prefixNST))
-    transformMenu.addCommand('VectorTracker NKPD', "nuke.createNode('{}VectorTracker.gizmo')".format(prefixNST), icon = 'vectorTools.png')
-except:
-    print("Could not load VectorTracker.py")
-    pass
+# VectorTracker, NST_VectorTracker.py is loaded when the node is created
+transformMenu.addCommand('VectorTracker NKPD', "nuke.createNode('{}VectorTracker.gizmo')".format(prefixNST), icon = 'vectorTools.png')
 
 transformMenu.addSeparator()
 
@@ -475,6 +477,7 @@ transformMenu.addCommand('CProject AK', "nuke.createNode('{}CProject')".format(p
 transformMenu.addCommand('TProject AK', "nuke.createNode('{}TProject')".format(prefixNST), icon='Transform.png')
 
 transformMenu.addCommand("StickIt MHD", "nuke.createNode('{}h_stickit')".format(prefixNST), icon="h_stickit.png")
+transformMenu.addCommand("StickIt Reduce Keyframes MHD", "import NST_stickit\nNST_stickit.ReduceSelectedKeyframes()", icon="h_stickit.png")
 transformMenu.addSeparator()
 
 transformMenu.addCommand('TransformMatrix AG', "nuke.createNode('{}TransformMatrix')".format(prefixNST), icon="Transform.png")
@@ -712,3 +715,6 @@ gizmoDemoMenu.addCommand('Sparky Demo DB', "nuke.nodePaste('{}/nk_files/{}Sparky
 gizmoDemoMenu.addCommand('ParticleLights Demo MHD', "nuke.nodePaste('{}/nk_files/{}ParticleLights_ExampleScript.nk')".format(NST_FolderPath, prefixNST), icon="ToolbarParticles.png")
 gizmoDemoMenu.addCommand("X_Aton Volumetric Demo XM", "nuke.nodePaste('{}/nk_files/{}X_Aton_Examples.nk')".format(NST_FolderPath, prefixNST), icon="X_Aton.png")
 
+
+NST_startupTimer.mark("menus")
+NST_startupTimer.report()
@@ -14,6 +14,7 @@ except:
     from h_Qt.QtGui import *
     from h_Qt.QtCore import *
 from nukescripts import panels
+import bisect
 import datetime
 import operator
 
@@ -163,6 +164,59 @@ class ColorValue:
 		self.distance = 1
 		self.selected = False
 
+#Number of entries in the lookup table used to paint a gradient
+LUT_SIZE = 1024
+
+class GradientStops:
+	'''
+	The color stops of a gradient sorted by position. Built once every time the stops
+	change, so sampling is a bisect over the positions and the painted image of the
+	gradient is only made once per change.
+	'''
+	def __init__(self, colorList=[]):
+		self.items = sorted(colorList, key=operator.attrgetter('position'))
+		self.positions = [item.position for item in self.items]
+		self.colors = [item.color.getRgbF() for item in self.items]
+		self._image = None
+
+	def __len__(self):
+		return len(self.items)
+
+	def colorAt(self, posx): #Linear interpolation between the two stops around posx, as (R,G,B,A)
+		if not self.items:
+			return (0.0, 0.0, 0.0, 0.0)
+		index = bisect.bisect_left(self.positions, posx)
+		if index == 0:
+			return self.colors[0]
+		if index == len(self.items):
+			return self.colors[-1]
+		_dist = self.positions[index]-self.positions[index-1]
+		_distT = 0.0 if _dist == 0.0 else (posx-self.positions[index-1])/_dist
+		colorA = self.colors[index-1]
+		colorB = self.colors[index]
+		return tuple([colorA[i] + (colorB[i]-colorA[i])*_distT for i in range(4)])
+
+	def lut(self, size=LUT_SIZE): #The gradient sampled at size evenly spaced positions from 0 to 1
+		return [self.colorAt(x/float(size-1)) for x in range(size)]
+
+	def image(self): #A LUT_SIZE x 1 image of the gradient, for painting
+		if self._image is None:
+			self._image = QtGui.QImage(LUT_SIZE, 1, QtGui.QImage.Format_ARGB32)
+			for x,color in enumerate(self.lut()):
+				self._image.setPixel(x, 0, QColor.fromRgbF(*[max(0.0,min(1.0,c)) for c in color]).rgba())
+		return self._image
+
+	def nearest(self, posx): #The stop closest to posx
+		if not self.items:
+			return None
+		index = bisect.bisect_left(self.positions, posx)
+		if index == len(self.items) or (index > 0 and posx-self.positions[index-1] <= self.positions[index]-posx):
+			index -= 1
+		return self.items[index]
+
+	def curveList(self): #The sorted list used by setColorCurve, formated [[R,G,B,A,INDEX],[...]]
+		return [list(color)+[position] for color,position in zip(self.colors, self.positions)]
+
 class GradientWidget(QtGui.QWidget):
 	def __init__(self, parent=None, mainDiameter=138, outerRingWidth=10,my_node="None"):
 		QtGui.QWidget.__init__(self, parent)
@@ -171,6 +225,8 @@ class GradientWidget(QtGui.QWidget):
 		self.colorLookupNode = my_node.node("ColorLookup1")
 		self.thisNode = my_node
 		self.colorList = [] #Used to store all the colors
+		self.stops = GradientStops() #The colors sorted by position, rebuilt by _update()
+		self.lastCurve = None #The last curve that was sent to the ColorLookup node
 		self.selectedHandle = False
 		self.selectedHandels = []
 		# this is the pixel diameter of the actual color wheel, without the extra decorations drawn as part of this widget
@@ -185,13 +241,14 @@ class GradientWidget(QtGui.QWidget):
 			colorlist = LoadCurveDataX(_data)
 		if len(colorlist) <= 1:
 			self.testPointsSetup()
+			self.stops = GradientStops(self.colorList)
 		else:
 			for item in colorlist:
 				ReturnItem = ColorValue()
 				ReturnItem.position = item[-1]
 				ReturnItem.color = QColor.fromRgbF(item[0], item[1], item[2], item[3])
 				self.colorList.append(ReturnItem)
-				self._update()
+			self._update()
 
 	def sliderUpdate(self,_color):
 		for item in self.colorList:
@@ -201,6 +258,7 @@ class GradientWidget(QtGui.QWidget):
 				break
 
 	def _update(self): #A function that is being called when changes have been made that needs to reflect in the UI
+		self.stops = GradientStops(self.colorList)
 		self.colorNodeUpdate()
 		self.repaint()
 
@@ -226,38 +284,7 @@ class GradientWidget(QtGui.QWidget):
 
 
 	def getColorAtOffset(self,posx):
-
-		#Get the points last and next point.
-		sorted_x = sorted(self.colorList,key=operator.attrgetter('position'))
-		current_index = len(sorted_x)
-		for x,item in enumerate(sorted_x):
-			if posx > item.position:
-				pass
-			else:
-				current_index = x
-				break
-
-		if current_index == 0:
-			itemA = sorted_x[0]
-			itemB = sorted_x[0]
-		elif current_index == len(sorted_x):
-			itemA = sorted_x[-1]
-			itemB = sorted_x[-1]
-		else:
-			itemA = sorted_x[current_index-1]
-			itemB = sorted_x[current_index]
-
-		#Calcualte how far between the two we are and get a color value
-		_dist = itemB.position-itemA.position
-		_distP = posx-itemA.position
-		if _dist == 0.0:
-			_distT = 0.0
-		else:
-			_distT = _distP/_dist
-		_red = _distT*itemA.color.getRgbF()[0] + (1-_distT)*itemB.color.getRgbF()[0]
-		_green = _distT*itemA.color.getRgbF()[1] + (1-_distT)*itemB.color.getRgbF()[1]
-		_blue = _distT*itemA.color.getRgbF()[2] + (1-_distT)*itemB.color.getRgbF()[2]
-		_alpha = _distT*itemA.color.getRgbF()[3] + (1-_distT)*itemB.color.getRgbF()[3]
+		_red, _green, _blue, _alpha = self.stops.colorAt(posx)
 		return QColor.fromRgbF(_green, _blue,_alpha,_red).rgba() #MUST BE A NUKE BUG THAT ITS GREEN BLUE ALPHA RED!!!
 
 
@@ -272,7 +299,6 @@ class GradientWidget(QtGui.QWidget):
 		color = QtGui.QColor(0, 0, 0)
 		color.setNamedColor('#008080')
 		painter.setPen(color)
-		gradient = QLinearGradient(self.widget_width+(self.widget_offset*2), 0, 0, 0)
 
 		painter.setBrush(Qt.CrossPattern)
 		painter.drawRect(self.widget_offset, self.widget_top+10, self.widget_width-1, self.widget_height)
@@ -280,21 +306,21 @@ class GradientWidget(QtGui.QWidget):
 		for item in self.colorList:
 			if item.selected:
 				painter.drawEllipse(QtCore.QPoint((item.position*self.widget_width)+self.widget_offset,self.widget_top) , 10, 10 ) #DRAW THE OUTER BLACK CIRCLE
-			gradient.setColorAt(1-item.position, item.color)
 			painter.setBrush(item.color)
 			painter.drawEllipse(QtCore.QPoint((item.position*self.widget_width)+self.widget_offset,self.widget_top) , 7, 7 ) #DRAW THE OUTER BLACK CIRCLE
 			painter.drawRect((item.position*self.widget_width)-self.handle_width+self.widget_offset,self.widget_top+15+self.widget_height , self.handle_width*2, self.handle_width*2 ) #DRAW THE OUTER BLACK CIRCLE
 
-		painter.setBrush(gradient)
-
+		#Paint the gradient from its lookup table
+		painter.setRenderHint(QtGui.QPainter.SmoothPixmapTransform)
+		painter.drawImage(QtCore.QRect(self.widget_offset, self.widget_top+10, self.widget_width-1, self.widget_height), self.stops.image())
+		painter.setBrush(Qt.NoBrush)
 		painter.drawRect(self.widget_offset, self.widget_top+10, self.widget_width-1, self.widget_height)
 
 
 	def getNearestHandle(self,posx,posy,dc=False):
-		for item in self.colorList:
-			item.distance = abs(posx-item.position)
-		sorted_x = sorted(self.colorList,key=operator.attrgetter('distance'))
-		if sorted_x[0].distance <= self.handle_width/float(self.widget_width):
+		nearest = self.stops.nearest(posx)
+		sorted_x = [nearest]
+		if nearest is not None and abs(posx-nearest.position) <= self.handle_width/float(self.widget_width):
 			if abs(posy-(self.widget_top)) <= self.handle_width: #The Main Color Handle
 				if dc:
 					#This part is triggered when you click a allready exsisting color chip (hence you want to edit the color)
@@ -373,11 +399,12 @@ class GradientWidget(QtGui.QWidget):
 				self.myTimer.restart()
 
 	def colorNodeUpdate(self):
-		colorList = []
-		for item in self.colorList:
-			color = item.color.getRgbF()
-			colorList.append([color[0],color[1],color[2],color[3],item.position])
-		colorList = sorted(colorList, key=lambda x: x[-1], reverse=False)
+		colorList = self.stops.curveList()
+		#Only rewrite the curves when the stops or the interpolation changed
+		curve = (colorList, self._parent.interpolationMenu.currentIndex())
+		if curve == self.lastCurve:
+			return
+		self.lastCurve = curve
 		setColorCurve(self.colorLookupNode,colorList,self.thisNode,self._parent)
 
 
@@ -392,6 +419,7 @@ class GradientLabel(QtGui.QLabel):
 		self.Name = name
 		self.colorList = []
 		self.ExtractColorData()
+		self.stops = GradientStops(self.colorList)
 
 	def mouseReleaseEvent(self, ev):
 		self.masterSignal.emit(self.GradientData)
@@ -417,10 +445,8 @@ class GradientLabel(QtGui.QLabel):
 		self.widget_height = 28
 		self.widget_top = 0
 
-		gradient = QLinearGradient(self.widget_width+(self.widget_offset*2), 0, 0, 0)
-		for item in self.colorList:
-			gradient.setColorAt(1-item.position, item.color)
-		painter.setBrush(gradient)
+		painter.setRenderHint(QtGui.QPainter.SmoothPixmapTransform)
+		painter.drawImage(QtCore.QRect(self.widget_offset, self.widget_top, self.widget_width, self.widget_height), self.stops.image())
 		painter.drawRect(self.widget_offset, self.widget_top, self.widget_width, self.widget_height)
 
 
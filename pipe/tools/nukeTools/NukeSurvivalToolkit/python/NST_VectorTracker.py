@@ -6,6 +6,12 @@ nuke.load('VectorTracker.py')
 nuke.menu("Nodes").addCommand('user/VectorTracker', "nuke.createNode('VectorTracker.gizmo')")
 '''
 
+try:
+    #tracking engine, needs numpy
+    import NST_VectorTracker_engine as vectorEngine
+except ImportError:
+    vectorEngine = None
+
 def allScriptNodes():
     #collect all nodes in the root node graph
     nodes = nuke.allNodes()
@@ -23,6 +29,65 @@ def allScriptNodes():
     #return all nodes on all levels
     return nodes
 
+class J_VTT_NodeField(object):
+    '''
+    vector field of one frame for the tracking engine, read from the vector node. The
+    pixels under the sample areas are read once each, trackers with overlapping areas
+    sharing them, and the engine's VectorField box filters them for all trackers at once.
+    '''
+
+    def __init__(self, vectors, u, v, frame):
+        self.vectors = vectors
+        self.u = u
+        self.v = v
+        self.frame = frame
+
+    def _read(self, left, bottom, right, top):
+        #the u and v planes of a window of pixels, row 0 at the bottom
+        np = vectorEngine.np
+        us = np.zeros((top - bottom, right - left))
+        vs = np.zeros((top - bottom, right - left))
+        for row in range(top - bottom):
+            for column in range(right - left):
+                us[row, column] = self.vectors.sample(self.u, left + column + .5, bottom + row + .5, 1, 1, self.frame)
+                vs[row, column] = self.vectors.sample(self.v, left + column + .5, bottom + row + .5, 1, 1, self.frame)
+        return vectorEngine.VectorField(us, vs)
+
+    def _windows(self, boxes):
+        #merge the pixel windows of the sample areas that overlap into (window, trackers)
+        windows = []
+        for i, box in enumerate(boxes):
+            box = list(box)
+            members = [i]
+            merged = True
+            while merged:
+                merged = False
+                for other in windows:
+                    otherBox = other[0]
+                    if box[0] < otherBox[2] and otherBox[0] < box[2] and box[1] < otherBox[3] and otherBox[1] < box[3]:
+                        box = [min(box[0], otherBox[0]), min(box[1], otherBox[1]), max(box[2], otherBox[2]), max(box[3], otherBox[3])]
+                        members += other[1]
+                        windows.remove(other)
+                        merged = True
+                        break
+            windows.append((box, members))
+        return windows
+
+    def sample(self, x, y, width, height):
+        np = vectorEngine.np
+        x = np.asarray(x, dtype=np.float64)
+        y = np.asarray(y, dtype=np.float64)
+        width = np.asarray(width, dtype=np.float64)
+        height = np.asarray(height, dtype=np.float64)
+        boxes = np.column_stack((np.floor(x - width / 2), np.floor(y - height / 2),
+                                 np.ceil(x + width / 2), np.ceil(y + height / 2))).astype(int)
+        us = np.zeros(len(x))
+        vs = np.zeros(len(x))
+        for (left, bottom, right, top), members in self._windows(boxes.tolist()):
+            field = self._read(left, bottom, max(right, left + 1), max(top, bottom + 1))
+            us[members], vs[members] = field.sample(x[members] - left, y[members] - bottom, width[members], height[members])
+        return us, vs
+
 def J_VTT_Track(first, last, pb = True):
     node = nuke.thisNode()
     vectors = node.input(1)
@@ -84,55 +149,96 @@ def J_VTT_Track(first, last, pb = True):
 
         #set frame list
         if forward:
-            rangeList = xrange(first, last+1)
+            rangeList = list(range(first, last+1))
         else:
-            rangeList = reversed(xrange(last, first+1))
+            rangeList = list(reversed(range(last, first+1)))
+
+        if vectorEngine is None:
+            J_VTT_TrackEachFrame(node, vectors, u, v, trackers, xpos, ypos, xsize, ysize, rangeList, last, totalFrames, pb)
+            return
 
         #set up pogress window
         if pb:
             task = nuke.ProgressTask("VectorTracker")
-            count = 0
-
-        #cycle through frames
-        for frame in rangeList:
 
+        def progress(count, frame):
             #stop tracking if process is cancelled
             if pb:
                 if task.isCancelled():
-                    break
+                    return False
+                #update process window
+                if frame != last:
+                    task.setMessage("sampling frame " + str(frame) + ' (frame ' + str(count+1) +' of ' + str(totalFrames) + ')')
+                    task.setProgress((count+1)*100/totalFrames)
+            return True
 
-            #update process window
-            if frame != last and pb:
-                count += 1
-                task.setMessage("sampling frame " + str(frame) + ' (frame ' + str(count) +' of ' + str(totalFrames) + ')')
-                task.setProgress(count*100/totalFrames)
+        #move all trackers together, one frame of vectors at a time
+        path = vectorEngine.track(list(zip(xpos, ypos)), list(zip(xsize, ysize)), rangeList,
+                                  lambda frame: J_VTT_NodeField(vectors, u, v, frame), progress)
+        if pb:
+            #close the progress window (progress() still refers to task, so it can't be deleted)
+            task = None
 
-            #execute for each tracker
-            for i, tracker in enumerate(trackers):
-                #get current position from list
-                curx = xpos[i]
-                cury = ypos[i]
+        #set all keyframes of a tracker at once
+        trackedFrames = rangeList[:len(path)]
+        for i, tracker in enumerate(trackers):
+            for curve in [0,1]:
+                values = path[:, i, curve].tolist()
+                node[tracker].animations()[curve].addKey([nuke.AnimationKey(frame, value) for frame, value in zip(trackedFrames, values)])
 
-                #set keyframe
-                node[tracker].animations()[0].setKey(frame, curx)
-                node[tracker].animations()[1].setKey(frame, cury)
+        #jump to the last tracked frame
+        if trackedFrames:
+            nuke.frame(trackedFrames[-1])
+    #message when there is no vector data
+    else:
+        nuke.message('No vectors found!')
 
-                if frame != last:
-                    #sample vectors
-                    x = vectors.sample(u, curx+.5, cury+.5, xsize[i],ysize[i], frame)
-                    y = vectors.sample(v, curx+.5, cury+.5, xsize[i],ysize[i], frame)
+def J_VTT_TrackEachFrame(node, vectors, u, v, trackers, xpos, ypos, xsize, ysize, rangeList, last, totalFrames, pb):
+    '''
+    tracking without the engine (no numpy): samples and keys every tracker frame by frame
+    '''
+    #set up pogress window
+    if pb:
+        task = nuke.ProgressTask("VectorTracker")
+        count = 0
 
-                    #set new position
-                    xpos[i] = curx + x
-                    ypos[i] = cury + y
+    #cycle through frames
+    for frame in rangeList:
 
-            #jump to frame
-            nuke.frame(frame)
+        #stop tracking if process is cancelled
         if pb:
-            del task
-    #message when there is no vector data
-    else:
-        nuke.message('No vectors found!')
+            if task.isCancelled():
+                break
+
+        #update process window
+        if frame != last and pb:
+            count += 1
+            task.setMessage("sampling frame " + str(frame) + ' (frame ' + str(count) +' of ' + str(totalFrames) + ')')
+            task.setProgress(count*100/totalFrames)
+
+        #execute for each tracker
+        for i, tracker in enumerate(trackers):
+            #get current position from list
+            curx = xpos[i]
+            cury = ypos[i]
+
+            #set keyframe
+            node[tracker].animations()[0].setKey(frame, curx)
+            node[tracker].animations()[1].setKey(frame, cury)
+
+            if frame != last:
+                #sample vectors
+                x = vectors.sample(u, curx+.5, cury+.5, xsize[i],ysize[i], frame)
+                y = vectors.sample(v, curx+.5, cury+.5, xsize[i],ysize[i], frame)
+
+                #set new position
+                xpos[i] = curx + x
+                ypos[i] = cury + y
+
+        #jump to frame
+        nuke.frame(frame)
+    if pb:
+        del task
 
 def J_VTT_AddTracker():
     node = nuke.thisNode()
@@ -0,0 +1,88 @@
+'''
+VectorTracker engine
+
+Moves a set of trackers through per-frame motion vectors. It does not import nuke, so
+it can be run on synthetic or recorded vector fields; NST_VectorTracker.py is the Nuke
+side that feeds it and writes the keys.
+
+A field is anything with sample(x, y, width, height) taking arrays of positions and
+sample area sizes and returning the (u, v) vectors averaged over those areas.
+VectorField does this for whole vector planes held in arrays.
+'''
+
+import numpy as np
+
+class VectorField(object):
+    '''
+    u and v vector planes as arrays of shape (height, width), row 0 at the bottom like
+    Nuke's y axis. Pixel (x, y) covers [x, x+1) x [y, y+1), outside the planes is black.
+    '''
+
+    def __init__(self, u, v):
+        self.height, self.width = np.shape(u)
+        self._tables = [self._summedArea(u), self._summedArea(v)]
+
+    def _summedArea(self, plane):
+        #table[y, x] holds the sum of plane[:y, :x]
+        table = np.zeros((self.height + 1, self.width + 1))
+        table[1:, 1:] = np.cumsum(np.cumsum(np.asarray(plane, dtype=np.float64), axis=0), axis=1)
+        return table
+
+    def _integral(self, table, x, y):
+        #the summed area table is exact at pixel corners and bilinear in between, so
+        #interpolating it gives the exact integral up to any point
+        x = np.clip(x, 0, self.width)
+        y = np.clip(y, 0, self.height)
+        x0 = np.minimum(np.floor(x).astype(int), self.width - 1)
+        y0 = np.minimum(np.floor(y).astype(int), self.height - 1)
+        fx = x - x0
+        fy = y - y0
+        return ((table[y0, x0] * (1 - fx) + table[y0, x0 + 1] * fx) * (1 - fy) +
+                (table[y0 + 1, x0] * (1 - fx) + table[y0 + 1, x0 + 1] * fx) * fy)
+
+    def sample(self, x, y, width=1, height=1):
+        '''
+        box filtered average of the vectors over width x height areas centered on (x, y).
+        An area of 1 x 1 is a bilinear interpolation between pixel centers.
+        '''
+        x = np.asarray(x, dtype=np.float64)
+        y = np.asarray(y, dtype=np.float64)
+        width = np.maximum(np.asarray(width, dtype=np.float64), 1e-6)
+        height = np.maximum(np.asarray(height, dtype=np.float64), 1e-6)
+        left = x - width / 2
+        right = x + width / 2
+        bottom = y - height / 2
+        top = y + height / 2
+
+        result = []
+        for table in self._tables:
+            total = (self._integral(table, right, top) - self._integral(table, left, top) -
+                     self._integral(table, right, bottom) + self._integral(table, left, bottom))
+            result.append(total / (width * height))
+        return result[0], result[1]
+
+def track(positions, sizes, frames, fieldAt, progress=None):
+    '''
+    advect all trackers together through the given frames.
+    positions -- array of shape (trackers, 2) with the positions on frames[0]
+    sizes -- array of shape (trackers, 2) with the sample area of each tracker
+    frames -- the frames to track through, in tracking order
+    fieldAt -- callable returning the field for a frame, the vectors of frame n move
+               the trackers to the next frame in the list
+    progress -- optional callable(index, frame), tracking stops when it returns False
+    returns an array of shape (tracked frames, trackers, 2) with the position on every
+    frame that was tracked, starting with frames[0]
+    '''
+    positions = np.array(positions, dtype=np.float64).reshape(-1, 2)
+    sizes = np.asarray(sizes, dtype=np.float64).reshape(-1, 2)
+    path = []
+    for index, frame in enumerate(frames):
+        if progress is not None and progress(index, frame) is False:
+            break
+        path.append(positions)
+
+        if index < len(frames) - 1:
+            #sample at the pixel center under the tracker
+            u, v = fieldAt(frame).sample(positions[:, 0] + .5, positions[:, 1] + .5, sizes[:, 0], sizes[:, 1])
+            positions = positions + np.column_stack((u, v))
+    return np.array(path).reshape(-1, len(positions), 2)
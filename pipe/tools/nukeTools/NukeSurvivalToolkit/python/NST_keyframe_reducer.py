@@ -0,0 +1,75 @@
+# keyframe_reducer.py
+# Curve simplification for tracked keyframes. This module must not import nuke, so
+# curves can be reduced and checked offline. NST_stickit.KeyframeReducer applies it to knobs.
+
+import numpy as np
+
+'''================================================================================
+; Function:             ReduceCurve(frames,values,tolerance):
+; Description:          Finds the keys needed to keep a curve within a tolerance
+; Parameter(s):         frames - Array of shape (N,) with the key frames, ascending
+;                       values - Array of shape (N,) or (N,D), e.g. the X and Y of a track
+;                       tolerance - Largest allowed distance (in pixels for XY curves)
+;                       between a removed key and the curve through the kept ones
+; Return:               kept - Indices of the keys to keep, ascending. The first and last
+;                       key are always kept.
+; Note(s):              Ramer-Douglas-Peucker in frame time: the distance of a key is taken
+;                       to the straight line between the kept keys at the same frame, so
+;                       the result holds for linear interpolation. Every open segment is
+;                       split in the same pass, so there is one pass per level of the tree.
+;=================================================================================='''
+def ReduceCurve(frames,values,tolerance):
+  frames = np.asarray(frames,dtype=np.float64)
+  values = np.asarray(values,dtype=np.float64).reshape(len(frames),-1)
+  count = len(frames)
+  if count <= 2:
+    return np.arange(count)
+
+  keep = np.zeros(count,dtype=bool)
+  keep[0] = keep[-1] = True
+  starts = np.array([0])
+  ends = np.array([count-1])
+  while len(starts):
+    lengths = ends-starts-1
+    active = lengths > 0
+    starts = starts[active]
+    ends = ends[active]
+    lengths = lengths[active]
+    if not len(starts):
+      break
+
+    #Every key inside every open segment, flattened
+    segment = np.repeat(np.arange(len(starts)),lengths)
+    first = np.concatenate(([0],np.cumsum(lengths)[:-1]))
+    index = np.arange(lengths.sum())-np.repeat(first,lengths)+np.repeat(starts+1,lengths)
+
+    a = starts[segment]
+    b = ends[segment]
+    t = (frames[index]-frames[a])/(frames[b]-frames[a])
+    line = values[a]+(values[b]-values[a])*t[:,None]
+    error = np.sqrt(((values[index]-line)**2).sum(axis=1))
+
+    #The worst key of each segment (the first one on ties)
+    worst = np.maximum.reduceat(error,first)
+    candidates = np.flatnonzero(error == worst[segment])
+    split = candidates[np.unique(segment[candidates],return_index=True)[1]]
+    split = split[worst > tolerance]
+    middle = index[split]
+    keep[middle] = True
+
+    splitSegments = segment[split]
+    starts,ends = np.concatenate((starts[splitSegments],middle)),np.concatenate((middle,ends[splitSegments]))
+  return np.flatnonzero(keep)
+
+'''================================================================================
+; Function:             ReduceKeys(keys,tolerance):
+; Description:          ReduceCurve for a list of keys
+; Parameter(s):         keys - A list of keys formated [[Frame,Value,...][...]], ascending
+; Return:               kept - The keys to keep, in the same format
+; Note(s):              N/A
+;=================================================================================='''
+def ReduceKeys(keys,tolerance):
+  if not len(keys):
+    return []
+  keys = np.asarray(keys,dtype=np.float64)
+  return keys[ReduceCurve(keys[:,0],keys[:,1:],tolerance)].tolist()
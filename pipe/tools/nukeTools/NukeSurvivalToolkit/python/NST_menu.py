@@ -0,0 +1,136 @@
+'''
+NST menu manifest and lazy tool loading
+
+menu.py used to import the python tools (ColorGradientUi and its Qt widgets, the
+VectorTracker functions) at every Nuke launch. They are now loaded the first time a node
+that needs them is created, which is also when a saved script containing one is opened.
+
+Which gizmos need which tool is found by reading the gizmo files. The result is kept in
+a manifest that is only rebuilt when the hash of the gizmos folder listing changes, so a
+normal launch stats the folder instead of reading every gizmo.
+'''
+
+import hashlib
+import json
+import os
+import sys
+import time
+
+import nuke
+
+# tool module -> text that shows up in the knob scripts of the gizmos that call it.
+# NST_h_stickit imports NST_stickit in its own knob scripts, so it needs no entry here.
+TOOLS = {
+    'ColorGradientUi': 'ColorGradientUi.',
+    'NST_VectorTracker': 'J_VTT_',
+}
+
+# tools that are scripts defining functions for __main__ rather than importable modules
+SCRIPT_TOOLS = ('NST_VectorTracker',)
+
+MANIFEST_VERSION = 1
+
+loadedTools = {}
+
+def defaultManifestPath():
+    return os.path.join(os.path.expanduser('~'), '.nuke', 'NST_menu_manifest.json')
+
+def directoryHash(folder):
+    '''
+    hash of the names, sizes and modification times of the files in a folder
+    '''
+    digest = hashlib.sha1()
+    for name in sorted(os.listdir(folder)):
+        st = os.stat(os.path.join(folder, name))
+        digest.update(('%s %d %r\n' % (name, st.st_size, st.st_mtime)).encode('utf-8'))
+    return digest.hexdigest()
+
+def buildManifest(gizmoFolder):
+    '''
+    read every gizmo and record the tools its knob scripts call
+    '''
+    gizmos = {}
+    for name in sorted(os.listdir(gizmoFolder)):
+        nodeClass, extension = os.path.splitext(name)
+        if extension != '.gizmo':
+            continue
+        with open(os.path.join(gizmoFolder, name), 'rb') as gizmoFile:
+            text = gizmoFile.read().decode('utf-8', 'replace')
+        gizmos[nodeClass] = sorted(tool for tool, marker in TOOLS.items() if marker in text)
+    return gizmos
+
+def loadManifest(gizmoFolder, manifestPath=None):
+    '''
+    return the manifest for the gizmo folder, rebuilding and saving it if the folder changed.
+    A manifest that can't be saved is still returned, it will just be rebuilt next launch.
+    '''
+    manifestPath = manifestPath or defaultManifestPath()
+    folderHash = directoryHash(gizmoFolder)
+    try:
+        with open(manifestPath) as manifestFile:
+            manifest = json.load(manifestFile)
+        if manifest.get('version') == MANIFEST_VERSION and manifest.get('hash') == folderHash:
+            return manifest
+    except (IOError, OSError, ValueError):
+        pass
+
+    manifest = {'version': MANIFEST_VERSION, 'hash': folderHash, 'gizmos': buildManifest(gizmoFolder)}
+    try:
+        if not os.path.isdir(os.path.dirname(manifestPath)):
+            os.makedirs(os.path.dirname(manifestPath))
+        temp = '%s.%d' % (manifestPath, os.getpid())
+        with open(temp, 'w') as manifestFile:
+            json.dump(manifest, manifestFile)
+        os.rename(temp, manifestPath)
+    except (IOError, OSError):
+        pass
+    return manifest
+
+def loadTool(tool):
+    '''
+    import a tool into __main__, where the knob scripts of the gizmos look for it.
+    Returns False if the tool could not be loaded.
+    '''
+    if tool in loadedTools:
+        return loadedTools[tool]
+    try:
+        if tool in SCRIPT_TOOLS:
+            nuke.load('{}.py'.format(tool))
+        else:
+            __import__(tool)
+            setattr(sys.modules['__main__'], tool, sys.modules[tool])
+        loadedTools[tool] = True
+    except Exception as error:
+        print("Could not load {}: {}".format(tool, error))
+        loadedTools[tool] = False
+    return loadedTools[tool]
+
+def registerLazyTools(manifest):
+    '''
+    load the tools a gizmo needs when a node of it is created
+    '''
+    for nodeClass, tools in manifest['gizmos'].items():
+        for tool in tools:
+            nuke.addOnCreate(loadTool, args=(tool,), nodeClass=nodeClass)
+
+class StartupTimer(object):
+    '''
+    times the toolkit's menu.py. Set NST_STARTUP_TIMING to print the timings.
+    '''
+
+    def __init__(self):
+        self.start = time.time()
+        self.last = self.start
+        self.steps = []
+
+    def mark(self, step):
+        now = time.time()
+        self.steps.append((step, now - self.last))
+        self.last = now
+
+    def report(self):
+        if not os.environ.get('NST_STARTUP_TIMING'):
+            return
+        for step, seconds in self.steps:
+            print("NST startup {}: {:.1f} ms".format(step, seconds * 1000))
+        print("NST startup total: {:.1f} ms".format((self.last - self.start) * 1000))
@@ -4,10 +4,16 @@
 
 import nuke
 import nuke.splinewarp as sw 
-import string #This is used by the code. Include!
 import math
 import struct
 import time
+import NST_stickit_tracks as tracks
+try:
+  import NST_stickit_solver as solver #Needs numpy, which not every Nuke version ships
+  import NST_keyframe_reducer as reducer
+except ImportError:
+  solver = None
+  reducer = None
 
 '''
 REAL TODO:
@@ -151,80 +157,10 @@ def CreateWarpPinPair(myNode,pointlist,refframe):
 ; Parameter(s):         myNode - A CameraTracker node containing tracking features
 ; Return:               Output - A list of points formated [ [[Frame,X,Y][...]] [[...][...]] ]
 ;                           
-; Note(s):              N/A
+; Note(s):              The parsing is done by NST_stickit_tracks.ParseCameraTrack
 ;=================================================================================='''
 def ExportCameraTrack(myNode):
-    myKnob = myNode.knob("serializeKnob")
-    myLines = myKnob.toScript()    
-    DataItems = string.split(myLines, '\n')
-    Output = []
-    for index,line in enumerate(DataItems):
-        tempSplit = string.split(line, ' ')
-        if (len(tempSplit) > 4 and tempSplit[ len(tempSplit)-1] == "10") or (len(tempSplit) > 6 and  tempSplit[len(tempSplit)-1] == "10"): #Header
-            #The first object always have 2 unknown ints, lets just fix it the easy way by offsetting by 2
-            if len(tempSplit) > 6 and  tempSplit[6] == "10":
-                offsetKey = 2
-                offsetItem = 0
-            else:
-                offsetKey = 0
-                offsetItem = 0
-            #For some wierd reason the header is located at the first index after the first item. So we go one step down and look for the header data.
-            itemHeader = DataItems[index+1]
-            itemHeadersplit = string.split(itemHeader, ' ')
-            itemHeader_UniqueID = itemHeadersplit[1]
-
-            #So this one is rather wierd but after a certain ammount of items the structure will change again.
-            backofs = 0
-            lastofs = 0
-            firstOffset = 0
-            secondOffset = 0
-            secondItem = DataItems[index+2]
-            secondSplit = string.split(secondItem, ' ')
-            if len(secondSplit) == 7:
-                 firstOffset = 0
-
-            if len(itemHeadersplit) == 3:
-                itemHeader = DataItems[index+2]
-                itemHeadersplit = string.split(itemHeader, ' ')
-                offsetKey = 2
-                offsetItem = 2
-                if len(secondSplit) == 11:
-                  firstOffset = 1 #In this case the 2nd item will be +1   
-                  backofs = 1             
-                elif len(secondSplit) == 7:
-                  firstOffset = 1
-                else:
-                  firstOffset = 0 #In this case the 2nd item will be +0
-
-
-            itemHeader_FirstItem = itemHeadersplit[3+offsetItem]
-            itemHeader_NumberOfKeys = itemHeadersplit[4+offsetKey]
-        
-            #Here we extract the individual XY coordinates
-            PositionList =[]
-            PositionList.append([LastFrame+(0),float(string.split(DataItems[index+0], ' ')[2])  ,float(string.split(DataItems[index+0], ' ')[3])])
-            for x in range(2,int(itemHeader_NumberOfKeys)+1):
-                if len(string.split(DataItems[index+x+firstOffset-1], ' '))>7 and len(string.split(DataItems[index+x+firstOffset-1], ' '))<10 and int(string.split(DataItems[index+x+firstOffset-1], ' ')[5]) > 0:
-                  Offset = int(string.split(DataItems[index+x+firstOffset-1], ' ')[7])
-                  PositionList.append([LastFrame+(x-1),float(string.split(DataItems[Offset+1], ' ')[2])  ,float(string.split(DataItems[Offset+1], ' ')[3])]) 
-                  secondOffset = 1
-                else:
-                  
-                  if x==(int(itemHeader_NumberOfKeys)) and backofs == 1:
-                    PositionList.append([LastFrame+(x-1),float(string.split(DataItems[int(lastofs)], ' ')[2] ) ,float(string.split(DataItems[int(lastofs)], ' ')[3])])    
-                  else:
-                    PositionList.append([LastFrame+(x-1),float(string.split(DataItems[index+x+firstOffset-secondOffset], ' ')[2] ) ,float(string.split(DataItems[index+x+firstOffset-secondOffset], ' ')[3])])         
-                if len(string.split(DataItems[index+x+firstOffset+secondOffset], ' ')) > 5 and len(string.split(DataItems[index+x+firstOffset+secondOffset], ' ')) < 16:
-                  lastofs = str(string.split(DataItems[index+x+firstOffset+secondOffset], ' ')[5])
-                else:
-                  lastofs = index+x+1
-
-            Output.append(PositionList)
-        elif (len(tempSplit) > 8 and tempSplit[1] == "0" and tempSplit[2] == "1"):
-            LastFrame = int(tempSplit[3])
-        else:  #Content
-          pass
-    return Output
+    return tracks.ParseCameraTrack(myNode.knob("serializeKnob").toScript())
 
 '''================================================================================
 ; Function:             GetAnimtionList(myList,myFrame):
@@ -263,6 +199,45 @@ def GetAnimtionList(myList,nestedPoints,myFrame,_rev=False,_ofs=False):
       pass #No points on this frame!
     return Output
 
+'''================================================================================
+; Function:             GetFramePairs(PointData,myFrame,_rev=False):
+; Description:          Returns the points that contain animation between myFrame and the following frame
+; Parameter(s):         PointData - The output of GrabListData()
+; Return:               (src,dst) - Two arrays of shape (N,2), see NST_stickit_solver.PairArrays
+;                           
+; Note(s):              Reads straight from the TrackStore when GrabListData returned one.
+;=================================================================================='''
+def GetFramePairs(PointData,myFrame,_rev=False):
+  if isinstance(PointData,tracks.TrackStore):
+    src,dst = PointData.pairs(int(myFrame),int(myFrame)+1)
+    return (dst,src) if _rev else (src,dst)
+  return solver.PairArrays(GetAnimtionList(PointData[0],PointData[1],myFrame,_rev))
+
+'''================================================================================
+; Function:             GetFrameAnimationList(PointData,myFrame,_rev=False,_ofs=False):
+; Description:          GetAnimtionList for either kind of GrabListData() output
+; Return:               Output - A list of points formated [ [[Frame,X,Y][...]] [[...][...]] ]
+;                           
+; Note(s):              N/A
+;=================================================================================='''
+def GetFrameAnimationList(PointData,myFrame,_rev=False,_ofs=False):
+  if not isinstance(PointData,tracks.TrackStore):
+    return GetAnimtionList(PointData[0],PointData[1],myFrame,_rev,_ofs)
+  thisFrame = int(myFrame)
+  src,dst = PointData.pairs(thisFrame,thisFrame+1)
+  Output = []
+  for this,next in zip(src.tolist(),dst.tolist()):
+    outThisframe = [thisFrame,this[0],this[1]]
+    outNextframe = [thisFrame+1,next[0],next[1]]
+    if _ofs: #This is a temporary fix to the strange offset bug
+      outThisframe = [outThisframe[0],outThisframe[1]+1,outThisframe[2]+0.01]
+      outNextframe = [outNextframe[0],outNextframe[1]+1,outNextframe[2]+0.01]
+    if _rev or _ofs:
+      Output.append([outNextframe,outThisframe])
+    else:
+      Output.append([outThisframe,outNextframe])
+  return Output
+
 '''================================================================================
 ; Function:             GetNearestPoints(myList,myFrame):
 ; Note(s):              N/A
@@ -323,7 +298,11 @@ def GrabListData():
     #01: Get all points from the cameratracker node.
     _return = ExportCameraTrack(Node)
 
-    #02: To optimize the lookups we index all the data into frame lists containing [x,y,index,firstframe,lastframe]
+    #02: With numpy the points go into a columnar store that is indexed by frame.
+    if tracks.np is not None:
+      return tracks.TrackStore.FromTracks(_return)
+
+    #    Otherwise, to optimize the lookups we index all the data into frame lists containing [x,y,index,firstframe,lastframe]
     #     this will give a 40+ times performence boost.
     item_dict = {}
     for list_index, big_lst in enumerate(_return):
@@ -384,35 +363,64 @@ class rangeKeeper():
 
 
 '''================================================================================
-; Function:             KeyframeReducer():
+; Function:             KeyframeReducer(knob,threshold=1.5,channels=(0,1)):
 ; Description:          Removes unwanted keyframes based on a threshold
+; Parameter(s):         knob - An animated knob, like a XY knob or translate
+;                       threshold - Largest allowed error in pixels
+;                       channels - The channels of the knob to reduce together
+; Return:               removed - Number of keys removed
 ;                           
-; Note(s):              _method  #0 = Local, 1 = Median, 2 = Average
+; Note(s):              Channels with keys on the same frames are reduced as one curve
+;                       (so the error of an XY knob is a distance), others one by one.
+;                       The kept keys get linear interpolation, which the threshold is
+;                       measured against.
 ;=================================================================================='''
-def KeyframeReducer(knob):
-    myKnob = knob
-    threshold = 1.5
-    firstFrame = 1
-    lastFrame = 99
-    reduce = False
-    for frame in range(firstFrame,lastFrame):
-        xd = myKnob.getValueAt(frame)[0]-myKnob.getValueAt(frame+1)[0]
-        yd = myKnob.getValueAt(frame)[1]-myKnob.getValueAt(frame+1)[1]
-        delta = math.sqrt(xd*xd+yd*yd)
-        if delta < threshold:
-            if reduce:
-                print "Reduce this",frame
-                if myKnob.isAnimated():
-                    myKnob.removeKeyAt(frame)
-            else:
-                print help(myKnob.setValueAt)
-                #myKnob.removeKeyAt(frame)
-                #myKnob.setValueAt(myKnob.getValueAt(frame)[0],frame,0)
-                #myKnob.setValueAt(myKnob.getValueAt(frame)[1],frame,1)
-                reduce = True
-            print frame, delta
-        else:
-            reduce = False
+def KeyframeReducer(knob,threshold=1.5,channels=(0,1)):
+  if reducer is None:
+    nuke.message("Keyframe reduction needs numpy")
+    return 0
+  curves = [knob.animation(channel) for channel in channels]
+  curves = [curve for curve in curves if curve is not None and curve.noExpression()]
+  if not curves:
+    return 0
+  keyLists = [[[key.x,key.y] for key in curve.keys()] for curve in curves]
+  before = sum([len(keys) for keys in keyLists])
+
+  frameLists = [[key[0] for key in keys] for keys in keyLists]
+  if all([frames == frameLists[0] for frames in frameLists]):
+    keys = [[frame]+[keys[i][1] for keys in keyLists] for i,frame in enumerate(frameLists[0])]
+    kept = reducer.ReduceKeys(keys,threshold)
+    keptLists = [[[key[0],key[1+c]] for key in kept] for c in range(len(curves))]
+  else:
+    keptLists = [reducer.ReduceKeys(keys,threshold) for keys in keyLists]
+
+  for curve,kept in zip(curves,keptLists):
+    curve.clear()
+    curve.addKey([nuke.AnimationKey(frame,value) for frame,value in kept])
+    curve.changeInterpolation(curve.keys(),nuke.LINEAR)
+  return before-sum([len(kept) for kept in keptLists])
+
+'''================================================================================
+; Function:             ReduceSelectedKeyframes():
+; Description:          Runs KeyframeReducer on every animated XY knob of the selected nodes
+;                           
+; Note(s):              Covers Transform translate, CornerPin to1-4 and VectorTracker trackers
+;=================================================================================='''
+def ReduceSelectedKeyframes():
+  threshold = nuke.getInput("Keyframe reduction threshold (pixels)","0.5")
+  if threshold is None:
+    return
+  try:
+    threshold = float(threshold)
+  except ValueError:
+    nuke.message("The threshold must be a number")
+    return
+  removed = 0
+  for node in nuke.selectedNodes():
+    for knob in node.allKnobs():
+      if knob.Class() == "XY_Knob" and knob.isAnimated():
+        removed += KeyframeReducer(knob,threshold)
+  nuke.message("Removed %d keyframes" % removed)
 
 '''================================================================================
 ; Function:             Solve2DTransform():
@@ -445,6 +453,59 @@ def CalculatePositionDelta(_method,_refpointList,temp_pos=[0,0]):
     _y3 = _y3/(len(_refpointList)+0.00001) 
   return [_x3,_y3]
 
+'''================================================================================
+; Function:             SolvePositions(_method,PointData,positions,frameForRef,StartFrame,EndFrame):
+; Description:          Moves a set of reference points backwards and forwards from the ref frame.
+; Parameter(s):         _method - #0 = Local, 1 = Median, 2 = Average
+;                       PointData - The output of GrabListData()
+;                       positions - The XY positions on the reference frame [[X,Y][...]]
+; Return:               (backwards,forwards) - Lists of [Frame,[[X,Y][...]]] with the solved
+;                       positions, backwards from frameForRef-1 and forwards from frameForRef+1
+; Note(s):              The point list of a frame is only built once for all the positions.
+;                       With numpy every method is solved by NST_stickit_solver, otherwise
+;                       frame by frame with CalculatePositionDelta.
+;=================================================================================='''
+def SolvePositions(_method,PointData,positions,frameForRef,StartFrame,EndFrame):
+  backFrames = list(reversed(range(StartFrame,frameForRef)))
+  foreFrames = list(range(frameForRef,EndFrame))
+  if _method == 0 and solver is not None:
+    backPath = solver.SolveLocal(positions,backFrames,lambda frame: GetFramePairs(PointData,frame,True)).tolist()
+    forePath = solver.SolveLocal(positions,foreFrames,lambda frame: GetFramePairs(PointData,frame)).tolist()
+  elif solver is not None and isinstance(PointData,tracks.TrackStore): #Global methods, all frames at once
+    backPath = solver.SolveGlobal(positions,-solver.GlobalDeltas(PointData,_method,StartFrame,frameForRef)[::-1]).tolist()
+    forePath = solver.SolveGlobal(positions,solver.GlobalDeltas(PointData,_method,frameForRef,EndFrame)).tolist()
+  else:
+    backPath = StepPositions(_method,PointData,positions,backFrames,True)
+    forePath = StepPositions(_method,PointData,positions,foreFrames)
+  backwards = [[frame,path] for frame,path in zip(backFrames,backPath)]
+  forwards = [[frame+1,path] for frame,path in zip(foreFrames,forePath)]
+  return backwards,forwards
+
+'''================================================================================
+; Function:             SetAnimationKeys(myKnob,channel,keys):
+; Description:          Adds a list of [Frame,Value] keys to one channel of a knob in a single call
+;                           
+; Note(s):              Much faster than a setValueAt per frame on long ranges
+;=================================================================================='''
+def SetAnimationKeys(myKnob,channel,keys):
+  if not keys:
+    return
+  if not myKnob.isAnimated(channel):
+    myKnob.setAnimated(channel)
+  myKnob.animation(channel).addKey([nuke.AnimationKey(frame,value) for frame,value in keys])
+
+def StepPositions(_method,PointData,positions,frames,_rev=False):
+  path = []
+  for frame in frames:
+    RefPointList = GetFrameAnimationList(PointData,frame,_rev)
+    if _method == 0:
+      deltas = [CalculatePositionDelta(_method,RefPointList,pos) for pos in positions]
+    else: #The global methods move every point by the same delta
+      deltas = [CalculatePositionDelta(_method,RefPointList)]*len(positions)
+    positions = [[pos[0]+_xy[0],pos[1]+_xy[1]] for pos,_xy in zip(positions,deltas)]
+    path.append(positions)
+  return path
+
 
 
 '''
@@ -534,14 +595,15 @@ def Solve2DTransform(_node):
  
 
 
-  #--------------------------
-  #Resolve backwards [<-----]
-  for frame in reversed(range(StartFrame,frameForRef)):
-    RefPointList = GetAnimtionList(PointData[0],PointData[1],frame,True)
-    _xy = CalculatePositionDelta(solve_method,RefPointList,temp_pos)
-    temp_pos = [temp_pos[0]+_xy[0],temp_pos[1]+_xy[1]] #Add our calculated motion delta to the current position
-    myKnob.setValueAt(temp_pos[0]-center_pos[0],frame,0) #Add a keyframe with the values
-    myKnob.setValueAt(temp_pos[1]-center_pos[1],frame,1)
+  backwards,forwards = SolvePositions(solve_method,PointData,[temp_pos],frameForRef,StartFrame,EndFrame)
+
+  #Add the keyframes, backwards [<-----] and forwards [----->]
+  SetAnimationKeys(myKnob,0,[[frame,path[0][0]-center_pos[0]] for frame,path in backwards+forwards])
+  SetAnimationKeys(myKnob,1,[[frame,path[0][1]-center_pos[1]] for frame,path in backwards+forwards])
+
+  #Compare the backwards solve with the existing keyframes
+  for frame,path in backwards:
+    temp_pos = path[0]
     if frameindex >=0 and useExsistingKeyframes:
       if frame == preProcessList[frameindex][0]:
         tempX = preProcessList[frameindex][1]
@@ -550,16 +612,6 @@ def Solve2DTransform(_node):
         print "Dif:", tempX-(temp_pos[0]-center_pos[0]),tempY-(temp_pos[1]-center_pos[1])
         frameindex -= 1
 
-  #-------------------------
-  #Resolve forwards [----->]
-  temp_pos = init_pos
-  for frame in range(frameForRef,EndFrame):
-    RefPointList = GetAnimtionList(PointData[0],PointData[1],frame)
-    _xy = CalculatePositionDelta(solve_method,RefPointList,temp_pos)
-    temp_pos = [temp_pos[0]+_xy[0],temp_pos[1]+_xy[1]] #Add our calculated motion delta to the current position
-    myKnob.setValueAt(temp_pos[0]-center_pos[0],frame+1,0)
-    myKnob.setValueAt(temp_pos[1]-center_pos[1],frame+1,1)
-
 '''================================================================================
 ; Function:             SolveCornerpin():
 ; Description:          Used to solve the points of a cornerpin
@@ -596,28 +648,13 @@ def SolveCornerpin(_node):
 
 
   PointData = GrabListData()
+  backwards,forwards = SolvePositions(solve_method,PointData,[item[0] for item in RefPointList],frameForRef,StartFrame,EndFrame)
 
-  for item in RefPointList:
-    temp_pos = item[0]
+  for idx,item in enumerate(RefPointList):
     myKnob = item[1]
-    #--------------------------
-    #Resolve backwards [<-----]
-    for frame in reversed(range(StartFrame,frameForRef)):
-      RefPointList = GetAnimtionList(PointData[0],PointData[1],frame,True)
-      _xy = CalculatePositionDelta(solve_method,RefPointList,temp_pos)
-      temp_pos = [temp_pos[0]+_xy[0],temp_pos[1]+_xy[1]] #Add our calculated motion delta to the current position
-      myKnob.setValueAt(temp_pos[0]-center_pos[0],frame,0) #Add a keyframe with the values
-      myKnob.setValueAt(temp_pos[1]-center_pos[1],frame,1)
-
-    #-------------------------
-    #Resolve forwards [----->]
-    temp_pos = item[0]
-    for frame in range(frameForRef,EndFrame):
-      RefPointList = GetAnimtionList(PointData[0],PointData[1],frame)
-      _xy = CalculatePositionDelta(solve_method,RefPointList,temp_pos)
-      temp_pos = [temp_pos[0]+_xy[0],temp_pos[1]+_xy[1]] #Add our calculated motion delta to the current position
-      myKnob.setValueAt(temp_pos[0]-center_pos[0],frame+1,0)
-      myKnob.setValueAt(temp_pos[1]-center_pos[1],frame+1,1)
+    #Add the keyframes, backwards [<-----] and forwards [----->]
+    SetAnimationKeys(myKnob,0,[[frame,path[idx][0]-center_pos[0]] for frame,path in backwards+forwards])
+    SetAnimationKeys(myKnob,1,[[frame,path[idx][1]-center_pos[1]] for frame,path in backwards+forwards])
 
 '''================================================================================
 ; Function:             SolveCurves():
@@ -652,27 +689,22 @@ def SolveCurves(_node,_isSplineWarp=False):
           RefPointListInt.append([subitem.getPosition(frameForRef)[0],subitem.getPosition(frameForRef)[1],subitem])
   
   PointData = GrabListData()
+  backwards,forwards = SolvePositions(solve_method,PointData,[[item[0],item[1]] for item in RefPointListInt],frameForRef,StartFrame,EndFrame)
 
-  for item in RefPointListInt:
-    temp_pos = [item[0],item[1]]
-    print "tempbos:",temp_pos
+  for idx,item in enumerate(RefPointListInt):
+    print "tempbos:",[item[0],item[1]]
     centerPoint = item[2]
     #--------------------------
     #Resolve backwards [<-----]
-    for frame in reversed(range(StartFrame,frameForRef)):
-      RefPointList = GetAnimtionList(PointData[0],PointData[1],frame,True)
-      _xy = CalculatePositionDelta(solve_method,RefPointList,temp_pos)
-      temp_pos = [temp_pos[0]+_xy[0],temp_pos[1]+_xy[1]] #Add our calculated motion delta to the current position
+    for frame,path in backwards:
+      temp_pos = path[idx]
       centerPoint.addPositionKey(frame,[temp_pos[0],temp_pos[1] ]) #Add a keyframe with the values
 
     #-------------------------
     #Resolve forwards [----->]
-    temp_pos = [item[0],item[1]]
-    for frame in range(frameForRef,EndFrame):
-      RefPointList = GetAnimtionList(PointData[0],PointData[1],frame)
-      _xy = CalculatePositionDelta(solve_method,RefPointList,temp_pos)
-      temp_pos = [temp_pos[0]+_xy[0],temp_pos[1]+_xy[1]] #Add our calculated motion delta to the current position
-      centerPoint.addPositionKey(frame+1,[temp_pos[0],temp_pos[1] ]) #Add a keyframe with the values
+    for frame,path in forwards:
+      temp_pos = path[idx]
+      centerPoint.addPositionKey(frame,[temp_pos[0],temp_pos[1] ]) #Add a keyframe with the values
 
 
 
@@ -708,28 +740,11 @@ def Solve2DTracker(_node):
   PointData = GrabListData()
 
   print "--Initializing Main Loop--"
-  trackIdx = 0
-  for item in RefPointList:
-    temp_pos = item
-    #--------------------------
-    #Resolve backwards [<-----]
-    for frame in reversed(range(StartFrame,frameForRef)):
-      RefPointList = GetAnimtionList(PointData[0],PointData[1],frame,True)
-      _xy = CalculatePositionDelta(solve_method,RefPointList,temp_pos)
-      temp_pos = [temp_pos[0]+_xy[0],temp_pos[1]+_xy[1]] #Add our calculated motion delta to the current position
-      _node.knob("tracks").setValueAt(temp_pos[0],frame,numColumns*trackIdx + colTrackX)
-      _node.knob("tracks").setValueAt(temp_pos[1],frame,numColumns*trackIdx + colTrackY)   
-
-    #-------------------------
-    #Resolve forwards [----->]
-    temp_pos = item
-    for frame in range(frameForRef,EndFrame):
-      RefPointList = GetAnimtionList(PointData[0],PointData[1],frame)
-      _xy = CalculatePositionDelta(solve_method,RefPointList,temp_pos)
-      temp_pos = [temp_pos[0]+_xy[0],temp_pos[1]+_xy[1]] #Add our calculated motion delta to the current position
-      _node.knob("tracks").setValueAt(temp_pos[0],frame+1,numColumns*trackIdx + colTrackX)
-      _node.knob("tracks").setValueAt(temp_pos[1],frame+1,numColumns*trackIdx + colTrackY)   
-    trackIdx += 1
+  backwards,forwards = SolvePositions(solve_method,PointData,RefPointList,frameForRef,StartFrame,EndFrame)
+  for trackIdx in range(len(RefPointList)):
+    #Add the keyframes, backwards [<-----] and forwards [----->]
+    SetAnimationKeys(_node.knob("tracks"),numColumns*trackIdx + colTrackX,[[frame,path[trackIdx][0]] for frame,path in backwards+forwards])
+    SetAnimationKeys(_node.knob("tracks"),numColumns*trackIdx + colTrackY,[[frame,path[trackIdx][1]] for frame,path in backwards+forwards])
 
 
 
@@ -810,28 +825,19 @@ def StickIT():
     PointData = GrabListData()
 
     #03: Get a set of reference points. This is the points we want to move.
-    RefPointList = GetAnimtionList(PointData[0],PointData[1],frameForRef,False,True)
+    RefPointList = GetFrameAnimationList(PointData,frameForRef,False,True)
     #04: Go through all of the frames and triangulate best points to move the refpoints with.
     start = time.clock()
 
+    #All the reference points are moved together, back from the ref frame and then forward
+    backwards,forwards = SolvePositions(0,PointData,[[item[0][1],item[0][2]] for item in RefPointList],frameForRef,StartFrame,EndFrame)
+
     finalAnimation = []
-    for item in RefPointList:
-      zx =  item[0][1]
-      zy =  item[0][2]
+    for idx,item in enumerate(RefPointList):
       tempAnimation = []
       tempAnimation.append([frameForRef,item[0][1],item[0][2]]) #Add a keyframe on the reference frame
-      #Now start from the ref frame and move back
-      for frame in reversed(range(StartFrame,frameForRef)):
-          newOffset = GetNearestPoints(item[0],GetAnimtionList(PointData[0],PointData[1],frame,True))
-          tempAnimation.append([frame,item[0][1]+newOffset[0],item[0][2]+newOffset[1]])
-          item[0][1] = item[0][1]+newOffset[0]
-          item[0][2] = item[0][2]+newOffset[1]
-      #Now start from the ref frame and move forward
-      for frame in range(frameForRef,EndFrame):
-          newOffset = GetNearestPoints([0,zx,zy],GetAnimtionList(PointData[0],PointData[1],frame))
-          tempAnimation.append([frame+1,zx+newOffset[0],zy+newOffset[1]])
-          zx = zx+newOffset[0]
-          zy = zy+newOffset[1]
+      for frame,path in backwards+forwards:
+          tempAnimation.append([frame,path[idx][0],path[idx][1]])
       #Now add the animation created to the animation list
       finalAnimation.append(sorted(tempAnimation)) 
 
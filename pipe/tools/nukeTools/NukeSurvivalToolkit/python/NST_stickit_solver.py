@@ -0,0 +1,196 @@
+# stickit_solver.py
+# NumPy solver core for NST_stickit. This module must not import nuke, so solves
+# can be run and checked offline against recorded track data.
+
+import sys
+import time
+import warnings
+
+import numpy as np
+
+#Inverse distance weighting uses this many of the nearest tracked points
+NEAREST_COUNT = 3
+
+#Upper bound on the number of query/point distances computed in one go
+CHUNK_SIZE = 1 << 22
+
+'''================================================================================
+; Function:             PairArrays(pointList):
+; Description:          Converts a GetAnimtionList output into point arrays
+; Parameter(s):         pointList - A list of point pairs formated [ [[Frame,X,Y],[Frame,X,Y]] [...] ]
+; Return:               (src,dst) - Two float arrays of shape (N,2) holding the first and
+;                       second XY of every pair
+; Note(s):              N/A
+;=================================================================================='''
+def PairArrays(pointList):
+  if not len(pointList):
+    empty = np.zeros((0,2))
+    return empty,empty
+  pairs = np.array([[item[0][1],item[0][2],item[1][1],item[1][2]] for item in pointList],dtype=np.float64)
+  return pairs[:,0:2],pairs[:,2:4]
+
+'''================================================================================
+; Function:             NearestIndices(distances):
+; Description:          Finds the nearest points for every query, nearest first
+; Parameter(s):         distances - Array of shape (M,N), N >= NEAREST_COUNT
+; Return:               indices - Array of shape (M,NEAREST_COUNT)
+; Note(s):              Equal distances are ordered by point index, matching the stable
+;                       sort GetNearestPoints uses.
+;=================================================================================='''
+def NearestIndices(distances):
+  k = NEAREST_COUNT
+  rows = np.arange(distances.shape[0])[:,None]
+  if distances.shape[1] == k:
+    indices = np.broadcast_to(np.arange(k),distances.shape).copy()
+  else:
+    indices = np.argpartition(distances,k-1,axis=1)[:,:k]
+    #argpartition is not stable. When a distance outside the selection ties with the
+    #last one in it, redo that row with a stable sort so the lowest index wins.
+    kth = distances[rows,indices].max(axis=1)
+    ties = np.count_nonzero(distances <= kth[:,None],axis=1) > k
+    for row in np.nonzero(ties)[0]:
+      indices[row] = np.argsort(distances[row],kind="stable")[:k]
+  order = np.lexsort((indices,distances[rows,indices]),axis=1)
+  return indices[rows,order]
+
+'''================================================================================
+; Function:             NearestOffsets(queries,src,dst):
+; Description:          Vectorized GetNearestPoints for many reference points at once
+; Parameter(s):         queries - Array of shape (M,2) with the positions to move
+;                       src,dst - Arrays of shape (N,2) from PairArrays
+; Return:               offsets - Array of shape (M,2) with the XY offset of every query
+; Note(s):              Gives the same results as GetNearestPoints: distances are offset
+;                       by one, an exact hit uses only the nearest point and fewer than
+;                       three points give no offset. Distances use np.hypot, which is
+;                       the C library hypot that math.hypot calls in Nuke's Python 2.
+;                       (Python 3.8+ rounds math.hypot on its own, so results there can
+;                       differ from GetNearestPoints in the last bit.)
+;=================================================================================='''
+def NearestOffsets(queries,src,dst):
+  queries = np.asarray(queries,dtype=np.float64).reshape(-1,2)
+  offsets = np.zeros(queries.shape)
+  if len(src) < NEAREST_COUNT:
+    return offsets
+
+  delta = dst-src
+  step = max(1,CHUNK_SIZE//len(src))
+  for start in range(0,len(queries),step):
+    chunk = queries[start:start+step]
+    distances = np.hypot(src[None,:,0]-chunk[:,0,None],src[None,:,1]-chunk[:,1,None])+1
+    indices = NearestIndices(distances)
+    rows = np.arange(len(chunk))[:,None]
+
+    perc = 1/distances[rows,indices]
+    perc[perc[:,0] == 1,1:] = 0
+    perctotal = perc[:,0]+perc[:,1]+perc[:,2]
+    percent = np.where(perctotal[:,None] == 0,perc,perc/np.where(perctotal == 0,1,perctotal)[:,None])
+
+    nearest = delta[indices]
+    offsets[start:start+step] = (nearest[:,0]*percent[:,0,None])+(nearest[:,1]*percent[:,1,None])+(nearest[:,2]*percent[:,2,None])
+  return offsets
+
+'''================================================================================
+; Function:             SolveLocal(positions,frames,pairsForFrame):
+; Description:          Moves a set of reference points through a range of frames
+; Parameter(s):         positions - Array of shape (M,2) with the start positions
+;                       frames - The frames to step through, in solve order
+;                       pairsForFrame - Callable returning (src,dst) arrays for a frame
+; Return:               path - Array of shape (len(frames),M,2) with the positions after
+;                       every frame
+; Note(s):              N/A
+;=================================================================================='''
+def SolveLocal(positions,frames,pairsForFrame):
+  positions = np.array(positions,dtype=np.float64).reshape(-1,2)
+  path = np.empty((len(frames),)+positions.shape)
+  for i,frame in enumerate(frames):
+    src,dst = pairsForFrame(frame)
+    positions = positions+NearestOffsets(positions,src,dst)
+    path[i] = positions
+  return path
+
+'''================================================================================
+; Function:             GlobalDeltas(store,_method,StartFrame,EndFrame):
+; Description:          Computes the global motion delta of every frame in one go
+; Parameter(s):         store - A NST_stickit_tracks.TrackStore
+;                       _method - 1 = Median, 2 = Average
+;                       StartFrame,EndFrame - The deltas are for frame -> frame+1, StartFrame <= frame < EndFrame
+; Return:               deltas - Array of shape (EndFrame-StartFrame,2)
+; Note(s):              The deltas of a frame are a row of a (frames,tracks) matrix where
+;                       missing tracks are NaN. The average adds the tracks in order with
+;                       cumsum, so it matches CalculatePositionDelta to the last bit.
+;                       Frames without points get no motion.
+;=================================================================================='''
+def GlobalDeltas(store,_method,StartFrame,EndFrame):
+  count = max(0,EndFrame-StartFrame)
+  frames,trackIds,deltas = store.steps()
+  keep = (frames >= StartFrame) & (frames < EndFrame)
+  rows = frames[keep]-StartFrame
+  columns = np.unique(trackIds[keep],return_inverse=True)[1].reshape(-1)
+  columnCount = int(columns.max())+1 if len(columns) else 0
+
+  if _method == 1:
+    matrix = np.full((count,columnCount,2),np.nan)
+    matrix[rows,columns] = deltas[keep]
+    with warnings.catch_warnings():
+      warnings.simplefilter("ignore",RuntimeWarning) #All-NaN rows
+      result = np.nanmedian(matrix,axis=1) if columnCount else np.full((count,2),np.nan)
+    result[np.isnan(result)] = 0
+  else:
+    matrix = np.zeros((count,columnCount,2))
+    matrix[rows,columns] = deltas[keep]
+    total = np.cumsum(matrix,axis=1)[:,-1] if columnCount else np.zeros((count,2))
+    result = total/(np.bincount(rows,minlength=count)+0.00001)[:,None]
+  return result
+
+'''================================================================================
+; Function:             SolveGlobal(positions,deltas):
+; Description:          Moves a set of points by a list of per-frame deltas
+; Parameter(s):         positions - Array of shape (M,2) with the start positions
+;                       deltas - Array of shape (N,2), in solve order
+; Return:               path - Array of shape (N,M,2) with the positions after every frame
+; Note(s):              The running sum is taken with cumsum starting from the positions,
+;                       which adds the deltas one at a time like the per-frame loop.
+;=================================================================================='''
+def SolveGlobal(positions,deltas):
+  positions = np.array(positions,dtype=np.float64).reshape(-1,2)
+  steps = np.empty((len(deltas)+1,)+positions.shape)
+  steps[0] = positions
+  steps[1:] = np.asarray(deltas).reshape(-1,1,2)
+  return np.cumsum(steps,axis=0)[1:]
+
+'''================================================================================
+; Function:             Benchmark(store,refFrame,StartFrame,EndFrame,pointCount):
+; Description:          Times the solves on recorded track data, outside of Nuke
+; Parameter(s):         store - A NST_stickit_tracks.TrackStore
+;                       pointCount - Number of reference points to solve for the local method
+; Return:               timings - A list of [name,seconds]
+; Note(s):              From a shell: python NST_stickit_solver.py serializeKnob.txt [pointCount]
+;                       where the file holds the toScript() of the CameraTracker serializeKnob.
+;=================================================================================='''
+def Benchmark(store,refFrame,StartFrame,EndFrame,pointCount=100):
+  refPoints = store.xy[store.rows(refFrame)][:pointCount]
+  timings = []
+
+  start = time.time()
+  SolveLocal(refPoints,list(reversed(range(StartFrame,refFrame))),lambda frame: store.pairs(frame+1,frame))
+  SolveLocal(refPoints,list(range(refFrame,EndFrame)),lambda frame: store.pairs(frame,frame+1))
+  timings.append(["local (%d points)" % len(refPoints),time.time()-start])
+
+  for _method,name in [[1,"median"],[2,"average"]]:
+    start = time.time()
+    SolveGlobal(refPoints,-GlobalDeltas(store,_method,StartFrame,refFrame)[::-1])
+    SolveGlobal(refPoints,GlobalDeltas(store,_method,refFrame,EndFrame))
+    timings.append([name,time.time()-start])
+  return timings
+
+if __name__ == "__main__":
+  import NST_stickit_tracks
+
+  with open(sys.argv[1]) as dataFile:
+    start = time.time()
+    store = NST_stickit_tracks.TrackStore.FromTracks(NST_stickit_tracks.ParseCameraTrack(dataFile.read()))
+  print("parse: %d points on frames %d-%d in %.3fs" % (len(store.points),store.firstFrame,store.lastFrame,time.time()-start))
+  pointCount = int(sys.argv[2]) if len(sys.argv) > 2 else 100
+  refFrame = (store.firstFrame+store.lastFrame)//2
+  for name,seconds in Benchmark(store,refFrame,store.firstFrame,store.lastFrame,pointCount):
+    print("%s: %.3fs" % (name,seconds))
@@ -0,0 +1,160 @@
+# stickit_tracks.py
+# Track data for NST_stickit. Parses the serialized CameraTracker features and keeps
+# them in a columnar store. This module must not import nuke.
+
+try:
+  import numpy as np
+  TRACK_DTYPE = np.dtype([('track_id',np.int32),('frame',np.int32),('x',np.float64),('y',np.float64)])
+except ImportError:
+  np = None #ParseCameraTrack still works, TrackStore needs numpy
+
+'''================================================================================
+; Function:             ParseCameraTrack(text):
+; Description:          Extracts all 2D Tracking Featrures from the serializeKnob of a CameraTracker.
+; Parameter(s):         text - The serializeKnob script (myNode.knob("serializeKnob").toScript())
+; Return:               Output - A list of points formated [ [[Frame,X,Y][...]] [[...][...]] ]
+;
+; Note(s):              Every line is split once up front, the parser then only indexes
+;                       the split rows.
+;=================================================================================='''
+def ParseCameraTrack(text):
+  DataItems = text.split('\n')
+  Rows = [line.split(' ') for line in DataItems]
+  Output = []
+  for index,tempSplit in enumerate(Rows):
+    if (len(tempSplit) > 4 and tempSplit[len(tempSplit)-1] == "10") or (len(tempSplit) > 6 and tempSplit[len(tempSplit)-1] == "10"): #Header
+      #The first object always have 2 unknown ints, lets just fix it the easy way by offsetting by 2
+      if len(tempSplit) > 6 and tempSplit[6] == "10":
+        offsetKey = 2
+      else:
+        offsetKey = 0
+      #For some wierd reason the header is located at the first index after the first item. So we go one step down and look for the header data.
+      itemHeadersplit = Rows[index+1]
+
+      #So this one is rather wierd but after a certain ammount of items the structure will change again.
+      backofs = 0
+      lastofs = 0
+      firstOffset = 0
+      secondOffset = 0
+      secondSplit = Rows[index+2]
+
+      if len(itemHeadersplit) == 3:
+        itemHeadersplit = Rows[index+2]
+        offsetKey = 2
+        if len(secondSplit) == 11:
+          firstOffset = 1 #In this case the 2nd item will be +1
+          backofs = 1
+        elif len(secondSplit) == 7:
+          firstOffset = 1
+        else:
+          firstOffset = 0 #In this case the 2nd item will be +0
+
+      itemHeader_NumberOfKeys = int(itemHeadersplit[4+offsetKey])
+
+      #Here we extract the individual XY coordinates
+      PositionList = []
+      PositionList.append([LastFrame,float(tempSplit[2]),float(tempSplit[3])])
+      for x in range(2,itemHeader_NumberOfKeys+1):
+        keySplit = Rows[index+x+firstOffset-1]
+        if len(keySplit) > 7 and len(keySplit) < 10 and int(keySplit[5]) > 0:
+          Offset = int(keySplit[7])
+          keySplit = Rows[Offset+1]
+          secondOffset = 1
+        elif x == itemHeader_NumberOfKeys and backofs == 1:
+          keySplit = Rows[int(lastofs)]
+        else:
+          keySplit = Rows[index+x+firstOffset-secondOffset]
+        PositionList.append([LastFrame+(x-1),float(keySplit[2]),float(keySplit[3])])
+
+        nextSplit = Rows[index+x+firstOffset+secondOffset]
+        if len(nextSplit) > 5 and len(nextSplit) < 16:
+          lastofs = nextSplit[5]
+        else:
+          lastofs = index+x+1
+
+      Output.append(PositionList)
+    elif (len(tempSplit) > 8 and tempSplit[1] == "0" and tempSplit[2] == "1"):
+      LastFrame = int(tempSplit[3])
+  return Output
+
+'''================================================================================
+; Class:                TrackStore(points):
+; Description:          Columnar store of tracked points, sorted by frame and then track.
+; Parameter(s):         points - Structured array of TRACK_DTYPE
+;
+; Note(s):              offsets holds the CSR style row range of every frame, so the
+;                       points of frame f are points[offsets[f-firstFrame]:offsets[f-firstFrame+1]].
+;=================================================================================='''
+class TrackStore():
+  def __init__(self,points):
+    order = np.lexsort((points['track_id'],points['frame']))
+    self.points = points[order]
+    frames = self.points['frame']
+    if len(frames):
+      self.firstFrame = int(frames[0])
+      self.lastFrame = int(frames[-1])
+    else:
+      self.firstFrame = 0
+      self.lastFrame = -1
+    counts = np.bincount(frames-self.firstFrame,minlength=self.lastFrame-self.firstFrame+1)
+    self.offsets = np.concatenate(([0],np.cumsum(counts)))
+    self.xy = np.column_stack((self.points['x'],self.points['y']))
+    self._steps = None
+
+  @classmethod
+  def FromTracks(cls,tracks):
+    '''Builds the store from a ParseCameraTrack output. The track id is the index in the list.'''
+    lengths = [len(track) for track in tracks]
+    points = np.empty(sum(lengths),dtype=TRACK_DTYPE)
+    points['track_id'] = np.repeat(np.arange(len(tracks)),lengths)
+    flat = np.array([key for track in tracks for key in track],dtype=np.float64).reshape(-1,3)
+    points['frame'] = flat[:,0]
+    points['x'] = flat[:,1]
+    points['y'] = flat[:,2]
+    return cls(points)
+
+  def rows(self,frame):
+    '''The slice of points that lie on the given frame.'''
+    if frame < self.firstFrame or frame > self.lastFrame:
+      return slice(0,0)
+    i = int(frame)-self.firstFrame
+    return slice(int(self.offsets[i]),int(self.offsets[i+1]))
+
+  def points_at(self,frame):
+    '''A view of the points on the given frame, ordered by track.'''
+    return self.points[self.rows(frame)]
+
+  def pairs(self,frame,otherFrame):
+    '''
+    The XY of every track that has a point on both frames, as two (N,2) arrays
+    (positions on frame, positions on otherFrame), ordered by track.
+    '''
+    a = self.rows(frame)
+    b = self.rows(otherFrame)
+    aTracks = self.points['track_id'][a]
+    bTracks = self.points['track_id'][b]
+    if not len(aTracks) or not len(bTracks):
+      empty = np.zeros((0,2))
+      return empty,empty
+    match = np.searchsorted(bTracks,aTracks)
+    match[match == len(bTracks)] = 0
+    found = bTracks[match] == aTracks
+    return self.xy[a][found],self.xy[b][match[found]]
+
+  def steps(self):
+    '''
+    The motion of every track from each frame to the next, as (frames,trackIds,deltas)
+    ordered by frame and then track. deltas has shape (N,2) and holds XY(frame+1)-XY(frame).
+    '''
+    if self._steps is None:
+      trackIds = self.points['track_id']
+      frames = self.points['frame']
+      order = np.lexsort((frames,trackIds))
+      linked = (trackIds[order][1:] == trackIds[order][:-1]) & (frames[order][1:] == frames[order][:-1]+1)
+      this = order[:-1][linked]
+      next = order[1:][linked]
+      byFrame = np.argsort(this)
+      this = this[byFrame]
+      next = next[byFrame]
+      self._steps = (frames[this],trackIds[this],self.xy[next]-self.xy[this])
+    return self._steps
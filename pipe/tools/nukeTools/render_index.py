@@ -0,0 +1,182 @@
+'''
+render index module
+
+Finds the rendered image sequences under the shot folders without globbing every frame.
+Directories are listed with os.scandir from a thread pool, the frame files of a directory
+are collapsed into sequences, and each directory's listing is cached until its mtime
+changes, so a second look at a shot only stats the directories. Has no nuke dependency.
+'''
+
+import os
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+# name.1001.exr, name_1001.exr, 1001.exr: the last run of digits before the extension
+FRAME_PATTERN = re.compile(r'^(.*?)(\d+)(\.[A-Za-z0-9]+)$')
+
+IMAGE_EXTENSIONS = ('.exr', '.dpx', '.tif', '.tiff', '.png', '.jpg', '.jpeg', '.tga', '.hdr', '.cin')
+
+MAX_WORKERS = 8
+
+_cache = {} # directory -> (mtime_ns, sequences, subdirectories)
+_cache_lock = threading.Lock()
+
+
+class Sequence:
+	'''
+	A numbered run of files in one directory, head + frame + tail. The frame number is
+	zero padded to padding digits; unpadded sequences have a padding of 1.
+	'''
+
+	def __init__(self, directory, head, tail, padding, frames):
+		self.directory = directory
+		self.head = head
+		self.tail = tail
+		self.padding = padding
+		self.frames = sorted(frames)
+
+	def __repr__(self):
+		return 'Sequence(%r, %d-%d)' % (self.nuke_path(), self.first, self.last)
+
+	@property
+	def first(self):
+		return self.frames[0]
+
+	@property
+	def last(self):
+		return self.frames[-1]
+
+	@property
+	def name(self):
+		'''
+		the sequence name without the frame separator, e.g. beauty for beauty.####.exr
+		'''
+		return self.head.rstrip('._-') or os.path.basename(self.directory)
+
+	def missing(self):
+		'''
+		return the frames between first and last that have no file
+		'''
+		present = set(self.frames)
+		return [frame for frame in range(self.first, self.last + 1) if frame not in present]
+
+	def path(self, frame):
+		return os.path.join(self.directory, '%s%0*d%s' % (self.head, self.padding, frame, self.tail))
+
+	def nuke_path(self):
+		'''
+		return the path with the frame written as #'s the way a Read node expects it
+		'''
+		return os.path.join(self.directory, self.head + '#' * self.padding + self.tail)
+
+	def printf_path(self):
+		return os.path.join(self.directory, '%s%%0%dd%s' % (self.head, self.padding, self.tail))
+
+
+def collapse(directory, names):
+	'''
+	group the frame files among names into sequences. Files are grouped on the text around
+	the frame number and on the padding, so name.0001.exr and name.1.exr stay apart.
+	'''
+	groups = {}
+	for name in names:
+		match = FRAME_PATTERN.match(name)
+		if match is None or not match.group(3).lower() in IMAGE_EXTENSIONS:
+			continue
+		head, digits, tail = match.groups()
+		padding = len(digits) if digits.startswith('0') and len(digits) > 1 else 1
+		groups.setdefault((head, tail, padding), []).append((int(digits), len(digits)))
+
+	sequences = []
+	# padded groups first, so unpadded frames can join the padded sequence they fit
+	for (head, tail, padding), frames in sorted(groups.items(), key=lambda item: item[0][2] == 1):
+		if padding == 1:
+			# 1001 could belong to a %04d sequence that never needed a leading zero; use the
+			# shortest number as the padding so #'s of that width read every frame
+			padding = min(length for frame, length in frames)
+			existing = [s for s in sequences if (s.head, s.tail, s.padding) == (head, tail, padding)]
+			if existing:
+				existing[0].frames = sorted(existing[0].frames + [frame for frame, length in frames])
+				continue
+		sequences.append(Sequence(directory, head, tail, padding, [frame for frame, length in frames]))
+	sequences.sort(key=lambda s: (s.head, s.tail))
+	return sequences
+
+
+def scan_directory(directory):
+	'''
+	return (sequences, subdirectories) of one directory, from the cache when the directory
+	hasn't changed since it was last listed
+	'''
+	mtime = os.stat(directory).st_mtime_ns
+	with _cache_lock:
+		cached = _cache.get(directory)
+	if cached is not None and cached[0] == mtime:
+		return cached[1], cached[2]
+
+	names = []
+	subdirectories = []
+	with os.scandir(directory) as entries:
+		for entry in entries:
+			try:
+				if entry.is_dir():
+					subdirectories.append(entry.path)
+					continue
+			except OSError:
+				continue
+			names.append(entry.name)
+	subdirectories.sort()
+	sequences = collapse(directory, names)
+
+	with _cache_lock:
+		_cache[directory] = (mtime, sequences, subdirectories)
+	return sequences, subdirectories
+
+
+def invalidate(directory=None):
+	'''
+	forget the cached listing of a directory, or of every directory
+	'''
+	with _cache_lock:
+		if directory is None:
+			_cache.clear()
+		else:
+			_cache.pop(directory, None)
+
+
+def scan(root, max_workers=MAX_WORKERS):
+	'''
+	return every sequence under root, in path order. Each directory is listed on the
+	thread pool as soon as its parent has been listed.
+	'''
+	sequences = []
+	with ThreadPoolExecutor(max_workers=max_workers) as pool:
+		pending = set([pool.submit(scan_directory, root)])
+		while pending:
+			done, pending = wait(pending, return_when=FIRST_COMPLETED)
+			for future in done:
+				try:
+					found, subdirectories = future.result()
+				except OSError:
+					continue # removed or unreadable while walking
+				sequences.extend(found)
+				for subdirectory in subdirectories:
+					pending.add(pool.submit(scan_directory, subdirectory))
+	sequences.sort(key=lambda s: (s.directory, s.head, s.tail))
+	return sequences
+
+
+def layers(root, max_workers=MAX_WORKERS):
+	'''
+	return a dict of label -> sequence for everything under root. The label is the path of
+	the sequence relative to root, e.g. SH010/v003/beauty.
+	'''
+	result = {}
+	for sequence in scan(root, max_workers):
+		relative = os.path.relpath(sequence.directory, root)
+		label = sequence.name if relative == '.' else os.path.join(relative, sequence.name)
+		if label in result:
+			label = os.path.join(os.path.dirname(label), os.path.basename(sequence.nuke_path()))
+		result[label] = sequence
+	return result
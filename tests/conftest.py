@@ -0,0 +1,55 @@
+import json
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# the pipe package is imported from the repo root, the way the launchers set PYTHONPATH,
+# and the NukeSurvivalToolkit modules by name, the way nuke's plugin path finds them
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, 'pipe', 'tools', 'nukeTools', 'NukeSurvivalToolkit', 'python'))
+
+PROJECT_DATA = {
+	'name': 'test',
+	'production_dir': 'production/',
+	'assets_dir': 'production/assets/',
+	'shots_dir': 'production/shots/',
+	'tools_dir': 'production/tools/',
+	'users_dir': 'production/users/',
+	'layouts_dir': 'production/layouts/',
+	'sequences_dir': 'production/sequences/',
+}
+
+@pytest.fixture
+def project(tmp_path, monkeypatch):
+	'''
+	an empty project in a tmp folder, made the current one through $MEDIA_PROJECT_DIR,
+	with the chunk store, the local cache and the metadata daemon turned off
+	'''
+	project_dir = tmp_path / 'project'
+	project_dir.mkdir()
+	(project_dir / '.project').write_text(json.dumps(PROJECT_DATA))
+	for name in PROJECT_DATA.values():
+		if name.endswith('/'):
+			(project_dir / name).mkdir(parents=True, exist_ok=True)
+	monkeypatch.setenv('MEDIA_PROJECT_DIR', str(project_dir))
+	monkeypatch.setenv('PIPE_METADATA_SOCKET', str(tmp_path / 'no_daemon.sock'))
+	monkeypatch.delenv('PIPE_CHUNK_STORE', raising=False)
+	monkeypatch.delenv('PIPE_LOCAL_CACHE', raising=False)
+	from pipe.pipeHandlers.project import Project
+	return Project()
+
+def publish(element, tmp_path, data, name=None, ext=None):
+	'''
+	publish a file holding data to an element, the way the DCC tools do, and return the
+	path of the new version's file
+	'''
+	if ext is not None:
+		element.update_app_ext(ext)
+	name = name if name is not None else element.get_parent()
+	work_file = tmp_path / ('work' + element.get_app_ext())
+	work_file.write_bytes(data if isinstance(data, bytes) else data.encode('utf-8'))
+	element.publish('tester', str(work_file), 'test publish', name)
+	return os.path.join(element.get_dir(), '.v%04d' % element.get_last_version(), name + element.get_app_ext())
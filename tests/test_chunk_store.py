@@ -0,0 +1,119 @@
+import io
+import os
+import random
+import zlib
+
+import pytest
+
+from conftest import publish
+from pipe.pipeHandlers import chunk_store
+from pipe.pipeHandlers import pipeline_io
+from pipe.pipeHandlers import resolver
+from pipe.pipeHandlers.body import Asset
+
+SIZE = 1024 * 1024
+
+def _data(seed, size=SIZE):
+	return random.Random(seed).getrandbits(8 * size).to_bytes(size, 'little')
+
+def _version(seed):
+	# every version is the first one with a different edit in the middle
+	return _data(0)[:SIZE // 2] + b'edit %d' % seed + _data(0)[SIZE // 2:]
+
+def _read(path):
+	with open(path, 'rb') as f:
+		return f.read()
+
+@pytest.fixture
+def element(project, tmp_path):
+	'''
+	the maya element of a chair with four publishes, the oldest three chunked
+	'''
+	maya = project.create_asset('chair').get_element(Asset.MAYA)
+	for version in range(4):
+		publish(maya, tmp_path, _version(version), ext='.mb')
+	folders, saved = chunk_store.Ingester(keep=1).run()
+	assert folders == [os.path.join(maya.get_dir(), '.v%04d' % version) for version in range(3)]
+	return maya
+
+def test_split_cuts_around_an_edit():
+	data = _data(1, 4 * SIZE)
+	chunks = list(chunk_store.split(io.BytesIO(data)))
+	assert b''.join(chunks) == data
+	assert all(len(chunk) <= chunk_store.MAX_CHUNK for chunk in chunks)
+	assert all(len(chunk) >= chunk_store.MIN_CHUNK for chunk in chunks[:-1])
+
+	edited = list(chunk_store.split(io.BytesIO(data[:2 * SIZE] + b'an edit' + data[2 * SIZE:])))
+	assert len(set(edited) - set(chunks)) <= 2
+
+def test_chunked_versions_share_chunks(element):
+	store = chunk_store.ChunkStore()
+	version_dir = element.get_version_dir(0)
+	assert chunk_store.is_chunked(version_dir)
+	assert not os.path.exists(os.path.join(version_dir, 'chair.mb'))
+	assert not chunk_store.is_chunked(element.get_version_dir(3))
+	# three versions that differ by an edit take little more room than one
+	stored = sum(size for digest, size, modified in store.list_chunks())
+	assert stored < 1.5 * SIZE
+
+def test_version_dir_is_the_published_folder(element):
+	assert element.get_version_dir(1) == os.path.join(element.get_dir(), '.v0001')
+	assert chunk_store.is_chunked(element.get_version_dir(1))
+
+def test_restore_version_rebuilds_in_place(element):
+	path = element.get_version_filepath(1)
+	assert path == os.path.join(element.get_dir(), '.v0001', 'chair.mb')
+	assert _read(path) == _version(1)
+	assert not chunk_store.is_chunked(os.path.dirname(path))
+	assert element.list_kept_versions() == [1]
+
+	# a kept version isn't moved back into the store
+	assert chunk_store.Ingester(keep=1).run() == ([], 0)
+	assert os.path.exists(path)
+
+def test_resolver_restores_without_keeping(element):
+	path = resolver.Resolver().resolve('pipe://asset/chair/maya@v0')
+	assert path == os.path.join(element.get_dir(), '.v0000', 'chair.mb')
+	assert _read(path) == _version(0)
+	assert element.list_kept_versions() == []
+
+def test_damaged_chunk_is_not_restored(element):
+	store = chunk_store.ChunkStore()
+	version_dir = element.get_version_dir(2)
+	entry = chunk_store.read_manifest(version_dir)['chair.mb']
+	with open(store.chunk_path(entry['chunks'][0][0]), 'wb') as f:
+		f.write(zlib.compress(b'damaged'))
+	with pytest.raises(IOError):
+		chunk_store.restore_version(version_dir, store)
+	assert os.listdir(version_dir) == [chunk_store.MANIFEST_FILENAME]
+
+def test_gc_keeps_the_chunks_in_use(element):
+	ingester = chunk_store.Ingester(keep=1)
+	assert ingester.store.collect(ingester.referenced(), grace=0) == (0, 0)
+
+	for version in range(3):
+		element.restore_version(version)
+	count, freed = ingester.store.collect(ingester.referenced(), grace=0)
+	assert count > 0 and freed > 0
+	assert ingester.store.list_chunks() == []
+	assert [_read(element.get_version_filepath(version)) for version in range(4)] == [_version(version) for version in range(4)]
+
+def test_publish_chunks_the_version_left_behind(project, tmp_path, monkeypatch):
+	monkeypatch.setenv(chunk_store.CHUNK_STORE_ENV, '1')
+	monkeypatch.setenv(chunk_store.KEEP_ENV, '2')
+	maya = project.create_asset('chair').get_element(Asset.MAYA)
+	maya.update_app_ext('.mb')
+	threads = []
+	ingest_previous = chunk_store.ingest_previous
+
+	def ingest_and_remember(*args):
+		threads.append(ingest_previous(*args))
+
+	monkeypatch.setattr(chunk_store, 'ingest_previous', ingest_and_remember)
+	for version in range(3):
+		publish(maya, tmp_path, _version(version))
+	for thread in threads:
+		if thread is not None:
+			thread.join()
+	assert [chunk_store.is_chunked(maya.get_version_dir(version)) for version in range(3)] == [True, False, False]
+	assert pipeline_io.readfile(os.path.join(maya.get_dir(), '.element'))['latest_version'] == 2
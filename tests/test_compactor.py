@@ -0,0 +1,104 @@
+import gzip
+import lzma
+import os
+
+import pytest
+
+from conftest import publish
+from pipe.pipeHandlers import compactor
+from pipe.pipeHandlers import resolver
+from pipe.pipeHandlers.body import Asset
+
+def _scene(version, lines=5000):
+	return ''.join('setAttr "chair_%d.translate" -type "double3" %d %d 0 ;\n' % (version, line, line * version) for line in range(lines))
+
+def _read(path):
+	with open(path, 'r') as f:
+		return f.read()
+
+@pytest.fixture
+def element(project, tmp_path):
+	'''
+	the maya element of a chair with four .ma publishes
+	'''
+	maya = project.create_asset('chair').get_element(Asset.MAYA)
+	for version in range(4):
+		publish(maya, tmp_path, _scene(version), ext='.ma')
+	return maya
+
+@pytest.mark.parametrize('codec, module', [(compactor.XZ, lzma), (compactor.GZIP, gzip)])
+def test_compact_leaves_the_newest_alone(element, codec, module):
+	folders, saved = compactor.Compactor(keep=1, codec=codec).run()
+	assert folders == [element.get_version_dir(version) for version in range(3)]
+	assert saved > 0
+	for version in range(3):
+		version_dir = element.get_version_dir(version)
+		entry = compactor.read_manifest(version_dir)['chair.ma']
+		assert sorted(os.listdir(version_dir)) == [compactor.MANIFEST_FILENAME, entry['file']]
+		# the framed file is still one the usual tools decompress
+		with open(os.path.join(version_dir, entry['file']), 'rb') as f:
+			assert module.decompress(f.read()).decode('utf-8') == _scene(version)
+	assert os.listdir(element.get_version_dir(3)) == ['chair.ma']
+	assert compactor.Compactor(keep=1, codec=codec).run() == ([], 0)
+
+def test_framed_reader_reads_a_range(element):
+	data = _scene(0).encode('utf-8')
+	version_dir = element.get_version_dir(0)
+	compactor.compact_version(version_dir, frame_size=4096)
+	with compactor.FramedReader(version_dir, 'chair.ma') as reader:
+		reader.seek(10000)
+		assert reader.read(5000) == data[10000:15000]
+		assert reader.tell() == 15000
+		reader.seek(-100, os.SEEK_END)
+		assert reader.read() == data[-100:]
+
+def test_restore_version_puts_the_originals_back(element):
+	compactor.Compactor(keep=1).run()
+	path = element.get_version_filepath(1)
+	assert path == os.path.join(element.get_dir(), '.v0001', 'chair.ma')
+	assert _read(path) == _scene(1)
+	assert os.listdir(os.path.dirname(path)) == ['chair.ma']
+	assert element.list_kept_versions() == [1]
+	# the restored version is kept, so it isn't compacted again
+	assert compactor.Compactor(keep=1).run() == ([], 0)
+	assert os.path.exists(path)
+
+def test_version_dir_is_the_published_folder(element):
+	compactor.Compactor(keep=1).run()
+	assert element.get_version_dir(2) == os.path.join(element.get_dir(), '.v0002')
+	assert compactor.is_compacted(element.get_version_dir(2))
+
+def test_resolver_restores_without_keeping(element):
+	compactor.Compactor(keep=1).run()
+	path = resolver.Resolver().resolve('pipe://asset/chair/maya@v0')
+	assert path == os.path.join(element.get_dir(), '.v0000', 'chair.ma')
+	assert _read(path) == _scene(0)
+	assert element.list_kept_versions() == []
+
+def test_damaged_copy_is_not_restored(element):
+	compactor.Compactor(keep=1).run()
+	version_dir = element.get_version_dir(0)
+	entry = compactor.read_manifest(version_dir)['chair.ma']
+	with open(os.path.join(version_dir, entry['file']), 'r+b') as f:
+		f.write(lzma.compress(b'damaged', format=lzma.FORMAT_XZ))
+	with pytest.raises((IOError, lzma.LZMAError)):
+		compactor.restore_version(version_dir)
+	assert sorted(os.listdir(version_dir)) == [compactor.MANIFEST_FILENAME, entry['file']]
+
+def test_anchored_folders_are_restored(project, tmp_path, monkeypatch):
+	usd = project.create_asset('chair').get_element(Asset.USD)
+	for version in range(3):
+		publish(usd, tmp_path, '#usda 1.0\n' + _scene(version), ext='.usda')
+	assert compactor.Compactor(keep=1).run() == ([], 0)
+
+	# an earlier run compacted layers
+	version_dir = usd.get_version_dir(0)
+	with monkeypatch.context() as patch:
+		patch.setattr(compactor, 'ANCHORED_EXTENSIONS', ())
+		patch.setattr(compactor, 'COMPRESSIBLE_EXTENSIONS', ('.usda',))
+		compactor.compact_version(version_dir)
+	assert not os.path.exists(os.path.join(version_dir, 'chair.usda'))
+
+	assert compactor.Compactor(keep=1).run() == ([version_dir], 0)
+	assert os.listdir(version_dir) == ['chair.usda']
+	assert _read(os.path.join(version_dir, 'chair.usda')) == '#usda 1.0\n' + _scene(0)
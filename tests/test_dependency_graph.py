@@ -0,0 +1,51 @@
+import os
+
+import pytest
+
+from pipe.pipeHandlers import dependency_graph
+from pipe.pipeHandlers.body import Asset
+
+LAYER = '''#usda 1.0
+def Xform "set" (
+	prepend references = [@pipe://asset/chair/maya@v1@, @../../../assets/table/usd/table_main.usda@]
+)
+{
+}
+'''
+
+@pytest.fixture
+def graph(project):
+	'''
+	shot A1, whose layout uses chair v1 and the table layer, on one line
+	'''
+	project.create_asset('chair')
+	project.create_asset('table')
+	project.create_asset('lamp')
+	layout_dir = project.create_shot('A1').get_element(Asset.LAYOUT).get_dir()
+	with open(os.path.join(layout_dir, 'A1.usda'), 'w') as f:
+		f.write(LAYER)
+	graph = dependency_graph.DependencyGraph()
+	graph.update()
+	return graph
+
+def test_usda_dependencies_after_a_versioned_uri(graph):
+	assert graph.dependent_shots('chair') == ['A1']
+	assert graph.dependent_shots('table') == ['A1']
+	assert graph.dependent_shots('lamp') == []
+
+@pytest.mark.parametrize('argv', [
+	['--no-update', 'dependents', 'chair'],
+	['dependents', 'chair', '--no-update'],
+	['dependents', '--no-update', 'chair', '--shots'],
+	['stale', '0', '--no-update'],
+])
+def test_no_update_before_or_after_the_command(graph, monkeypatch, argv):
+	monkeypatch.setattr(dependency_graph.DependencyGraph, 'update', lambda self: pytest.fail('the graph was rescanned'))
+	dependency_graph.main(argv)
+
+def test_queries_update_by_default(graph, monkeypatch):
+	updates = []
+	monkeypatch.setattr(dependency_graph.DependencyGraph, 'update', lambda self: updates.append(self) or [])
+	dependency_graph.main(['dependents', 'chair'])
+	dependency_graph.main(['stale', '0'])
+	assert len(updates) == 2
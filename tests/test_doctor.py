@@ -0,0 +1,82 @@
+import os
+
+import pytest
+
+from conftest import publish
+from pipe.pipeHandlers import doctor
+from pipe.pipeHandlers import pipeline_io
+from pipe.pipeHandlers import resolver
+from pipe.pipeHandlers.body import Asset
+
+@pytest.fixture
+def maya(project, tmp_path):
+	'''
+	the maya element of a chair with three publishes, in a project whose asset list
+	only has the chair
+	'''
+	element = project.create_asset('chair').get_element(Asset.MAYA)
+	for version in range(3):
+		publish(element, tmp_path, 'version %d' % version, ext='.ma')
+	project.create_asset('table')
+	with open(os.path.join(project.get_assets_dir(), doctor.LIST_FILES[resolver.ASSET]), 'w') as f:
+		f.write('chair')
+	return element
+
+def _set_latest(element, latest_version):
+	pipeline_file = os.path.join(element.get_dir(), doctor.ELEMENT_FILENAME)
+	datadict = pipeline_io.readfile(pipeline_file)
+	datadict['latest_version'] = latest_version
+	pipeline_io.writefile(pipeline_file, datadict)
+
+def _issues(report):
+	return sorted((issue['check'], issue['fixed']) for issue in report['issues'])
+
+def test_a_healthy_project_has_no_issues(maya, project):
+	with open(os.path.join(project.get_assets_dir(), doctor.LIST_FILES[resolver.ASSET]), 'a') as f:
+		f.write('\ntable\n')
+	report = doctor.Doctor().run()
+	assert report['issues'] == []
+	assert report['bodies'] == 2
+
+def test_fix_repairs_latest_version_links_and_lists(maya, project):
+	_set_latest(maya, 0)
+	cache_dir = os.path.join(maya.get_dir(), 'cache')
+	os.makedirs(cache_dir, exist_ok=True)
+	link = os.path.join(cache_dir, 'chair.abc')
+	os.symlink(os.path.join(cache_dir, 'gone.abc'), link)
+
+	report = doctor.Doctor().run()
+	assert _issues(report) == [(doctor.DANGLING_LINK, False), (doctor.LATEST_MISMATCH, False), (doctor.NOT_LISTED, False)]
+	assert all(issue['fixable'] for issue in report['issues'])
+	assert pipeline_io.readfile(os.path.join(maya.get_dir(), doctor.ELEMENT_FILENAME))['latest_version'] == 0
+
+	report = doctor.Doctor(fix=True).run()
+	assert _issues(report) == [(doctor.DANGLING_LINK, True), (doctor.LATEST_MISMATCH, True), (doctor.NOT_LISTED, True)]
+	assert pipeline_io.readfile(os.path.join(maya.get_dir(), doctor.ELEMENT_FILENAME))['latest_version'] == 2
+	assert not os.path.lexists(link)
+	with open(os.path.join(project.get_assets_dir(), doctor.LIST_FILES[resolver.ASSET])) as f:
+		assert f.read() == 'chair\ntable\n'
+	assert doctor.Doctor().run()['issues'] == []
+
+def test_fix_leaves_what_could_lose_data(maya):
+	_set_latest(maya, 0)
+	version_dir = maya.get_version_dir(1)
+	for name in os.listdir(version_dir):
+		os.remove(os.path.join(version_dir, name))
+	os.rmdir(version_dir)
+	orphan_dir = os.path.join(maya.get_dir(), '.v0007')
+	os.mkdir(orphan_dir)
+
+	report = doctor.Doctor(fix=True).run()
+	issues = [(issue['check'], issue['fixed']) for issue in report['issues'] if issue['check'] != doctor.NOT_LISTED]
+	assert sorted(issues) == [(doctor.LATEST_MISMATCH, False), (doctor.MISSING_VERSION, False), (doctor.ORPHAN_VERSION, False)]
+	# a publish is missing its folder, so latest_version isn't moved past it
+	assert pipeline_io.readfile(os.path.join(maya.get_dir(), doctor.ELEMENT_FILENAME))['latest_version'] == 0
+	assert os.path.isdir(orphan_dir)
+
+def test_main_fails_only_while_issues_remain(maya, capsys):
+	_set_latest(maya, 1)
+	assert doctor.main([]) == 1
+	assert doctor.main(['--fix']) == 0
+	assert '(fixed)' in capsys.readouterr().out
+	assert doctor.main([]) == 0
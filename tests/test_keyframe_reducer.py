@@ -0,0 +1,73 @@
+import numpy as np
+
+import NST_keyframe_reducer as reducer
+
+
+def rdp(frames, values, tolerance, start, end, keep):
+    '''
+    recursive Ramer-Douglas-Peucker in frame time, the reference for ReduceCurve
+    '''
+    if end - start < 2:
+        return
+    worst, worstError = None, -1.0
+    for i in range(start + 1, end):
+        t = (frames[i] - frames[start]) / (frames[end] - frames[start])
+        line = values[start] + (values[end] - values[start]) * t
+        error = np.sqrt(((values[i] - line) ** 2).sum())
+        if error > worstError:
+            worst, worstError = i, error
+    if worstError > tolerance:
+        keep.add(worst)
+        rdp(frames, values, tolerance, start, worst, keep)
+        rdp(frames, values, tolerance, worst, end, keep)
+
+
+def reference(frames, values, tolerance):
+    frames = np.asarray(frames, dtype=np.float64)
+    values = np.asarray(values, dtype=np.float64).reshape(len(frames), -1)
+    if len(frames) <= 2:
+        return list(range(len(frames)))
+    keep = set([0, len(frames) - 1])
+    rdp(frames, values, tolerance, 0, len(frames) - 1, keep)
+    return sorted(keep)
+
+
+def random_curve(rng, count):
+    frames = np.cumsum(rng.randint(1, 4, count)) + 1000
+    values = np.cumsum(rng.normal(0, 2, (count, 2)), axis=0)
+    return frames, values
+
+
+def test_reduce_curve_matches_reference_on_random_curves():
+    rng = np.random.RandomState(9)
+    for count in (1, 2, 3, 10, 100, 500):
+        frames, values = random_curve(rng, count)
+        for tolerance in (0.0, 0.5, 2.0, 10.0):
+            assert reducer.ReduceCurve(frames, values, tolerance).tolist() == reference(frames, values, tolerance)
+
+
+def test_reduce_curve_matches_reference_on_one_dimensional_and_flat_curves():
+    rng = np.random.RandomState(10)
+    frames = np.arange(200)
+    values = rng.normal(0, 1, 200)
+    assert reducer.ReduceCurve(frames, values, 1.0).tolist() == reference(frames, values, 1.0)
+    # a flat curve ties everywhere, the first key of a tie is split on
+    flat = np.zeros(50)
+    flat[[10, 20, 30]] = 5
+    assert reducer.ReduceCurve(frames[:50], flat, 1.0).tolist() == reference(frames[:50], flat, 1.0)
+
+
+def test_removed_keys_stay_within_tolerance():
+    rng = np.random.RandomState(11)
+    frames, values = random_curve(rng, 300)
+    tolerance = 1.5
+    kept = reducer.ReduceCurve(frames, values, tolerance)
+    curve = np.column_stack([np.interp(frames, frames[kept], values[kept, axis]) for axis in range(2)])
+    assert np.sqrt(((curve - values) ** 2).sum(axis=1)).max() <= tolerance
+    assert kept[0] == 0 and kept[-1] == len(frames) - 1
+
+
+def test_reduce_keys_keeps_the_key_format():
+    keys = [[1, 0.0, 0.0], [2, 1.0, 1.0], [3, 2.0, 2.0], [4, 3.0, 5.0], [5, 4.0, 4.0]]
+    assert reducer.ReduceKeys(keys, 0.1) == [[1, 0.0, 0.0], [3, 2.0, 2.0], [4, 3.0, 5.0], [5, 4.0, 4.0]]
+    assert reducer.ReduceKeys([], 0.1) == []
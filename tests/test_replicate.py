@@ -0,0 +1,91 @@
+import os
+import random
+
+import pytest
+
+from conftest import publish
+from pipe.pipeHandlers import pipeline_io
+from pipe.pipeHandlers import replicate
+from pipe.pipeHandlers.body import Asset
+
+SIZE = 2 * 1024 * 1024
+
+def _data(seed, size=SIZE):
+	return random.Random(seed).getrandbits(8 * size).to_bytes(size, 'little')
+
+def _read(path):
+	with open(path, 'rb') as f:
+		return f.read()
+
+@pytest.fixture
+def source(project, tmp_path):
+	'''
+	a project with two maya publishes of a chair, and a layer using absolute, relative
+	and versioned pipe:// asset paths
+	'''
+	chair = project.create_asset('chair')
+	maya = chair.get_element(Asset.MAYA)
+	publish(maya, tmp_path, _data(0), ext='.mb')
+	publish(maya, tmp_path, _data(0)[:SIZE // 2] + b'an edit' + _data(0)[SIZE // 2:], ext='.mb')
+	layer = '''#usda 1.0
+def Xform "chair" (
+	prepend references = [@pipe://asset/chair/maya@v1@, @%s@</chair>, @./chair_main.usda@]
+)
+{
+}
+''' % os.path.join(maya.get_dir(), 'chair_main.mb')
+	publish(chair.get_element(Asset.USD), tmp_path, layer, ext='.usda')
+	return project.get_project_dir()
+
+def _replicator(source, target):
+	return replicate.Replicator(source, replicate.LocalSite(target), workers=2)
+
+def test_first_sync_copies_every_publish(source, tmp_path):
+	target = str(tmp_path / 'target')
+	versions, sent = _replicator(source, target).run()
+	assert sorted(versions) == [
+		('production/assets/chair/maya', 0),
+		('production/assets/chair/maya', 1),
+		('production/assets/chair/usd', 0),
+	]
+	# v1 only sends the chunks around the edit that v0 doesn't have
+	assert 2 * SIZE < sent < 3 * SIZE
+	for rel_path in ('production/assets/chair/maya/.v0000/chair.mb', 'production/assets/chair/maya/.v0001/chair.mb',
+			'production/assets/chair/maya/chair_main.mb'):
+		assert _read(os.path.join(target, rel_path)) == _read(os.path.join(source, rel_path))
+	assert os.path.exists(os.path.join(target, '.project'))
+	assert os.path.exists(os.path.join(target, 'production/assets/chair/.body'))
+
+	datadict = pipeline_io.readfile(os.path.join(target, 'production/assets/chair/maya/.element'))
+	assert [publish[3] for publish in datadict['publishes']] == [os.path.join(target, 'production/assets/chair/maya/chair_main.mb')] * 2
+	assert not [name for name in os.listdir(os.path.join(target, 'production/assets/chair/maya')) if name.endswith(replicate.INCOMING_SUFFIX)]
+
+def test_delta_sync_sends_only_new_versions(source, tmp_path, project):
+	target = str(tmp_path / 'target')
+	_replicator(source, target).run()
+	assert _replicator(source, target).run() == ([], 0)
+
+	maya = project.get_asset('chair').get_element(Asset.MAYA)
+	publish(maya, tmp_path, _data(0)[:SIZE // 2] + b'another edit' + _data(0)[SIZE // 2:], ext='.mb')
+	versions, sent = _replicator(source, target).run()
+	assert versions == [('production/assets/chair/maya', 2)]
+	# the new version against v1 and the main file against the site's own copy
+	assert 0 < sent < SIZE // 2
+	for rel_path in ('production/assets/chair/maya/.v0002/chair.mb', 'production/assets/chair/maya/chair_main.mb'):
+		assert _read(os.path.join(target, rel_path)) == _read(os.path.join(source, rel_path))
+	assert len(pipeline_io.readfile(os.path.join(target, 'production/assets/chair/maya/.element'))['publishes']) == 3
+
+def test_layers_point_into_the_target(source, tmp_path):
+	target = str(tmp_path / 'target')
+	_replicator(source, target).run()
+	with open(os.path.join(target, 'production/assets/chair/usd/.v0000/chair.usda')) as f:
+		layer = f.read()
+	assert '@pipe://asset/chair/maya@v1@' in layer
+	assert '@%s@</chair>' % os.path.join(target, 'production/assets/chair/maya/chair_main.mb') in layer
+	assert '@./chair_main.usda@' in layer
+	assert source not in layer
+
+def test_rewrite_layer_keeps_versioned_uris():
+	text = 'references = [@pipe://asset/chair/maya@v1@, @/old/assets/chair/maya/chair_main.mb@]'
+	assert replicate.rewrite_layer(text, '/old', '/new') == (
+		'references = [@pipe://asset/chair/maya@v1@, @/new/assets/chair/maya/chair_main.mb@]')
@@ -0,0 +1,119 @@
+import os
+import tarfile
+
+import pytest
+
+from conftest import publish
+from pipe.pipeHandlers import shot_pack
+from pipe.pipeHandlers.body import Asset
+from pipe.pipeHandlers.environment import Environment
+
+LAYER = '''#usda 1.0
+def Xform "chair_v1" (
+	prepend references = @pipe://asset/chair/maya@v1@
+)
+{
+}
+def Xform "chair" (
+	prepend references = @pipe://asset/chair/maya/latest@</chair>
+)
+{
+}
+def Xform "table" (
+	prepend references = @../../../assets/table/usd/table_main.usda@
+)
+{
+}
+'''
+
+TABLE_LAYER = '''#usda 1.0
+def Mesh "top" {
+	asset inputs:file = @textures/wood.<UDIM>.png@
+}
+'''
+
+@pytest.fixture
+def shot(project, tmp_path):
+	'''
+	shot A1, whose layout references chair v1, the latest chair and the table layer,
+	which uses a udim texture. The chair has three maya publishes.
+	'''
+	chair = project.create_asset('chair').get_element(Asset.MAYA)
+	for version in range(3):
+		publish(chair, tmp_path, 'chair %d' % version, ext='.mb')
+	publish(project.get_asset('chair').get_element(Asset.MATERIALS), tmp_path, 'chair shader', ext='.mtlx')
+
+	table = project.create_asset('table').get_element(Asset.USD)
+	publish(table, tmp_path, TABLE_LAYER, ext='.usda')
+	textures = os.path.join(table.get_dir(), 'textures')
+	os.mkdir(textures)
+	for tile in (1001, 1002):
+		with open(os.path.join(textures, 'wood.%d.png' % tile), 'w') as f:
+			f.write('tile %d' % tile)
+
+	layout_dir = project.create_shot('A1').get_element(Asset.LAYOUT).get_dir()
+	with open(os.path.join(layout_dir, 'A1.usda'), 'w') as f:
+		f.write(LAYER)
+	return layout_dir
+
+def _packer():
+	return shot_pack.ShotPacker('A1', env=Environment(), workers=2)
+
+def test_closure_follows_versioned_uris(shot):
+	packer = _packer()
+	names = set(packer.closure().values())
+	assert 'production/assets/chair/maya/.v0001/chair.mb' in names
+	assert 'production/assets/chair/maya/chair_main.mb' in names
+	assert 'production/assets/chair/materials/chair_main.mtlx' in names
+	assert 'production/assets/table/usd/table_main.usda' in names
+	assert 'production/assets/table/usd/textures/wood.1001.png' in names
+	assert 'production/assets/table/usd/textures/wood.1002.png' in names
+	assert 'production/shots/A1/layout/A1.usda' in names
+	assert packer.missing == []
+	assert packer.external == []
+
+@pytest.mark.parametrize('archive_name', ['A1.tar', 'A1.tar.gz', 'A1.zip'])
+def test_pack_unpack_verify(shot, tmp_path, archive_name):
+	archive = str(tmp_path / archive_name)
+	manifest = _packer().pack(archive)
+	assert shot_pack.verify(archive) == []
+
+	folder = str(tmp_path / 'unpacked')
+	assert shot_pack.unpack(archive, folder) == []
+	assert shot_pack.verify(folder) == []
+	assert sorted(manifest['files']) == sorted(
+		os.path.relpath(os.path.join(dirpath, name), folder).replace(os.sep, '/')
+		for dirpath, dirnames, filenames in os.walk(folder) for name in filenames if name != shot_pack.MANIFEST_NAME)
+
+	layer_dir = os.path.join(folder, 'production', 'shots', 'A1', 'layout')
+	with open(os.path.join(layer_dir, 'A1.usda')) as f:
+		layer = f.read()
+	assert '@../../../assets/chair/maya/.v0001/chair.mb@\n' in layer
+	assert '@../../../assets/chair/maya/chair_main.mb@</chair>' in layer
+	assert '@../../../assets/table/usd/table_main.usda@' in layer
+	assert 'pipe://' not in layer
+	with open(os.path.join(layer_dir, '../../../assets/chair/maya/.v0001/chair.mb')) as f:
+		assert f.read() == 'chair 1'
+
+def test_verify_finds_damaged_and_missing_files(shot, tmp_path):
+	archive = str(tmp_path / 'A1.tar')
+	_packer().pack(archive)
+	folder = str(tmp_path / 'unpacked')
+	shot_pack.unpack(archive, folder)
+
+	with open(os.path.join(folder, 'production/assets/chair/maya/.v0001/chair.mb'), 'a') as f:
+		f.write(' changed')
+	os.remove(os.path.join(folder, 'production/assets/table/usd/textures/wood.1002.png'))
+	assert shot_pack.verify(folder) == [
+		'damaged production/assets/chair/maya/.v0001/chair.mb',
+		'missing production/assets/table/usd/textures/wood.1002.png',
+	]
+
+def test_unpack_refuses_paths_outside_the_folder(tmp_path):
+	archive = str(tmp_path / 'evil.tar')
+	source = tmp_path / 'evil.txt'
+	source.write_text('evil')
+	with tarfile.open(archive, 'w') as tar:
+		tar.add(str(source), arcname='../evil.txt')
+	with pytest.raises(IOError):
+		shot_pack.unpack(archive, str(tmp_path / 'unpacked'))
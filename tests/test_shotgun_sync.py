@@ -0,0 +1,162 @@
+import json
+import sys
+import types
+
+import pytest
+
+from pipe.pipeHandlers import shotgun_sync
+
+
+PROJECT = {"type": "Project", "id": 7}
+ASSETS = [
+    {"id": 1, "code": "Tree", "parents": [], "updated_at": 100.0, "project": PROJECT},
+    {"id": 2, "code": "Tree A", "parents": [{"name": "Tree"}], "updated_at": 100.0, "project": PROJECT},
+    {"id": 3, "code": "Rock", "parents": [], "updated_at": 100.0, "project": PROJECT},
+]
+SHOTS = [
+    {"id": 1, "code": "A010", "updated_at": 100.0, "project": PROJECT},
+    {"id": 2, "code": "A020", "updated_at": 100.0, "project": PROJECT},
+]
+
+
+def write_server(path, assets, shots):
+    with open(path, "w") as f:
+        json.dump({"Asset": assets, "Shot": shots}, f)
+
+
+@pytest.fixture
+def server(tmp_path):
+    path = str(tmp_path / "shotgun.json")
+    write_server(path, ASSETS, SHOTS)
+    return path
+
+
+@pytest.fixture
+def mirror(tmp_path):
+    return str(tmp_path / "mirror")
+
+
+@pytest.fixture
+def dummy_reader(server, monkeypatch):
+    '''
+    the ShotgunReader from shotgun_dummy, talking to a LocalShotgun instead of a server
+    '''
+    fake = types.ModuleType("shotgun_api3")
+    fake.Shotgun = lambda *args: shotgun_sync.LocalShotgun(server)
+    monkeypatch.setitem(sys.modules, "shotgun_api3", fake)
+    monkeypatch.delitem(sys.modules, "pipe.pipeHandlers.shotgun_dummy", raising=False)
+    from pipe.pipeHandlers import shotgun_dummy
+    monkeypatch.setattr(shotgun_dummy, "PROJECT_ID", 7)
+    return shotgun_dummy.ShotgunReader()
+
+
+class ListReader:
+    '''
+    a reader with only the list api, like the ShotgunReader in pipe.pipeHandlers.shotgun
+    '''
+
+    def __init__(self, asset_lists, shot_list):
+        self.asset_lists = asset_lists
+        self.shot_list = shot_list
+
+    def getAssetLists(self):
+        return self.asset_lists
+
+    def getShotList(self):
+        return self.shot_list
+
+
+def test_build_asset_lists_groups_variants():
+    name_list, short_list = shotgun_sync.build_asset_lists([("Tree", []), ("TreeA", ["Tree"]), ("Rock", [])])
+    assert name_list == ["Tree", "TreeA", "Rock"]
+    assert short_list == [{"name": "Tree", "children": ["TreeA"]}, {"name": "Rock", "children": ["Rock"]}]
+
+
+def test_first_sync_adds_everything(server, mirror):
+    sync = shotgun_sync.ShotgunSync(shotgun_sync.LocalShotgun(server), mirror)
+    diff = sync.sync()
+    assert diff["Asset"]["added"] == ["Tree", "TreeA", "Rock"]
+    assert diff["Shot"]["added"] == ["A010", "A020"]
+    assert sync.get_shot_list() == ["A010", "A020"]
+    assert sync.get_asset_lists()[1][0] == {"name": "Tree", "children": ["TreeA"]}
+
+
+def test_sync_reports_renames_and_removals(server, mirror):
+    sync = shotgun_sync.ShotgunSync(shotgun_sync.LocalShotgun(server), mirror)
+    sync.sync()
+    sync.commit()
+
+    shots = [{"id": 1, "code": "A015", "updated_at": 200.0, "project": PROJECT}]
+    write_server(server, ASSETS, shots)
+    sync = shotgun_sync.ShotgunSync(shotgun_sync.LocalShotgun(server), mirror)
+    diff = sync.sync([shotgun_sync.SHOT])["Shot"]
+    assert diff["renamed"] == [("A010", "A015")]
+    assert diff["removed"] == ["A020"]
+    assert diff["added"] == []
+    assert sync.get_shot_list() == ["A015"]
+
+
+def test_mirror_is_only_written_on_commit(server, mirror):
+    sync = shotgun_sync.ShotgunSync(shotgun_sync.LocalShotgun(server), mirror)
+    sync.sync()
+
+    # the local update "failed": nothing was committed, so the next sync sees the same changes
+    retry = shotgun_sync.ShotgunSync(shotgun_sync.LocalShotgun(server), mirror)
+    assert retry.sync()["Shot"]["added"] == ["A010", "A020"]
+    retry.commit()
+
+    again = shotgun_sync.ShotgunSync(shotgun_sync.LocalShotgun(server), mirror)
+    diff = again.sync()
+    assert diff["Shot"]["added"] == []
+    assert diff["Asset"]["added"] == []
+
+
+def test_failed_sync_leaves_mirror_untouched(server, mirror):
+    sync = shotgun_sync.ShotgunSync(shotgun_sync.LocalShotgun(server), mirror)
+    sync.sync()
+    sync.commit()
+
+    write_server(server, ASSETS + [{"id": 4, "code": "Bush", "parents": [], "updated_at": 300.0, "project": PROJECT}], SHOTS)
+
+    class Broken(shotgun_sync.LocalShotgun):
+        def filters(self, entity_type):
+            if entity_type == shotgun_sync.SHOT:
+                raise IOError("lost the connection")
+            return []
+
+    sync = shotgun_sync.ShotgunSync(Broken(server), mirror)
+    with pytest.raises(IOError):
+        sync.sync()
+    assert "Bush" not in sync.get_asset_lists()[0]
+
+
+def test_dummy_reader(dummy_reader, server, mirror):
+    name_list, short_list = dummy_reader.getAssetLists()
+    assert name_list == ["Tree", "TreeA", "Rock"]
+    assert dummy_reader.getShotList() == ["A010", "A020"]
+
+    sync = shotgun_sync.ShotgunSync(dummy_reader, mirror)
+    diff = sync.sync()
+    assert diff["Asset"]["added"] == name_list
+    assert sync.get_asset_lists() == [name_list, short_list]
+    assert sync.get_shot_list() == dummy_reader.getShotList()
+
+
+def test_list_reader_fallback(mirror):
+    reader = ListReader([["Tree", "TreeA", "Rock"], [{"name": "Tree", "children": ["TreeA"]},
+                                                     {"name": "Rock", "children": ["Rock"]}]], ["A010", "A020"])
+    sync = shotgun_sync.ShotgunSync(reader, mirror)
+    diff = sync.sync()
+    assert diff["Asset"]["added"] == ["Tree", "TreeA", "Rock"]
+    assert diff["Shot"]["added"] == ["A010", "A020"]
+    assert sync.get_asset_lists() == reader.getAssetLists()
+    sync.commit()
+
+    reader.shot_list = ["A010", "A030"]
+    reader.asset_lists = [["Tree", "TreeA"], [{"name": "Tree", "children": ["TreeA"]}]]
+    sync = shotgun_sync.ShotgunSync(reader, mirror)
+    diff = sync.sync()
+    assert diff["Shot"]["added"] == ["A030"]
+    assert diff["Shot"]["removed"] == ["A020"]
+    assert diff["Asset"]["removed"] == ["Rock"]
+    assert sync.get_shot_list() == ["A010", "A030"]
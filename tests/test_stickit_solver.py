@@ -0,0 +1,167 @@
+import math
+
+import numpy as np
+
+import NST_stickit_solver as solver
+import NST_stickit_tracks as tracks
+
+
+def nearest_points(refpoint, pointList):
+    '''
+    the per point GetNearestPoints NST_stickit used before the solver, as the reference
+    '''
+    if len(pointList) < 3:
+        return [0.0, 0.0]
+    distancelist = [math.hypot(item[0][1] - refpoint[1], item[0][2] - refpoint[2]) + 1 for item in pointList]
+    sorted_lookup = sorted(enumerate(distancelist), key=lambda i: i[1])
+    indices = [sorted_lookup[n][0] for n in range(3)]
+    perc = [1 / sorted_lookup[n][1] for n in range(3)]
+    if perc[0] == 1:
+        perc[1] = perc[2] = 0
+    perctotal = sum(perc)
+    percent = [p if perctotal == 0 else p / perctotal for p in perc]
+    xOffset = sum((pointList[i][1][1] - pointList[i][0][1]) * p for i, p in zip(indices, percent))
+    yOffset = sum((pointList[i][1][2] - pointList[i][0][2]) * p for i, p in zip(indices, percent))
+    return [xOffset, yOffset]
+
+
+def random_pairs(rng, count, frame=1):
+    src = rng.uniform(0, 1920, (count, 2))
+    dst = src + rng.normal(0, 3, (count, 2))
+    return [[[frame, a[0], a[1]], [frame + 1, b[0], b[1]]] for a, b in zip(src, dst)]
+
+
+def random_store(rng, trackCount=40, first=1, last=30):
+    '''
+    tracks that start and end on random frames and drift by a few pixels a frame
+    '''
+    trackList = []
+    for n in range(trackCount):
+        start = rng.randint(first, last)
+        end = rng.randint(start, last + 1)
+        xy = rng.uniform(0, 1920, 2) + np.cumsum(rng.normal(0, 2, (end - start + 1, 2)), axis=0)
+        trackList.append([[frame, x, y] for frame, (x, y) in zip(range(start, end + 1), xy)])
+    return tracks.TrackStore.FromTracks(trackList)
+
+
+def test_nearest_offsets_match_reference_on_random_points():
+    rng = np.random.RandomState(3)
+    pointList = random_pairs(rng, 25)
+    src, dst = solver.PairArrays(pointList)
+    queries = rng.uniform(0, 1920, (300, 2))
+
+    expected = [nearest_points([0, x, y], pointList) for x, y in queries]
+    np.testing.assert_allclose(solver.NearestOffsets(queries, src, dst), expected, rtol=1e-12, atol=1e-12)
+
+
+def test_nearest_offsets_match_reference_on_ties_and_exact_hits():
+    # a grid puts many points at the same distance, and the queries sit on points or between them
+    grid = [[[1, float(x), float(y)], [1, x + (x * 7 + y) % 5, y - (x + y * 3) % 4]] for x in range(0, 50, 10) for y in range(0, 50, 10)]
+    src, dst = solver.PairArrays(grid)
+    queries = [[x, y] for x in range(-5, 56, 5) for y in range(-5, 56, 5)]
+
+    expected = [nearest_points([0, x, y], grid) for x, y in queries]
+    np.testing.assert_allclose(solver.NearestOffsets(queries, src, dst), expected, rtol=1e-12, atol=1e-12)
+
+
+def test_nearest_offsets_need_three_points():
+    rng = np.random.RandomState(4)
+    src, dst = solver.PairArrays(random_pairs(rng, 2))
+    assert not solver.NearestOffsets([[10, 10], [500, 500]], src, dst).any()
+    src, dst = solver.PairArrays([])
+    assert solver.NearestOffsets([[10, 10]], src, dst).shape == (1, 2)
+
+
+def test_nearest_offsets_are_the_same_in_chunks(monkeypatch):
+    rng = np.random.RandomState(5)
+    src, dst = solver.PairArrays(random_pairs(rng, 30))
+    queries = rng.uniform(0, 1920, (100, 2))
+    whole = solver.NearestOffsets(queries, src, dst)
+    monkeypatch.setattr(solver, "CHUNK_SIZE", 30 * 7)
+    np.testing.assert_array_equal(solver.NearestOffsets(queries, src, dst), whole)
+
+
+def test_solve_local_matches_frame_by_frame_reference():
+    rng = np.random.RandomState(6)
+    store = random_store(rng)
+    refFrame = 15
+    start = store.xy[store.rows(refFrame)][:10]
+
+    def pairs(frame, otherFrame):
+        a, b = store.pairs(frame, otherFrame)
+        return [[[frame, p[0], p[1]], [otherFrame, q[0], q[1]]] for p, q in zip(a, b)]
+
+    for frames, step in [(list(range(refFrame, 30)), 1), (list(reversed(range(1, refFrame))), -1)]:
+        if step == 1:
+            path = solver.SolveLocal(start, frames, lambda frame: store.pairs(frame, frame + 1))
+            pointLists = [pairs(frame, frame + 1) for frame in frames]
+        else:
+            path = solver.SolveLocal(start, frames, lambda frame: store.pairs(frame + 1, frame))
+            pointLists = [pairs(frame + 1, frame) for frame in frames]
+
+        positions = [list(p) for p in start]
+        for i, pointList in enumerate(pointLists):
+            for p in positions:
+                offset = nearest_points([0, p[0], p[1]], pointList)
+                p[0] += offset[0]
+                p[1] += offset[1]
+            np.testing.assert_allclose(path[i], positions, rtol=1e-12, atol=1e-9)
+
+
+def median(lst):
+    sortedLst = sorted(lst)
+    index = (len(lst) - 1) // 2
+    if len(lst) % 2:
+        return sortedLst[index]
+    return (sortedLst[index] + sortedLst[index + 1]) / 2.0
+
+
+def position_delta(_method, pointList):
+    '''
+    the median and average branches of NST_stickit's CalculatePositionDelta, as the reference
+    '''
+    xlist = [float(item[1][1]) - float(item[0][1]) for item in pointList]
+    ylist = [float(item[1][2]) - float(item[0][2]) for item in pointList]
+    if _method == 1:
+        if not pointList:
+            return [0, 0]
+        return [median(xlist), median(ylist)]
+    x = 0
+    y = 0
+    for dx, dy in zip(xlist, ylist):
+        x += dx
+        y += dy
+    return [x / (len(pointList) + 0.00001), y / (len(pointList) + 0.00001)]
+
+
+def frame_pairs(store, frame):
+    a, b = store.pairs(frame, frame + 1)
+    return [[[frame, p[0], p[1]], [frame + 1, q[0], q[1]]] for p, q in zip(a, b)]
+
+
+def test_global_deltas_match_reference_on_random_tracks():
+    rng = np.random.RandomState(7)
+    store = random_store(rng, trackCount=60, first=1, last=40)
+    for _method in (1, 2):
+        for StartFrame, EndFrame in [(1, 40), (10, 25), (-5, 50)]:
+            deltas = solver.GlobalDeltas(store, _method, StartFrame, EndFrame)
+            expected = [position_delta(_method, frame_pairs(store, frame)) for frame in range(StartFrame, EndFrame)]
+            if _method == 2:
+                # the average adds the tracks in the same order, so it is exact
+                np.testing.assert_array_equal(deltas, expected)
+            else:
+                np.testing.assert_allclose(deltas, expected, rtol=1e-12, atol=1e-12)
+
+
+def test_solve_global_matches_running_sum():
+    rng = np.random.RandomState(8)
+    start = rng.uniform(0, 1920, (5, 2))
+    deltas = rng.normal(0, 4, (30, 2))
+    path = solver.SolveGlobal(start, deltas)
+
+    positions = [list(p) for p in start]
+    for i, (dx, dy) in enumerate(deltas):
+        for p in positions:
+            p[0] += dx
+            p[1] += dy
+        np.testing.assert_array_equal(path[i], positions)
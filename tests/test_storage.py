@@ -0,0 +1,84 @@
+import os
+
+import pytest
+
+from conftest import publish
+from pipe.pipeHandlers import doctor
+from pipe.pipeHandlers import pipeline_io
+from pipe.pipeHandlers import storage
+from pipe.pipeHandlers.body import Asset
+
+def _read(path):
+	with open(path, 'r') as f:
+		return f.read()
+
+@pytest.fixture
+def maya(project, tmp_path):
+	'''
+	the maya element of a chair with six publishes, v1 tagged to be kept and v2 used by
+	a versioned uri in a shot's layout
+	'''
+	element = project.create_asset('chair').get_element(Asset.MAYA)
+	for version in range(6):
+		publish(element, tmp_path, 'version %d' % version, ext='.ma')
+	element.keep_version(1)
+	layout_dir = project.create_shot('A1').get_element(Asset.LAYOUT).get_dir()
+	with open(os.path.join(layout_dir, 'A1.usda'), 'w') as f:
+		f.write('#usda 1.0\ndef "chair" (references = @pipe://asset/chair/maya@v2@) {}\n')
+	return element
+
+def test_plan_keeps_the_protected_versions(maya):
+	candidates = storage.Storage().plan(keep_last=2)
+	assert sorted(candidate.version for candidate in candidates) == [0, 3]
+	assert all(candidate.type == storage.VERSION_CANDIDATE for candidate in candidates)
+	# a dry run changes nothing
+	assert all(os.path.isdir(candidate.path) for candidate in candidates)
+
+def test_retire_and_restore_round_trip(maya):
+	store = storage.Storage()
+	candidates = store.plan(keep_last=2)
+	batch = store.retire(candidates)
+	assert os.path.dirname(batch) == store.trash_dir
+	for version in (0, 3):
+		assert not os.path.exists(maya.get_version_dir(version))
+	assert pipeline_io.read_retired(maya.get_dir()) == set([0, 3])
+	assert [entry[0] for entry in store.list_batches()] == [batch]
+	# retired versions aren't offered again, and the doctor doesn't report them missing
+	assert store.plan(keep_last=2) == []
+	assert doctor.Doctor().run()['issues'] == []
+
+	store.restore(batch)
+	for version in (0, 3):
+		assert _read(os.path.join(maya.get_version_dir(version), 'chair.ma')) == 'version %d' % version
+	assert pipeline_io.read_retired(maya.get_dir()) == set()
+	assert not os.path.exists(batch)
+	assert store.list_batches() == []
+	assert sorted(candidate.version for candidate in store.plan(keep_last=2)) == [0, 3]
+
+def test_restore_leaves_a_replaced_folder_alone(maya):
+	store = storage.Storage()
+	batch = store.retire(store.plan(keep_last=2))
+	os.mkdir(maya.get_version_dir(0))
+	store.restore(batch)
+	assert os.listdir(maya.get_version_dir(0)) == []
+	assert _read(os.path.join(maya.get_version_dir(3), 'chair.ma')) == 'version 3'
+	assert pipeline_io.read_retired(maya.get_dir()) == set([0])
+
+def test_purge_only_deletes_old_batches(maya):
+	store = storage.Storage()
+	batch = store.retire(store.plan(keep_last=2))
+	assert store.purge(days=1) == []
+	assert os.path.isdir(batch)
+	assert store.purge(days=0) == [batch]
+	assert not os.path.exists(batch)
+	assert pipeline_io.read_retired(maya.get_dir()) == set([0, 3])
+
+def test_command_line_round_trip(maya, capsys):
+	assert storage.main(['retain', '--keep', '2']) == 0
+	assert os.path.isdir(maya.get_version_dir(0))
+	assert storage.main(['retain', '--keep', '2', '--apply']) == 0
+	assert not os.path.exists(maya.get_version_dir(0))
+	batch = capsys.readouterr().out.splitlines()[-1][len('moved to '):]
+	assert storage.main(['restore', batch]) == 0
+	assert _read(os.path.join(maya.get_version_dir(0), 'chair.ma')) == 'version 0'
+	assert pipeline_io.read_retired(maya.get_dir()) == set()
@@ -0,0 +1,134 @@
+import numpy as np
+import pytest
+
+import NST_VectorTracker as tracker
+import NST_VectorTracker_engine as engine
+
+
+def box_average(plane, x, y, width, height):
+    '''
+    the average of a plane over an area, adding up every pixel's overlap with it
+    '''
+    rows, columns = plane.shape
+    left, right = x - width / 2.0, x + width / 2.0
+    bottom, top = y - height / 2.0, y + height / 2.0
+    total = 0.0
+    for j in range(rows):
+        overlap_y = max(0.0, min(top, j + 1) - max(bottom, j))
+        for i in range(columns):
+            overlap_x = max(0.0, min(right, i + 1) - max(left, i))
+            total += plane[j, i] * overlap_x * overlap_y
+    return total / (width * height)
+
+
+def constant_field(u, v, width=64, height=48):
+    return engine.VectorField(np.full((height, width), u), np.full((height, width), v))
+
+
+def test_sample_matches_brute_force_box_filter():
+    rng = np.random.RandomState(1)
+    u = rng.uniform(-5, 5, (12, 16))
+    v = rng.uniform(-5, 5, (12, 16))
+    field = engine.VectorField(u, v)
+
+    # areas inside, across pixel borders and hanging over the edges of the planes
+    x = rng.uniform(-2, 18, 200)
+    y = rng.uniform(-2, 14, 200)
+    width = rng.uniform(0.5, 6, 200)
+    height = rng.uniform(0.5, 6, 200)
+    su, sv = field.sample(x, y, width, height)
+
+    expected_u = [box_average(u, *area) for area in zip(x, y, width, height)]
+    expected_v = [box_average(v, *area) for area in zip(x, y, width, height)]
+    np.testing.assert_allclose(su, expected_u, rtol=1e-9, atol=1e-9)
+    np.testing.assert_allclose(sv, expected_v, rtol=1e-9, atol=1e-9)
+
+
+def test_unit_sample_is_bilinear_between_pixel_centers():
+    rng = np.random.RandomState(2)
+    u = rng.uniform(-1, 1, (8, 8))
+    field = engine.VectorField(u, u)
+    su, sv = field.sample([3.0, 3.5, 4.25], [2.5, 3.0, 5.75])
+    assert su[0] == pytest.approx((u[2, 2] + u[2, 3]) / 2)
+    assert su[1] == pytest.approx((u[2, 3] + u[3, 3]) / 2)
+    expected = (u[5, 3] * .25 + u[5, 4] * .75) * .75 + (u[6, 3] * .25 + u[6, 4] * .75) * .25
+    assert su[2] == pytest.approx(expected)
+
+
+def test_constant_field_moves_trackers_in_a_straight_line():
+    field = constant_field(1.5, -0.75)
+    start = [[10.0, 30.0], [20.25, 35.5], [5.0, 40.0]]
+    path = engine.track(start, [[4, 4]] * 3, list(range(1001, 1011)), lambda frame: field)
+
+    assert path.shape == (10, 3, 2)
+    steps = np.arange(10)[:, None, None]
+    np.testing.assert_allclose(path, np.array(start)[None] + steps * np.array([1.5, -0.75]), atol=1e-9)
+
+
+def test_rotating_field_matches_step_by_step_integration():
+    # pixel (i, j) moves by omega * (-(j - cy), i - cx), so a tracker at (x, y), sampled at
+    # its pixel center, moves by omega * (-(y - cy), x - cx): one euler step of a rotation
+    omega, cx, cy = 0.02, 64.0, 64.0
+    j, i = np.mgrid[0:128, 0:128].astype(np.float64)
+    field = engine.VectorField(-omega * (j - cy), omega * (i - cx))
+
+    start = [[80.0, 64.0], [64.0, 40.0], [50.5, 70.25]]
+    frames = list(range(30))
+    path = engine.track(start, [[1, 1]] * 3, frames, lambda frame: field)
+
+    for tracker, (x, y) in enumerate(start):
+        for frame in frames:
+            np.testing.assert_allclose(path[frame, tracker], [x, y], atol=1e-9)
+            x, y = x - omega * (y - cy), y + omega * (x - cx)
+
+    # an euler step of a rotation grows the radius by sqrt(1 + omega^2)
+    radius = np.hypot(path[:, :, 0] - cx, path[:, :, 1] - cy)
+    np.testing.assert_allclose(radius[1:] / radius[:-1], np.sqrt(1 + omega ** 2), rtol=1e-9)
+
+
+def test_track_uses_each_frames_field_and_stops_on_progress():
+    fields = dict((frame, constant_field(frame, 0)) for frame in range(1, 6))
+    seen = []
+
+    def progress(index, frame):
+        seen.append(frame)
+        return index < 3
+
+    path = engine.track([[10, 10]], [[2, 2]], [1, 2, 3, 4, 5], fields.__getitem__, progress)
+    assert seen == [1, 2, 3, 4]
+    # frame 4 was refused, so the path ends on frame 3 after the moves of frames 1 and 2
+    np.testing.assert_allclose(path[:, 0, 0], [10, 11, 13])
+
+
+class FakeVectors(object):
+    '''
+    a vector node whose sample() reads one pixel of its planes, counting the reads
+    '''
+    def __init__(self, u, v):
+        self.planes = {'forward.u': u, 'forward.v': v}
+        self.reads = []
+
+    def sample(self, channel, x, y, dx, dy, frame):
+        plane = self.planes[channel]
+        column, row = int(np.floor(x)), int(np.floor(y))
+        self.reads.append((channel, column, row))
+        if 0 <= row < plane.shape[0] and 0 <= column < plane.shape[1]:
+            return plane[row, column]
+        return 0.0
+
+
+def test_node_field_reads_each_pixel_once_and_matches_the_engine():
+    rng = np.random.RandomState(3)
+    u = rng.uniform(-5, 5, (40, 60))
+    v = rng.uniform(-5, 5, (40, 60))
+    # two overlapping trackers, one alone and one partly off the plate
+    x = np.array([10.3, 13.8, 40.5, 58.2])
+    y = np.array([10.7, 12.1, 30.2, 2.4])
+    width = np.array([6.0, 5.5, 4.0, 8.0])
+    height = np.array([5.0, 6.0, 3.0, 7.5])
+    vectors = FakeVectors(u, v)
+    us, vs = tracker.J_VTT_NodeField(vectors, 'forward.u', 'forward.v', 1).sample(x, y, width, height)
+    expected_u, expected_v = engine.VectorField(u, v).sample(x, y, width, height)
+    assert np.allclose(us, expected_u)
+    assert np.allclose(vs, expected_v)
+    assert len(vectors.reads) == len(set(vectors.reads))